@@ -0,0 +1,214 @@
+"""Benchmarks for VCF conversion, partitioning and index parsing, for use with asv.
+
+All input data is generated in `setup_cache`, so the benchmarks run offline.
+"""
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Any, Tuple
+
+import fsspec
+
+from sgkit_vcf import partition_into_regions, vcf_to_zarr
+from sgkit_vcf.csi import read_csi
+from sgkit_vcf.tbi import read_tabix
+from sgkit_vcf.vcf_generator import generate_vcf
+
+N_SAMPLES = [10, 100]
+N_VARIANTS = [1_000, 10_000]
+CHUNKS = [(1_000, 100), (5_000, 1_000)]
+STORAGE = ["local", "memory"]
+
+
+def vcf_name(n_variants: int, n_samples: int) -> str:
+    return f"sim_{n_variants}_{n_samples}.vcf.gz"
+
+
+def generate_all(data_dir: Path) -> str:
+    for n_variants in N_VARIANTS:
+        for n_samples in N_SAMPLES:
+            path = data_dir / vcf_name(n_variants, n_samples)
+            generate_vcf(path, n_variants=n_variants, n_samples=n_samples)
+            generate_vcf(path, n_variants=n_variants, n_samples=n_samples, index="csi")
+    return str(data_dir)
+
+
+class OutputStore:
+    """A Zarr output location in either a local directory or an fsspec memory filesystem."""
+
+    def __init__(self, storage: str):
+        self.storage = storage
+        if storage == "local":
+            self.dir = tempfile.mkdtemp()
+            self.url = str(Path(self.dir) / "output.zarr")
+        else:
+            self.url = f"memory://sgkit-vcf-bench/{uuid.uuid4()}/output.zarr"
+
+    def store(self) -> Any:
+        if self.storage == "local":
+            return self.url
+        return fsspec.get_mapper(self.url)
+
+    def clear(self) -> None:
+        fs, path = fsspec.core.url_to_fs(self.url)
+        if fs.exists(path):
+            fs.rm(path, recursive=True)
+
+    def size(self) -> int:
+        fs, path = fsspec.core.url_to_fs(self.url)
+        return int(fs.du(path))
+
+    def close(self) -> None:
+        self.clear()
+        if self.storage == "local":
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class VcfToZarrSuite:
+    params = (N_SAMPLES, N_VARIANTS, CHUNKS, STORAGE)
+    param_names = ["n_samples", "n_variants", "chunks", "storage"]
+    timeout = 600
+
+    def setup_cache(self) -> str:
+        return generate_all(Path.cwd())
+
+    def setup(
+        self,
+        data_dir: str,
+        n_samples: int,
+        n_variants: int,
+        chunks: Tuple[int, int],
+        storage: str,
+    ) -> None:
+        self.input = str(Path(data_dir) / vcf_name(n_variants, n_samples))
+        self.output = OutputStore(storage)
+
+    def teardown(self, *args: Any) -> None:
+        self.output.close()
+
+    def convert(self, chunks: Tuple[int, int]) -> None:
+        self.output.clear()
+        chunk_length, chunk_width = chunks
+        vcf_to_zarr(
+            self.input,
+            self.output.store(),
+            chunk_length=chunk_length,
+            chunk_width=chunk_width,
+        )
+
+    def time_vcf_to_zarr(
+        self,
+        data_dir: str,
+        n_samples: int,
+        n_variants: int,
+        chunks: Tuple[int, int],
+        storage: str,
+    ) -> None:
+        self.convert(chunks)
+
+    def peakmem_vcf_to_zarr(
+        self,
+        data_dir: str,
+        n_samples: int,
+        n_variants: int,
+        chunks: Tuple[int, int],
+        storage: str,
+    ) -> None:
+        self.convert(chunks)
+
+    def track_output_size(
+        self,
+        data_dir: str,
+        n_samples: int,
+        n_variants: int,
+        chunks: Tuple[int, int],
+        storage: str,
+    ) -> int:
+        self.convert(chunks)
+        return self.output.size()
+
+    track_output_size.unit = "bytes"  # type: ignore[attr-defined]
+
+
+class VcfToZarrParallelSuite:
+    params = ([1, 2, 8], STORAGE)
+    param_names = ["num_parts", "storage"]
+    timeout = 600
+
+    def setup_cache(self) -> str:
+        return generate_all(Path.cwd())
+
+    def setup(self, data_dir: str, num_parts: int, storage: str) -> None:
+        self.input = str(Path(data_dir) / vcf_name(max(N_VARIANTS), max(N_SAMPLES)))
+        self.regions = partition_into_regions(self.input, num_parts=num_parts)
+        self.output = OutputStore(storage)
+        self.tempdir = tempfile.mkdtemp()
+
+    def teardown(self, *args: Any) -> None:
+        self.output.close()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def convert(self) -> None:
+        self.output.clear()
+        vcf_to_zarr(
+            self.input,
+            self.output.store(),
+            regions=self.regions,
+            chunk_length=1_000,
+            chunk_width=1_000,
+            tempdir=self.tempdir,
+        )
+
+    def time_vcf_to_zarr(self, data_dir: str, num_parts: int, storage: str) -> None:
+        self.convert()
+
+    def peakmem_vcf_to_zarr(self, data_dir: str, num_parts: int, storage: str) -> None:
+        self.convert()
+
+    def track_output_size(self, data_dir: str, num_parts: int, storage: str) -> int:
+        self.convert()
+        return self.output.size()
+
+    track_output_size.unit = "bytes"  # type: ignore[attr-defined]
+
+
+class PartitionSuite:
+    params = ([2, 16, 128],)
+    param_names = ["num_parts"]
+
+    def setup_cache(self) -> str:
+        return generate_all(Path.cwd())
+
+    def setup(self, data_dir: str, num_parts: int) -> None:
+        self.input = str(Path(data_dir) / vcf_name(max(N_VARIANTS), max(N_SAMPLES)))
+
+    def time_partition_into_regions(self, data_dir: str, num_parts: int) -> None:
+        partition_into_regions(self.input, num_parts=num_parts)
+
+    def track_num_regions(self, data_dir: str, num_parts: int) -> int:
+        regions = partition_into_regions(self.input, num_parts=num_parts)
+        return 1 if regions is None else len(regions)
+
+
+class IndexSuite:
+    params = (N_VARIANTS,)
+    param_names = ["n_variants"]
+
+    def setup_cache(self) -> str:
+        return generate_all(Path.cwd())
+
+    def setup(self, data_dir: str, n_variants: int) -> None:
+        self.input = str(Path(data_dir) / vcf_name(n_variants, min(N_SAMPLES)))
+
+    def time_read_tabix(self, data_dir: str, n_variants: int) -> None:
+        read_tabix(self.input + ".tbi")
+
+    def time_read_csi(self, data_dir: str, n_variants: int) -> None:
+        read_csi(self.input + ".csi")
+
+    def peakmem_read_tabix(self, data_dir: str, n_variants: int) -> None:
+        read_tabix(self.input + ".tbi")
+
+    def peakmem_read_csi(self, data_dir: str, n_variants: int) -> None:
+        read_csi(self.input + ".csi")
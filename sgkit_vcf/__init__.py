@@ -1,8 +1,74 @@
-from sgkit_vcf.vcf_partition import partition_into_regions  # noqa: F401
-from sgkit_vcf.vcf_reader import (  # noqa: F401
-    vcf_to_zarr,
-    vcf_to_zarrs,
-    zarrs_to_dataset,
-)
-
-__all__ = ["partition_into_regions", "vcf_to_zarr", "vcf_to_zarrs", "zarrs_to_dataset"]
+"""Readers for VCF and BCF files, and conversion to sgkit datasets in Zarr.
+
+The public functions are imported from their modules on first use (see PEP 562), so
+that importing the package is fast, and functions that only need an index (such as
+`partition_into_regions`) don't import Dask, xarray or sgkit. The xarray accessors for
+sparse and packed genotypes are registered when xarray is imported (see `accessors`).
+"""
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
+from sgkit_vcf.accessors import register_accessors_on_import
+
+if TYPE_CHECKING:  # pragma: no cover
+    from sgkit_vcf.genotype_packing import (  # noqa: F401
+        pack_genotypes,
+        unpack_genotypes,
+    )
+    from sgkit_vcf.region_index import select_region  # noqa: F401
+    from sgkit_vcf.vcf_batch import (  # noqa: F401
+        BatchPlan,
+        merge_parts,
+        plan_batch_conversion,
+        run_part,
+    )
+    from sgkit_vcf.vcf_iterator import iter_vcf_chunks  # noqa: F401
+    from sgkit_vcf.vcf_partition import (  # noqa: F401
+        partition_files_into_regions,
+        partition_into_regions,
+    )
+    from sgkit_vcf.vcf_plan import plan_vcf_to_zarr  # noqa: F401
+    from sgkit_vcf.vcf_reader import (  # noqa: F401
+        ConversionOptions,
+        read_vcf,
+        vcf_to_zarr,
+        vcf_to_zarrs,
+        zarrs_to_dataset,
+    )
+
+# The module that defines each public name
+_MODULES = {
+    "BatchPlan": "sgkit_vcf.vcf_batch",
+    "ConversionOptions": "sgkit_vcf.vcf_reader",
+    "iter_vcf_chunks": "sgkit_vcf.vcf_iterator",
+    "merge_parts": "sgkit_vcf.vcf_batch",
+    "pack_genotypes": "sgkit_vcf.genotype_packing",
+    "partition_files_into_regions": "sgkit_vcf.vcf_partition",
+    "partition_into_regions": "sgkit_vcf.vcf_partition",
+    "plan_batch_conversion": "sgkit_vcf.vcf_batch",
+    "plan_vcf_to_zarr": "sgkit_vcf.vcf_plan",
+    "read_vcf": "sgkit_vcf.vcf_reader",
+    "run_part": "sgkit_vcf.vcf_batch",
+    "select_region": "sgkit_vcf.region_index",
+    "unpack_genotypes": "sgkit_vcf.genotype_packing",
+    "vcf_to_zarr": "sgkit_vcf.vcf_reader",
+    "vcf_to_zarrs": "sgkit_vcf.vcf_reader",
+    "zarrs_to_dataset": "sgkit_vcf.vcf_reader",
+}
+
+__all__ = sorted(_MODULES, key=str.lower)
+
+register_accessors_on_import()
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_MODULES[name]), name)
+    # cache the value, so this is only called once for each name
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + __all__)
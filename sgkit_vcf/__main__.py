@@ -0,0 +1,6 @@
+import sys
+
+from sgkit_vcf.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Registration of the xarray accessors for sparse and packed genotypes.
+
+Datasets written with ``sparse_hom_ref`` or ``pack_genotypes`` are read back with the
+``ds.sparse_genotypes`` and ``ds.packed_genotypes`` accessors, which must be registered
+with xarray before they are used. Importing xarray (which imports Dask) is slow, so
+rather than importing it when sgkit_vcf is imported, the accessors are registered as
+soon as xarray is imported, by whatever imports it.
+"""
+import importlib
+import importlib.util
+import sys
+from importlib.abc import MetaPathFinder
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Any, Optional, Sequence
+
+# The modules that register accessors when they are imported
+ACCESSOR_MODULES = ("sgkit_vcf.genotype_packing", "sgkit_vcf.sparse_genotypes")
+
+
+def register_accessors() -> None:
+    """Register the accessors with xarray, importing it if needed."""
+    for module in ACCESSOR_MODULES:
+        importlib.import_module(module)
+
+
+class _XarrayImportHook(MetaPathFinder):
+    """Registers the accessors once xarray has been imported."""
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[ModuleType] = None,
+    ) -> Optional[ModuleSpec]:
+        if fullname != "xarray":
+            return None
+        # find xarray with the other finders, then run it as usual
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        if spec is None or spec.loader is None:  # pragma: no cover
+            return spec
+        loader: Any = spec.loader
+        exec_module = loader.exec_module
+
+        def exec_module_and_register(module: ModuleType) -> None:
+            exec_module(module)
+            register_accessors()
+
+        loader.exec_module = exec_module_and_register
+        return spec
+
+
+def register_accessors_on_import() -> None:
+    """Register the accessors now if xarray has been imported, or when it is imported otherwise."""
+    if "xarray" in sys.modules:
+        register_accessors()
+    elif not any(isinstance(f, _XarrayImportHook) for f in sys.meta_path):
+        sys.meta_path.insert(0, _XarrayImportHook())
@@ -0,0 +1,372 @@
+"""A native decoder for BCF files, which reads records straight into NumPy arrays.
+
+BCF records are already binary: the fixed fields are little-endian integers, and the
+values of each FORMAT field are stored for all samples as a single typed vector. So
+rather than creating a cyvcf2 ``Variant`` for each record, the records are read from
+the BGZF blocks directly (starting from the virtual offset in the .csi index for a
+region), and the genotype vectors of a whole chunk of records are decoded with a few
+vectorized NumPy operations.
+
+Only the fixed fields and the genotype calls are decoded natively. The format is
+described in the [VCF specification](https://samtools.github.io/hts-specs/VCFv4.3.pdf).
+"""
+import re
+import struct
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from sgkit_vcf.bgzf import BgzfReader, decompress_block, read_block
+from sgkit_vcf.block_cache import open_input
+from sgkit_vcf.csi import CSI_EXTENSION, read_csi
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.utils import gather_bytes, gather_strings
+from sgkit_vcf.vcf_fields import INT_FILL, INT_MISSING
+from sgkit_vcf.vcf_partition import parse_region, region_virtual_offset
+
+BCF_MAGIC = b"BCF\x02"
+
+# BCF typed value types
+BCF_TYPE_INT8 = 1
+BCF_TYPE_INT16 = 2
+BCF_TYPE_INT32 = 3
+BCF_TYPE_FLOAT = 5
+BCF_TYPE_CHAR = 7
+BCF_INT_DTYPE = {BCF_TYPE_INT8: "<i1", BCF_TYPE_INT16: "<i2", BCF_TYPE_INT32: "<i4"}
+
+# The value that marks the end of a vector that is shorter than the others, for each
+# integer type (the missing value is one less)
+BCF_INT_VECTOR_END = {
+    BCF_TYPE_INT8: -127,
+    BCF_TYPE_INT16: -32767,
+    BCF_TYPE_INT32: -2147483647,
+}
+
+_TYPE_SIZES = {
+    BCF_TYPE_INT8: 1,
+    BCF_TYPE_INT16: 2,
+    BCF_TYPE_INT32: 4,
+    BCF_TYPE_FLOAT: 4,
+    BCF_TYPE_CHAR: 1,
+}
+_TYPE_SIZE_LOOKUP = np.zeros(16, dtype=np.int64)
+for _type, _size in _TYPE_SIZES.items():
+    _TYPE_SIZE_LOOKUP[_type] = _size
+
+_HEADER_ID = re.compile(r"^##(FILTER|INFO|FORMAT|contig)=<ID=([^,>]+)")
+_HEADER_IDX = re.compile(r"[<,]IDX=(\d+)[,>]")
+
+
+def is_bcf(path: PathType, storage_options: Optional[Dict[str, str]] = None) -> bool:
+    """Return True if a file is a (BGZF-compressed) BCF file."""
+    with open_input(path, storage_options) as f:
+        try:
+            block = read_block(f)
+        except ValueError:
+            return False
+        return decompress_block(block).startswith(BCF_MAGIC) if block else False
+
+
+def parse_header_dictionaries(text: str) -> Tuple[List[str], Dict[str, int]]:
+    """Return the contig names, and the string dictionary, that BCF records refer to by index.
+
+    Contigs are numbered in the order of their header lines, and FILTER, INFO and FORMAT
+    IDs share a dictionary that starts with PASS, unless ``IDX`` attributes say otherwise.
+    """
+    contigs: Dict[int, str] = {}
+    strings: Dict[str, int] = {"PASS": 0}
+    for line in text.splitlines():
+        match = _HEADER_ID.match(line)
+        if match is None:
+            continue
+        key, id = match.groups()
+        idx = _HEADER_IDX.search(line)
+        if key == "contig":
+            contigs[int(idx.group(1)) if idx else len(contigs)] = id
+        elif id not in strings or idx is not None:
+            strings[id] = int(idx.group(1)) if idx else len(strings)
+    return [contigs[i] for i in sorted(contigs)], strings
+
+
+class BcfFile:
+    """An open BCF file, whose records can be read for a region, and decoded in chunks."""
+
+    def __init__(
+        self, path: PathType, storage_options: Optional[Dict[str, str]] = None
+    ):
+        self.path = str(path)
+        self.storage_options = storage_options or {}
+        self._file: IO[Any] = open_input(self.path, self.storage_options)
+        self.reader = BgzfReader(self._file)
+        magic = self.reader.read(5)
+        if not magic.startswith(BCF_MAGIC):
+            raise ValueError(f"File not in BCF format: {self.path}")
+        (l_text,) = struct.unpack("<I", self.reader.read(4))
+        self.header_text = self.reader.read(l_text).rstrip(b"\x00").decode("utf-8")
+        self.contigs, self.dictionary = parse_header_dictionaries(self.header_text)
+        self.first_record_offset = self.reader.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "BcfFile":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def record_chunks(
+        self, region: Optional[str] = None, chunk_length: int = 10_000
+    ) -> Iterator[Tuple[bytes, np.ndarray]]:
+        """Iterate over chunks of (up to) `chunk_length` records that start in a region.
+
+        Each chunk is a buffer of decompressed data, and the offsets of the records in it.
+        As for the VCF decoder, a region includes the records whose position is between
+        its start and end (inclusive), but not earlier records that overlap it.
+        """
+        if region is None:
+            ci, start, end = None, 1, None
+            self.reader.seek(self.first_record_offset)
+        else:
+            contig, start, end = parse_region(region)
+            if contig not in self.contigs:
+                return
+            ci = self.contigs.index(contig)
+            csi = read_csi(
+                self.path + CSI_EXTENSION, storage_options=self.storage_options
+            )
+            offset = region_virtual_offset(csi, ci, start)
+            if offset is None:
+                return
+            self.reader.seek(offset)
+
+        # the record lengths, contig and (0-based) position
+        unpack_record_start = struct.Struct("<IIii").unpack_from
+        data = bytearray()
+        pos = 0  # the offset of the next record in data
+        offsets: List[int] = []
+        finished = False
+        while not finished:
+            more = self.reader.read_block_remainder()
+            data += more
+            size = len(data)
+            while pos + 16 <= size:
+                l_shared, l_indiv, chrom, record_pos = unpack_record_start(data, pos)
+                record_end = pos + 8 + l_shared + l_indiv
+                if record_end > size:
+                    break  # the rest of the record is in the next block
+                if ci is not None:
+                    if chrom != ci or (end is not None and record_pos >= end):
+                        finished = True
+                        break
+                    if record_pos + 1 < start:
+                        pos = record_end
+                        continue
+                offsets.append(pos)
+                pos = record_end
+                if len(offsets) == chunk_length:
+                    yield bytes(data), np.array(offsets)
+                    del data[:pos]
+                    size -= pos
+                    pos = 0
+                    offsets = []
+            if len(more) == 0:
+                finished = True
+        if len(offsets) > 0:
+            yield bytes(data), np.array(offsets)
+
+
+def decode_bcf_records(
+    data: bytes,
+    offsets: np.ndarray,
+    buffers: Dict[str, np.ndarray],
+    contig_indexes: np.ndarray,
+    gt_key: Optional[int],
+    sizes: Optional[Dict[str, int]] = None,
+) -> int:
+    """Decode BCF records into the start of the given buffers, and return the number decoded.
+
+    Each field is decoded for all the records at once, using NumPy operations on the
+    record `offsets` in `data` (as returned by `BcfFile.record_chunks`), rather than by
+    looping over the records.
+
+    The buffers are as for the VCF decoder, and only the variables that have a buffer are
+    decoded. `contig_indexes` maps the contig index of each record to the value of
+    ``variant_contig``, and `gt_key` is the dictionary index of the ``GT`` key (if any).
+    If `sizes` is given, the largest number of ALT alleles and the largest ploidy of any
+    record are stored in it (as ``alt_number`` and ``ploidy``), and calls with a higher
+    ploidy than `call_genotype` holds are not decoded rather than being an error, so
+    that the records can be decoded again into larger buffers.
+    """
+    variant_contig = buffers.get("variant_contig")
+    variant_position = buffers.get("variant_position")
+    variant_end = buffers.get("variant_end")
+    variant_id = buffers.get("variant_id")
+    variant_allele = buffers.get("variant_allele")
+    call_genotype = buffers.get("call_genotype")
+    call_genotype_phased = buffers.get("call_genotype_phased")
+
+    u8 = np.frombuffer(data, dtype=np.uint8)
+    n = len(offsets)
+    # l_shared, l_indiv, CHROM, POS, rlen, QUAL, n_allele_info and n_fmt_sample
+    fixed = gather_bytes(u8, offsets, 32).view("<i4").astype(np.int64)
+    fixed[:, 6:] &= 0xFFFFFFFF  # unsigned
+    if variant_contig is not None:
+        variant_contig[:n] = contig_indexes[fixed[:, 2]]
+    if variant_position is not None:
+        variant_position[:n] = fixed[:, 3] + 1
+    if variant_end is not None:
+        # the reference length includes the extent of reference blocks given by END
+        variant_end[:n] = fixed[:, 3] + fixed[:, 4]
+
+    ids, o = _typed_strings(u8, offsets + 32)
+    if variant_id is not None:
+        ids[ids == ""] = "."
+        variant_id[:n] = ids
+    n_allele = fixed[:, 6] >> 16
+    if sizes is not None:
+        sizes["alt_number"] = max(int(n_allele.max(initial=0)) - 1, 0)
+    if variant_allele is not None:
+        alleles = variant_allele[:n]
+        alleles[...] = ""
+        # alleles beyond the number stored are dropped
+        for j in range(min(alleles.shape[1], int(n_allele.max(initial=0)))):
+            has_allele = n_allele > j
+            alleles[has_allele, j], o[has_allele] = _typed_strings(u8, o[has_allele])
+
+    if call_genotype is not None or call_genotype_phased is not None:
+        gt_offset, gt_type, gt_k = _find_format_values(
+            u8, offsets + 8 + fixed[:, 0], fixed[:, 7], gt_key
+        )
+        # no GT field means every call is missing
+        no_gt = gt_offset < 0
+        if sizes is not None:
+            sizes["ploidy"] = int(gt_k[~no_gt].max(initial=0))
+        if call_genotype is not None:
+            call_genotype[:n][no_gt] = INT_MISSING
+        if call_genotype_phased is not None:
+            call_genotype_phased[:n][no_gt] = False
+        # decode the records with the same type and number of values together
+        layouts = np.unique((gt_type << 32 | gt_k)[~no_gt])
+        for type, k in zip(layouts >> 32, layouts & 0xFFFFFFFF):
+            index = np.flatnonzero((gt_type == type) & (gt_k == k) & ~no_gt)
+            if call_genotype is not None and k > call_genotype.shape[2]:
+                if sizes is not None:
+                    continue
+                raise ValueError(
+                    f"Variant at position {fixed[index[0], 3] + 1} has a call with "
+                    f"ploidy {k}, which is more than {call_genotype.shape[2]}; "
+                    "set ploidy to None to detect the ploidy from the input"
+                )
+            _decode_genotypes(
+                data,
+                gt_offset[index],
+                index,
+                int(type),
+                int(k),
+                call_genotype,
+                call_genotype_phased,
+            )
+    return n
+
+
+def _decode_genotypes(
+    data: bytes,
+    offsets: np.ndarray,
+    index: np.ndarray,
+    type: int,
+    k: int,
+    call_genotype: Optional[np.ndarray],
+    call_genotype_phased: Optional[np.ndarray],
+) -> None:
+    """Decode the GT vectors (with `k` values per sample, of the given type) at the offsets in one go."""
+    buffer: Any = call_genotype if call_genotype is not None else call_genotype_phased
+    n_sample = buffer.shape[1]
+    size = n_sample * k * _TYPE_SIZES[type]
+    u8 = np.frombuffer(data, dtype=np.uint8)
+    # copy the vectors out of a (no-copy) view of every window of `size` bytes
+    values = np.lib.stride_tricks.sliding_window_view(u8, size)[offsets]
+    raw = values.view(BCF_INT_DTYPE[type]).reshape(len(index), n_sample, k)
+    if call_genotype is not None:
+        # values are (allele + 1) << 1 | phased, with 0 for a missing allele, and calls
+        # with a lower ploidy are padded with the vector end value
+        alleles = (raw >> 1).astype(np.int8) - 1
+        alleles[raw == BCF_INT_VECTOR_END[type] - 1] = INT_MISSING
+        alleles[raw == BCF_INT_VECTOR_END[type]] = INT_FILL
+        call_genotype[index, :, :k] = alleles
+        call_genotype[index, :, k:] = INT_FILL
+    if call_genotype_phased is not None:
+        # the phase of a call is given by its second allele
+        if k > 1:
+            call_genotype_phased[index] = (raw[:, :, 1] & 1).astype(bool)
+        else:
+            call_genotype_phased[index] = False
+
+
+def _typed_ints(u8: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode the typed (single) integers at the offsets, returning their values and the offsets after them."""
+    type = u8[offsets] & 0xF
+    raw = gather_bytes(u8, offsets + 1, 4)
+    int8 = raw[:, 0].view(np.int8)
+    int16 = raw[:, :2].copy().view("<i2")[:, 0]
+    int32 = raw.view("<i4")[:, 0]
+    values = np.where(
+        type == BCF_TYPE_INT8, int8, np.where(type == BCF_TYPE_INT16, int16, int32)
+    ).astype(np.int64)
+    return values, offsets + 1 + _TYPE_SIZE_LOOKUP[type]
+
+
+def _typed_descriptors(
+    u8: np.ndarray, offsets: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Decode the type descriptors at the offsets, returning the types, the numbers of values, and the offsets of the values."""
+    descriptor = u8[offsets]
+    type = descriptor & 0xF
+    count = (descriptor >> 4).astype(np.int64)
+    values_offsets = offsets + 1
+    # a count of 15 means the count follows, as a typed integer
+    long = count == 15
+    if long.any():
+        count[long], values_offsets[long] = _typed_ints(u8, values_offsets[long])
+    return type, count, values_offsets
+
+
+def _typed_strings(
+    u8: np.ndarray, offsets: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode the typed strings at the offsets, returning them as an object array and the offsets after them."""
+    _, count, values_offsets = _typed_descriptors(u8, offsets)
+    return gather_strings(u8, values_offsets, count), values_offsets + count
+
+
+def _find_format_values(
+    u8: np.ndarray, offsets: np.ndarray, n_fmt_sample: np.ndarray, key: Optional[int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the values of a FORMAT field in the individual block of each record (at `offsets`).
+
+    Returns the offset of the values (or -1 if the record doesn't have the field), their
+    type, and the number of values per sample.
+    """
+    n = len(offsets)
+    values_offsets = np.full(n, -1, dtype=np.int64)
+    types = np.zeros(n, dtype=np.int64)
+    counts = np.zeros(n, dtype=np.int64)
+    if key is None:
+        return values_offsets, types, counts
+    n_fmt = n_fmt_sample >> 24
+    n_sample = n_fmt_sample & 0xFFFFFF
+    o = offsets.copy()
+    pending = np.arange(n)  # the records that the field hasn't been found in yet
+    for f in range(int(n_fmt.max(initial=0))):
+        pending = pending[n_fmt[pending] > f]
+        if len(pending) == 0:
+            break
+        keys, keys_end = _typed_ints(u8, o[pending])
+        type, count, values_start = _typed_descriptors(u8, keys_end)
+        found = keys == key
+        values_offsets[pending[found]] = values_start[found]
+        types[pending[found]] = type[found]
+        counts[pending[found]] = count[found]
+        o[pending] = values_start + n_sample[pending] * count * _TYPE_SIZE_LOOKUP[type]
+        pending = pending[~found]
+    return values_offsets, types, counts
@@ -0,0 +1,183 @@
+"""Functions for reading and writing BGZF (blocked gzip) files.
+
+The implementation follows the BGZF section of the [SAM file format](https://samtools.github.io/hts-specs/SAMv1.pdf).
+
+"""
+import struct
+import zlib
+from typing import IO, Any
+
+# Maximum amount of uncompressed data in a block, as used by htslib
+BGZF_BLOCK_SIZE = 0xFF00
+
+# Maximum size of a compressed block, including its header and footer
+BGZF_MAX_BLOCK_SIZE = 0x10000
+
+# The empty block that marks the end of a BGZF file
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data: bytes, compresslevel: int = 6) -> bytes:
+    """Compress data (of at most 64KB) into a single BGZF block."""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    # BSIZE is the total block size minus one: 18 byte header, 8 byte footer
+    bsize = len(cdata) + 25
+    header = struct.pack(
+        "<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, bsize
+    )
+    footer = struct.pack("<2I", zlib.crc32(data) & 0xFFFFFFFF, len(data))
+    return header + cdata + footer
+
+
+def decompress_block(block: bytes) -> bytes:
+    """Decompress a single BGZF block, as returned by `read_block`."""
+    xlen = struct.unpack_from("<H", block, 10)[0]
+    return zlib.decompress(block[12 + xlen : -8], -15)
+
+
+def read_block(fileobj: IO[Any]) -> bytes:
+    """Read the next (compressed) BGZF block from a binary stream, or an empty bytes object at the end of the stream."""
+    header = fileobj.read(12)
+    if len(header) == 0:
+        return b""
+    if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+        raise ValueError("Not a BGZF block")
+    xlen = struct.unpack_from("<H", header, 10)[0]
+    extra = fileobj.read(xlen)
+    # find the BC subfield, which holds the total block size minus one
+    i = 0
+    while i + 4 <= len(extra):
+        si1, si2, slen = struct.unpack_from("<BBH", extra, i)
+        if si1 == 66 and si2 == 67 and slen == 2:
+            bsize = struct.unpack_from("<H", extra, i + 4)[0]
+            return header + extra + fileobj.read(bsize + 1 - 12 - xlen)
+        i += 4 + slen
+    raise ValueError("Not a BGZF block")
+
+
+def make_virtual_offset(block_offset: int, within_block_offset: int) -> int:
+    """Combine a compressed block offset and an offset within the block into a virtual file pointer."""
+    return block_offset << 16 | within_block_offset
+
+
+class BgzfWriter:
+    """Write data to a binary stream as a sequence of BGZF blocks.
+
+    Virtual file offsets (as used in .tbi and .csi indexes) for the data written so far
+    are available from `tell`, which makes it possible to index records as they are written.
+    """
+
+    def __init__(self, fileobj: IO[Any], compresslevel: int = 6):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.block_offset = 0  # compressed offset of the current block
+        self.buffer = bytearray()
+
+    def tell(self) -> int:
+        """Return the virtual file offset of the next byte to be written."""
+        return make_virtual_offset(self.block_offset, len(self.buffer))
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= BGZF_BLOCK_SIZE:
+            self._write_block(bytes(self.buffer[:BGZF_BLOCK_SIZE]))
+            del self.buffer[:BGZF_BLOCK_SIZE]
+
+    def flush(self) -> None:
+        """Write any buffered data as a (possibly short) block."""
+        if len(self.buffer) > 0:
+            self._write_block(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self, write_eof: bool = True) -> None:
+        """Flush buffered data, and write the BGZF end-of-file marker block.
+
+        The underlying stream is not closed.
+        """
+        self.flush()
+        if write_eof:
+            self.fileobj.write(BGZF_EOF)
+            self.block_offset += len(BGZF_EOF)
+
+    def _write_block(self, data: bytes) -> None:
+        block = compress_block(data, self.compresslevel)
+        self.fileobj.write(block)
+        self.block_offset += len(block)
+
+    def __enter__(self) -> "BgzfWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class BgzfReader:
+    """Read decompressed data from a binary stream of BGZF blocks.
+
+    Reading starts at the beginning of the stream, or at a virtual file offset (as found
+    in .tbi and .csi indexes) passed to `seek`. Blocks are decompressed one at a time,
+    as they are needed.
+    """
+
+    def __init__(self, fileobj: IO[Any]):
+        self.fileobj = fileobj
+        self.block_offset = 0  # compressed offset of the current block
+        self.next_block_offset = 0  # compressed offset of the next block
+        self.buffer = b""  # the decompressed data of the current block
+        self.pos = 0  # the offset of the next byte to read in the buffer
+
+    def tell(self) -> int:
+        """Return the virtual file offset of the next byte to be read."""
+        if self.pos == len(self.buffer):
+            return make_virtual_offset(self.next_block_offset, 0)
+        return make_virtual_offset(self.block_offset, self.pos)
+
+    def seek(self, virtual_offset: int) -> None:
+        """Move to a virtual file offset."""
+        self.fileobj.seek(virtual_offset >> 16)
+        self.next_block_offset = virtual_offset >> 16
+        self.buffer = b""
+        self.pos = 0
+        self._read_block()
+        self.pos = min(virtual_offset & 0xFFFF, len(self.buffer))
+
+    def read(self, n: int) -> bytes:
+        """Read `n` bytes, or fewer if the end of the stream is reached."""
+        if self.pos + n <= len(self.buffer):
+            data = self.buffer[self.pos : self.pos + n]
+            self.pos += n
+            return data
+        parts = [self.buffer[self.pos :]]
+        remaining = n - len(parts[0])
+        self.pos = len(self.buffer)
+        while remaining > 0 and self._read_block():
+            part = self.buffer[:remaining]
+            parts.append(part)
+            self.pos = len(part)
+            remaining -= len(part)
+        return b"".join(parts)
+
+    def read_block_remainder(self) -> bytes:
+        """Read the rest of the current block (or all of the next one, if at the end of a block).
+
+        Returns an empty bytes object at the end of the stream.
+        """
+        if self.pos == len(self.buffer) and not self._read_block():
+            return b""
+        data = self.buffer[self.pos :]
+        self.pos = len(self.buffer)
+        return data
+
+    def _read_block(self) -> bool:
+        # skip empty blocks (such as the EOF marker), returning False at the end
+        while True:
+            block = read_block(self.fileobj)
+            if len(block) == 0:
+                return False
+            self.block_offset = self.next_block_offset
+            self.next_block_offset += len(block)
+            self.buffer = decompress_block(block)
+            self.pos = 0
+            if len(self.buffer) > 0:
+                return True
@@ -0,0 +1,327 @@
+"""A local read-through cache for remote VCF, BCF and index files.
+
+When a remote file is converted in many regions, each task fetches the header, the
+index, and the BGZF blocks at its region boundaries again, and rerunning a conversion
+fetches everything again. With the cache enabled (see `block_cache`), remote files are
+read in pages of `PAGE_SIZE` bytes. Each page is stored in a local directory (ideally on
+an SSD) the first time it is read, and is read from there after that.
+
+Pages are keyed by the file's version (its fsspec ``ukey``, such as an ETag or a
+modification time), so a file that changes is fetched again. The least recently used
+pages are evicted when the directory grows beyond its maximum size. The pages are
+plain files, written atomically, so the cache can be shared by all the threads and
+processes on a machine that use the same directory. The cache is configured with
+environment variables (`CACHE_DIRECTORY_ENV` and `CACHE_SIZE_ENV`), so worker processes
+inherit it.
+
+The native decoders (``engine="native"``) and the .tbi and .csi index readers read
+files through the cache directly. cyvcf2 reads files through htslib, which can't use
+the cache, so it is given a local copy of the file instead (see `write_local_copy`),
+with just the pages that it reads for the header and the region being converted, read
+through the cache. Local files are never cached.
+"""
+import gzip
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fsspec
+from fsspec.implementations.local import LocalFileSystem
+
+from sgkit_vcf.typing import PathType
+
+# The environment variable with the directory to cache pages in, which enables the cache
+CACHE_DIRECTORY_ENV = "SGKIT_VCF_BLOCK_CACHE"
+
+# The environment variable with the maximum size of the cache, in bytes
+CACHE_SIZE_ENV = "SGKIT_VCF_BLOCK_CACHE_SIZE"
+
+DEFAULT_MAX_SIZE = 10 * 2 ** 30
+
+# The size of the pages that files are read and cached in. It is a multiple of the
+# maximum size of a BGZF block (64KB), so a block is in at most two pages.
+PAGE_SIZE = 2 ** 20
+
+# When the cache is too large, pages are evicted until it is this fraction of its
+# maximum size, so that eviction doesn't run for every page added
+EVICTION_TARGET = 0.9
+
+
+class BlockCache:
+    """A directory of cached pages, which are evicted least recently used first.
+
+    The size of the cache is only checked against `max_size` when this process adds a
+    page, so it may go over the limit for a while if several processes share it.
+    """
+
+    def __init__(self, directory: PathType, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = str(directory)
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None  # the size at the last scan, plus pages added
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached page for a key, or None if it isn't cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            _touch(path)
+        except FileNotFoundError:
+            # it may also have been evicted by another process after it was opened
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Add a page to the cache, evicting other pages if it is too large."""
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        _touch(path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _pages(self) -> List[Tuple[str, os.stat_result]]:
+        pages = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                pages.append((entry.path, entry.stat()))
+            except FileNotFoundError:  # pragma: no cover
+                pass
+        return pages
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._pages())
+
+    def _evict(self) -> None:
+        pages = sorted(self._pages(), key=lambda page: page[1].st_mtime_ns)
+        size = sum(stat.st_size for _, stat in pages)
+        for path, stat in pages:
+            if size <= self.max_size * EVICTION_TARGET:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # pragma: no cover
+                pass
+            size -= stat.st_size
+        self._size = size
+
+
+def _touch(path: str) -> None:
+    # use the clock rather than the filesystem's (coarser) timestamps, to keep the order
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class CachedFile(io.RawIOBase):
+    """A read-only file whose data is read in pages through a `BlockCache`."""
+
+    def __init__(
+        self, fs: Any, path: str, cache: BlockCache, page_size: int = PAGE_SIZE
+    ):
+        self.fs = fs
+        self.path = path
+        self.cache = cache
+        self.page_size = page_size
+        self.size = fs.size(path)
+        self.version = fs.ukey(path)
+        self.pos = 0
+        self._page_index = -1
+        self._page = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+        self.pos = pos
+        return pos
+
+    def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer).cast("B")
+        n = 0
+        while n < len(view) and self.pos < self.size:
+            page = self._read_page(self.pos // self.page_size)
+            start = self.pos % self.page_size
+            data = page[start : start + len(view) - n]
+            view[n : n + len(data)] = data
+            n += len(data)
+            self.pos += len(data)
+        return n
+
+    def _read_page(self, index: int) -> bytes:
+        if index != self._page_index:
+            key = f"{self.path}@{self.version}/{self.page_size}/{index}"
+            page = self.cache.get(key)
+            if page is None:
+                start = index * self.page_size
+                end = min(start + self.page_size, self.size)
+                page = self.fs.cat_file(self.path, start=start, end=end)
+                self.cache.put(key, page)
+            self._page_index = index
+            self._page = page
+        return self._page
+
+
+@lru_cache(maxsize=None)
+def _open_block_cache(directory: str, max_size: int) -> BlockCache:
+    return BlockCache(directory, max_size)
+
+
+def get_block_cache() -> Optional[BlockCache]:
+    """Return the block cache, or None if caching is not enabled."""
+    directory = os.environ.get(CACHE_DIRECTORY_ENV)
+    if not directory:
+        return None
+    max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_SIZE))
+    return _open_block_cache(directory, max_size)
+
+
+@contextmanager
+def block_cache(
+    directory: PathType, max_size: int = DEFAULT_MAX_SIZE
+) -> Iterator[BlockCache]:
+    """Cache the remote files read within the context manager block in a local directory.
+
+    The cache is enabled by setting environment variables, so it is also used by any
+    worker processes started within the block. To enable it for separate processes
+    (such as the jobs of a batch conversion), set the variables instead:
+    ``SGKIT_VCF_BLOCK_CACHE`` to the directory, and optionally
+    ``SGKIT_VCF_BLOCK_CACHE_SIZE`` to the maximum size in bytes.
+
+    Remote inputs are cached whichever engine decodes them. For the default engine
+    (``engine="cyvcf2"``), the pages that htslib reads are copied through the cache
+    into a temporary local file before each region is read.
+
+    Parameters
+    ----------
+    directory : PathType
+        The local directory to store cached pages in, which is created if it doesn't
+        exist. The cache persists after the block, so later runs can use it.
+    max_size : int, optional
+        The maximum size of the cache in bytes, by default 10GiB.
+
+    Yields
+    -------
+    BlockCache
+        The cache, which counts the pages found (``hits``) and not found (``misses``)
+        in this process.
+    """
+    if max_size < 1:
+        raise ValueError("max_size must be positive")
+    settings = {CACHE_DIRECTORY_ENV: str(directory), CACHE_SIZE_ENV: str(max_size)}
+    previous: Dict[str, Optional[str]] = {}
+    for name, value in settings.items():
+        previous[name] = os.environ.get(name)
+        os.environ[name] = value
+    try:
+        yield _open_block_cache(str(directory), max_size)
+    finally:
+        for name, previous_value in previous.items():
+            if previous_value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = previous_value
+
+
+def uses_block_cache(
+    path: PathType, storage_options: Optional[Dict[str, str]] = None
+) -> bool:
+    """Return True if the block cache is enabled and the file is remote, so that `open_input` reads it through the cache."""
+    if get_block_cache() is None:
+        return False
+    fs, _ = fsspec.core.url_to_fs(str(path), **(storage_options or {}))
+    return not isinstance(fs, LocalFileSystem)
+
+
+def open_input(
+    path: PathType, storage_options: Optional[Dict[str, str]] = None
+) -> IO[Any]:
+    """Open an input file for reading in binary mode, through the block cache if it is enabled."""
+    url = str(path)
+    storage_options = storage_options or {}
+    cache = get_block_cache()
+    if cache is not None and uses_block_cache(url, storage_options):
+        fs, fs_path = fsspec.core.url_to_fs(url, **storage_options)
+        return CachedFile(fs, fs_path, cache)  # type: ignore[return-value]
+    file: IO[Any] = fsspec.open(url, "rb", **storage_options).open()
+    return file
+
+
+def write_local_copy(
+    path: PathType,
+    local_path: PathType,
+    ranges: Optional[Sequence[Tuple[int, int]]] = None,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> None:
+    """Copy a file to a local path, reading it through the block cache if it is enabled.
+
+    If `ranges` is given, only the pages that overlap the (start, end) byte ranges are
+    copied, and the rest of the local file is left as a hole of the same size (which
+    reads as zeros), so that offsets in the file are unchanged.
+    """
+    with open_input(path, storage_options) as src, open(local_path, "wb") as dst:
+        size = src.seek(0, io.SEEK_END)
+        dst.truncate(size)
+        if ranges is None:
+            ranges = [(0, size)]
+        pages = sorted(
+            {
+                page
+                for start, end in ranges
+                for page in range(start // PAGE_SIZE, min(end, size - 1) // PAGE_SIZE + 1)
+            }
+        )
+        for page in pages:
+            src.seek(page * PAGE_SIZE)
+            dst.seek(page * PAGE_SIZE)
+            dst.write(src.read(PAGE_SIZE))
+
+
+@contextmanager
+def open_gzip(
+    path: PathType, storage_options: Optional[Dict[str, str]] = None
+) -> Iterator[IO[Any]]:
+    """Open a gzip-compressed input file for reading, through the block cache if it is enabled."""
+    with open_input(path, storage_options) as raw, gzip.GzipFile(fileobj=raw) as f:
+        yield f  # type: ignore[misc]
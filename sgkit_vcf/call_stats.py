@@ -0,0 +1,139 @@
+"""Summary statistics of genotype calls, computed while converting a VCF.
+
+Quality control usually starts with a pass over all the genotype calls to count the
+called, heterozygous and homozygous calls for each variant and each sample. When
+`vcf_to_zarr` is run with ``compute_stats=True`` these are computed from each chunk of
+calls as it is decoded, so the store doesn't need to be read again afterwards.
+
+The per-variant statistics are stored along with the other variant variables. The
+per-sample statistics are counts accumulated over all the variants in a part, which
+are summed when parts are merged, and the call rates are derived from the counts.
+The variable names follow sgkit's ``variant_stats`` and ``sample_stats`` functions.
+
+Calls are counted as called if none of their alleles are missing. Fill values (for
+calls with fewer alleles than the ploidy) are ignored, so a haploid call of ``1`` is a
+hom-alt call. Allele counts include the non-missing alleles of partly missing calls.
+"""
+from typing import Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+import xarray as xr
+
+from sgkit_vcf.vcf_fields import INT_FILL, INT_MISSING
+
+# The per-variant and per-sample counts, which can be summed over calls
+VARIANT_COUNTS = (
+    "variant_n_called",
+    "variant_n_het",
+    "variant_n_hom_ref",
+    "variant_n_hom_alt",
+    "variant_n_non_ref",
+    "variant_allele_count",
+)
+SAMPLE_COUNTS = (
+    "sample_n_called",
+    "sample_n_het",
+    "sample_n_hom_ref",
+    "sample_n_hom_alt",
+    "sample_n_non_ref",
+)
+VARIANT_STATS = VARIANT_COUNTS + ("variant_call_rate",)
+SAMPLE_STATS = SAMPLE_COUNTS + ("sample_call_rate",)
+
+
+def call_counts(
+    call_genotype: np.ndarray, n_allele: int
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Count the genotype calls of each kind for each variant and each sample.
+
+    Parameters
+    ----------
+    call_genotype : np.ndarray
+        The allele indexes of the calls, of shape (variants, samples, ploidy).
+    n_allele : int
+        The number of alleles to count. Allele indexes beyond this (for alleles that
+        were dropped) are not counted in ``variant_allele_count``.
+
+    Returns
+    -------
+    Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]
+        The counts in `VARIANT_COUNTS`, along the variants dimension (and the alleles
+        dimension for allele counts), and the counts in `SAMPLE_COUNTS`, along the
+        samples dimension.
+    """
+    n_variants = call_genotype.shape[0]
+    first = call_genotype[..., 0]
+    called = ~np.any(call_genotype == INT_MISSING, axis=2) & (first >= 0)
+    homozygous = np.all(
+        (call_genotype == first[..., None]) | (call_genotype == INT_FILL), axis=2
+    )
+    kinds = dict(
+        n_called=called,
+        n_het=called & ~homozygous,
+        n_hom_ref=called & homozygous & (first == 0),
+        n_hom_alt=called & homozygous & (first > 0),
+        n_non_ref=called & np.any(call_genotype > 0, axis=2),
+    )
+    variant_counts = {
+        f"variant_{kind}": np.count_nonzero(calls, axis=1).astype(np.int32)
+        for kind, calls in kinds.items()
+    }
+    sample_counts = {
+        f"sample_{kind}": np.count_nonzero(calls, axis=0).astype(np.int64)
+        for kind, calls in kinds.items()
+    }
+
+    # count each allele separately, so the only temporary array is a boolean one the
+    # size of the calls (there are only a few alleles)
+    allele_count = np.empty((n_variants, n_allele), dtype=np.int32)
+    for a in range(n_allele):
+        allele_count[:, a] = np.count_nonzero(call_genotype == a, axis=(1, 2))
+    variant_counts["variant_allele_count"] = allele_count
+    return variant_counts, sample_counts
+
+
+def add_variant_stats(
+    ds: xr.Dataset, variant_counts: Mapping[str, np.ndarray]
+) -> xr.Dataset:
+    """Add the per-variant count variables, and the call rate, to a dataset."""
+    for var, counts in variant_counts.items():
+        ds[var] = (["variants", "alleles"][: counts.ndim], counts)
+    # allele counts are padded with zeros if parts with more alleles are merged
+    ds["variant_allele_count"].attrs.update(missing=0, fill=0)
+    ds["variant_call_rate"] = ds["variant_n_called"] / ds.sizes["samples"]
+    return ds
+
+
+def sample_stats_dataset(
+    sample_counts: Mapping[str, np.ndarray], n_variants: int
+) -> xr.Dataset:
+    """Return a dataset of the per-sample counts, and the call rate, for a number of variants."""
+    ds = xr.Dataset(
+        {var: (["samples"], counts) for var, counts in sample_counts.items()}
+    )
+    ds["sample_call_rate"] = ds["sample_n_called"] / max(n_variants, 1)
+    return ds
+
+
+def combine_variant_stats(datasets: Sequence[xr.Dataset]) -> Dict[str, xr.DataArray]:
+    """Combine the per-variant statistics of datasets for the same variants and different samples."""
+    stats = {var: _sum([ds[var] for ds in datasets]) for var in VARIANT_COUNTS}
+    n_samples = sum(ds.sizes["samples"] for ds in datasets)
+    stats["variant_call_rate"] = stats["variant_n_called"] / n_samples
+    stats["variant_allele_count"].attrs.update(missing=0, fill=0)
+    return stats
+
+
+def combine_sample_stats(datasets: Sequence[xr.Dataset]) -> Dict[str, xr.DataArray]:
+    """Combine the per-sample statistics of datasets for the same samples and different variants."""
+    stats = {var: _sum([ds[var] for ds in datasets]) for var in SAMPLE_COUNTS}
+    n_variants = sum(ds.sizes["variants"] for ds in datasets)
+    stats["sample_call_rate"] = stats["sample_n_called"] / max(n_variants, 1)
+    return stats
+
+
+def _sum(arrays: Sequence[xr.DataArray]) -> xr.DataArray:
+    total = arrays[0]
+    for array in arrays[1:]:
+        total = total + array
+    return total
@@ -0,0 +1,478 @@
+"""The ``sgkit-vcf`` command-line interface, which can also be run with ``python -m sgkit_vcf``.
+
+The commands are:
+
+- ``convert``, to convert VCF files to a Zarr store with `vcf_to_zarr`, or to check
+  the memory use of a conversion with `plan_vcf_to_zarr`, or to split it into parts
+  for batch jobs with `plan_batch_conversion`
+- ``run-part`` and ``merge``, to run the steps of a conversion that has been split into
+  parts and saved as JSON (see `sgkit_vcf.vcf_batch`), so each part can be run as a
+  separate job on a batch scheduler
+- ``partition``, to print the regions from `partition_into_regions`
+- ``count``, to print the number of variants from `count_variants`
+- ``index-info``, to print the contigs and record counts in a .tbi or .csi index
+
+The conversion modules are imported by the commands that use them, so the commands
+that only read indexes start quickly.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Union
+
+from sgkit_vcf.block_cache import DEFAULT_MAX_SIZE, block_cache
+from sgkit_vcf.csi import CSI_EXTENSION
+from sgkit_vcf.profiling import Span, Tracer, trace
+from sgkit_vcf.tbi import TABIX_EXTENSION
+from sgkit_vcf.vcf_partition import (
+    estimate_region_variant_counts,
+    find_index_path,
+    get_sequence_names,
+    get_vcf_file_infos,
+    partition_files_into_regions,
+    partition_into_regions,
+    read_index,
+)
+
+EXECUTORS = ("dask", "threads", "processes")
+
+
+def parse_bytes(s: str) -> int:
+    """Parse a size such as ``16GB`` (see `dask.utils.parse_bytes`)."""
+    # Dask is imported here (and in format_bytes), rather than at the top of the module,
+    # so that commands that don't use it start quickly
+    from dask.utils import parse_bytes
+
+    return int(parse_bytes(s))
+
+
+def format_bytes(n: int) -> str:
+    """Format a size in bytes for display (see `dask.utils.format_bytes`)."""
+    from dask.utils import format_bytes
+
+    return str(format_bytes(n))
+
+
+class Progress(Tracer):
+    """A tracer that shows the number of variants decoded and the bytes written so far, and their rates.
+
+    Only spans recorded in the current process are counted, so variants decoded by
+    worker processes are not shown until they are merged into the output.
+    """
+
+    def __init__(
+        self,
+        total_variants: Optional[int] = None,
+        stream: Optional[TextIO] = None,
+        interval: float = 0.5,
+    ):
+        super().__init__()
+        self.total_variants = total_variants
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.variants = 0
+        self.merged_variants = 0
+        self.bytes_written = 0
+        self.start = time.perf_counter()
+        self._last_shown = self.start
+
+    def record(self, span: Span) -> None:
+        # the spans are counted rather than kept
+        with self._lock:
+            if span.name == "region read":
+                self.variants += span.args.get("variants", 0)
+            elif span.name == "merge":
+                self.merged_variants += span.args.get("variants", 0)
+            self.bytes_written += span.args.get("nbytes", 0)
+            now = time.perf_counter()
+            if now - self._last_shown >= self.interval:
+                self._last_shown = now
+                self.show()
+
+    def status(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        status = f"decoded {self.variants:,}"
+        rate = f"{self.variants / elapsed:,.0f}/s"
+        if self.total_variants:
+            percent = min(100 * self.variants / self.total_variants, 100)
+            status += f"/~{self.total_variants:,}"
+            rate = f"{percent:.0f}%, {rate}"
+        status += f" variants ({rate})"
+        if self.merged_variants > 0:
+            status += f", merged {self.merged_variants:,} variants"
+        written = format_bytes(self.bytes_written)
+        write_rate = format_bytes(int(self.bytes_written / elapsed))
+        return f"{status}, wrote {written} ({write_rate}/s) in {elapsed:.1f}s"
+
+    def show(self, end: str = "") -> None:
+        print(f"\r{self.status()}\033[K", end=end, file=self.stream, flush=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self.show(end="\n")
+
+
+def _optional_int(value: str) -> Optional[int]:
+    return None if value == "auto" else int(value)
+
+
+@contextmanager
+def _executor(kind: str, workers: Optional[int]) -> Iterator[Optional[Any]]:
+    if kind == "threads":
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield executor
+    elif kind == "processes":
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield executor
+    else:
+        import dask
+
+        config: Dict[str, Any] = {"scheduler": "threads"}
+        if workers is not None:
+            config["num_workers"] = workers
+        with dask.config.set(config):
+            yield None
+
+
+def _regions(
+    args: argparse.Namespace,
+) -> Union[None, str, Sequence[str], List[Optional[Sequence[str]]]]:
+    """The regions argument of `vcf_to_zarr` for the command line arguments."""
+    if args.num_parts is not None:
+        if args.region is not None:
+            raise ValueError("Only one of --region and --num-parts may be set")
+        if len(args.input) == 1 or args.merge_samples:
+            # sample batches have the same variants, so are partitioned the same way
+            return partition_into_regions(args.input[0], num_parts=args.num_parts)
+        return partition_files_into_regions(args.input, num_parts=args.num_parts)
+    if args.region is None or args.merge_samples:
+        return args.region  # type: ignore[no-any-return]
+    if len(args.input) == 1:
+        # a single region is converted sequentially
+        return args.region[0] if len(args.region) == 1 else args.region
+    return [args.region] * len(args.input)
+
+
+def _part_regions(
+    inputs: Sequence[str], regions: Any, merge_samples: bool
+) -> List[List[Optional[str]]]:
+    """The regions converted for each input."""
+    if regions is None or isinstance(regions, str):
+        return [[regions] for _ in inputs]
+    if merge_samples or len(inputs) == 1:
+        return [list(regions) for _ in inputs]
+    return [[None] if r is None else list(r) for r in regions]
+
+
+def _total_variants(inputs: Sequence[str], part_regions: Any) -> Optional[int]:
+    """The estimated number of variants decoded, or None if it can't be estimated."""
+    total = 0
+    for info, regions in zip(get_vcf_file_infos(inputs), part_regions):
+        if info.index_path is None:
+            return None
+        counts = estimate_region_variant_counts(
+            info.path, regions, index_path=info.index_path, file_length=info.size
+        )
+        if counts is None:
+            return None
+        total += sum(counts)
+    return total
+
+
+def convert_command(args: argparse.Namespace) -> None:
+    from sgkit_vcf.vcf_batch import plan_batch_conversion
+    from sgkit_vcf.vcf_plan import plan_vcf_to_zarr
+    from sgkit_vcf.vcf_reader import vcf_to_zarr
+
+    inputs = args.input
+    regions = _regions(args)
+    options = dict(
+        chunk_length=args.chunk_length,
+        chunk_width=args.chunk_width,
+        temp_chunk_length=args.temp_chunk_length,
+        fields=args.field,
+        exclude_fields=args.exclude_field,
+        pack_genotypes=args.pack_genotypes,
+        sparse_hom_ref=args.sparse_hom_ref,
+        alt_number=args.alt_number,
+        ploidy=args.ploidy,
+        engine=args.engine,
+        merge_samples=args.merge_samples,
+        compute_stats=args.compute_stats,
+    )
+    input = inputs[0] if len(inputs) == 1 else inputs
+
+    if args.batch_plan is not None:
+        if args.tempdir is None:
+            raise ValueError("--tempdir must be set to write a batch plan")
+        plan = plan_batch_conversion(
+            input, args.output, tempdir=args.tempdir, regions=regions, **options
+        )
+        plan.save(args.batch_plan)
+        print(f"Wrote a plan with {len(plan.parts)} parts to {args.batch_plan}")
+        return
+
+    if args.memory_limit is not None or args.dry_run:
+        # the tasks running at once share the memory
+        workers = args.workers or os.cpu_count() or 1
+        task_memory_limit = (
+            None if args.memory_limit is None else args.memory_limit // workers
+        )
+        conversion_plan = plan_vcf_to_zarr(
+            input, regions=regions, memory_limit=task_memory_limit, **options
+        )
+        if args.dry_run:
+            print(
+                f"{len(conversion_plan.parts)} parts, "
+                f"{conversion_plan.variants:,} variants, "
+                f"{conversion_plan.n_samples:,} samples\n"
+                f"Peak memory per task: {format_bytes(conversion_plan.peak_memory_bytes)}\n"
+                f"Temporary storage: {format_bytes(conversion_plan.temp_bytes)}\n"
+                f"Output size: {format_bytes(conversion_plan.output_bytes)}"
+            )
+        if len(conversion_plan.warnings) > 0:
+            raise ValueError("; ".join(conversion_plan.warnings))
+        if args.dry_run:
+            return
+
+    progress = None
+    if args.progress:
+        part_regions = _part_regions(inputs, regions, args.merge_samples)
+        progress = Progress(_total_variants(inputs, part_regions))
+    with ExitStack() as stack:
+        if args.cache_dir is not None:
+            # before the executor starts, so its worker processes use the cache too
+            stack.enter_context(block_cache(args.cache_dir, args.cache_size))
+        executor = stack.enter_context(_executor(args.executor, args.workers))
+        if progress is not None:
+            stack.enter_context(trace(progress))
+        vcf_to_zarr(
+            input,
+            args.output,
+            regions=regions,  # type: ignore[arg-type]
+            tempdir=args.tempdir,
+            executor=executor,
+            **options,
+        )
+    if progress is not None:
+        progress.close()
+
+
+def run_part_command(args: argparse.Namespace) -> None:
+    from sgkit_vcf.vcf_batch import BatchPlan, run_part
+
+    plan = BatchPlan.load(args.plan)
+    for index in args.index:
+        seconds = run_part(plan, index)
+        part = plan.parts[index]
+        region = part.region or "all"
+        print(f"Converted part {index} ({part.input} {region}) in {seconds:.1f}s")
+
+
+def merge_command(args: argparse.Namespace) -> None:
+    from sgkit_vcf.vcf_batch import BatchPlan, merge_parts
+
+    plan = BatchPlan.load(args.plan)
+    merge_parts(plan)
+    print(f"Merged {len(plan.parts)} parts into {plan.output}")
+
+
+def partition_command(args: argparse.Namespace) -> None:
+    regions = partition_into_regions(
+        args.input, num_parts=args.num_parts, target_part_size=args.target_part_size
+    )
+    # the whole file is a single part, which is printed as "."
+    for region in regions or ["."]:
+        print(region)
+
+
+def count_command(args: argparse.Namespace) -> None:
+    from sgkit_vcf.vcf_reader import count_variants
+
+    print(count_variants(args.input, region=args.region))
+
+
+def index_info_command(args: argparse.Namespace) -> None:
+    path = args.input
+    if path.endswith(TABIX_EXTENSION) or path.endswith(CSI_EXTENSION):
+        index_path = path
+        vcf_path = path[: path.rindex(".")]
+    else:
+        index_path = find_index_path(path)
+        vcf_path = path
+    index = read_index(index_path)
+    sequence_names = get_sequence_names(vcf_path, index)
+    print(f"{index_path}: {type(index).__name__} with {len(index.bins)} contigs")
+    print("contig\tbins\trecords")
+    for name, bins, count in zip(sequence_names, index.bins, index.record_counts):
+        # contigs without any records have no bins, and so no count
+        print(f"{name}\t{len(bins)}\t{max(count, 0)}")
+    if index.n_no_coor:
+        print(f"unplaced\t\t{index.n_no_coor}")
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sgkit-vcf", description="Convert VCF files to Zarr."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="Convert VCF or BCF files to a Zarr store."
+    )
+    convert_parser.add_argument("input", nargs="+", help="The input VCF or BCF files.")
+    convert_parser.add_argument("output", help="The output Zarr store.")
+    convert_parser.add_argument(
+        "--region",
+        action="append",
+        help="A region to convert, which may be repeated. By default, all variants.",
+    )
+    convert_parser.add_argument(
+        "--num-parts",
+        type=int,
+        help="Partition each input into this many regions, converted in parallel.",
+    )
+    convert_parser.add_argument("--chunk-length", type=int, default=10_000)
+    convert_parser.add_argument("--chunk-width", type=int, default=1_000)
+    convert_parser.add_argument("--temp-chunk-length", type=int)
+    convert_parser.add_argument(
+        "--tempdir", help="The directory for intermediate stores."
+    )
+    convert_parser.add_argument(
+        "--field",
+        action="append",
+        help="An INFO or FORMAT field to extract, such as FORMAT/DP, which may be repeated.",
+    )
+    convert_parser.add_argument(
+        "--exclude-field", action="append", help="A field not to extract."
+    )
+    convert_parser.add_argument("--pack-genotypes", action="store_true")
+    convert_parser.add_argument("--sparse-hom-ref", action="store_true")
+    convert_parser.add_argument(
+        "--alt-number",
+        type=_optional_int,
+        default=3,
+        help="The number of ALT alleles to store, or 'auto' for the largest number.",
+    )
+    convert_parser.add_argument(
+        "--ploidy",
+        type=_optional_int,
+        default=2,
+        help="The ploidy of the calls to store, or 'auto' for the largest ploidy.",
+    )
+    convert_parser.add_argument(
+        "--engine", default="cyvcf2", help="The decoder to use, cyvcf2 or native."
+    )
+    convert_parser.add_argument(
+        "--merge-samples",
+        action="store_true",
+        help="Merge the inputs along the samples dimension.",
+    )
+    convert_parser.add_argument("--compute-stats", action="store_true")
+    convert_parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="dask",
+        help="What to convert the parts on, by default the Dask threaded scheduler.",
+    )
+    convert_parser.add_argument(
+        "--workers", type=int, help="The number of parts to convert at once."
+    )
+    convert_parser.add_argument(
+        "--memory-limit",
+        type=parse_bytes,
+        help=(
+            "The memory available to the conversion, such as 16GB. The conversion "
+            "fails before starting if its tasks are estimated to need more."
+        ),
+    )
+    convert_parser.add_argument(
+        "--cache-dir",
+        help=(
+            "A local directory to cache remote inputs in, which is shared by the "
+            "workers and kept for later runs. Only the records decoded by the native "
+            "engine and the index files are cached; use --engine native with it."
+        ),
+    )
+    convert_parser.add_argument(
+        "--cache-size",
+        type=parse_bytes,
+        default=DEFAULT_MAX_SIZE,
+        help="The maximum size of the cache, by default 10GiB.",
+    )
+    convert_parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Show the variants decoded and the bytes written as they progress.",
+    )
+    convert_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the estimated size and memory use, without converting.",
+    )
+    convert_parser.add_argument(
+        "--batch-plan",
+        help=(
+            "Write a plan for converting the parts as separate jobs to this JSON "
+            "file, without converting. Requires --tempdir."
+        ),
+    )
+    convert_parser.set_defaults(func=convert_command)
+
+    run_part_parser = subparsers.add_parser(
+        "run-part", help="Convert parts of a batch conversion plan."
+    )
+    run_part_parser.add_argument("plan", help="The plan JSON file.")
+    run_part_parser.add_argument(
+        "index", type=int, nargs="+", help="The index of each part to convert."
+    )
+    run_part_parser.set_defaults(func=run_part_command)
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="Merge the converted parts of a batch conversion plan."
+    )
+    merge_parser.add_argument("plan", help="The plan JSON file.")
+    merge_parser.set_defaults(func=merge_command)
+
+    partition_parser = subparsers.add_parser(
+        "partition",
+        help="Print regions that partition a VCF or BCF file into roughly equal parts.",
+    )
+    partition_parser.add_argument("input", help="The VCF or BCF file.")
+    group = partition_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--num-parts", type=int)
+    group.add_argument("--target-part-size", type=parse_bytes)
+    partition_parser.set_defaults(func=partition_command)
+
+    count_parser = subparsers.add_parser(
+        "count", help="Print the number of variants in a VCF or BCF file."
+    )
+    count_parser.add_argument("input", help="The VCF or BCF file.")
+    count_parser.add_argument("--region", help="The region to count variants in.")
+    count_parser.set_defaults(func=count_command)
+
+    index_info_parser = subparsers.add_parser(
+        "index-info",
+        help="Print the contigs and record counts in a .tbi or .csi index.",
+    )
+    index_info_parser.add_argument(
+        "input", help="The index, or the VCF or BCF file it indexes."
+    )
+    index_info_parser.set_defaults(func=index_info_command)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except ValueError as e:
+        print(f"{parser.prog}: error: {e}", file=sys.stderr)
+        return 1
+    return 0
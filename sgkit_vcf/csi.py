@@ -3,20 +3,26 @@
 The implementation follows the [CSI index file format](http://samtools.github.io/hts-specs/CSIv1.pdf).
 
 """
+import struct
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Sequence
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
 
+import fsspec
 import numpy as np
 
-from sgkit.typing import PathType
+from sgkit_vcf.bgzf import BgzfWriter
+from sgkit_vcf.block_cache import open_gzip
+from sgkit_vcf.typing import PathType
 from sgkit_vcf.utils import (
+    build_binning_index,
     get_file_offset,
-    open_gzip,
     read_bytes_as_tuple,
     read_bytes_as_value,
 )
 
 CSI_EXTENSION = ".csi"
+CSI_MIN_SHIFT = 14
+CSI_DEPTH = 5
 
 
 @dataclass
@@ -148,3 +154,96 @@ def read_csi(
         assert len(f.read(1)) == 0
 
         return CSIIndex(min_shift, depth, aux, bins, record_counts, n_no_coor)
+
+
+def build_csi_index(
+    sequence_names: Sequence[str],
+    records: Iterable[Tuple[int, int, int, int, int]],
+    *,
+    is_vcf: bool = True,
+    min_shift: int = CSI_MIN_SHIFT,
+    depth: int = CSI_DEPTH,
+) -> CSIIndex:
+    """Build a `CSIIndex` object for the records in a BGZF-compressed VCF or BCF file.
+
+    Parameters
+    ----------
+    sequence_names : Sequence[str]
+        The names of the sequences (contigs) in the VCF or BCF file.
+    records : Iterable[Tuple[int, int, int, int, int]]
+        Tuples of (contig index, 0-based start, end (exclusive), virtual offset of record start,
+        virtual offset of record end) for each record, in file order.
+    is_vcf : bool, optional
+        True if the index is for a VCF file, in which case the sequence names are stored in
+        the auxiliary data (as for tabix), or False for a BCF file, by default True.
+    min_shift : int, optional
+        The number of bits for the minimal interval, by default 14.
+    depth : int, optional
+        The depth of the binning index, by default 5.
+
+    Returns
+    -------
+    CSIIndex
+        An object representing a CSI index.
+    """
+    aux: Any = b""
+    if is_vcf:
+        names = b"".join(name.encode("utf-8") + b"\x00" for name in sequence_names)
+        # format (VCF), col_seq, col_beg, col_end, meta, skip, l_nm
+        aux = struct.pack("<7i", 2, 1, 2, 0, ord("#"), 0, len(names)) + names
+    csi = CSIIndex(min_shift, depth, aux, [], [], 0)
+    pseudo_bin = bin_limit(min_shift, depth) + 1
+    binning_indexes = build_binning_index(
+        len(sequence_names), records, min_shift, depth
+    )
+    bins = []
+    record_counts = []
+    for binning_index in binning_indexes:
+        linear_index = binning_index.linear_index
+        seq_bins = []
+        for bin, chunks in sorted(binning_index.bins.items()):
+            # the offset of the first record overlapping the bin
+            window = (get_first_locus_in_bin(csi, bin) - 1) >> min_shift
+            loffset = linear_index[min(window, len(linear_index) - 1)]
+            seq_bins.append(Bin(bin, loffset, [Chunk(*chunk) for chunk in chunks]))
+        if binning_index.n_records > 0:
+            pseudo_chunks = [
+                Chunk(binning_index.ref_beg, binning_index.ref_end),
+                Chunk(binning_index.n_records, 0),
+            ]
+            seq_bins.append(Bin(pseudo_bin, 0, pseudo_chunks))
+        bins.append(seq_bins)
+        record_counts.append(
+            binning_index.n_records if binning_index.n_records > 0 else -1
+        )
+    return CSIIndex(min_shift, depth, aux, bins, record_counts, 0)
+
+
+def write_csi(
+    file: PathType, index: CSIIndex, storage_options: Optional[Dict[str, str]] = None,
+) -> None:
+    """Write a `CSIIndex` object to a CSI file.
+
+    Parameters
+    ----------
+    file : PathType
+        The path to the CSI file.
+    index : CSIIndex
+        The CSI index to write.
+    storage_options : Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+    """
+    storage_options = storage_options or {}
+    aux = index.aux if isinstance(index.aux, bytes) else index.aux.encode("utf-8")
+    with fsspec.open(str(file), "wb", **storage_options) as f, BgzfWriter(f) as w:
+        w.write(b"CSI\x01")
+        w.write(struct.pack("<3i", index.min_shift, index.depth, len(aux)))
+        w.write(aux)
+        w.write(struct.pack("<i", len(index.bins)))
+        for seq_bins in index.bins:
+            w.write(struct.pack("<i", len(seq_bins)))
+            for bin in seq_bins:
+                w.write(struct.pack("<IQi", bin.bin, bin.loffset, len(bin.chunks)))
+                for chunk in bin.chunks:
+                    w.write(struct.pack("<QQ", chunk.cnk_beg, chunk.cnk_end))
+        w.write(struct.pack("<Q", index.n_no_coor))
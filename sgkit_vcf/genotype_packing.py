@@ -0,0 +1,212 @@
+"""Functions for packing genotype calls into a few bits each, and unpacking them again.
+
+Each allele index in a call is stored as a code in the fewest bits that can hold every
+allele index (for the number of alleles in the dataset), as well as the missing (-1) and
+fill (-2) values. The code is the allele index plus two, so biallelic calls need two bits
+per allele. The allele codes for a call are followed by a single bit for its phase, and
+the calls for a variant are concatenated (in sample order) and packed into bytes.
+
+For diploid biallelic data this needs 5 bits per call, rather than the 24 bits used by
+the ``call_genotype``, ``call_genotype_mask`` and ``call_genotype_phased`` variables.
+"""
+from typing import Any, Dict, Tuple
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+PACKED_VARIABLE = "call_genotype_packed"
+DIM_PACKED = "packed_genotype_bytes"
+
+
+def bits_per_allele(n_allele: int) -> int:
+    """The number of bits used to store each allele index, for a given number of alleles."""
+    # codes are needed for the fill and missing values, as well as the alleles
+    return int(np.ceil(np.log2(n_allele + 2)))
+
+
+def bits_per_call(n_allele: int, ploidy: int) -> int:
+    """The number of bits used to store each call, including its phase."""
+    return ploidy * bits_per_allele(n_allele) + 1
+
+
+def packed_chunk_size(chunk_width: int, n_allele: int, ploidy: int) -> int:
+    """The number of bytes that hold a chunk of `chunk_width` samples, which must be a multiple of 8."""
+    if chunk_width % 8 != 0:
+        raise ValueError(
+            f"Chunk width must be a multiple of 8 to pack genotypes: {chunk_width}"
+        )
+    return chunk_width * bits_per_call(n_allele, ploidy) // 8
+
+
+def pack_genotypes(
+    call_genotype: np.ndarray, call_genotype_phased: np.ndarray, n_allele: int
+) -> np.ndarray:
+    """Pack genotype calls and their phases into bytes.
+
+    Parameters
+    ----------
+    call_genotype : np.ndarray
+        Allele indexes of shape (variants, samples, ploidy), with -1 for missing values
+        and -2 for fill values.
+    call_genotype_phased : np.ndarray
+        Phases of shape (variants, samples).
+    n_allele : int
+        The number of alleles, which determines the number of bits for each allele index.
+
+    Returns
+    -------
+    np.ndarray
+        A uint8 array of shape (variants, bytes), where the number of bytes is enough
+        to hold the calls for all the samples.
+
+    Raises
+    ------
+    ValueError
+        If any allele index is too large to be stored in the bits available.
+    """
+    n_variants, n_samples, ploidy = call_genotype.shape
+    b = bits_per_allele(n_allele)
+    codes = call_genotype.astype(np.int16) + 2
+    if codes.size > 0 and (codes.min() < 0 or codes.max() >= 2 ** b):
+        raise ValueError(
+            f"Genotype calls must have allele indexes between -2 and {2 ** b - 3} "
+            f"to be packed for {n_allele} alleles"
+        )
+    bits = np.unpackbits(
+        codes.astype(np.uint8)[..., np.newaxis], axis=-1, count=b, bitorder="little"
+    ).reshape(n_variants, n_samples, ploidy * b)
+    phase_bits = call_genotype_phased.astype(np.uint8)[..., np.newaxis]
+    bits = np.concatenate([bits, phase_bits], axis=-1)
+    return np.packbits(bits.reshape(n_variants, -1), axis=-1, bitorder="little")
+
+
+def unpack_genotypes(
+    packed: np.ndarray, n_samples: int, ploidy: int, n_allele: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Unpack genotype calls and their phases from bytes packed by `pack_genotypes`.
+
+    Parameters
+    ----------
+    packed : np.ndarray
+        A uint8 array of shape (variants, bytes).
+    n_samples : int
+        The number of samples.
+    ploidy : int
+        The ploidy.
+    n_allele : int
+        The number of alleles.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The int8 allele indexes, of shape (variants, samples, ploidy), and the boolean
+        phases, of shape (variants, samples).
+    """
+    n_variants = packed.shape[0]
+    b = bits_per_allele(n_allele)
+    c = ploidy * b + 1
+    bits = np.unpackbits(
+        packed, axis=-1, count=n_samples * c, bitorder="little"
+    ).reshape(n_variants, n_samples, c)
+    allele_bits = bits[..., : ploidy * b].reshape(n_variants, n_samples, ploidy, b)
+    codes = np.packbits(allele_bits, axis=-1, bitorder="little")[..., 0]
+    call_genotype = codes.astype(np.int8) - 2
+    call_genotype_phased = bits[..., -1].astype(bool)
+    return call_genotype, call_genotype_phased
+
+
+def pack_dataset(ds: xr.Dataset) -> xr.Dataset:
+    """Replace the genotype call variables in an in-memory dataset with a packed variable."""
+    n_allele = ds.sizes["alleles"]
+    ploidy = ds.sizes["ploidy"]
+    packed = pack_genotypes(
+        ds["call_genotype"].values, ds["call_genotype_phased"].values, n_allele
+    )
+    ds = ds.drop_vars(["call_genotype", "call_genotype_mask", "call_genotype_phased"])
+    ds[PACKED_VARIABLE] = (["variants", DIM_PACKED], packed)
+    ds[PACKED_VARIABLE].attrs.update(_packed_attrs(n_allele, ploidy))
+    return ds
+
+
+def _packed_attrs(n_allele: int, ploidy: int) -> Dict[str, Any]:
+    return dict(
+        comment="Genotype calls and phases, packed by sgkit_vcf.genotype_packing.",
+        ploidy=ploidy,
+        bits_per_allele=bits_per_allele(n_allele),
+    )
+
+
+@xr.register_dataset_accessor("packed_genotypes")
+class PackedGenotypesAccessor:
+    """Unpacks the ``call_genotype_packed`` variable of a dataset.
+
+    For example, ``ds.packed_genotypes.unpack()`` returns a dataset with the usual
+    ``call_genotype``, ``call_genotype_mask`` and ``call_genotype_phased`` variables.
+    If the packed variable is a Dask array (as it is when opened from Zarr), then
+    so are the unpacked variables, and each chunk is only unpacked when needed.
+    """
+
+    def __init__(self, ds: xr.Dataset):
+        self._ds = ds
+
+    def unpack(self) -> xr.Dataset:
+        """Return the dataset with the packed variable replaced by the unpacked ones."""
+        ds = self._ds
+        if PACKED_VARIABLE not in ds:
+            raise ValueError(f"Dataset has no {PACKED_VARIABLE} variable")
+        packed = ds[PACKED_VARIABLE]
+        ploidy = packed.attrs["ploidy"]
+        b = packed.attrs["bits_per_allele"]
+        # the largest number of alleles that uses b bits per allele
+        n_allele = 2 ** b - 2
+        n_samples = ds.sizes["samples"]
+
+        data = packed.data
+        call_genotype: Any
+        call_genotype_phased: Any
+        if isinstance(data, da.Array):
+            call_genotype, call_genotype_phased = _unpack_dask(
+                data, n_samples, ploidy, n_allele
+            )
+        else:
+            call_genotype, call_genotype_phased = unpack_genotypes(
+                data, n_samples, ploidy, n_allele
+            )
+
+        ds = ds.drop_vars(PACKED_VARIABLE)
+        ds["call_genotype"] = (["variants", "samples", "ploidy"], call_genotype)
+        ds["call_genotype_mask"] = (
+            ["variants", "samples", "ploidy"],
+            call_genotype < 0,
+        )
+        ds["call_genotype_phased"] = (["variants", "samples"], call_genotype_phased)
+        return ds
+
+
+def _unpack_dask(
+    packed: da.Array, n_samples: int, ploidy: int, n_allele: int
+) -> Tuple[da.Array, da.Array]:
+    c = bits_per_call(n_allele, ploidy)
+    byte_chunks = packed.chunks[1]
+    if any(n * 8 % c != 0 for n in byte_chunks[:-1]):
+        raise ValueError(
+            f"Chunks of {DIM_PACKED} must hold whole calls ({c} bits each): {byte_chunks}"
+        )
+    sample_chunks = tuple(n * 8 // c for n in byte_chunks[:-1])
+    sample_chunks += (n_samples - sum(sample_chunks),)
+
+    def unpack_block(block: np.ndarray, block_info: Any = None) -> np.ndarray:
+        location = block_info[None]["chunk-location"][1]
+        gt, phased = unpack_genotypes(block, sample_chunks[location], ploidy, n_allele)
+        # return the phase alongside the alleles, so each block is only unpacked once
+        return np.concatenate([gt, phased[..., np.newaxis].astype(np.int8)], axis=-1)
+
+    unpacked = da.map_blocks(
+        unpack_block,
+        packed,
+        dtype=np.int8,
+        chunks=(packed.chunks[0], sample_chunks, (ploidy + 1,)),
+        new_axis=2,
+    )
+    return unpacked[..., :ploidy], unpacked[..., ploidy].astype(bool)
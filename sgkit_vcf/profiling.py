@@ -0,0 +1,262 @@
+"""Functions for recording timed spans of work so that conversion runs can be profiled.
+
+Spans are exported in the [Trace Event Format](https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU),
+which can be loaded into `chrome://tracing` or [Perfetto](https://ui.perfetto.dev).
+
+"""
+import cProfile
+import itertools
+import json
+import marshal
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional
+
+import fsspec
+
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.utils import build_url
+
+
+@dataclass
+class Span:
+    name: str
+    cat: str
+    ts: int  # start time in microseconds since the epoch
+    dur: int  # duration in microseconds
+    pid: int
+    tid: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """Collects spans recorded by any thread in the current process."""
+
+    def __init__(
+        self,
+        cprofile_dir: Optional[PathType] = None,
+        storage_options: Optional[Dict[str, str]] = None,
+    ):
+        self.spans: List[Span] = []
+        self.cprofile_dir = None if cprofile_dir is None else str(cprofile_dir)
+        self.storage_options = storage_options or {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._counter)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the recorded spans as a Trace Event Format object."""
+        events: List[Dict[str, Any]] = []
+        threads = sorted({(span.pid, span.tid) for span in self.spans})
+        for pid, tid in threads:
+            events.append(
+                dict(
+                    name="thread_name",
+                    ph="M",
+                    pid=pid,
+                    tid=tid,
+                    args=dict(name=f"worker {pid}/{tid}"),
+                )
+            )
+        for span in sorted(self.spans, key=lambda s: s.ts):
+            events.append(
+                dict(
+                    name=span.name,
+                    cat=span.cat,
+                    ph="X",
+                    ts=span.ts,
+                    dur=span.dur,
+                    pid=span.pid,
+                    tid=span.tid,
+                    args=span.args,
+                )
+            )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def write(
+        self, path: PathType, storage_options: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Write the recorded spans to a Chrome trace JSON file."""
+        storage_options = storage_options or {}
+        with fsspec.open(str(path), "w", **storage_options) as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the active tracer, or None if profiling is not enabled."""
+    return _tracer
+
+
+@contextmanager
+def span(name: str, cat: str = "task", **args: Any) -> Iterator[Dict[str, Any]]:
+    """A context manager that records the enclosed block as a span, if profiling is enabled.
+
+    The block is given the span's arguments, which it can add to (for example, with the
+    number of variants it processed).
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield args
+        return
+    start = time.time_ns()
+    try:
+        yield args
+    finally:
+        end = time.time_ns()
+        tracer.record(
+            Span(
+                name=name,
+                cat=cat,
+                ts=start // 1000,
+                dur=(end - start) // 1000,
+                pid=os.getpid(),
+                tid=threading.get_ident(),
+                args=args,
+            )
+        )
+
+
+@contextmanager
+def task_span(name: str, cat: str = "task", **args: Any) -> Iterator[Dict[str, Any]]:
+    """Like `span`, but also dumps a cProfile file for the block if requested by the tracer."""
+    tracer = _tracer
+    if tracer is None or tracer.cprofile_dir is None:
+        with span(name, cat, **args) as span_args:
+            yield span_args
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # pragma: no cover
+        # another profiler is already active on this thread
+        profiler = None  # type: ignore[assignment]
+    try:
+        with span(name, cat, **args) as span_args:
+            yield span_args
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            filename = f"{name}-{os.getpid()}-{tracer.next_id()}.prof"
+            url = build_url(tracer.cprofile_dir, filename.replace(" ", "_"))
+            with fsspec.open(url, "wb", **tracer.storage_options) as f:
+                profiler.create_stats()
+                f.write(_marshal_stats(profiler))
+
+
+def _marshal_stats(profiler: cProfile.Profile) -> bytes:
+    # This is what `Profile.dump_stats` writes, but to bytes so any fsspec URL can be used
+    return marshal.dumps(profiler.stats)  # type: ignore[attr-defined]
+
+
+class TracedStore(MutableMapping[str, bytes]):
+    """A Zarr store wrapper that records a span for every chunk read or write."""
+
+    def __init__(self, store: MutableMapping[str, bytes], cat: str, write_name: str):
+        self.store = store
+        self.cat = cat
+        self.write_name = write_name
+
+    def __getitem__(self, key: str) -> bytes:
+        with span("store read", self.cat, key=key):
+            return self.store[key]
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        with span(self.write_name, self.cat, key=key, nbytes=len(value)):
+            self.store[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.store[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.store
+
+
+def traced_store(store: Any, cat: str, write_name: str = "chunk write") -> Any:
+    """Wrap a Zarr store (or path) so that its chunk reads and writes are traced.
+
+    If profiling is not enabled the store is returned unchanged.
+    """
+    if _tracer is None:
+        return store
+    if not isinstance(store, MutableMapping):
+        store = fsspec.get_mapper(str(store))
+    return TracedStore(store, cat, write_name)
+
+
+@contextmanager
+def profile(
+    trace_path: PathType,
+    *,
+    cprofile_dir: Optional[PathType] = None,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> Iterator[Tracer]:
+    """Profile the conversion functions called within the context manager block.
+
+    Timestamped spans are recorded for each task (planning, index reads, region reads,
+    chunk writes, and chunk writes during the final merge), along with the process and
+    thread that ran them. On exit, the spans are written to `trace_path` as a Chrome
+    trace JSON file, which can be inspected with `chrome://tracing` or Perfetto.
+
+    Spans are only recorded for work done in the current process, so this is suited to
+    the threaded (default) Dask scheduler.
+
+    Parameters
+    ----------
+    trace_path : PathType
+        The path of the Chrome trace JSON file to write.
+    cprofile_dir : Optional[PathType], optional
+        If specified, a directory (which must exist) in which a cProfile stats file is
+        written for every region conversion task, by default None.
+    storage_options : Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+
+    Yields
+    -------
+    Tracer
+        The tracer collecting the spans.
+    """
+    tracer = Tracer(cprofile_dir=cprofile_dir, storage_options=storage_options)
+    # only write the spans once tracing has started, so that a failure to start doesn't
+    # overwrite an existing trace with an empty one
+    with trace(tracer):
+        try:
+            yield tracer
+        finally:
+            tracer.write(trace_path, storage_options=storage_options)
+
+
+@contextmanager
+def trace(tracer: Tracer) -> Iterator[Tracer]:
+    """Record spans with a tracer for the conversion functions called within the context manager block.
+
+    Unlike `profile`, the spans are not written anywhere, so this is for tracers that
+    act on spans as they are recorded (by overriding `Tracer.record`), such as progress
+    displays.
+    """
+    global _tracer
+    if _tracer is not None:
+        raise ValueError("Profiling is already enabled")
+    _tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _tracer = None
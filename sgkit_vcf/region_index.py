@@ -0,0 +1,267 @@
+"""A compact index of variant positions, for selecting the variants in a genomic region.
+
+Finding the variants in a region of a dataset would otherwise mean loading all of its
+``variant_contig`` and ``variant_position`` values. Instead, `vcf_to_zarr` stores a
+small ``region_index`` variable with a row for each run of variants on the same contig
+within a chunk, holding the contig, the range of variant indexes, and the smallest and
+largest positions in the run. `select_region` uses it to find the runs that overlap a
+region, and only loads the positions of the (at most two) runs that are partly inside
+it, so a query touches a few kilobytes of metadata rather than the coordinate arrays.
+
+The index is built by a `RegionIndexBuilder` from the coordinates of each chunk as it is
+written, so the output store doesn't have to be read again to index it.
+
+For datasets with sparse hom-ref calls (see `sparse_genotypes`), each row also holds
+the range of dense variant indexes for the run, so the dense calls can be selected too.
+"""
+
+from typing import List, MutableMapping, Optional, Sequence, Union
+
+import dask
+import dask.array as da
+import fsspec
+import numpy as np
+import xarray as xr
+
+from sgkit_vcf.sparse_genotypes import DIM_DENSE_VARIANT, HOM_REF_VARIABLE
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.vcf_partition import parse_region
+
+REGION_INDEX_VARIABLE = "region_index"
+DIM_REGION_INDEX = "region_index_runs"
+DIM_REGION_INDEX_COLUMN = "region_index_columns"
+
+# The columns of the region index, where variant (and dense variant) index ranges are
+# half-open, and positions are 1-based and inclusive
+REGION_INDEX_COLUMNS = (
+    "contig",
+    "start",
+    "stop",
+    "min_position",
+    "max_position",
+    "dense_start",
+    "dense_stop",
+)
+CONTIG, START, STOP, MIN_POSITION, MAX_POSITION, DENSE_START, DENSE_STOP = range(
+    len(REGION_INDEX_COLUMNS)
+)
+
+
+def build_region_index(ds: xr.Dataset) -> np.ndarray:
+    """Build the region index for a dataset, with a row for each run of variants on the same contig within a chunk.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        A dataset with ``variant_contig`` and ``variant_position`` variables. If these are
+        Dask arrays then the runs are found for each chunk in parallel, otherwise the
+        whole dataset is treated as one chunk.
+
+    Returns
+    -------
+    np.ndarray
+        An integer array of shape (runs, 7), with the columns in `REGION_INDEX_COLUMNS`.
+    """
+    builder = RegionIndexBuilder()
+    builder.add_dataset(ds)
+    return builder.index()
+
+
+class RegionIndexBuilder:
+    """Builds a region index from the chunks of variants written to a store, in order."""
+
+    def __init__(self) -> None:
+        self.chunk_indexes: List[np.ndarray] = []
+        self.n_variants = 0
+
+    def add_dataset(self, ds: xr.Dataset) -> None:
+        """Add the runs in each chunk of a dataset that is being written after the variants added so far.
+
+        Only the ``variant_contig``, ``variant_position`` and (for sparse datasets)
+        ``variant_hom_ref`` variables are loaded, so this is cheap even for a dataset
+        whose calls are Dask arrays that have not been computed yet.
+        """
+        if not isinstance(ds["variant_contig"].data, da.Array):
+            # a single chunk in memory, so there's no need for Dask
+            hom_ref = ds[HOM_REF_VARIABLE].values if HOM_REF_VARIABLE in ds else None
+            self.chunk_indexes.append(
+                _chunk_region_index(
+                    self.n_variants,
+                    ds["variant_contig"].values,
+                    ds["variant_position"].values,
+                    hom_ref,
+                )
+            )
+            self.n_variants += ds.sizes["variants"]
+            return
+        contig = ds["variant_contig"].data
+        arrays = [
+            contig,
+            da.asarray(ds["variant_position"].data).rechunk(contig.chunks),
+        ]
+        if HOM_REF_VARIABLE in ds:
+            arrays.append(da.asarray(ds[HOM_REF_VARIABLE].data).rechunk(contig.chunks))
+        offsets = self.n_variants + np.cumsum((0,) + contig.chunks[0][:-1])
+        blocks = zip(*(array.to_delayed().ravel() for array in arrays))
+        self.chunk_indexes.extend(
+            dask.compute(
+                *[
+                    dask.delayed(_chunk_region_index)(offset, *block)
+                    for offset, block in zip(offsets, blocks)
+                ]
+            )
+        )
+        self.n_variants += len(contig)
+
+    def index(self) -> np.ndarray:
+        """Return the region index for the variants added so far."""
+        index = np.concatenate(
+            [np.empty((0, len(REGION_INDEX_COLUMNS)), dtype=np.int64)]
+            + self.chunk_indexes
+        )
+        # each run holds the number of dense variants in it, which are numbered across runs
+        n_dense = index[:, DENSE_STOP].copy()
+        index[:, DENSE_STOP] = np.cumsum(n_dense)
+        index[:, DENSE_START] = index[:, DENSE_STOP] - n_dense
+        return index
+
+
+def _chunk_region_index(
+    offset: int,
+    contig: np.ndarray,
+    position: np.ndarray,
+    hom_ref: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    n = len(contig)
+    index = np.empty((0, len(REGION_INDEX_COLUMNS)), dtype=np.int64)
+    if n == 0:
+        return index
+    boundaries = np.flatnonzero(np.diff(contig) != 0) + 1
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [n]])
+    index = np.empty((len(starts), len(REGION_INDEX_COLUMNS)), dtype=np.int64)
+    index[:, CONTIG] = contig[starts]
+    index[:, START] = starts + offset
+    index[:, STOP] = stops + offset
+    index[:, MIN_POSITION] = np.minimum.reduceat(position, starts)
+    index[:, MAX_POSITION] = np.maximum.reduceat(position, starts)
+    # the number of dense variants, which are turned into ranges by the caller
+    if hom_ref is None:
+        index[:, DENSE_STOP] = stops - starts
+    else:
+        index[:, DENSE_STOP] = np.add.reduceat(~hom_ref, starts)
+    return index
+
+
+def write_region_index(
+    output: Union[PathType, MutableMapping[str, bytes]],
+    index: Optional[np.ndarray] = None,
+) -> None:
+    """Add a region index variable to a Zarr store, unless the store was not written because there were no variants.
+
+    The `index` is normally built while the store is written (see `RegionIndexBuilder`).
+    If it is None, it is built from the store, which means loading all the positions.
+    """
+    store = (
+        output if isinstance(output, MutableMapping) else fsspec.get_mapper(str(output))
+    )
+    if ".zgroup" not in store:
+        return
+    ds = xr.open_zarr(store)  # type: ignore[no-untyped-call]
+    if index is None:
+        index = build_region_index(ds)
+    index_ds = xr.Dataset(
+        {
+            REGION_INDEX_VARIABLE: (
+                [DIM_REGION_INDEX, DIM_REGION_INDEX_COLUMN],
+                index,
+                {
+                    "columns": list(REGION_INDEX_COLUMNS),
+                    "comment": "Runs of variants on the same contig within each chunk, for selecting regions.",
+                },
+            )
+        },
+        # appending to the store replaces the dataset attributes
+        attrs=ds.attrs,
+    )
+    index_ds.to_zarr(store, mode="a")
+
+
+def select_region(ds: xr.Dataset, region: str) -> xr.Dataset:
+    """Select the variants in a genomic region of a dataset.
+
+    As for VCF files, the variants in the region are those on its contig whose position
+    is between its start and end (inclusive). If the dataset has a region index (as
+    written by `vcf_to_zarr`), only the positions of the variants in the chunks at
+    either end of the region are loaded, otherwise the index is built first, which
+    loads all the positions.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        A dataset, such as one opened from the output of `vcf_to_zarr`.
+    region : str
+        The region, in the form ``contig``, ``contig:start-`` or ``contig:start-end``.
+
+    Returns
+    -------
+    xr.Dataset
+        The dataset for the variants in the region (without the region index), which is
+        lazily indexed if the dataset is backed by Dask arrays.
+    """
+    if REGION_INDEX_VARIABLE in ds:
+        index = ds[REGION_INDEX_VARIABLE].values
+        ds = ds.drop_vars(REGION_INDEX_VARIABLE)
+    else:
+        index = build_region_index(ds)
+
+    contig, start, end = parse_region(region)
+    if end is None:
+        end = np.iinfo(np.int64).max
+    contigs = list(ds.attrs["contigs"])
+    if contig in contigs:
+        runs = index[
+            (index[:, CONTIG] == contigs.index(contig))
+            & (index[:, MAX_POSITION] >= start)
+            & (index[:, MIN_POSITION] <= end)
+        ]
+    else:
+        runs = index[:0]
+
+    variant_pieces: List[Sequence[int]] = []
+    dense_pieces: List[Sequence[int]] = []
+    for run in runs:
+        if run[MIN_POSITION] >= start and run[MAX_POSITION] <= end:
+            # the whole run is in the region, so its positions aren't needed
+            variant_pieces.append(range(run[START], run[STOP]))
+            dense_pieces.append(range(run[DENSE_START], run[DENSE_STOP]))
+            continue
+        position = ds["variant_position"][run[START] : run[STOP]].values
+        in_region = (position >= start) & (position <= end)
+        variant_pieces.append(run[START] + np.flatnonzero(in_region))
+        if HOM_REF_VARIABLE in ds:
+            dense = ~ds[HOM_REF_VARIABLE][run[START] : run[STOP]].values
+            dense_pieces.append(run[DENSE_START] + np.flatnonzero(in_region[dense]))
+
+    indexers = {"variants": _indexer(variant_pieces)}
+    if DIM_DENSE_VARIANT in ds.dims:
+        indexers[DIM_DENSE_VARIANT] = _indexer(dense_pieces)
+    return ds.isel(indexers)
+
+
+def _indexer(pieces: Sequence[Sequence[int]]) -> Union[slice, np.ndarray]:
+    """Combine increasing pieces of indexes into a slice if they are contiguous, or an array if not."""
+    start: Optional[int] = None
+    stop: Optional[int] = None
+    for piece in pieces:
+        if len(piece) == 0:
+            continue
+        contiguous = piece[-1] - piece[0] == len(piece) - 1
+        if not contiguous or (stop is not None and piece[0] != stop):
+            return np.concatenate([np.asarray(p, dtype=np.int64) for p in pieces])
+        if start is None:
+            start = piece[0]
+        stop = piece[-1] + 1
+    if start is None:
+        return slice(0, 0)
+    return slice(int(start), int(stop))  # type: ignore[arg-type]
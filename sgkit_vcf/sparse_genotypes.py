@@ -0,0 +1,147 @@
+"""Functions for storing hom-ref genotype calls sparsely, and densifying them again.
+
+In gVCF files most records are reference blocks (with an ``END`` INFO field) or sites
+where every call is hom-ref. Rather than storing a row of genotype calls for each of
+these, a ``variant_hom_ref`` variable flags the variants whose calls are all unphased
+hom-ref, and only the calls for the other variants are stored, along a separate
+``dense_variants`` dimension. The end position of every variant (including the extent
+of reference blocks) is stored in ``variant_end``, so the intervals covered by
+reference blocks are kept too.
+
+The dense call for the ``i``-th variant is the ``j``-th dense call, where ``j`` is the
+number of variants before ``i`` that are not hom-ref, so no index needs to be stored.
+"""
+from typing import Any, Tuple
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+DIM_DENSE_VARIANT = "dense_variants"
+HOM_REF_VARIABLE = "variant_hom_ref"
+DENSE_GENOTYPE_VARIABLE = "dense_call_genotype"
+DENSE_PHASED_VARIABLE = "dense_call_genotype_phased"
+
+
+def hom_ref_variants(
+    call_genotype: np.ndarray, call_genotype_phased: np.ndarray
+) -> np.ndarray:
+    """Return a boolean array that is True for the variants whose calls are all unphased hom-ref."""
+    n_variants = call_genotype.shape[0]
+    return np.all(call_genotype.reshape(n_variants, -1) == 0, axis=1) & ~np.any(
+        call_genotype_phased, axis=1
+    )
+
+
+def sparsify_dataset(ds: xr.Dataset) -> xr.Dataset:
+    """Replace the genotype call variables in an in-memory dataset with sparse ones."""
+    call_genotype = ds["call_genotype"].values
+    call_genotype_phased = ds["call_genotype_phased"].values
+    hom_ref = hom_ref_variants(call_genotype, call_genotype_phased)
+    ds = ds.drop_vars(["call_genotype", "call_genotype_mask", "call_genotype_phased"])
+    ds[HOM_REF_VARIABLE] = (["variants"], hom_ref)
+    ds[HOM_REF_VARIABLE].attrs[
+        "comment"
+    ] = "Whether all the calls for the variant are unphased hom-ref."
+    ds[DENSE_GENOTYPE_VARIABLE] = (
+        [DIM_DENSE_VARIANT, "samples", "ploidy"],
+        call_genotype[~hom_ref],
+    )
+    ds[DENSE_PHASED_VARIABLE] = (
+        [DIM_DENSE_VARIANT, "samples"],
+        call_genotype_phased[~hom_ref],
+    )
+    return ds
+
+
+def densify_genotypes(
+    variant_hom_ref: np.ndarray,
+    dense_call_genotype: Any,
+    dense_call_genotype_phased: Any,
+) -> Tuple[Any, Any]:
+    """Expand sparse genotype calls to a call for every variant.
+
+    Parameters
+    ----------
+    variant_hom_ref : np.ndarray
+        A boolean array that is True for the variants whose calls are all unphased hom-ref.
+    dense_call_genotype : Any
+        The allele indexes of the other variants, of shape (dense variants, samples, ploidy),
+        as a NumPy or Dask array.
+    dense_call_genotype_phased : Any
+        The phases of the other variants, of shape (dense variants, samples), as a NumPy or
+        Dask array.
+
+    Returns
+    -------
+    Tuple[Any, Any]
+        The allele indexes, of shape (variants, samples, ploidy), and the phases, of shape
+        (variants, samples). These are Dask arrays if the dense calls are, in which case
+        nothing is computed until they are.
+    """
+    n_dense = len(dense_call_genotype)
+    if np.count_nonzero(~variant_hom_ref) != n_dense:
+        raise ValueError(
+            f"Number of dense calls ({n_dense}) does not match the number of variants "
+            "that are not hom-ref"
+        )
+    # each variant takes the last dense call at or before it, which is padded with a
+    # leading row of zeros for hom-ref variants before the first dense call, so the
+    # index is sorted (which Dask can take efficiently)
+    index = np.cumsum(~variant_hom_ref)
+    return (
+        _take_padded(dense_call_genotype, index, variant_hom_ref[:, None, None]),
+        _take_padded(dense_call_genotype_phased, index, variant_hom_ref[:, None]),
+    )
+
+
+def _take_padded(dense: Any, index: np.ndarray, hom_ref: np.ndarray) -> Any:
+    padding = np.zeros((1,) + dense.shape[1:], dtype=dense.dtype)
+    if isinstance(dense, da.Array):
+        padded = da.concatenate([da.from_array(padding, chunks=-1), dense])
+        return da.where(hom_ref, padding, padded[index])
+    else:
+        padded = np.concatenate([padding, dense])
+        return np.where(hom_ref, padding, padded[index])
+
+
+@xr.register_dataset_accessor("sparse_genotypes")
+class SparseGenotypesAccessor:
+    """Densifies the sparse genotype call variables of a dataset.
+
+    For example, ``ds.sparse_genotypes.densify()`` returns a dataset with the usual
+    ``call_genotype``, ``call_genotype_mask`` and ``call_genotype_phased`` variables.
+    If the dense calls are Dask arrays (as they are when opened from Zarr), then so are
+    the densified variables, chunked like the other variables along the variants
+    dimension. Only ``variant_hom_ref`` (one byte per variant) is loaded up front.
+    """
+
+    def __init__(self, ds: xr.Dataset):
+        self._ds = ds
+
+    def densify(self) -> xr.Dataset:
+        """Return the dataset with the sparse variables replaced by the dense ones."""
+        ds = self._ds
+        if HOM_REF_VARIABLE not in ds:
+            raise ValueError(f"Dataset has no {HOM_REF_VARIABLE} variable")
+        hom_ref = ds[HOM_REF_VARIABLE]
+        call_genotype, call_genotype_phased = densify_genotypes(
+            hom_ref.values,
+            ds[DENSE_GENOTYPE_VARIABLE].data,
+            ds[DENSE_PHASED_VARIABLE].data,
+        )
+        if isinstance(call_genotype, da.Array) and hom_ref.chunks is not None:
+            variant_chunks = hom_ref.chunks[0]
+            call_genotype = call_genotype.rechunk({0: variant_chunks})
+            call_genotype_phased = call_genotype_phased.rechunk({0: variant_chunks})
+
+        ds = ds.drop_vars(
+            [HOM_REF_VARIABLE, DENSE_GENOTYPE_VARIABLE, DENSE_PHASED_VARIABLE]
+        )
+        ds["call_genotype"] = (["variants", "samples", "ploidy"], call_genotype)
+        ds["call_genotype_mask"] = (
+            ["variants", "samples", "ploidy"],
+            call_genotype < 0,
+        )
+        ds["call_genotype_phased"] = (["variants", "samples"], call_genotype_phased)
+        return ds
@@ -3,21 +3,29 @@
 The implementation follows the [Tabix index file format](https://samtools.github.io/hts-specs/tabix.pdf).
 
 """
+import struct
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Sequence
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
 
+import fsspec
 import numpy as np
 
-from sgkit.typing import PathType
+from sgkit_vcf.bgzf import BgzfWriter
+from sgkit_vcf.block_cache import open_gzip
+from sgkit_vcf.typing import PathType
 from sgkit_vcf.utils import (
+    build_binning_index,
     get_file_offset,
-    open_gzip,
     read_bytes_as_tuple,
     read_bytes_as_value,
 )
 
 TABIX_EXTENSION = ".tbi"
 TABIX_LINEAR_INDEX_INTERVAL_SIZE = 1 << 14  # 16kb interval size
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+TABIX_PSEUDO_BIN = 37450
+TABIX_FORMAT_VCF = 2
 
 
 @dataclass
@@ -127,7 +135,7 @@ def read_tabix(
                         chunks.append(chunk)
                     seq_bins.append(Bin(bin, chunks))
 
-                    if bin == 37450:  # pseudo-bin, see section 5.2 of BAM spec
+                    if bin == TABIX_PSEUDO_BIN:  # see section 5.2 of BAM spec
                         assert len(chunks) == 2
                         n_mapped, n_unmapped = chunks[1].cnk_beg, chunks[1].cnk_end
                         record_count = n_mapped + n_unmapped
@@ -147,3 +155,107 @@ def read_tabix(
         return TabixIndex(
             header, sequence_names, bins, linear_indexes, record_counts, n_no_coor
         )
+
+
+def build_tabix_index(
+    sequence_names: Sequence[str],
+    records: Iterable[Tuple[int, int, int, int, int]],
+) -> TabixIndex:
+    """Build a `TabixIndex` object for the records in a BGZF-compressed VCF file.
+
+    Parameters
+    ----------
+    sequence_names : Sequence[str]
+        The names of the sequences (contigs) in the VCF file.
+    records : Iterable[Tuple[int, int, int, int, int]]
+        Tuples of (contig index, 0-based start, end (exclusive), virtual offset of record start,
+        virtual offset of record end) for each record, in file order.
+
+    Returns
+    -------
+    TabixIndex
+        An object representing a tabix index.
+    """
+    names = b"".join(name.encode("utf-8") + b"\x00" for name in sequence_names)
+    header = Header(
+        n_ref=len(sequence_names),
+        format=TABIX_FORMAT_VCF,
+        col_seq=1,
+        col_beg=2,
+        col_end=0,
+        meta=ord("#"),
+        skip=0,
+        l_nm=len(names),
+    )
+    binning_indexes = build_binning_index(
+        len(sequence_names), records, TABIX_MIN_SHIFT, TABIX_DEPTH
+    )
+    bins = []
+    linear_indexes = []
+    record_counts = []
+    for binning_index in binning_indexes:
+        seq_bins = [
+            Bin(bin, [Chunk(*chunk) for chunk in chunks])
+            for bin, chunks in sorted(binning_index.bins.items())
+        ]
+        if binning_index.n_records > 0:
+            pseudo_chunks = [
+                Chunk(binning_index.ref_beg, binning_index.ref_end),
+                Chunk(binning_index.n_records, 0),
+            ]
+            seq_bins.append(Bin(TABIX_PSEUDO_BIN, pseudo_chunks))
+        bins.append(seq_bins)
+        linear_indexes.append(binning_index.linear_index)
+        record_counts.append(
+            binning_index.n_records if binning_index.n_records > 0 else -1
+        )
+    return TabixIndex(
+        header, list(sequence_names), bins, linear_indexes, record_counts, 0
+    )
+
+
+def write_tabix(
+    file: PathType,
+    index: TabixIndex,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> None:
+    """Write a `TabixIndex` object to a tabix file.
+
+    Parameters
+    ----------
+    file : PathType
+        The path to the tabix file.
+    index : TabixIndex
+        The tabix index to write.
+    storage_options : Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+    """
+    storage_options = storage_options or {}
+    header = index.header
+    with fsspec.open(str(file), "wb", **storage_options) as f, BgzfWriter(f) as w:
+        w.write(b"TBI\x01")
+        w.write(
+            struct.pack(
+                "<8i",
+                header.n_ref,
+                header.format,
+                header.col_seq,
+                header.col_beg,
+                header.col_end,
+                header.meta,
+                header.skip,
+                header.l_nm,
+            )
+        )
+        w.write(
+            b"".join(name.encode("utf-8") + b"\x00" for name in index.sequence_names)
+        )
+        for seq_bins, linear_index in zip(index.bins, index.linear_indexes):
+            w.write(struct.pack("<i", len(seq_bins)))
+            for bin in seq_bins:
+                w.write(struct.pack("<Ii", bin.bin, len(bin.chunks)))
+                for chunk in bin.chunks:
+                    w.write(struct.pack("<QQ", chunk.cnk_beg, chunk.cnk_end))
+            w.write(struct.pack("<i", len(linear_index)))
+            w.write(struct.pack(f"<{len(linear_index)}Q", *linear_index))
+        w.write(struct.pack("<Q", index.n_no_coor))
@@ -0,0 +1,152 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+import xarray as xr
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import partition_into_regions, read_vcf, vcf_to_zarr
+from sgkit_vcf.bcf_reader import BcfFile, is_bcf, parse_header_dictionaries
+from sgkit_vcf.tests.utils import path_for_test
+from sgkit_vcf.vcf_generator import generate_vcf
+from sgkit_vcf.vcf_reader import open_vcf, read_bcf_chunks, read_vcf_chunks
+
+
+def read_all(chunks: Any) -> Dict[str, np.ndarray]:
+    arrays: Dict[str, List[np.ndarray]] = {}
+    for chunk in chunks:
+        for var, arr in chunk.items():
+            arrays.setdefault(var, []).append(arr.copy())
+    return {var: np.concatenate(arrs) for var, arrs in arrays.items()}
+
+
+def assert_native_matches_cyvcf2(path: Any, region: Any = None, **kwargs: Any) -> None:
+    with open_vcf(path) as vcf:
+        expected = read_all(read_vcf_chunks(vcf, region, 1000, (), **kwargs))
+    with open_vcf(path) as vcf:
+        actual = read_all(read_bcf_chunks(vcf, path, region, 1000, **kwargs))
+    assert actual.keys() == expected.keys()
+    for var in expected:
+        assert_array_equal(actual[var], expected[var], err_msg=var)
+
+
+def test_parse_header_dictionaries():
+    text = "\n".join(
+        [
+            "##fileformat=VCFv4.2",
+            '##FILTER=<ID=q10,Description="Quality below 10">',
+            '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+            '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+            '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+            "##contig=<ID=20,length=63025520>",
+            "##contig=<ID=X,length=155270560>",
+        ]
+    )
+    contigs, dictionary = parse_header_dictionaries(text)
+    assert contigs == ["20", "X"]
+    # IDs that are shared by INFO and FORMAT fields are only numbered once
+    assert dictionary == {"PASS": 0, "q10": 1, "DP": 2, "GT": 3}
+
+    contigs, dictionary = parse_header_dictionaries(
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype",IDX=5>\n'
+        "##contig=<ID=X,IDX=1>\n"
+        "##contig=<ID=20,IDX=0>"
+    )
+    assert contigs == ["20", "X"]
+    assert dictionary == {"PASS": 0, "GT": 5}
+
+
+def test_is_bcf(shared_datadir):
+    assert is_bcf(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf"))
+    assert not is_bcf(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    assert not is_bcf(path_for_test(shared_datadir, "sample.vcf"))
+
+    with pytest.raises(ValueError, match=r"File not in BCF format"):
+        BcfFile(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+
+
+@pytest.mark.parametrize(
+    "region",
+    [None, "20", "21", "20:10001600-10001700", "21:10000000-", "20:1-10000000"],
+)
+def test_read_bcf_chunks(shared_datadir, region):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf")
+    assert_native_matches_cyvcf2(path, region)
+    assert_native_matches_cyvcf2(path, region, variant_end=True, alt_number=7)
+
+
+def test_read_bcf_chunks__missing_contig(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf")
+    with BcfFile(path) as bcf:
+        assert list(bcf.record_chunks("22")) == []
+
+
+@pytest.mark.parametrize(
+    "ploidy", [2, 3],
+)
+def test_read_bcf_chunks__generated(tmp_path, ploidy):
+    path = tmp_path / "sim.bcf"
+    generate_vcf(
+        path,
+        n_variants=3000,
+        n_samples=7,
+        contigs=3,
+        max_alt_alleles=5,
+        ploidy=ploidy,
+        missing_rate=0.1,
+        phased_rate=0.5,
+        format_fields=["DP", "GT"],
+        num_workers=1,
+    )
+    assert_native_matches_cyvcf2(path, ploidy=ploidy)
+    for region in partition_into_regions(path, num_parts=5):
+        assert_native_matches_cyvcf2(path, region, ploidy=ploidy + 1)
+
+    if ploidy > 2:
+        with open_vcf(path) as vcf:
+            with pytest.raises(ValueError, match=r"has a call with ploidy 3"):
+                list(read_bcf_chunks(vcf, path, ploidy=2))
+
+
+def test_read_bcf_chunks__haploid(tmp_path):
+    path = tmp_path / "sim.bcf"
+    generate_vcf(path, n_variants=100, n_samples=3, ploidy=1, missing_rate=0.1)
+    with open_vcf(path) as vcf:
+        expected = read_all(read_vcf_chunks(vcf, None, 1000, ()))
+    with open_vcf(path) as vcf:
+        actual = read_all(read_bcf_chunks(vcf, path))
+    # cyvcf2 doesn't report a meaningful phase for haploid calls
+    assert_array_equal(actual["call_genotype"], expected["call_genotype"])
+    assert not actual["call_genotype_phased"].any()
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_vcf_to_zarr__native_engine(shared_datadir, is_path, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf", is_path)
+    output = tmp_path.joinpath("native.zarr").as_posix()
+    expected_output = tmp_path.joinpath("cyvcf2.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+
+    vcf_to_zarr(path, output, regions=regions, chunk_length=5_000, engine="native")
+    vcf_to_zarr(path, expected_output, regions=regions, chunk_length=5_000)
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    xr.testing.assert_equal(ds, expected)
+
+
+def test_read_vcf__native_engine_fallback(shared_datadir):
+    # BCFs with fields requested are decoded by cyvcf2
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf")
+    ds = read_vcf(path, fields=["FORMAT/DP"], engine="native")
+    xr.testing.assert_equal(ds, read_vcf(path, fields=["FORMAT/DP"]))
+
+
+def test_read_vcf__invalid_engine(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf")
+    with pytest.raises(ValueError, match=r"Engine must be one of"):
+        read_vcf(path, engine="pysam")
+    with pytest.raises(ValueError, match=r"Engine must be one of"):
+        vcf_to_zarr(path, tmp_path.joinpath("vcf.zarr").as_posix(), engine="pysam")
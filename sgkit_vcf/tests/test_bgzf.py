@@ -0,0 +1,77 @@
+import gzip
+
+import pytest
+
+from sgkit_vcf.bgzf import (
+    BGZF_BLOCK_SIZE,
+    BGZF_EOF,
+    BgzfReader,
+    BgzfWriter,
+    compress_block,
+    decompress_block,
+    read_block,
+)
+from sgkit_vcf.utils import get_file_offset
+
+
+def test_compress_block():
+    data = b"hello world"
+    block = compress_block(data)
+    assert gzip.decompress(block) == data
+    assert gzip.decompress(compress_block(b"")) == b""
+    assert len(BGZF_EOF) == 28
+    assert decompress_block(block) == data
+
+
+def test_bgzf_writer(tmp_path):
+    path = tmp_path / "data.gz"
+    data = bytes(range(256)) * 1000  # spans several blocks
+    with open(path, "wb") as f, BgzfWriter(f) as w:
+        assert w.tell() == 0
+        w.write(b"header")
+        w.flush()
+        offset = w.tell()
+        w.write(data)
+        end = w.tell()
+
+    assert gzip.decompress(path.read_bytes()) == b"header" + data
+    assert path.read_bytes().endswith(BGZF_EOF)
+
+    # the data starts at the beginning of the second block
+    assert offset & 0xFFFF == 0
+    assert get_file_offset(offset) > 0
+    assert end & 0xFFFF == (len(data) % BGZF_BLOCK_SIZE)
+
+
+def test_bgzf_reader(tmp_path):
+    path = tmp_path / "data.gz"
+    data = bytes(range(256)) * 1000
+    with open(path, "wb") as f, BgzfWriter(f) as w:
+        w.write(b"header")
+        w.flush()
+        offset = w.tell()
+        w.write(data)
+
+    with open(path, "rb") as f:
+        r = BgzfReader(f)
+        assert r.read(6) == b"header"
+        assert r.tell() == offset
+        assert r.read(len(data) + 1) == data
+        assert r.read(1) == b""
+
+        # seek to a virtual offset within the data
+        r.seek(offset + 1000)
+        assert r.read(10) == data[1000:1010]
+        assert r.read_block_remainder() == data[1010:BGZF_BLOCK_SIZE]
+        assert r.read_block_remainder() == data[BGZF_BLOCK_SIZE : 2 * BGZF_BLOCK_SIZE]
+
+        f.seek(0)
+        assert decompress_block(read_block(f)) == b"header"
+
+
+def test_read_block__invalid(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"not a bgzf file")
+    with open(path, "rb") as f:
+        with pytest.raises(ValueError, match=r"Not a BGZF block"):
+            read_block(f)
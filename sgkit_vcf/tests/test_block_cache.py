@@ -0,0 +1,216 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import fsspec
+import numpy as np
+import pytest
+import xarray as xr
+
+from sgkit_vcf import block_cache as block_cache_module
+from sgkit_vcf import vcf_reader
+from sgkit_vcf.bcf_reader import BcfFile
+from sgkit_vcf.block_cache import (
+    CACHE_DIRECTORY_ENV,
+    BlockCache,
+    CachedFile,
+    block_cache,
+    get_block_cache,
+)
+from sgkit_vcf.csi import read_csi
+from sgkit_vcf.tests.utils import path_for_test
+from sgkit_vcf.utils import url_filename
+from sgkit_vcf.vcf_reader import open_vcf, vcf_to_zarr
+
+
+@pytest.fixture
+def memory_dir():
+    """A directory in the in-memory filesystem, which stands in for a remote one."""
+    fs = fsspec.filesystem("memory")
+    path = f"/{uuid.uuid4().hex}"
+    fs.mkdir(path)
+    yield path
+    fs.rm(path, recursive=True)
+
+
+def test_block_cache(tmp_path):
+    cache = BlockCache(tmp_path, max_size=350)
+    for key in "abc":
+        cache.put(key, key.encode() * 100)
+    assert cache.get("a") == b"a" * 100
+    assert cache.get("missing") is None
+
+    # the least recently used page is evicted when the cache is too large
+    cache.put("d", b"d" * 100)
+    assert cache.get("b") is None
+    assert [cache.get(key) is not None for key in "acd"] == [True] * 3
+    assert len(os.listdir(tmp_path)) == 3
+    assert (cache.hits, cache.misses) == (4, 2)
+
+
+def test_cached_file(tmp_path, memory_dir):
+    fs = fsspec.filesystem("memory")
+    path = f"{memory_dir}/data"
+    data = np.random.default_rng(0).bytes(3500)
+    fs.pipe(path, data)
+    cache = BlockCache(tmp_path)
+
+    with CachedFile(fs, path, cache, page_size=1000) as f:
+        assert f.read(10) == data[:10]
+        f.seek(990)
+        # a read across a page boundary
+        assert f.read(20) == data[990:1010]
+        f.seek(-100, os.SEEK_END)
+        assert f.read() == data[-100:]
+        assert f.read(10) == b""
+        with pytest.raises(ValueError, match="Negative seek position"):
+            f.seek(-1)
+    assert (cache.hits, cache.misses) == (0, 3)
+
+    with CachedFile(fs, path, cache, page_size=1000) as f:
+        assert f.read() == data
+    assert (cache.hits, cache.misses) == (3, 4)
+
+    # a new version of the file is not read from the cache
+    fs.pipe(path, data[::-1])
+    with CachedFile(fs, path, cache, page_size=1000) as f:
+        assert f.read() == data[::-1]
+    assert (cache.hits, cache.misses) == (3, 8)
+
+
+def test_block_cache__bcf(shared_datadir, tmp_path, memory_dir):
+    vcf_path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf")
+    url = f"memory://{memory_dir}/sample.bcf"
+    fs = fsspec.filesystem("memory")
+    fs.put_file(str(vcf_path), f"{memory_dir}/sample.bcf")
+    fs.put_file(f"{vcf_path}.csi", f"{memory_dir}/sample.bcf.csi")
+
+    def read_region(path):
+        with BcfFile(path) as bcf:
+            return [bytes(data) for data, _ in bcf.record_chunks("21:10010625-", 1000)]
+
+    expected = read_region(vcf_path)
+    with block_cache(tmp_path / "cache") as cache:
+        assert get_block_cache() is cache
+        assert read_region(url) == expected
+        misses = cache.misses
+        assert misses > 0
+        assert read_region(url) == expected
+        assert read_csi(url + ".csi") == read_csi(f"{vcf_path}.csi")
+        assert cache.misses == misses
+
+        # local files are not cached
+        cached_pages = len(os.listdir(tmp_path / "cache"))
+        assert read_region(vcf_path) == expected
+        assert len(os.listdir(tmp_path / "cache")) == cached_pages
+
+        # the cache is inherited by new processes
+        code = "from sgkit_vcf.block_cache import get_block_cache; print(get_block_cache().directory)"
+        result = subprocess.run(
+            [sys.executable, "-c", code], check=True, stdout=subprocess.PIPE
+        )
+        assert result.stdout.decode().strip() == str(tmp_path / "cache")
+    assert get_block_cache() is None
+    assert CACHE_DIRECTORY_ENV not in os.environ
+
+    with pytest.raises(ValueError, match="max_size must be positive"):
+        with block_cache(tmp_path / "cache", max_size=0):
+            pass  # pragma: no cover
+
+
+def _put_files(shared_datadir, memory_dir, *files):
+    fs = fsspec.filesystem("memory")
+    for file in files:
+        fs.put_file(str(shared_datadir / file), f"{memory_dir}/{file}")
+    return f"memory://{memory_dir}/{files[0]}"
+
+
+def _variants(vcf, region=None):
+    variants = vcf if region is None else vcf(region)
+    return [(v.CHROM, v.POS, v.REF, v.ALT, v.genotypes) for v in variants]
+
+
+@pytest.mark.parametrize(
+    "file, index",
+    [
+        ("CEUTrio.20.21.gatk3.4.g.bcf", ".csi"),
+        ("CEUTrio.20.21.gatk3.4.g.vcf.bgz", ".tbi"),
+        ("CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz", ".csi"),
+    ],
+)
+@pytest.mark.parametrize("region", ["20:10000100-10000200", "21:10010625-", "22", None])
+def test_open_vcf(shared_datadir, tmp_path, memory_dir, monkeypatch, file, index, region):
+    url = _put_files(shared_datadir, memory_dir, file, file + index)
+    with open_vcf(shared_datadir / file) as vcf:
+        expected = _variants(vcf, region)
+        samples = vcf.samples
+
+    # copy small pages, so that only some of the file is copied for a region
+    monkeypatch.setattr(block_cache_module, "PAGE_SIZE", 4096)
+    local_copies = []
+    real_write_local_copy = block_cache_module.write_local_copy
+
+    def write_local_copy(path, local_path, ranges=None, storage_options=None):
+        real_write_local_copy(path, local_path, ranges, storage_options)
+        local_copies.append((local_path, ranges))
+
+    monkeypatch.setattr(vcf_reader, "write_local_copy", write_local_copy)
+    with block_cache(tmp_path / "cache") as cache:
+        with open_vcf(url, region) as vcf:
+            assert _variants(vcf, region) == expected
+        assert cache.misses > 0
+        misses = cache.misses
+        with open_vcf(url, region) as vcf:
+            assert _variants(vcf, region) == expected
+        assert cache.misses == misses
+
+        with open_vcf(url, header_only=True) as vcf:
+            assert vcf.samples == samples
+    # the local copies are removed
+    assert not any(os.path.exists(path) for path, _ in local_copies)
+
+    index_copies = [path for path, _ in local_copies if path.endswith(index)]
+    assert len(index_copies) == (0 if region is None else 2)
+    assert all(path.endswith(url_filename(url) + index) for path in index_copies)
+    ranges = [r for path, r in local_copies if path.endswith(url_filename(url))]
+    if region is None:
+        assert ranges[0] is None
+    elif region != "22":
+        # the header and the last block, and the index chunks for the region
+        assert len(ranges[0]) > 2
+    # just the header and the last block
+    assert len(ranges[-1]) == 2
+
+
+def test_open_vcf__local(shared_datadir, tmp_path, monkeypatch):
+    path = shared_datadir / "CEUTrio.20.21.gatk3.4.g.bcf"
+    monkeypatch.setattr(vcf_reader, "write_local_copy", None)
+    with block_cache(tmp_path / "cache"):
+        with open_vcf(path, "21:10010625-") as vcf:
+            assert len(_variants(vcf, "21:10010625-")) > 0
+
+
+@pytest.mark.parametrize(
+    "file, index",
+    [
+        ("CEUTrio.20.21.gatk3.4.g.bcf", ".csi"),
+        ("CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz", ".csi"),
+    ],
+)
+def test_vcf_to_zarr__native_remote(shared_datadir, tmp_path, memory_dir, file, index):
+    url = _put_files(shared_datadir, memory_dir, file, file + index)
+    regions = ["20", "21"]
+    expected = tmp_path / "expected.zarr"
+    vcf_to_zarr(shared_datadir / file, expected, regions=regions)
+
+    # htslib can't read an in-memory file, so cyvcf2 mustn't open it for the header
+    output = tmp_path / "native.zarr"
+    vcf_to_zarr(url, output, regions=regions, engine="native")
+    xr.testing.assert_equal(xr.open_zarr(output), xr.open_zarr(expected))
+
+    # ... but it can read a copy made through the block cache
+    output = tmp_path / "cyvcf2.zarr"
+    with block_cache(tmp_path / "cache"):
+        vcf_to_zarr(url, output, regions=regions)
+    xr.testing.assert_equal(xr.open_zarr(output), xr.open_zarr(expected))
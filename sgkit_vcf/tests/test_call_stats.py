@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import xarray as xr
+from numpy.testing import assert_allclose, assert_array_equal
+
+import sgkit
+from sgkit_vcf import partition_into_regions, vcf_to_zarr
+from sgkit_vcf.call_stats import SAMPLE_STATS, VARIANT_STATS, call_counts
+from sgkit_vcf.vcf_generator import generate_vcf
+
+
+def test_call_counts():
+    call_genotype = np.array(
+        [
+            [[0, 0], [0, 1], [1, 1], [-1, -1]],
+            [[1, -2], [0, -2], [-1, -2], [2, 2]],
+            [[0, -1], [3, 1], [1, 0], [2, 1]],
+        ]
+    )
+    variant_counts, sample_counts = call_counts(call_genotype, n_allele=3)
+
+    assert_array_equal(variant_counts["variant_n_called"], [3, 3, 3])
+    assert_array_equal(variant_counts["variant_n_het"], [1, 0, 3])
+    assert_array_equal(variant_counts["variant_n_hom_ref"], [1, 1, 0])
+    assert_array_equal(variant_counts["variant_n_hom_alt"], [1, 2, 0])
+    assert_array_equal(variant_counts["variant_n_non_ref"], [2, 2, 3])
+    # the allele with index 3 isn't counted, but fill values are ignored
+    assert_array_equal(
+        variant_counts["variant_allele_count"], [[3, 3, 0], [1, 1, 2], [2, 3, 1]]
+    )
+    assert_array_equal(sample_counts["sample_n_called"], [2, 3, 2, 2])
+    assert_array_equal(sample_counts["sample_n_het"], [0, 2, 1, 1])
+    assert_array_equal(sample_counts["sample_n_hom_ref"], [1, 1, 0, 0])
+    assert_array_equal(sample_counts["sample_n_hom_alt"], [1, 0, 1, 1])
+    assert_array_equal(sample_counts["sample_n_non_ref"], [1, 2, 2, 2])
+
+
+@pytest.mark.parametrize(
+    "mode", ["sequential", "parallel", "executor"],
+)
+def test_vcf_to_zarr__compute_stats(tmp_path, mode):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(
+        path,
+        n_variants=1000,
+        n_samples=7,
+        contigs=3,
+        max_alt_alleles=3,
+        missing_rate=0.1,
+        num_workers=1,
+    )
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    if mode == "sequential":
+        vcf_to_zarr(path, output, chunk_length=300, chunk_width=3, compute_stats=True)
+    else:
+        regions = partition_into_regions(path, num_parts=4)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            vcf_to_zarr(
+                path,
+                output,
+                regions=regions,
+                chunk_length=300,
+                chunk_width=3,
+                executor=executor if mode == "executor" else None,
+                alt_number=None,
+                compute_stats=True,
+            )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds["variant_n_called"].chunks == ((300, 300, 300, 100),)
+    assert ds["sample_n_called"].chunks == ((3, 3, 1),)
+
+    genotypes = ds.drop_vars(list(VARIANT_STATS + SAMPLE_STATS)).compute()
+    expected = xr.merge(
+        [
+            sgkit.variant_stats(genotypes, merge=False),
+            sgkit.sample_stats(genotypes, merge=False),
+        ]
+    )
+    for var in VARIANT_STATS + SAMPLE_STATS:
+        assert_allclose(ds[var].values, expected[var].values, err_msg=var)
@@ -0,0 +1,136 @@
+import io
+
+import pytest
+import xarray as xr
+
+from sgkit_vcf import partition_into_regions
+from sgkit_vcf.cli import Progress, main
+from sgkit_vcf.profiling import Span
+from sgkit_vcf.tests.utils import path_for_test
+from sgkit_vcf.vcf_reader import count_variants
+
+
+@pytest.mark.parametrize("executor", ["dask", "threads"])
+def test_convert(shared_datadir, tmp_path, capsys, executor):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    args = ["convert", path, output, "--num-parts", "4", "--chunk-length", "5000"]
+    args += ["--field", "INFO/DP", "--executor", executor, "--workers", "2"]
+    assert main(args + ["--progress"]) == 0
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["variants"] == 19910
+    assert "variant_DP" in ds
+    assert ds.chunks["variants"][0] == 5000
+    # the last status line is the final summary
+    status = capsys.readouterr().err.split("\r")[-1]
+    assert "decoded 19,910/~19,910 variants (100%" in status
+    assert "merged 19,910 variants" in status
+
+
+def test_convert__region(shared_datadir, tmp_path):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    args = ["convert", path, output, "--region", "21", "--ploidy", "auto"]
+    assert main(args) == 0
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["variants"] == count_variants(path, region="21")
+
+
+def test_convert__cache_dir(shared_datadir, tmp_path):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    cache_dir = tmp_path.joinpath("cache")
+    args = ["convert", path, output, "--num-parts", "2", "--executor", "processes"]
+    args += ["--engine", "native", "--cache-dir", str(cache_dir)]
+    args += ["--cache-size", "10MB"]
+    assert main(args) == 0
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["variants"] == 19910
+    # local inputs are read directly
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_convert__memory_limit(shared_datadir, tmp_path, capsys):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    args = ["convert", path, output, "--num-parts", "2", "--workers", "2"]
+
+    assert main(args + ["--memory-limit", "10kB"]) == 1
+    assert "sgkit-vcf: error:" in capsys.readouterr().err
+    assert not tmp_path.joinpath("vcf.zarr").exists()
+
+    assert main(args + ["--memory-limit", "10GB", "--dry-run"]) == 0
+    out = capsys.readouterr().out
+    assert "parts, 19,910 variants, 1 samples" in out
+    assert "Peak memory per task" in out
+    assert not tmp_path.joinpath("vcf.zarr").exists()
+
+
+def test_convert__batch_plan(shared_datadir, tmp_path, capsys):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    plan_path = str(tmp_path / "plan.json")
+    args = ["convert", path, output, "--region", "20", "--region", "21"]
+
+    assert main(args + ["--batch-plan", plan_path]) == 1
+    assert "--tempdir must be set" in capsys.readouterr().err
+
+    args += ["--tempdir", str(tmp_path / "parts"), "--batch-plan", plan_path]
+    assert main(args) == 0
+    assert "Wrote a plan with 2 parts" in capsys.readouterr().out
+    assert main(["run-part", plan_path, "0", "1"]) == 0
+    assert main(["merge", plan_path]) == 0
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["variants"] == 19910
+
+
+def test_partition(shared_datadir, capsys):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    assert main(["partition", path, "--num-parts", "3"]) == 0
+    regions = capsys.readouterr().out.splitlines()
+    assert regions == partition_into_regions(path, num_parts=3)
+
+    assert main(["partition", path, "--target-part-size", "1MB"]) == 0
+    assert capsys.readouterr().out == ".\n"
+
+    with pytest.raises(SystemExit):
+        main(["partition", path])
+
+
+def test_count(shared_datadir, capsys):
+    path = str(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    assert main(["count", path]) == 0
+    assert capsys.readouterr().out == "19910\n"
+    assert main(["count", path, "--region", "20"]) == 0
+    assert int(capsys.readouterr().out) == count_variants(path, region="20")
+
+
+@pytest.mark.parametrize(
+    "vcf_file", ["CEUTrio.20.21.gatk3.4.g.vcf.bgz", "CEUTrio.20.21.gatk3.4.g.bcf"]
+)
+def test_index_info(shared_datadir, capsys, vcf_file):
+    path = str(path_for_test(shared_datadir, vcf_file))
+    assert main(["index-info", path]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1] == "contig\tbins\trecords"
+    records = {line.split("\t")[0]: int(line.split("\t")[2]) for line in lines[2:]}
+    assert records["20"] == count_variants(path, region="20")
+    assert sum(records.values()) == 19910
+
+    # the index can also be given directly
+    index_path = lines[0].split(":")[0]
+    assert main(["index-info", index_path]) == 0
+    assert capsys.readouterr().out.splitlines() == lines
+
+
+def test_progress():
+    stream = io.StringIO()
+    progress = Progress(100, stream=stream, interval=0)
+    progress.record(Span("region read", "part", 0, 0, 0, 0, dict(variants=25)))
+    progress.record(Span("chunk write", "part", 0, 0, 0, 0, dict(nbytes=2000)))
+    progress.close()
+    assert progress.spans == []
+    assert "decoded 25/~100 variants (25%" in stream.getvalue()
+    assert "wrote 1.95 kiB" in stream.getvalue()
+    assert stream.getvalue().endswith("\n")
@@ -1,8 +1,8 @@
 import pytest
 from cyvcf2 import VCF
 
-from sgkit_vcf.csi import read_csi
-from sgkit_vcf.tests.utils import path_for_test
+from sgkit_vcf.csi import build_csi_index, read_csi, write_csi
+from sgkit_vcf.tests.utils import path_for_test, write_simple_vcf
 from sgkit_vcf.vcf_partition import get_csi_path
 from sgkit_vcf.vcf_reader import count_variants
 
@@ -32,3 +32,22 @@ def test_record_counts_csi(shared_datadir, vcf_file, is_path):
 def test_read_csi__invalid_csi(shared_datadir, file, is_path):
     with pytest.raises(ValueError, match=r"File not in CSI format."):
         read_csi(path_for_test(shared_datadir, file, is_path))
+
+
+def test_write_csi__roundtrip(shared_datadir, tmp_path):
+    csi = read_csi(shared_datadir / "CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz.csi")
+    output = tmp_path / "roundtrip.csi"
+    write_csi(output, csi)
+    assert read_csi(output) == csi
+
+
+def test_build_csi_index(tmp_path):
+    vcf_path = tmp_path / "sim.vcf.gz"
+    sequence_names, records = write_simple_vcf(vcf_path)
+    csi = build_csi_index(sequence_names, records)
+    write_csi(str(vcf_path) + ".csi", csi)
+
+    assert read_csi(str(vcf_path) + ".csi") == csi
+    assert csi.record_counts == [1000, -1, 1000]
+    assert count_variants(vcf_path, "1:10000-20000") == 11
+    assert count_variants(vcf_path, "3:995001-") == 5
@@ -0,0 +1,153 @@
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import (
+    pack_genotypes,
+    partition_into_regions,
+    read_vcf,
+    unpack_genotypes,
+    vcf_to_zarr,
+)
+from sgkit_vcf.genotype_packing import (
+    PACKED_VARIABLE,
+    bits_per_allele,
+    bits_per_call,
+    pack_dataset,
+    packed_chunk_size,
+)
+from sgkit_vcf.tests.utils import path_for_test
+
+
+@pytest.mark.parametrize(
+    "n_allele,ploidy,n_samples", [(2, 2, 11), (4, 2, 16), (4, 3, 5), (6, 1, 0)],
+)
+def test_pack_genotypes__round_trip(n_allele, ploidy, n_samples):
+    rs = np.random.RandomState(0)
+    call_genotype = rs.randint(-2, n_allele, size=(7, n_samples, ploidy)).astype("i1")
+    call_genotype_phased = rs.randint(0, 2, size=(7, n_samples)).astype(bool)
+
+    packed = pack_genotypes(call_genotype, call_genotype_phased, n_allele)
+
+    assert packed.dtype == np.uint8
+    n_bits = n_samples * bits_per_call(n_allele, ploidy)
+    assert packed.shape == (7, (n_bits + 7) // 8)
+    gt, phased = unpack_genotypes(packed, n_samples, ploidy, n_allele)
+    assert_array_equal(gt, call_genotype)
+    assert_array_equal(phased, call_genotype_phased)
+
+
+def test_bits_per_call():
+    assert bits_per_allele(2) == 2
+    assert bits_per_allele(3) == 3
+    assert bits_per_allele(6) == 3
+    assert bits_per_allele(7) == 4
+    assert bits_per_call(2, 2) == 5
+    assert bits_per_call(4, 2) == 7
+
+    assert packed_chunk_size(1000, 2, 2) == 625
+    with pytest.raises(ValueError, match=r"Chunk width must be a multiple of 8"):
+        packed_chunk_size(10, 2, 2)
+
+
+def test_pack_genotypes__invalid():
+    call_genotype = np.array([[[0, 4]]])
+    call_genotype_phased = np.array([[False]])
+
+    with pytest.raises(
+        ValueError, match=r"between -2 and 1 to be packed for 2 alleles"
+    ):
+        pack_genotypes(call_genotype, call_genotype_phased, 2)
+    pack_genotypes(call_genotype, call_genotype_phased, 5)
+
+
+def test_unpack__in_memory(shared_datadir):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    expected = read_vcf(path).compute()
+
+    ds = pack_dataset(expected)
+
+    assert "call_genotype" not in ds
+    assert ds[PACKED_VARIABLE].shape == (9, 3)
+    assert ds[PACKED_VARIABLE].attrs["bits_per_allele"] == 3
+    xr.testing.assert_equal(ds.packed_genotypes.unpack(), expected)
+
+    with pytest.raises(ValueError, match=r"Dataset has no call_genotype_packed"):
+        expected.packed_genotypes.unpack()
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_vcf_to_zarr__pack_genotypes(shared_datadir, is_path, tmp_path):
+    path = path_for_test(shared_datadir, "sample.vcf.gz", is_path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    vcf_to_zarr(path, output, chunk_length=5, chunk_width=8, pack_genotypes=True)
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds[PACKED_VARIABLE].chunks == ((5, 4), (3,))
+    unpacked = ds.packed_genotypes.unpack()
+    assert isinstance(unpacked["call_genotype"].data, da.Array)
+    expected = read_vcf(path)
+    for var in ["call_genotype", "call_genotype_mask", "call_genotype_phased"]:
+        assert_array_equal(unpacked[var].values, expected[var].values)
+
+
+def test_vcf_to_zarr__pack_genotypes_parallel(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+
+    vcf_to_zarr(
+        path,
+        output,
+        regions=regions,
+        chunk_length=5_000,
+        chunk_width=8,
+        pack_genotypes=True,
+    )
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds[PACKED_VARIABLE].shape == (19910, 1)
+    assert ds[PACKED_VARIABLE].chunks[0] == (5000, 5000, 5000, 4910)
+    unpacked = ds.packed_genotypes.unpack()
+    expected = read_vcf(path, regions=regions)
+    for var in ["call_genotype", "call_genotype_mask", "call_genotype_phased"]:
+        assert_array_equal(unpacked[var].values, expected[var].values)
+
+    with pytest.raises(ValueError, match=r"Chunk width must be a multiple of 8"):
+        vcf_to_zarr(path, output, chunk_width=10, pack_genotypes=True)
+
+
+def test_unpack__dask_chunks():
+    rs = np.random.RandomState(0)
+    call_genotype = rs.randint(-2, 2, size=(6, 20, 2)).astype("i1")
+    call_genotype_phased = rs.randint(0, 2, size=(6, 20)).astype(bool)
+    ds = xr.Dataset(
+        {
+            "call_genotype": (["variants", "samples", "ploidy"], call_genotype),
+            "call_genotype_phased": (["variants", "samples"], call_genotype_phased),
+            "call_genotype_mask": (
+                ["variants", "samples", "ploidy"],
+                call_genotype < 0,
+            ),
+            "variant_allele": (["variants", "alleles"], np.zeros((6, 2), dtype="O")),
+            "sample_id": (["samples"], np.arange(20)),
+        }
+    )
+    packed = pack_dataset(ds)
+    assert packed[PACKED_VARIABLE].shape == (6, 13)
+
+    # 8 samples (5 bytes) in each chunk
+    unpacked = packed.chunk({"variants": 4, "packed_genotype_bytes": 5})
+    unpacked = unpacked.packed_genotypes.unpack()
+    assert unpacked["call_genotype"].chunks == ((4, 2), (8, 8, 4), (2,))
+    assert_array_equal(unpacked["call_genotype"].values, call_genotype)
+    assert_array_equal(unpacked["call_genotype_phased"].values, call_genotype_phased)
+
+    # chunks that split a call can't be unpacked independently
+    with pytest.raises(ValueError, match=r"must hold whole calls \(5 bits each\)"):
+        packed.chunk({"packed_genotype_bytes": 4}).packed_genotypes.unpack()
@@ -0,0 +1,89 @@
+import json
+import subprocess
+import sys
+from typing import List
+
+import pytest
+
+import sgkit_vcf
+from sgkit_vcf import vcf_to_zarr
+from sgkit_vcf.tests.utils import path_for_test
+
+# Modules that are slow to import, and are only needed to convert files
+HEAVY_MODULES = {"cyvcf2", "dask", "sgkit", "xarray", "yarl"}
+
+
+def run_imports(code: str) -> List[str]:
+    """Run code in a new interpreter, returning the top-level modules it imported."""
+    script = f"""
+import json, sys
+before = set(sys.modules)
+{code}
+modules = sorted({{name.split(".")[0] for name in set(sys.modules) - before}})
+print(json.dumps(modules))
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script], check=True, stdout=subprocess.PIPE
+    )
+    # the modules are printed last, after any output from the code
+    return json.loads(result.stdout.splitlines()[-1])  # type: ignore[no-any-return]
+
+
+def test_import():
+    modules = run_imports("import sgkit_vcf")
+    assert HEAVY_MODULES.isdisjoint(modules)
+
+
+def test_import__partition_into_regions(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    code = f"""
+from sgkit_vcf import partition_into_regions
+from sgkit_vcf.tbi import read_tabix
+read_tabix("{path}.tbi")
+assert partition_into_regions("{path}", num_parts=2) is not None
+"""
+    modules = run_imports(code)
+    assert HEAVY_MODULES.isdisjoint(modules)
+    assert "sgkit_vcf" in modules
+
+
+def test_import__cli(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    code = f"""
+from sgkit_vcf.cli import main
+assert main(["index-info", "{path}"]) == 0
+assert main(["partition", "{path}", "--num-parts", "2"]) == 0
+"""
+    modules = run_imports(code)
+    assert HEAVY_MODULES.isdisjoint(modules)
+    assert "sgkit_vcf" in modules
+
+
+def test_import__accessors(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    sparse = tmp_path.joinpath("sparse.zarr").as_posix()
+    packed = tmp_path.joinpath("packed.zarr").as_posix()
+    vcf_to_zarr(path, sparse, regions="20", sparse_hom_ref=True)
+    vcf_to_zarr(path, packed, regions="20", chunk_width=8, pack_genotypes=True)
+
+    # the accessors are registered when xarray is imported after sgkit_vcf
+    code = f"""
+import sgkit_vcf
+import xarray as xr
+ds = xr.open_zarr("{sparse}").sparse_genotypes.densify()
+assert ds["call_genotype"].shape == (3450, 1, 2)
+ds = xr.open_zarr("{packed}").packed_genotypes.unpack()
+assert ds["call_genotype"].shape == (3450, 1, 2)
+"""
+    run_imports(code)
+
+
+def test_import__public_api():
+    from sgkit_vcf import vcf_reader
+
+    assert sgkit_vcf.vcf_to_zarr is vcf_reader.vcf_to_zarr
+    for name in sgkit_vcf.__all__:
+        assert callable(getattr(sgkit_vcf, name))
+    assert set(sgkit_vcf.__all__) <= set(dir(sgkit_vcf))
+    with pytest.raises(AttributeError, match="has no attribute 'vcf_to_bcf'"):
+        sgkit_vcf.vcf_to_bcf
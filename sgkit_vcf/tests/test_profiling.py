@@ -0,0 +1,98 @@
+import json
+import pstats
+
+import pytest
+import xarray as xr
+
+from sgkit_vcf import partition_into_regions, vcf_to_zarr
+from sgkit_vcf.profiling import Tracer, get_tracer, profile, span, trace
+from sgkit_vcf.tests.utils import path_for_test
+
+
+def test_profile(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    trace_path = tmp_path.joinpath("trace.json")
+    cprofile_dir = tmp_path.joinpath("cprofile")
+    cprofile_dir.mkdir()
+
+    with profile(trace_path, cprofile_dir=cprofile_dir) as tracer:
+        assert get_tracer() is tracer
+        regions = partition_into_regions(path, num_parts=2)
+        vcf_to_zarr(path, output, regions=regions, chunk_length=5_000)
+    assert get_tracer() is None
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds["call_genotype"].shape == (19910, 1, 2)
+
+    with open(trace_path) as f:
+        trace = json.load(f)
+    events = trace["traceEvents"]
+    names = {event["name"] for event in events}
+    assert {
+        "thread_name",
+        "index read",
+        "plan",
+        "convert part",
+        "region read",
+        "chunk write",
+        "store read",
+        "merge",
+        "merge chunk",
+    } <= names
+    for event in events:
+        if event["ph"] == "X":
+            assert event["dur"] >= 0
+            assert "pid" in event and "tid" in event
+
+    # one cProfile dump per region conversion task
+    prof_files = sorted(cprofile_dir.iterdir())
+    assert len(prof_files) == len(regions)
+    stats = pstats.Stats(str(prof_files[0]))
+    assert stats.total_calls > 0  # type: ignore[attr-defined]
+
+
+def test_profile__sequential(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    trace_path = tmp_path.joinpath("trace.json")
+
+    with profile(trace_path):
+        vcf_to_zarr(path, output, chunk_length=5, chunk_width=2)
+
+    with open(trace_path) as f:
+        names = {event["name"] for event in json.load(f)["traceEvents"]}
+    assert {"convert part", "region read", "chunk write"} <= names
+    assert xr.open_zarr(output)["call_genotype"].shape == (9, 3, 2)  # type: ignore[no-untyped-call]
+
+
+def test_profile__not_enabled():
+    assert get_tracer() is None
+    with span("noop"):
+        pass
+
+
+def test_profile__nested(tmp_path):
+    trace2_path = tmp_path.joinpath("trace2.json")
+    trace2_path.write_text("previous trace")
+    with profile(tmp_path.joinpath("trace.json")):
+        with pytest.raises(ValueError, match=r"Profiling is already enabled"):
+            with profile(trace2_path):
+                pass  # pragma: no cover
+    # the nested trace is not written
+    assert trace2_path.read_text() == "previous trace"
+
+
+def test_trace(shared_datadir):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    with trace(Tracer()) as tracer:
+        assert get_tracer() is tracer
+        with span("work", n=1) as args:
+            args["done"] = 2
+        vcf_to_zarr(path, {}, chunk_length=5, chunk_width=2)
+    assert get_tracer() is None
+
+    assert tracer.spans[0].name == "work"
+    assert tracer.spans[0].args == dict(n=1, done=2)
+    reads = [s for s in tracer.spans if s.name == "region read"]
+    assert sum(s.args["variants"] for s in reads) == 9
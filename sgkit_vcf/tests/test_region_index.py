@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, MutableMapping
+
+import numpy as np
+import pytest
+import xarray as xr
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import (
+    partition_into_regions,
+    read_vcf,
+    region_index,
+    select_region,
+    vcf_to_zarr,
+)
+from sgkit_vcf.region_index import (
+    DENSE_START,
+    DENSE_STOP,
+    REGION_INDEX_VARIABLE,
+    build_region_index,
+)
+from sgkit_vcf.tests.utils import path_for_test
+
+
+class RecordingStore(MutableMapping[str, bytes]):
+    """A Zarr store that records the keys that are read."""
+
+    def __init__(self, store: MutableMapping[str, bytes]):
+        self.store = store
+        self.keys_read: List[str] = []
+
+    def __getitem__(self, key: str) -> bytes:
+        self.keys_read.append(key)
+        return self.store[key]
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        self.store[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.store[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+def region_mask(ds: xr.Dataset, region: str) -> np.ndarray:
+    contig, _, start_end = region.partition(":")
+    start, _, end = start_end.partition("-")
+    if contig not in ds.attrs["contigs"]:
+        return np.zeros(ds.sizes["variants"], dtype=bool)
+    position = ds["variant_position"].values
+    mask = (ds["variant_contig"].values == ds.attrs["contigs"].index(contig)) & (
+        position >= int(start or 1)
+    )
+    if end != "":
+        mask &= position <= int(end)
+    return mask
+
+
+@pytest.mark.parametrize(
+    "region",
+    [
+        "20",
+        "21",
+        "20:10000000-10001000",
+        "20:10001600-10001700",
+        "21:10000000-",
+        "21:1-10000000",
+        "22",
+    ],
+)
+def test_select_region(shared_datadir, tmp_path, region):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    store: Dict[str, bytes] = {}
+    vcf_to_zarr(
+        path,
+        store,
+        regions=partition_into_regions(path, num_parts=4),
+        chunk_length=1000,
+    )
+    expected = xr.open_zarr(store).compute()  # type: ignore[no-untyped-call]
+    assert expected[REGION_INDEX_VARIABLE].shape == (21, 7)
+
+    recording_store = RecordingStore(store)
+    ds = xr.open_zarr(recording_store)  # type: ignore[no-untyped-call]
+    subset = select_region(ds, region)
+    assert REGION_INDEX_VARIABLE not in subset
+    # only the positions in the chunks at either end of the region are loaded
+    assert (
+        len([k for k in recording_store.keys_read if k.startswith("variant_position/")])
+        <= 2
+    )
+
+    mask = region_mask(expected, region)
+    for var in ["variant_position", "variant_allele", "call_genotype"]:
+        assert_array_equal(subset[var].values, expected[var].values[mask])
+
+
+def test_select_region__sparse(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    vcf_to_zarr(path, output, chunk_length=1000, sparse_hom_ref=True)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    index = ds[REGION_INDEX_VARIABLE].values
+    assert index[-1, DENSE_STOP] == ds.sizes["dense_variants"]
+    assert_array_equal(index[1:, DENSE_START], index[:-1, DENSE_STOP])
+
+    expected = ds.sparse_genotypes.densify()
+    for region in ["20:10001600-10001700", "21", "21:10002000-10003000"]:
+        subset = select_region(ds, region).sparse_genotypes.densify()
+        mask = region_mask(expected, region)
+        assert_array_equal(
+            subset["variant_position"].values, expected["variant_position"][mask]
+        )
+        expected_subset = select_region(expected, region)
+        assert_array_equal(
+            subset["call_genotype"].values, expected_subset["call_genotype"].values
+        )
+
+
+@pytest.mark.parametrize(
+    "conversion",
+    [
+        dict(),
+        dict(sparse_hom_ref=True),
+        dict(num_parts=4),
+        dict(num_parts=4, sparse_hom_ref=True),
+        dict(num_parts=4, executor=True),
+    ],
+)
+def test_vcf_to_zarr__region_index_while_writing(
+    shared_datadir, monkeypatch, conversion
+):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    kwargs: Dict[str, Any] = dict(conversion)
+    num_parts = kwargs.pop("num_parts", None)
+    if num_parts is not None:
+        kwargs["regions"] = partition_into_regions(path, num_parts=num_parts)
+    if kwargs.pop("executor", False):
+        kwargs["executor"] = ThreadPoolExecutor(max_workers=2)
+
+    def fail(ds: xr.Dataset) -> np.ndarray:
+        raise AssertionError("The region index was built from the output store")
+
+    # the index is built as the chunks are written, not by reading the output again
+    monkeypatch.setattr(region_index, "build_region_index", fail)
+    store: Dict[str, bytes] = {}
+    vcf_to_zarr(path, store, chunk_length=1000, temp_chunk_length=500, **kwargs)
+
+    ds = xr.open_zarr(store)  # type: ignore[no-untyped-call]
+    assert_array_equal(
+        ds[REGION_INDEX_VARIABLE].values,
+        build_region_index(ds.drop_vars(REGION_INDEX_VARIABLE)),
+    )
+
+
+def test_select_region__no_index(shared_datadir):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    ds = read_vcf(path)
+
+    subset = select_region(ds, "20:17000-1234567")
+    assert_array_equal(subset["variant_position"], [17330, 1110696, 1230237, 1234567])
+    assert select_region(ds, "Y").sizes["variants"] == 0
+
+
+def test_build_region_index():
+    ds = xr.Dataset(
+        {
+            "variant_contig": (["variants"], np.array([0, 0, 1, 1, 0])),
+            "variant_position": (["variants"], np.array([5, 2, 1, 7, 3])),
+        },
+        attrs={"contigs": ["1", "2"]},
+    )
+    assert_array_equal(
+        build_region_index(ds.chunk({"variants": 3})),
+        [[0, 0, 2, 2, 5, 0, 2], [1, 2, 3, 1, 1, 2, 3], [1, 3, 4, 7, 7, 3, 4]]
+        + [[0, 4, 5, 3, 3, 4, 5]],
+    )
+
+    # the variants in the region don't have to be contiguous
+    subset: Any = select_region(ds, "1:3-")
+    assert_array_equal(subset["variant_position"], [5, 3])
+    assert_array_equal(select_region(ds, "2")["variant_position"], [1, 7])
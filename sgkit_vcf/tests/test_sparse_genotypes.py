@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import partition_into_regions, read_vcf, vcf_to_zarr
+from sgkit_vcf.sparse_genotypes import (
+    densify_genotypes,
+    hom_ref_variants,
+    sparsify_dataset,
+)
+from sgkit_vcf.tests.utils import path_for_test
+
+GENOTYPE_VARIABLES = ["call_genotype", "call_genotype_mask", "call_genotype_phased"]
+
+
+def test_hom_ref_variants():
+    call_genotype = np.array(
+        [
+            [[0, 0], [0, 0]],
+            [[0, 0], [0, 1]],
+            [[0, 0], [0, 0]],
+            [[0, -1], [0, 0]],
+            [[0, 0], [0, 0]],
+        ]
+    )
+    call_genotype_phased = np.array(
+        [[False, False], [False, False], [True, False], [False, False], [False, False]]
+    )
+
+    hom_ref = hom_ref_variants(call_genotype, call_genotype_phased)
+
+    # phased hom-ref calls are kept, so their phase isn't lost
+    assert_array_equal(hom_ref, [True, False, False, False, True])
+
+    gt, phased = densify_genotypes(
+        hom_ref, call_genotype[~hom_ref], call_genotype_phased[~hom_ref]
+    )
+    assert_array_equal(gt, call_genotype)
+    assert_array_equal(phased, call_genotype_phased)
+
+    gt, phased = densify_genotypes(
+        hom_ref,
+        da.from_array(call_genotype[~hom_ref], chunks=2),
+        da.from_array(call_genotype_phased[~hom_ref], chunks=2),
+    )
+    assert isinstance(gt, da.Array)
+    assert_array_equal(gt.compute(), call_genotype)
+    assert_array_equal(phased.compute(), call_genotype_phased)
+
+    with pytest.raises(ValueError, match=r"Number of dense calls \(2\) does not match"):
+        densify_genotypes(hom_ref, call_genotype[:2], call_genotype_phased[:2])
+
+
+def test_densify__in_memory(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    expected = read_vcf(path, regions="20:10001600-10001700").compute()
+
+    ds = sparsify_dataset(expected)
+
+    # alternating variants and reference blocks
+    assert_array_equal(ds["variant_hom_ref"], [False, True] * 4)
+    assert ds["dense_call_genotype"].shape == (4, 1, 2)
+    xr.testing.assert_equal(ds.sparse_genotypes.densify(), expected)
+
+    with pytest.raises(ValueError, match=r"Dataset has no variant_hom_ref variable"):
+        expected.sparse_genotypes.densify()
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_vcf_to_zarr__sparse_hom_ref(shared_datadir, is_path, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz", is_path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    vcf_to_zarr(path, output, chunk_length=5_000, sparse_hom_ref=True)
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert "call_genotype" not in ds
+    assert ds.sizes["variants"] == 19910
+    assert ds.sizes["dense_variants"] == 1201
+    # reference blocks are stored as intervals
+    assert_array_equal(ds["variant_position"][:3], [1, 9999902, 9999903])
+    assert_array_equal(ds["variant_end"][:3], [9999901, 9999902, 9999904])
+    assert ds["variant_end"][-1] == 48129895
+
+    densified = ds.sparse_genotypes.densify()
+    assert densified["call_genotype"].chunks[0] == (5000, 5000, 5000, 4910)
+    expected = read_vcf(path)
+    for var in GENOTYPE_VARIABLES:
+        assert_array_equal(densified[var].values, expected[var].values)
+
+
+@pytest.mark.parametrize(
+    "use_executor", [False, True],
+)
+def test_vcf_to_zarr__sparse_hom_ref_parallel(shared_datadir, tmp_path, use_executor):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+
+    with ThreadPoolExecutor(2) as executor:
+        vcf_to_zarr(
+            path,
+            output,
+            regions=regions,
+            chunk_length=500,
+            executor=executor if use_executor else None,
+            sparse_hom_ref=True,
+        )
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds["dense_call_genotype"].chunks[0] == (500, 500, 201)
+    densified = ds.sparse_genotypes.densify()
+    expected = read_vcf(path, regions=regions)
+    for var in GENOTYPE_VARIABLES + ["variant_position", "variant_contig"]:
+        assert_array_equal(densified[var].values, expected[var].values)
+
+
+def test_vcf_to_zarr__sparse_hom_ref_packed(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    with pytest.raises(
+        ValueError, match=r"Only one of pack_genotypes and sparse_hom_ref"
+    ):
+        vcf_to_zarr(
+            path, output, chunk_width=8, pack_genotypes=True, sparse_hom_ref=True
+        )
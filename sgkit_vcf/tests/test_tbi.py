@@ -1,7 +1,7 @@
 import pytest
 
-from sgkit_vcf.tbi import read_tabix
-from sgkit_vcf.tests.utils import path_for_test
+from sgkit_vcf.tbi import build_tabix_index, read_tabix, write_tabix
+from sgkit_vcf.tests.utils import path_for_test, write_simple_vcf
 from sgkit_vcf.vcf_partition import get_tabix_path
 from sgkit_vcf.vcf_reader import count_variants
 
@@ -32,3 +32,27 @@ def test_record_counts_tbi(shared_datadir, vcf_file, is_path):
 def test_read_tabix__invalid_tbi(shared_datadir, file, is_path):
     with pytest.raises(ValueError, match=r"File not in Tabix format."):
         read_tabix(path_for_test(shared_datadir, file, is_path))
+
+
+@pytest.mark.parametrize(
+    "vcf_file", ["CEUTrio.20.21.gatk3.4.g.vcf.bgz", "sample.vcf.gz"],
+)
+def test_write_tabix__roundtrip(shared_datadir, tmp_path, vcf_file):
+    tbi = read_tabix(shared_datadir / (vcf_file + ".tbi"))
+    output = tmp_path / "roundtrip.tbi"
+    write_tabix(output, tbi)
+    assert read_tabix(output) == tbi
+
+
+def test_build_tabix_index(tmp_path):
+    vcf_path = tmp_path / "sim.vcf.gz"
+    sequence_names, records = write_simple_vcf(vcf_path)
+    tbi = build_tabix_index(sequence_names, records)
+    write_tabix(str(vcf_path) + ".tbi", tbi)
+
+    assert read_tabix(str(vcf_path) + ".tbi") == tbi
+    assert tbi.record_counts == [1000, -1, 1000]
+    assert count_variants(vcf_path, "1") == 1000
+    assert count_variants(vcf_path, "2") == 0
+    assert count_variants(vcf_path, "1:10000-20000") == 11
+    assert count_variants(vcf_path, "3:995001-") == 5
@@ -6,7 +6,7 @@ import fsspec
 import pytest
 from callee.strings import StartsWith
 
-from sgkit_vcf.utils import build_url, temporary_directory
+from sgkit_vcf.utils import build_url, n_genotypes, temporary_directory
 
 
 def directory_with_file_scheme() -> str:
@@ -71,6 +71,13 @@ def test_non_local_filesystem(mocker):
     )
 
 
+def test_n_genotypes():
+    assert n_genotypes(2, 1) == 2
+    assert n_genotypes(2, 2) == 3
+    assert n_genotypes(3, 2) == 6
+    assert n_genotypes(4, 3) == 20
+
+
 def test_build_url():
     assert build_url("http://host/path", "subpath") == "http://host/path/subpath"
     assert build_url("http://host/path/", "subpath") == "http://host/path/subpath"
@@ -0,0 +1,165 @@
+import subprocess
+import sys
+
+import pytest
+import xarray as xr
+from xarray.testing import assert_identical
+
+from sgkit_vcf import (
+    BatchPlan,
+    merge_parts,
+    partition_into_regions,
+    plan_batch_conversion,
+    run_part,
+    vcf_batch,
+    vcf_to_zarr,
+)
+from sgkit_vcf.cli import main
+from sgkit_vcf.tests.utils import path_for_test, write_sample_batches
+from sgkit_vcf.vcf_batch import is_part_done
+from sgkit_vcf.vcf_generator import generate_vcf
+
+
+def test_batch_conversion(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    regions = partition_into_regions(path, num_parts=4)
+    assert regions is not None
+    # a region with no variants doesn't have a part store
+    regions = regions + ["22"]
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    plan = plan_batch_conversion(
+        path,
+        output,
+        tempdir=tmp_path / "parts",
+        regions=regions,
+        chunk_length=5_000,
+        temp_chunk_length=2_500,
+        fields=["INFO/DP"],
+        compute_stats=True,
+    )
+    plan_path = tmp_path / "plan.json"
+    plan.save(plan_path)
+    plan = BatchPlan.load(plan_path)
+    assert [part.region for part in plan.parts] == regions
+    assert plan.options.fields == ["INFO/DP"]
+
+    # parts can be converted in any order, but must all be converted before merging
+    for i in reversed(range(1, len(plan.parts))):
+        run_part(plan, i)
+    assert not is_part_done(plan, 0)
+    with pytest.raises(ValueError, match=r"Parts have not been converted: \[0\]"):
+        merge_parts(plan)
+    run_part(plan, 0)
+    merge_parts(plan)
+
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(
+        path,
+        expected_output,
+        regions=regions[:-1],
+        chunk_length=5_000,
+        temp_chunk_length=2_500,
+        fields=["INFO/DP"],
+        compute_stats=True,
+    )
+    assert_identical(
+        xr.open_zarr(output).compute(),  # type: ignore[no-untyped-call]
+        xr.open_zarr(expected_output).compute(),  # type: ignore[no-untyped-call]
+    )
+
+
+def test_batch_conversion__merge_samples(tmp_path):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(path, n_variants=500, n_samples=5, contigs=2, num_workers=1)
+    batches = [tmp_path / f"batch-{i}.vcf.gz" for i in range(2)]
+    write_sample_batches(path, list(zip(batches, [[0, 1], [2, 3, 4]])))
+    regions = partition_into_regions(path, num_parts=3)
+    output = tmp_path.joinpath("merged.zarr").as_posix()
+
+    plan = plan_batch_conversion(
+        batches,
+        output,
+        tempdir=tmp_path / "parts",
+        regions=regions,
+        chunk_length=200,
+        chunk_width=2,
+        merge_samples=True,
+    )
+    assert len(plan.parts) == 2 * len(regions)
+    for i in range(len(plan.parts)):
+        run_part(plan, i)
+    merge_parts(plan)
+
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(path, expected_output, regions=regions, chunk_length=200, chunk_width=2)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    assert ds["sample_id"].values.tolist() == expected["sample_id"].values.tolist()
+    assert (ds["call_genotype"].values == expected["call_genotype"].values).all()
+
+
+def test_run_part__retry(shared_datadir, tmp_path, monkeypatch):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    plan = plan_batch_conversion(path, output, tempdir=tmp_path / "parts")
+    run_part(plan, 0)
+    assert is_part_done(plan, 0)
+
+    def convert_part_and_fail(*args, **kwargs):  # type: ignore
+        convert_part(*args, **kwargs)
+        raise RuntimeError("Job killed")
+
+    # a retry that fails partway leaves the part not done
+    convert_part = vcf_batch._convert_part
+    monkeypatch.setattr(vcf_batch, "_convert_part", convert_part_and_fail)
+    with pytest.raises(RuntimeError, match="Job killed"):
+        run_part(plan, 0)
+    assert not is_part_done(plan, 0)
+    with pytest.raises(ValueError, match=r"Parts have not been converted: \[0\]"):
+        merge_parts(plan)
+
+    monkeypatch.undo()
+    run_part(plan, 0)
+    merge_parts(plan)
+    assert xr.open_zarr(output).sizes["variants"] == 9  # type: ignore[no-untyped-call]
+
+
+def test_batch_plan__invalid(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    with pytest.raises(ValueError, match="must evenly divide"):
+        plan_batch_conversion(
+            path, "out.zarr", tempdir=tmp_path, chunk_length=10, temp_chunk_length=3
+        )
+
+    plan = plan_batch_conversion(path, "out.zarr", tempdir=tmp_path)
+    with pytest.raises(ValueError, match="Part index must be between 0 and 0: 1"):
+        run_part(plan, 1)
+
+    text = plan.to_json().replace('"version": 1', '"version": 2')
+    with pytest.raises(ValueError, match="Unsupported batch plan version 2"):
+        BatchPlan.from_json(text)
+
+
+def test_cli(shared_datadir, tmp_path, capsys):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    plan = plan_batch_conversion(
+        path, output, tempdir=tmp_path / "parts", regions=["20", "21"]
+    )
+    plan_path = str(tmp_path / "plan.json")
+    plan.save(plan_path)
+
+    assert main(["merge", plan_path]) == 1
+    assert "Parts have not been converted: [0, 1]" in capsys.readouterr().err
+
+    assert main(["run-part", plan_path, "0"]) == 0
+    # run the module, as a batch job would
+    subprocess.run(
+        [sys.executable, "-m", "sgkit_vcf", "run-part", plan_path, "1"], check=True
+    )
+    assert main(["merge", plan_path]) == 0
+    assert "Merged 2 parts" in capsys.readouterr().out
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["variants"] == 19910
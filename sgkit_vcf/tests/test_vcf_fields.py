@@ -0,0 +1,212 @@
+import numpy as np
+import pytest
+from cyvcf2 import VCF
+from numcodecs import Blosc
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf.vcf_fields import FieldEncoding, VcfField, get_vcf_fields
+
+
+def test_get_vcf_fields(shared_datadir):
+    vcf = VCF(str(shared_datadir / "sample.vcf.gz"))
+
+    assert get_vcf_fields(vcf) == []
+
+    fields = get_vcf_fields(vcf, ["INFO/*", "FORMAT/*"], exclude_fields=["INFO/A?"])
+    assert [f.name for f in fields] == [
+        "variant_NS",
+        "variant_DP",
+        "variant_DB",
+        "variant_H2",
+        "call_GQ",
+        "call_DP",
+        "call_HQ",
+    ]
+
+    (field,) = get_vcf_fields(vcf, ["FORMAT/HQ"])
+    assert field == VcfField(
+        category="FORMAT",
+        key="HQ",
+        vcf_number="2",
+        vcf_type="Integer",
+        description="Haplotype Quality",
+        dimension=2,
+    )
+    assert field.dims == ["variants", "samples", "FORMAT_HQ_dim"]
+    assert field.shape(3) == (3, 2)
+
+    (field,) = get_vcf_fields(vcf, ["INFO/DB"])
+    assert field.dims == ["variants"]
+    assert field.dtype == "bool"
+    assert field.compressor == Blosc(cname="zstd", clevel=7, shuffle=Blosc.BITSHUFFLE)
+
+
+@pytest.mark.parametrize(
+    "number,dimension,dimension_name",
+    [
+        ("A", 3, "alt_alleles"),
+        ("R", 4, "alleles"),
+        ("G", 10, "genotypes"),
+        ("5", 5, "INFO_AC_dim"),
+    ],
+)
+def test_get_vcf_fields__field_defs(shared_datadir, number, dimension, dimension_name):
+    vcf = VCF(str(shared_datadir / "sample.vcf.gz"))
+
+    (field,) = get_vcf_fields(
+        vcf, ["INFO/AC"], field_defs={"INFO/AC": {"Number": number}}
+    )
+
+    assert field.dimension == dimension
+    assert field.dims == ["variants", dimension_name]
+
+    (field,) = get_vcf_fields(
+        vcf, ["INFO/AC"], field_defs={"INFO/AC": {"dimension": 2, "Type": "Float"}}
+    )
+    assert field.shape(3) == (2,)
+    assert field.dtype == "f4"
+
+
+def test_get_vcf_fields__invalid(shared_datadir):
+    vcf = VCF(str(shared_datadir / "sample.vcf.gz"))
+
+    # genotypes are always extracted
+    assert get_vcf_fields(vcf, ["FORMAT/GT"]) == []
+
+    with pytest.raises(ValueError, match=r"must be of the form .*: DP"):
+        get_vcf_fields(vcf, ["DP"])
+    with pytest.raises(ValueError, match=r"must be of the form .*: FILTER/q10"):
+        get_vcf_fields(vcf, ["INFO/DP"], exclude_fields=["FILTER/q10"])
+    with pytest.raises(ValueError, match=r"Field INFO/XX is not defined"):
+        get_vcf_fields(vcf, ["INFO/XX"])
+    with pytest.raises(ValueError, match=r"INFO/AC has Number=., so its dimension"):
+        get_vcf_fields(vcf, ["INFO/*"])
+
+
+def test_vcf_field_decode(shared_datadir):
+    vcf = VCF(str(shared_datadir / "sample.vcf.gz"))
+    field_defs = {"INFO/AF": {"Number": "A"}, "INFO/AC": {"Number": "2"}}
+    fields = get_vcf_fields(
+        vcf,
+        ["INFO/AA", "INFO/AC", "INFO/AF", "FORMAT/DP", "FORMAT/HQ"],
+        None,
+        field_defs,
+    )
+    buffers = {f.name: np.empty((9,) + f.shape(3), dtype=f.dtype) for f in fields}
+
+    for i, variant in enumerate(vcf):
+        for field in fields:
+            field.decode(variant, buffers[field.name], i)
+
+    assert_array_equal(
+        buffers["variant_AA"], [".", ".", ".", ".", "T", "T", "G", ".", "."]
+    )
+    assert_array_equal(buffers["variant_AC"][5:7], [[-1, -1], [3, 1]])
+    assert_array_equal(
+        buffers["variant_AF"][3:5],
+        np.array([[0.017, np.nan, np.nan], [0.333, 0.667, np.nan]], dtype="f4"),
+    )
+    assert_array_equal(buffers["call_DP"][5], [-1, 4, 2])
+    assert_array_equal(buffers["call_HQ"][2], [[51, 51], [51, 51], [-1, -1]])
+    assert_array_equal(buffers["call_HQ"][7], [[-1, -1], [-1, -1], [-1, -1]])
+
+
+def test_vcf_field_decode__strings(shared_datadir):
+    vcf = VCF(str(shared_datadir / "CEUTrio.20.21.gatk3.4.g.vcf.bgz"))
+    fields = get_vcf_fields(
+        vcf,
+        ["FORMAT/PGT", "FORMAT/PID"],
+        field_defs={"FORMAT/PID": {"Number": "2"}},
+    )
+    buffers = {f.name: np.empty((1,) + f.shape(1), dtype=f.dtype) for f in fields}
+
+    for variant in vcf("20:10001661-10001661"):
+        for field in fields:
+            field.decode(variant, buffers[field.name], 0)
+
+    assert_array_equal(buffers["call_PGT"], [["0|1"]])
+    assert_array_equal(buffers["call_PID"], [[["10001661_T_C", ""]]])
+
+
+def test_vcf_field_encoding(shared_datadir):
+    vcf = VCF(str(shared_datadir / "sample.vcf.gz"))
+    field_defs = {
+        "INFO/AF": {"Number": "A", "dtype": "f2"},
+        "INFO/AC": {"Number": "2", "scale": 0.5, "Type": "Float", "max_value": 1000},
+        "FORMAT/GQ": {"max_value": 45},
+        "FORMAT/DP": {"dtype": "i2"},
+        "FORMAT/HQ": {"max_value": 1000},
+    }
+    fields = get_vcf_fields(
+        vcf,
+        ["INFO/AC", "INFO/AF", "FORMAT/GQ", "FORMAT/DP", "FORMAT/HQ"],
+        None,
+        field_defs,
+    )
+    assert [f.dtype for f in fields] == ["i2", "f2", "i1", "i2", "i2"]
+    assert fields[0].attrs == dict(
+        comment="Allele count in genotypes, for each ALT allele, in the same order as listed",
+        scale=0.5,
+        missing=-32768,
+        fill=-32767,
+    )
+    assert fields[2].compressor.shuffle == Blosc.BITSHUFFLE
+    assert fields[3].compressor.shuffle == Blosc.SHUFFLE
+
+    buffers = {f.name: np.empty((9,) + f.shape(3), dtype=f.dtype) for f in fields}
+    for i, variant in enumerate(vcf):
+        for field in fields:
+            field.decode(variant, buffers[field.name], i)
+
+    assert_array_equal(buffers["variant_AC"][5:7], [[-32768, -32768], [6, 2]])
+    assert_array_equal(
+        buffers["variant_AF"][3:5],
+        np.array([[0.017, np.nan, np.nan], [0.333, 0.667, np.nan]], dtype="f2"),
+    )
+    # capped at 45
+    assert_array_equal(
+        buffers["call_GQ"][2:5], [[45, 45, 43], [45, 3, 41], [21, 2, 35]]
+    )
+    assert_array_equal(buffers["call_DP"][5], [-1, 4, 2])
+    assert_array_equal(buffers["call_HQ"][2], [[51, 51], [51, 51], [-1, -1]])
+
+
+def test_vcf_field_encoding__quantize():
+    field = VcfField(
+        category="INFO",
+        key="AB",
+        vcf_number="1",
+        vcf_type="Float",
+        description="Allele balance",
+        dimension=None,
+        encoding=FieldEncoding(scale=0.01, max_value=1.0),
+    )
+    assert field.dtype == "i1"
+
+    values = np.array([0.0, 0.123, 0.5, 0.996, 1.5, np.nan])
+    encoded = field._encode(values)
+    assert_array_equal(encoded, [0, 12, 50, 100, 100, -128])
+    # the error is at most half the scale
+    assert np.all(np.abs(encoded[:4] * 0.01 - values[:4]) <= 0.005)
+
+    # values that don't fit are capped at the dtype maximum, or just above the minimum
+    field = VcfField("INFO", "DP", "1", "Integer", "", None, FieldEncoding(dtype="i1"))
+    assert_array_equal(field._encode(np.array([-1, 5, 1000])), [-1, 5, 127])
+    assert_array_equal(field._encode(np.array([-2, -126, -200])), [-2, -126, -126])
+    field = VcfField("INFO", "AF", "1", "Float", "", None, FieldEncoding(dtype="f2"))
+    assert_array_equal(field._encode(np.array([1e6])).astype("f2"), [65504])
+
+
+def test_vcf_field_encoding__invalid(shared_datadir):
+    vcf = VCF(str(shared_datadir / "sample.vcf.gz"))
+
+    with pytest.raises(ValueError, match=r"Only Float fields can be quantized"):
+        get_vcf_fields(vcf, ["INFO/DP"], field_defs={"INFO/DP": {"scale": 0.1}})
+    with pytest.raises(ValueError, match=r"cannot be stored with dtype u1"):
+        get_vcf_fields(vcf, ["INFO/DP"], field_defs={"INFO/DP": {"dtype": "u1"}})
+    with pytest.raises(ValueError, match=r"cannot be stored with dtype i2"):
+        get_vcf_fields(
+            vcf, ["INFO/AF"], field_defs={"INFO/AF": {"Number": "A", "dtype": "i2"}}
+        )
+    with pytest.raises(ValueError, match=r"cannot be stored with dtype i1"):
+        get_vcf_fields(vcf, ["INFO/AA"], field_defs={"INFO/AA": {"dtype": "i1"}})
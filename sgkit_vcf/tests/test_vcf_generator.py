@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import xarray as xr
+from cyvcf2 import VCF
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import partition_into_regions, vcf_to_zarr
+from sgkit_vcf.csi import read_csi
+from sgkit_vcf.tbi import read_tabix
+from sgkit_vcf.utils import n_genotypes
+from sgkit_vcf.vcf_generator import generate_vcf
+from sgkit_vcf.vcf_reader import count_variants
+
+
+@pytest.mark.parametrize("suffix", [".vcf.gz", ".bcf"])
+def test_generate_vcf(tmp_path, suffix):
+    path = tmp_path / f"sim{suffix}"
+    generate_vcf(
+        path,
+        n_variants=500,
+        n_samples=5,
+        contigs=["chr1", "chr2"],
+        max_alt_alleles=3,
+        missing_rate=0.1,
+        phased_rate=0.5,
+        info_fields=["AC", "AN", "AF", "DP", "DB", "AA"],
+        format_fields=["GT", "DP", "GQ", "AD", "PL"],
+        num_workers=1,
+    )
+
+    vcf = VCF(str(path))
+    assert vcf.seqnames == ["chr1", "chr2"]
+    assert len(vcf.samples) == 5
+    records = list(vcf)
+    assert len(records) == 500
+    for record in records:
+        n_alleles = 1 + len(record.ALT)
+        assert 2 <= n_alleles <= 4
+        gt = record.genotype.array()[:, :2]
+        called = gt[gt >= 0]
+        ac = np.bincount(called, minlength=n_alleles)
+        assert list(np.atleast_1d(record.INFO["AC"])) == list(ac[1:])
+        assert record.INFO["AN"] == len(called)
+        assert record.format("AD").shape == (5, n_alleles)
+        assert record.format("PL").shape == (5, n_genotypes(n_alleles, 2))
+
+    # the index can be used for region queries
+    assert count_variants(path, "chr1") == 250
+    assert count_variants(path, "chr2") == 250
+    regions = partition_into_regions(path, num_parts=4)
+    assert regions is not None
+    assert sum(count_variants(path, region) for region in regions) == 500
+
+
+def test_generate_vcf__index(tmp_path):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(path, n_variants=100, contigs=3, index="csi", num_workers=1)
+    assert not (tmp_path / "sim.vcf.gz.tbi").exists()
+    assert read_csi(str(path) + ".csi").record_counts == [34, 33, 33]
+
+    generate_vcf(path, n_variants=100, contigs=3, num_workers=1)
+    assert read_tabix(str(path) + ".tbi").record_counts == [34, 33, 33]
+
+
+def test_generate_vcf__deterministic(tmp_path):
+    paths = [tmp_path / f"sim{i}.vcf.gz" for i in range(3)]
+    generate_vcf(paths[0], n_variants=1000, contigs=4, seed=1, num_workers=1)
+    generate_vcf(paths[1], n_variants=1000, contigs=4, seed=1, num_workers=2)
+    generate_vcf(paths[2], n_variants=1000, contigs=4, seed=2, num_workers=1)
+    assert paths[0].read_bytes() == paths[1].read_bytes()
+    assert paths[0].read_bytes() != paths[2].read_bytes()
+
+
+def test_generate_vcf__vcf_to_zarr(tmp_path):
+    path = tmp_path / "sim.vcf.gz"
+    output = tmp_path / "sim.zarr"
+    generate_vcf(
+        path,
+        n_variants=200,
+        n_samples=4,
+        max_alt_alleles=3,
+        missing_rate=0.2,
+        phased_rate=0.5,
+        num_workers=1,
+    )
+    vcf_to_zarr(path, output)
+    ds = xr.open_zarr(str(output))  # type: ignore[no-untyped-call]
+
+    records = list(VCF(str(path)))
+    gt = np.stack([r.genotype.array() for r in records])
+    assert_array_equal(ds["call_genotype"].values, gt[:, :, :2])
+    assert_array_equal(ds["call_genotype_phased"].values, gt[:, :, 2].astype(bool))
+    assert_array_equal(ds["variant_position"].values, [r.POS for r in records])
+
+
+@pytest.mark.parametrize("ploidy", [1, 3])
+def test_generate_vcf__ploidy(tmp_path, ploidy):
+    path = tmp_path / "sim.vcf.gz"
+    # more than 10 alleles exercises the general genotype formatting
+    generate_vcf(
+        path,
+        n_variants=100,
+        n_samples=4,
+        ploidy=ploidy,
+        max_alt_alleles=12,
+        missing_rate=0.2,
+        format_fields=["GT", "PL"],
+        num_workers=1,
+    )
+    for record in VCF(str(path)):
+        n_alleles = 1 + len(record.ALT)
+        assert record.genotype.array().shape == (4, ploidy + 1)
+        assert record.format("PL").shape == (4, n_genotypes(n_alleles, ploidy))
+
+
+def test_generate_vcf__invalid_arguments(tmp_path):
+    with pytest.raises(ValueError, match=r"Index must be one of"):
+        generate_vcf(tmp_path / "sim.vcf.gz", index="bai")
+    with pytest.raises(ValueError, match=r"BCF files can only be indexed with csi"):
+        generate_vcf(tmp_path / "sim.bcf", index="tbi")
+    with pytest.raises(ValueError, match=r"Unknown INFO field: XX"):
+        generate_vcf(tmp_path / "sim.vcf.gz", info_fields=["XX"])
+    with pytest.raises(ValueError, match=r"Unknown FORMAT field: XX"):
+        generate_vcf(tmp_path / "sim.vcf.gz", format_fields=["XX"])
@@ -0,0 +1,182 @@
+import threading
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import iter_vcf_chunks, partition_into_regions, read_vcf
+from sgkit_vcf.tests.utils import path_for_test, write_mixed_ploidy_vcf
+
+
+def concat_chunks(chunks):
+    return {var: np.concatenate([chunk[var] for chunk in chunks]) for var in chunks[0]}
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_iter_vcf_chunks(shared_datadir, is_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz", is_path)
+    regions = partition_into_regions(path, num_parts=4)
+
+    chunks = list(iter_vcf_chunks(path, regions=regions, chunk_length=1000))
+
+    # chunks never span regions
+    assert [len(c["variant_position"]) for c in chunks[:5]] == [1000] * 3 + [450, 1000]
+    assert len(chunks) == 4 + 2 + 5 + 6 + 6
+
+    expected = read_vcf(path, regions=regions)
+    actual = concat_chunks(chunks)
+    assert set(actual) == set(expected.variables) - {"sample_id", "call_genotype_mask"}
+    for var, values in actual.items():
+        assert_array_equal(values, expected[var].values)
+
+
+def test_iter_vcf_chunks__no_regions(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+
+    assert list(iter_vcf_chunks(path, regions=[])) == []
+    assert list(iter_vcf_chunks([path, path], regions=[[], []])) == []
+
+
+def test_iter_vcf_chunks__variables(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+
+    chunks = list(
+        iter_vcf_chunks(
+            path, regions="20", variables=["variant_position", "variant_id"]
+        )
+    )
+
+    assert len(chunks) == 1
+    assert set(chunks[0]) == {"variant_position", "variant_id", "variant_id_mask"}
+    assert chunks[0]["variant_position"].shape == (3450,)
+
+    with pytest.raises(ValueError, match=r"Unknown variables: \['call_DP'\]"):
+        next(iter_vcf_chunks(path, variables=["variant_position", "call_DP"]))
+
+    # only the requested variables of the requested fields are decoded
+    chunks = list(
+        iter_vcf_chunks(
+            path,
+            regions="20",
+            fields=["FORMAT/DP", "FORMAT/GQ"],
+            variables=["variant_position", "call_DP"],
+        )
+    )
+    assert set(chunks[0]) == {"variant_position", "call_DP"}
+    assert chunks[0]["call_DP"].shape == (3450, 1)
+
+
+def test_iter_vcf_chunks__recycle_buffers(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    expected = read_vcf(path)["variant_position"].values
+
+    buffers = set()
+    positions = []
+    for chunk in iter_vcf_chunks(path, chunk_length=500, recycle_buffers=True):
+        buffers.add(id(chunk["variant_position"].base))
+        positions.append(chunk["variant_position"].copy())
+
+    # at most one buffer for the caller, one being decoded, and one prefetched
+    assert len(buffers) <= 3
+    assert_array_equal(np.concatenate(positions), expected)
+
+
+def test_iter_vcf_chunks__num_workers(shared_datadir):
+    paths = [
+        path_for_test(shared_datadir, "CEUTrio.20.gatk3.4.g.vcf.bgz"),
+        path_for_test(shared_datadir, "CEUTrio.21.gatk3.4.g.vcf.bgz"),
+    ]
+    regions = [partition_into_regions(path, num_parts=4) for path in paths]
+
+    chunks = list(
+        iter_vcf_chunks(
+            paths, regions=regions, chunk_length=1000, prefetch=4, num_workers=4
+        )
+    )
+
+    actual = concat_chunks(chunks)
+    expected = read_vcf(paths, regions=regions)
+    order = np.lexsort((actual["variant_position"], actual["variant_contig"]))
+    for var, values in actual.items():
+        assert_array_equal(values[order], expected[var].values)
+
+
+def test_iter_vcf_chunks__close(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    regions = partition_into_regions(path, num_parts=4)
+    n_threads = threading.active_count()
+
+    it = iter_vcf_chunks(path, regions=regions, chunk_length=100, num_workers=2)
+    next(it)
+    assert threading.active_count() == n_threads + 2
+    it.close()
+
+    assert threading.active_count() == n_threads
+
+
+def test_iter_vcf_chunks__worker_error(shared_datadir):
+    paths = [
+        path_for_test(shared_datadir, "CEUTrio.20.gatk3.4.g.vcf.bgz"),
+        path_for_test(shared_datadir, "no-such-file.vcf.gz"),
+    ]
+
+    with pytest.raises(OSError):
+        list(iter_vcf_chunks(paths))
+
+
+@pytest.mark.parametrize(
+    "vcf_file",
+    ["CEUTrio.20.21.gatk3.4.g.bcf", "CEUTrio.20.21.gatk3.4.g.vcf.bgz"],
+)
+def test_iter_vcf_chunks__native(shared_datadir, vcf_file):
+    path = path_for_test(shared_datadir, vcf_file)
+    regions = partition_into_regions(path, num_parts=4)
+
+    # the chunks are copied, since their buffers are recycled
+    chunks = [
+        {var: array.copy() for var, array in chunk.items()}
+        for chunk in iter_vcf_chunks(
+            path,
+            regions=regions,
+            chunk_length=1000,
+            engine="native",
+            variables=["variant_position", "call_genotype"],
+            recycle_buffers=True,
+        )
+    ]
+
+    expected = read_vcf(path, regions=regions)
+    actual = concat_chunks(chunks)
+    assert set(actual) == {"variant_position", "call_genotype"}
+    for var, values in actual.items():
+        assert_array_equal(values, expected[var].values)
+
+
+def test_iter_vcf_chunks__mixed_ploidy(tmp_path):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+
+    with pytest.raises(ValueError, match=r"Variant at 3:100 has a call with ploidy 3"):
+        list(iter_vcf_chunks(path))
+
+    chunks = list(iter_vcf_chunks(path, alt_number=None, ploidy=None))
+    expected = read_vcf(path, ploidy=None)
+    actual = concat_chunks(chunks)
+    assert actual["variant_allele"].shape == (6, 2)
+    assert actual["call_genotype"].shape == (6, 2, 3)
+    assert_array_equal(actual["call_genotype"], expected["call_genotype"].values)
+
+
+def test_iter_vcf_chunks__invalid_arguments(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+
+    with pytest.raises(ValueError, match=r"chunk_length must be at least 1: 0"):
+        next(iter_vcf_chunks(path, chunk_length=0))
+    with pytest.raises(ValueError, match=r"prefetch must be at least 1: 0"):
+        next(iter_vcf_chunks(path, prefetch=0))
+    with pytest.raises(ValueError, match=r"num_workers must be at least 1: 0"):
+        next(iter_vcf_chunks(path, num_workers=0))
+    with pytest.raises(ValueError, match=r"Engine must be one of"):
+        next(iter_vcf_chunks(path, engine="htslib"))
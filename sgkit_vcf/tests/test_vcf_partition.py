@@ -1,7 +1,16 @@
 import pytest
 
 from sgkit_vcf.tests.utils import path_for_test
-from sgkit_vcf.vcf_partition import partition_into_regions
+from sgkit_vcf.utils import get_file_length
+from sgkit_vcf.vcf_partition import (
+    estimate_region_sizes,
+    estimate_region_variant_counts,
+    get_vcf_file_infos,
+    parse_region,
+    partition_files_into_regions,
+    partition_into_regions,
+    split_region,
+)
 from sgkit_vcf.vcf_reader import count_variants
 
 
@@ -106,3 +115,150 @@ def test_partition_into_regions__missing_index(shared_datadir, is_path):
     )
     with pytest.raises(ValueError, match=r"Only .tbi or .csi indexes are supported."):
         partition_into_regions(vcf_path, index_path=bogus_index_path, num_parts=2)
+
+
+def test_get_vcf_file_infos(shared_datadir):
+    vcf_files = [
+        "CEUTrio.20.21.gatk3.4.g.vcf.bgz",
+        "CEUTrio.20.21.gatk3.4.g.bcf",
+        "CEUTrio.20.21.gatk3.4.noindex.g.vcf.bgz",
+    ]
+    vcf_paths = [path_for_test(shared_datadir, f) for f in vcf_files]
+
+    infos = get_vcf_file_infos(vcf_paths)
+    assert [info.path for info in infos] == [str(p) for p in vcf_paths]
+    assert [info.size for info in infos] == [get_file_length(p) for p in vcf_paths]
+    assert [info.index_path for info in infos] == [
+        f"{vcf_paths[0]}.tbi",
+        f"{vcf_paths[1]}.csi",
+        None,
+    ]
+    assert get_vcf_file_infos([]) == []
+
+    with pytest.raises(FileNotFoundError, match="missing.vcf.gz"):
+        get_vcf_file_infos(vcf_paths + [shared_datadir / "missing.vcf.gz"])
+
+
+def test_get_vcf_file_infos__async(shared_datadir):
+    pytest.importorskip("fsspec.implementations.asyn_wrapper")
+    vcf_path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    # the local filesystem, wrapped in an async filesystem
+    url = f"async_wrapper://{vcf_path}"
+    storage_options = dict(target_protocol="file", target_options={})
+
+    infos = get_vcf_file_infos([url] * 10, storage_options=storage_options)  # type: ignore[arg-type]
+    assert all(info.size == get_file_length(vcf_path) for info in infos)
+    assert all(info.index_path == f"{url}.tbi" for info in infos)
+
+    regions = partition_files_into_regions(
+        [url, url], num_parts=4, storage_options=storage_options  # type: ignore[arg-type]
+    )
+    assert regions == [partition_into_regions(vcf_path, num_parts=4)] * 2
+
+
+def test_partition_files_into_regions(shared_datadir):
+    vcf_paths = [
+        path_for_test(shared_datadir, "CEUTrio.20.gatk3.4.g.vcf.bgz"),
+        path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf"),
+    ]
+    assert partition_files_into_regions(vcf_paths, num_parts=3) == [
+        partition_into_regions(vcf_path, num_parts=3) for vcf_path in vcf_paths
+    ]
+    assert partition_files_into_regions(vcf_paths, target_part_size=10**9) == [
+        None,
+        None,
+    ]
+
+
+def test_parse_region():
+    assert parse_region("20") == ("20", 1, None)
+    assert parse_region("20:100-") == ("20", 100, None)
+    assert parse_region("20:100-200") == ("20", 100, 200)
+    assert parse_region("HLA-A*01:01:100-200") == ("HLA-A*01:01", 100, 200)
+
+
+@pytest.mark.parametrize(
+    "vcf_file",
+    [
+        "CEUTrio.20.21.gatk3.4.g.bcf",
+        "CEUTrio.20.21.gatk3.4.g.vcf.bgz",
+        "CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz",
+    ],
+)
+def test_estimate_region_sizes(shared_datadir, vcf_file):
+    vcf_path = path_for_test(shared_datadir, vcf_file)
+    file_length = get_file_length(vcf_path)
+
+    regions = partition_into_regions(vcf_path, num_parts=4)
+    assert regions is not None
+    sizes = estimate_region_sizes(vcf_path, regions)
+    assert all(size > 0 for size in sizes)
+    assert sum(sizes) <= file_length
+
+    # larger regions have larger estimates
+    size_20, size_21 = estimate_region_sizes(vcf_path, ["20", "21"])
+    assert count_variants(vcf_path, "20") < count_variants(vcf_path, "21")
+    assert 0 < size_20 < size_21
+
+    assert estimate_region_sizes(vcf_path, [None, "X"]) == [file_length, 0]
+    assert estimate_region_sizes(vcf_path, [None]) == [file_length]
+
+
+@pytest.mark.parametrize(
+    "vcf_file",
+    [
+        "CEUTrio.20.21.gatk3.4.g.bcf",
+        "CEUTrio.20.21.gatk3.4.g.vcf.bgz",
+        "CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz",
+    ],
+)
+def test_estimate_region_variant_counts(shared_datadir, vcf_file):
+    vcf_path = path_for_test(shared_datadir, vcf_file)
+    regions = partition_into_regions(vcf_path, num_parts=8)
+    assert regions is not None
+
+    # whole contigs are exact
+    assert estimate_region_variant_counts(vcf_path, [None, "20", "21", "22"]) == [
+        19910,
+        count_variants(vcf_path, "20"),
+        count_variants(vcf_path, "21"),
+        0,
+    ]
+    counts = estimate_region_variant_counts(vcf_path, regions)
+    assert counts is not None
+    # other regions are only as accurate as the index, but add up to about the total
+    assert sum(counts) == pytest.approx(19910, rel=0.05)
+    assert all(count > 0 for count in counts)
+
+
+@pytest.mark.parametrize(
+    "vcf_file",
+    [
+        "CEUTrio.20.21.gatk3.4.g.bcf",
+        "CEUTrio.20.21.gatk3.4.g.vcf.bgz",
+        "CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz",
+    ],
+)
+@pytest.mark.parametrize(
+    "region", [None, "21", "21:10010625-", "21:10010625-10200000"],
+)
+def test_split_region(shared_datadir, vcf_file, region):
+    vcf_path = path_for_test(shared_datadir, vcf_file)
+
+    sub_regions = split_region(vcf_path, region, 4)
+
+    assert sub_regions is not None
+    assert 1 < len(sub_regions) <= 5
+    sub_region_counts = [count_variants(vcf_path, r) for r in sub_regions]
+    assert sum(sub_region_counts) == count_variants(vcf_path, region)
+
+
+def test_split_region__unsplittable(shared_datadir):
+    vcf_path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+
+    assert split_region(vcf_path, "21", 1) is None
+    assert split_region(vcf_path, "21:1-100", 4) is None
+    assert split_region(vcf_path, "X", 4) is None
+
+    with pytest.raises(ValueError, match=r"num_parts must be positive"):
+        split_region(vcf_path, "21", 0)
@@ -0,0 +1,93 @@
+from typing import Dict
+
+import pytest
+
+from sgkit_vcf import partition_into_regions, plan_vcf_to_zarr, vcf_to_zarr
+from sgkit_vcf.tests.utils import path_for_test, write_sample_batches
+from sgkit_vcf.vcf_generator import generate_vcf
+
+
+def store_size(store: Dict[str, bytes]) -> int:
+    return sum(len(value) for value in store.values())
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_plan_vcf_to_zarr(tmp_path, partitioned):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(
+        path,
+        n_variants=5000,
+        n_samples=50,
+        contigs=2,
+        max_alt_alleles=3,
+        missing_rate=0.1,
+        num_workers=1,
+    )
+    regions = partition_into_regions(path, num_parts=4) if partitioned else None
+
+    plan = plan_vcf_to_zarr(path, regions=regions, chunk_length=1000, chunk_width=20)
+    assert [part.region for part in plan.parts] == (regions or [None])
+    assert plan.n_samples == 50
+    assert plan.variants == 5000
+    assert plan.part_memory_bytes > 0
+    if partitioned:
+        assert plan.merge_tasks == 5 * 3
+        assert plan.merge_memory_bytes > 0
+        assert plan.temp_bytes > 0
+    else:
+        assert plan.merge_tasks == 0
+        assert plan.temp_bytes == 0
+    assert plan.warnings == []
+
+    store: Dict[str, bytes] = {}
+    vcf_to_zarr(path, store, regions=regions, chunk_length=1000, chunk_width=20)
+    actual = store_size(store)
+    assert actual / 2 < plan.output_bytes < actual * 2
+
+
+def test_plan_vcf_to_zarr__memory_limit(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    regions = partition_into_regions(path, num_parts=4)
+
+    plan = plan_vcf_to_zarr(path, regions=regions, chunk_length=10_000)
+    assert plan.warnings == []
+
+    plan = plan_vcf_to_zarr(
+        path,
+        regions=regions,
+        chunk_length=10_000,
+        memory_limit=plan.peak_memory_bytes - 1,
+    )
+    assert len(plan.warnings) == 1
+
+    # smaller chunks for the parts need less memory
+    smaller_plan = plan_vcf_to_zarr(
+        path,
+        regions=regions,
+        chunk_length=10_000,
+        temp_chunk_length=1_000,
+        memory_limit=plan.peak_memory_bytes - 1,
+    )
+    assert smaller_plan.part_memory_bytes < plan.part_memory_bytes
+    assert smaller_plan.output_bytes == plan.output_bytes
+
+
+def test_plan_vcf_to_zarr__merge_samples(tmp_path):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(path, n_variants=1000, n_samples=7, contigs=3, num_workers=1)
+    batches = [tmp_path / f"batch-{i}.vcf.gz" for i in range(2)]
+    write_sample_batches(path, list(zip(batches, [[0, 1, 2], [3, 4, 5, 6]])))
+    regions = partition_into_regions(path, num_parts=4)
+
+    plan = plan_vcf_to_zarr(batches, regions=regions, merge_samples=True)
+    assert len(plan.parts) == 2 * len(regions)
+    assert plan.n_samples == 7
+    assert plan.variants == 1000
+
+
+def test_plan_vcf_to_zarr__invalid_options(shared_datadir):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    with pytest.raises(ValueError, match="must evenly divide"):
+        plan_vcf_to_zarr(path, chunk_length=10, temp_chunk_length=3)
+    with pytest.raises(ValueError, match="merge_samples cannot be combined"):
+        plan_vcf_to_zarr(path, merge_samples=True, sparse_hom_ref=True)
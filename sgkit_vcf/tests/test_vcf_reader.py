@@ -1,12 +1,38 @@
-from typing import MutableMapping
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, MutableMapping
 
 import numpy as np
 import pytest
 import xarray as xr
+from distributed import Client
 from numpy.testing import assert_array_equal
 
-from sgkit_vcf import partition_into_regions, vcf_to_zarr
-from sgkit_vcf.tests.utils import path_for_test
+from sgkit_vcf import (
+    partition_into_regions,
+    read_vcf,
+    vcf_reader,
+    vcf_to_zarr,
+    vcf_to_zarrs,
+)
+from sgkit_vcf.profiling import profile
+from sgkit_vcf.region_index import REGION_INDEX_VARIABLE
+from sgkit_vcf.tests.utils import (
+    path_for_test,
+    write_mixed_ploidy_vcf,
+    write_sample_batches,
+)
+from sgkit_vcf.vcf_generator import generate_vcf
+from sgkit_vcf.vcf_partition import estimate_region_sizes
+from sgkit_vcf.vcf_reader import (
+    StreamingMerge,
+    VcfPart,
+    _estimate_part_sizes,
+    _read_region,
+    max_alt_alleles,
+    max_ploidy,
+)
 
 
 @pytest.mark.parametrize(
@@ -297,3 +323,759 @@ def test_vcf_to_zarr__mutiple_partitioned_invalid_regions(
         match=r"multiple input regions must be a sequence of sequence of strings",
     ):
         vcf_to_zarr(paths, output, regions=regions, chunk_length=5_000)
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """A single-threaded executor that records the regions in the order they are submitted."""
+
+    def __init__(self) -> None:
+        super().__init__(max_workers=1)
+        self.regions: List[Any] = []
+
+    def submit(self, fn, part, *args, **kwargs):  # type: ignore
+        self.regions.append(part.region)
+        return super().submit(fn, part, *args, **kwargs)
+
+
+def delayed_call(delay, fn, *args, **kwargs):  # type: ignore
+    time.sleep(delay)
+    return fn(*args, **kwargs)
+
+
+class SlowExecutor(ThreadPoolExecutor):
+    """An executor that delays parts whose URLs match the given patterns, to simulate stragglers."""
+
+    def __init__(self, delays: Dict[str, float]) -> None:
+        super().__init__(max_workers=4)
+        self.delays = delays
+
+    def submit(self, fn, part, *args, **kwargs):  # type: ignore
+        for pattern, delay in self.delays.items():
+            if re.search(pattern, part.url):
+                return super().submit(delayed_call, delay, fn, part, *args, **kwargs)
+        return super().submit(fn, part, *args, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "executor_class", [ThreadPoolExecutor, ProcessPoolExecutor],
+)
+def test_vcf_to_zarr__parallel_executor(shared_datadir, tmp_path, executor_class):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf_concat.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+
+    with executor_class(max_workers=2) as executor:
+        vcf_to_zarr(
+            path,
+            output,
+            regions=regions,
+            chunk_length=5_000,
+            temp_chunk_length=2_500,
+            executor=executor,
+        )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    # the output is the same as when merging after all parts have completed
+    expected_output = tmp_path.joinpath("vcf_concat_dask.zarr").as_posix()
+    vcf_to_zarr(
+        path,
+        expected_output,
+        regions=regions,
+        chunk_length=5_000,
+        temp_chunk_length=2_500,
+    )
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    xr.testing.assert_identical(ds, expected)
+    for var in expected.variables:
+        assert ds[var].chunks == expected[var].chunks
+
+    assert ds["call_genotype"].shape == (19910, 1, 2)
+    assert ds["variant_allele"].dtype == "S48"
+    assert ds.attrs == {"contigs": ["20", "21"], "mixed_ploidy": False}
+
+
+def test_vcf_to_zarrs__executor_largest_first(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("parts").as_posix()
+    regions = ["20", "21"]
+
+    with RecordingExecutor() as executor:
+        parts = vcf_to_zarrs(path, output, regions, executor=executor)
+
+    # chromosome 21 has more variants, so it is submitted first...
+    assert executor.regions == ["21", "20"]
+    # ... but the parts are returned in region order
+    assert len(parts) == 2
+    for i, part in enumerate(parts):
+        assert part.endswith(f"part-{i}.zarr")
+        ds = xr.open_zarr(part)  # type: ignore[no-untyped-call]
+        assert ds["variant_contig"].values[0] == i
+
+
+def test_vcf_to_zarrs__dask_client(shared_datadir, tmp_path):
+    paths = [
+        path_for_test(shared_datadir, "CEUTrio.20.gatk3.4.g.vcf.bgz"),
+        path_for_test(shared_datadir, "CEUTrio.21.gatk3.4.g.vcf.bgz"),
+    ]
+    output = tmp_path.joinpath("vcf_concat.zarr").as_posix()
+
+    with Client(processes=False, n_workers=1) as client:
+        vcf_to_zarr(paths, output, chunk_length=5_000, executor=client)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    assert ds["call_genotype"].shape == (19910, 1, 2)
+
+
+def test_vcf_to_zarrs__executor_error(tmp_path):
+    path = tmp_path.joinpath("not_a.vcf")
+    path.write_text("not a VCF file")
+    output = tmp_path.joinpath("parts").as_posix()
+
+    with ThreadPoolExecutor() as executor, pytest.raises(OSError):
+        vcf_to_zarrs([path], output, None, executor=executor)
+
+
+def test_streaming_merge(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    regions = ["20", "21:1-10100000", "21:10100001-"]
+    counts = [3450, 6006, 10454]
+    parts = vcf_to_zarrs(path, tmp_path.joinpath("parts").as_posix(), regions)
+    output = tmp_path.joinpath("vcf_concat.zarr").as_posix()
+
+    # the chunk length divides the total number of variants, so there are no leftovers
+    merge = StreamingMerge(output, parts, chunk_length=1_810, chunk_width=1_000)
+
+    # nothing can be written until the first part completes
+    merge.part_completed(1)
+    assert not tmp_path.joinpath("vcf_concat.zarr").exists()
+
+    # whole chunks for the first two parts are written
+    merge.part_completed(0)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds["call_genotype"].shape == (9050, 1, 2)
+    assert "variant_allele" not in ds
+
+    with pytest.raises(ValueError, match=r"Not all parts have completed"):
+        merge.close()
+
+    merge.part_completed(2)
+    merge.close()
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds["call_genotype"].shape == (sum(counts), 1, 2)
+    assert ds["variant_allele"].shape == (sum(counts), 4)
+    assert ds.chunks["variants"] == (1_810,) * 11
+
+    # nothing is written until there is a whole chunk
+    output = tmp_path.joinpath("vcf_concat_large_chunks.zarr").as_posix()
+    merge = StreamingMerge(output, parts, chunk_length=5_000, chunk_width=1_000)
+    merge.part_completed(0)
+    assert not tmp_path.joinpath("vcf_concat_large_chunks.zarr").exists()
+
+
+def test_vcf_to_zarrs__straggler_split(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("parts").as_posix()
+    regions = ["20", "21"]
+
+    # the part for chromosome 21 is very slow, so the sub-parts finish first
+    with SlowExecutor({r"part-1\.zarr$": 2.0}) as executor:
+        parts = vcf_to_zarrs(
+            path, output, regions, executor=executor, straggler_factor=1.5
+        )
+
+    assert parts[0].endswith("part-0.zarr")
+    assert len(parts) > 2
+    for j, part in enumerate(parts[1:]):
+        assert part.endswith(f"part-1-{j}.zarr")
+    datasets = [xr.open_zarr(part) for part in parts]  # type: ignore[no-untyped-call]
+    assert sum(ds.sizes["variants"] for ds in datasets) == 19910
+
+
+def test_vcf_to_zarrs__straggler_not_split(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("parts").as_posix()
+    regions = ["20", "21"]
+
+    # the sub-parts are slower than the original part, so they are not used
+    with SlowExecutor({r"part-1\.zarr$": 0.5, r"part-1-\d\.zarr$": 2.0}) as executor:
+        parts = vcf_to_zarrs(
+            path, output, regions, executor=executor, straggler_factor=0
+        )
+
+    assert len(parts) == 2
+    assert parts[1].endswith("part-1.zarr")
+
+
+def test_vcf_to_zarr__straggler_merge(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf_concat.zarr").as_posix()
+    regions = ["20", "21"]
+
+    with SlowExecutor({r"part-1\.zarr$": 2.0}) as executor:
+        vcf_to_zarr(
+            path,
+            output,
+            regions=regions,
+            chunk_length=5_000,
+            executor=executor,
+            straggler_factor=1.5,
+        )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    expected_output = tmp_path.joinpath("vcf_concat_dask.zarr").as_posix()
+    vcf_to_zarr(path, expected_output, regions=regions, chunk_length=5_000)
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    xr.testing.assert_identical(ds, expected)
+
+
+def test_estimate_part_sizes(shared_datadir):
+    paths = [
+        path_for_test(shared_datadir, "CEUTrio.20.gatk3.4.g.vcf.bgz"),
+        path_for_test(shared_datadir, "CEUTrio.21.gatk3.4.g.vcf.bgz"),
+    ]
+    regions = [partition_into_regions(path, num_parts=2) for path in paths]
+    parts = [
+        VcfPart(path, region, f"part-{i}-{j}.zarr")
+        for i, (path, path_regions) in enumerate(zip(paths, regions))
+        for j, region in enumerate(path_regions)
+    ]
+
+    expected = [
+        size
+        for path, path_regions in zip(paths, regions)
+        for size in estimate_region_sizes(path, path_regions)
+    ]
+    assert _estimate_part_sizes(parts) == expected
+
+
+def test_vcf_to_zarr__straggler_cleanup(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf_concat.zarr").as_posix()
+    tempdir = tmp_path / "temp"
+    tempdir.mkdir()
+
+    # the abandoned original part is still running when the sub-parts are merged
+    with SlowExecutor({r"part-1\.zarr$": 2.0}) as executor:
+        vcf_to_zarr(
+            path,
+            output,
+            regions=["20", "21"],
+            executor=executor,
+            tempdir=str(tempdir),
+            straggler_factor=1.5,
+        )
+        assert list(tempdir.iterdir()) == []
+    # and it didn't write to the temporary directory after it was removed
+    assert list(tempdir.iterdir()) == []
+
+
+def test_vcf_to_zarr__merge_samples(tmp_path):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(
+        path,
+        n_variants=1000,
+        n_samples=7,
+        contigs=3,
+        max_alt_alleles=3,
+        missing_rate=0.1,
+        format_fields=["GT", "DP"],
+        num_workers=1,
+    )
+    # batches in different directories, with the same file name
+    batches = [tmp_path / d / "calls.vcf.gz" for d in "abc"]
+    for batch in batches:
+        batch.parent.mkdir()
+    write_sample_batches(path, list(zip(batches, [[0, 1, 2], [3, 4], [5, 6]])))
+    regions = partition_into_regions(path, num_parts=4)
+    output = tmp_path.joinpath("merged.zarr").as_posix()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        vcf_to_zarr(
+            batches,
+            output,
+            regions=regions,
+            chunk_length=300,
+            chunk_width=2,
+            executor=executor,
+            fields=["FORMAT/DP"],
+            merge_samples=True,
+            compute_stats=True,
+        )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(
+        path,
+        expected_output,
+        regions=regions,
+        chunk_length=300,
+        chunk_width=2,
+        fields=["FORMAT/DP"],
+        compute_stats=True,
+    )
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    xr.testing.assert_identical(ds, expected)
+    assert ds["call_genotype"].chunks[:2] == ((300, 300, 300, 100), (2, 2, 2, 1))
+
+
+def test_vcf_to_zarr__merge_samples_invalid(tmp_path):
+    path = tmp_path / "sim.vcf.gz"
+    generate_vcf(path, n_variants=100, n_samples=4, num_workers=1)
+    batches = [tmp_path / "a.vcf.gz", tmp_path / "b.vcf.gz", tmp_path / "c.vcf.gz"]
+    write_sample_batches(path, list(zip(batches, [[0, 1], [2, 3], [1]])))
+    other = tmp_path / "other.vcf.gz"
+    generate_vcf(other, n_variants=100, n_samples=4, seed=1, num_workers=1)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    with pytest.raises(ValueError, match=r"Inputs must have disjoint samples"):
+        vcf_to_zarr(batches, output, merge_samples=True)
+    with pytest.raises(ValueError, match=r"Inputs must have the same variants"):
+        vcf_to_zarr([batches[0], other], output, merge_samples=True)
+    with pytest.raises(ValueError, match=r"regions must be a sequence of strings"):
+        vcf_to_zarr(batches, output, regions=[["1"], ["1"]], merge_samples=True)
+    with pytest.raises(ValueError, match=r"merge_samples cannot be combined"):
+        vcf_to_zarr(batches, output, pack_genotypes=True, merge_samples=True)
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_read_vcf(shared_datadir, is_path, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz", is_path)
+    regions = partition_into_regions(path, num_parts=4)
+
+    ds = read_vcf(path, regions=regions)
+
+    # one chunk per region
+    assert ds["call_genotype"].chunks[0] == (3450, 1369, 4806, 5112, 5173)
+    assert ds.attrs["contigs"] == ["20", "21"]
+    assert ds["variant_id"].dtype == "O"
+
+    # the values are the same as the ones converted to Zarr
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    vcf_to_zarr(path, output, regions=regions)
+    expected = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    expected = expected.drop_vars(REGION_INDEX_VARIABLE)
+    assert set(ds.variables) == set(expected.variables)
+    for var in expected.variables:
+        values = expected[var].values
+        if values.dtype.kind == "S":
+            values = values.astype(str)
+        assert_array_equal(ds[var].values, values)
+
+
+def test_read_vcf__lazy(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    regions = partition_into_regions(path, num_parts=4)
+    trace_path = tmp_path.joinpath("trace.json")
+
+    with profile(trace_path) as tracer:
+        ds = read_vcf(path, regions=regions)
+        assert not any(span.name == "read region" for span in tracer.spans)
+
+        # only the first region is decoded
+        positions = ds["variant_position"][:10].values
+        read_regions = [s.args["region"] for s in tracer.spans if s.name == "read region"]
+        assert read_regions == [regions[0]]
+
+    assert positions[0] == 1
+
+
+def test_read_vcf__single_region(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+
+    assert read_vcf(path, regions="20")["call_genotype"].shape == (3450, 1, 2)
+    assert read_vcf(path)["call_genotype"].shape == (19910, 1, 2)
+
+    # no variants
+    ds = read_vcf(path, regions=["21:50000000-50000100", "21:50000101-50000200"])
+    assert ds["call_genotype"].shape == (0, 1, 2)
+    assert ds["variant_allele"].shape == (0, 4)
+
+
+def test_read_vcf__multiple(shared_datadir):
+    paths = [
+        path_for_test(shared_datadir, "CEUTrio.20.gatk3.4.g.vcf.bgz"),
+        path_for_test(shared_datadir, "CEUTrio.21.gatk3.4.g.vcf.bgz"),
+    ]
+    regions = [partition_into_regions(path, num_parts=2) for path in paths]
+
+    ds = read_vcf(paths, regions=regions)
+
+    assert ds["call_genotype"].shape == (19910, 1, 2)
+    assert_array_equal(ds["variant_contig"].values[[0, -1]], [0, 1])
+
+    with pytest.raises(
+        ValueError,
+        match=r"multiple input regions must be a sequence of sequence of strings",
+    ):
+        read_vcf(paths, regions=regions[0])
+
+
+def test_read_vcf__region_changed(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+
+    with pytest.raises(ValueError, match=r"Number of variants in region 20 .* changed"):
+        _read_region(path, "20", 3000)
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_vcf_to_zarr__fields(shared_datadir, is_path, tmp_path):
+    path = path_for_test(shared_datadir, "sample.vcf.gz", is_path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    vcf_to_zarr(
+        path,
+        output,
+        chunk_length=5,
+        chunk_width=2,
+        fields=["INFO/*", "FORMAT/DP", "FORMAT/HQ"],
+        exclude_fields=["INFO/AC"],
+        field_defs={"INFO/AF": {"Number": "A"}},
+    )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    assert_array_equal(ds["variant_DP"], [-1, -1, 14, 11, 10, 13, 9, -1, -1])
+    assert ds["variant_DP"].dims == ("variants",)
+    assert ds["variant_DP"].attrs["comment"] == "Total Depth"
+    assert_array_equal(ds["variant_AF"][4], np.array([0.333, 0.667, np.nan], "f4"))
+    assert ds["variant_AF"].dims == ("variants", "alt_alleles")
+    assert_array_equal(ds["variant_AA"][4:7], ["T", "T", "G"])
+    assert_array_equal(ds["variant_DB"][:5], [False, False, True, False, True])
+    assert "variant_AC" not in ds
+    assert_array_equal(ds["call_DP"][5], [-1, 4, 2])
+    assert ds["call_DP"].dims == ("variants", "samples")
+    assert ds["call_DP"].encoding["chunks"] == (5, 2)
+    assert ds["call_HQ"].dims == ("variants", "samples", "FORMAT_HQ_dim")
+    assert ds["call_HQ"].encoding["chunks"] == (5, 2, 2)
+    assert ds["call_HQ"].encoding["compressor"].cname == "zstd"
+    assert "call_GQ" not in ds
+
+
+def test_vcf_to_zarr__parallel_fields(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+    fields = ["INFO/MLEAC", "FORMAT/DP", "FORMAT/AD", "FORMAT/PL"]
+    field_defs = {"FORMAT/AD": {"Number": "R"}}
+
+    vcf_to_zarr(
+        path,
+        output,
+        regions=regions,
+        chunk_length=5_000,
+        fields=fields,
+        field_defs=field_defs,
+    )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    expected = read_vcf(path, regions=regions, fields=fields, field_defs=field_defs)
+
+    assert ds["call_AD"].dims == ("variants", "samples", "alleles")
+    assert ds["call_PL"].dims == ("variants", "samples", "genotypes")
+    assert ds["call_PL"].shape == (19910, 1, 10)
+    assert ds["variant_MLEAC"].dims == ("variants", "alt_alleles")
+    for var in ["variant_MLEAC", "call_DP", "call_AD", "call_PL"]:
+        assert_array_equal(ds[var].values, expected[var].values)
+        assert ds[var].attrs["comment"] == expected[var].attrs["comment"]
+
+    # a call with two alleles
+    i = int(np.flatnonzero(ds["variant_position"].values == 10001661)[0])
+    assert_array_equal(ds["call_AD"][i, 0], [0, 81, 0, -2])
+    assert_array_equal(ds["variant_MLEAC"][i], [2, 0, -2])
+
+
+def test_vcf_to_zarr__field_encoding(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+    field_defs = {
+        "FORMAT/GQ": {"max_value": 99},
+        "FORMAT/DP": {"dtype": "i2"},
+        "INFO/MQ": {"scale": 0.01, "max_value": 70},
+    }
+
+    vcf_to_zarr(
+        path,
+        output,
+        regions=regions,
+        fields=["INFO/MQ", "FORMAT/DP", "FORMAT/GQ"],
+        field_defs=field_defs,
+    )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    assert ds["call_GQ"].dtype == np.int8
+    assert ds["call_GQ"].max() == 99
+    assert ds["call_DP"].dtype == np.int16
+    assert ds["variant_MQ"].dtype == np.int16
+    assert ds["variant_MQ"].attrs["scale"] == 0.01
+    assert ds["variant_MQ"].attrs["missing"] == -32768
+
+    i = int(np.flatnonzero(ds["variant_position"].values == 10001661)[0])
+    assert ds["variant_MQ"][i] == 5833  # MQ=58.33
+
+
+def test_max_alt_alleles(shared_datadir):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    regions = partition_into_regions(path, num_parts=4)
+
+    assert [max_alt_alleles(path, r) for r in regions] == [5, 3, 7, 4, 4]
+    assert max_alt_alleles(path) == 7
+    assert max_alt_alleles(path, "21:50000000-50000100") == 1
+
+
+@pytest.mark.parametrize(
+    "use_executor", [False, True],
+)
+def test_vcf_to_zarr__alt_number_none(shared_datadir, tmp_path, use_executor):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+    fields = ["INFO/MLEAF", "FORMAT/AD", "FORMAT/PL"]
+    field_defs = {"FORMAT/AD": {"Number": "R"}, "INFO/MLEAF": {"scale": 0.001}}
+
+    with ThreadPoolExecutor(2) as executor:
+        vcf_to_zarr(
+            path,
+            output,
+            regions=regions,
+            chunk_length=5_000,
+            chunk_width=1,
+            executor=executor if use_executor else None,
+            fields=fields,
+            field_defs=field_defs,
+            alt_number=None,
+        )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    # the parts are widened to the most alleles in any part
+    assert ds.sizes["alleles"] == 8
+    assert ds.sizes["alt_alleles"] == 7
+    assert ds.sizes["genotypes"] == 36
+    assert ds["variant_allele"].chunks[1] == (8,)
+
+    # which is the same as a single pass with the same number of alleles
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(
+        path,
+        expected_output,
+        chunk_length=5_000,
+        chunk_width=1,
+        fields=fields,
+        field_defs=field_defs,
+        alt_number=7,
+    )
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    for var in expected.data_vars:
+        values = ds[var].values
+        if values.dtype.kind == "S":
+            values = values.astype(str)
+        assert_array_equal(values, expected[var].values)
+
+
+def test_vcf_to_zarr__alt_number(shared_datadir, tmp_path):
+    path = path_for_test(shared_datadir, "sample.vcf.gz")
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    vcf_to_zarr(path, output, alt_number=None)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["alleles"] == 4
+    assert_array_equal(ds["variant_allele"][4], ["A", "G", "T", ""])
+
+    # alleles beyond alt_number are dropped
+    vcf_to_zarr(path, output, alt_number=1)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["alleles"] == 2
+    assert_array_equal(ds["variant_allele"][4], ["A", "G"])
+
+    with pytest.raises(ValueError, match=r"alt_number must be set to pack genotypes"):
+        vcf_to_zarr(path, output, chunk_width=8, pack_genotypes=True, alt_number=None)
+
+
+@pytest.mark.parametrize(
+    "filename,engine,fields",
+    [
+        (
+            "CEUTrio.20.21.gatk3.4.g.vcf.bgz",
+            "cyvcf2",
+            ["INFO/MLEAF", "FORMAT/AD", "FORMAT/PL"],
+        ),
+        ("CEUTrio.20.21.gatk3.4.g.vcf.bgz", "native", None),
+        ("CEUTrio.20.21.gatk3.4.g.bcf", "native", None),
+    ],
+)
+def test_vcf_to_zarr__alt_number_none_sequential(
+    shared_datadir, tmp_path, monkeypatch, filename, engine, fields
+):
+    path = path_for_test(shared_datadir, filename)
+    field_defs = {"FORMAT/AD": {"Number": "R"}} if fields else None
+
+    # the number of ALT alleles is found while decoding, without scanning the input
+    def fail(*args: Any) -> None:
+        raise AssertionError("scanned the input")
+
+    monkeypatch.setattr(vcf_reader, "scan_sizes", fail)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    vcf_to_zarr(
+        path,
+        output,
+        chunk_length=1_000,
+        chunk_width=1,
+        fields=fields,
+        field_defs=field_defs,
+        alt_number=None,
+        engine=engine,
+    )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["alleles"] == 8
+
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(
+        path,
+        expected_output,
+        chunk_length=1_000,
+        chunk_width=1,
+        fields=fields,
+        field_defs=field_defs,
+        alt_number=7,
+        engine=engine,
+    )
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    # the output was widened after the first chunk
+    first_chunk = expected["variant_allele"][:1_000].values
+    assert np.count_nonzero(first_chunk != "", axis=1).max() < 8
+    assert set(ds.data_vars) == set(expected.data_vars)
+    for var in expected.data_vars:
+        assert_array_equal(ds[var].values, expected[var].values)
+
+
+def test_max_ploidy(tmp_path):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+
+    assert [max_ploidy(path, r) for r in ["1", "2", "3"]] == [2, 1, 3]
+    assert max_ploidy(path) == 3
+
+
+def test_vcf_to_zarr__mixed_ploidy(tmp_path):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    # haploid calls are padded with the fill value
+    vcf_to_zarr(path, output, regions="1")
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.attrs["mixed_ploidy"]
+    assert_array_equal(
+        ds["call_genotype"],
+        [[[0, 1], [1, 1]], [[1, -2], [0, 1]], [[-1, -1], [0, 0]]],
+    )
+    assert_array_equal(
+        ds["call_genotype_mask"],
+        [[[False, False], [False, False]], [[False, True], [False, False]]]
+        + [[[True, True], [False, False]]],
+    )
+
+    # calls with a higher ploidy than requested are an error
+    with pytest.raises(ValueError, match=r"Variant at 3:100 has a call with ploidy 3"):
+        vcf_to_zarr(path, output)
+
+    vcf_to_zarr(path, output, ploidy=None)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["ploidy"] == 3
+    assert_array_equal(
+        ds["call_genotype"][-3:],
+        [
+            [[0, -2, -2], [1, -2, -2]],
+            [[-1, -2, -2], [0, -2, -2]],
+            [[0, 1, 1], [0, 0, -2]],
+        ],
+    )
+
+    vcf_to_zarr(path, output, regions="2", ploidy=None)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.sizes["ploidy"] == 1
+    assert not ds.attrs["mixed_ploidy"]
+
+    with pytest.raises(ValueError, match=r"ploidy must be set to pack genotypes"):
+        vcf_to_zarr(path, output, chunk_width=8, pack_genotypes=True, ploidy=None)
+
+
+@pytest.mark.parametrize(
+    "engine", ["cyvcf2", "native"],
+)
+def test_vcf_to_zarr__mixed_ploidy_sequential(tmp_path, monkeypatch, engine):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+
+    # the ploidy is found while decoding, without scanning the input
+    def fail(*args: Any) -> None:
+        raise AssertionError("scanned the input")
+
+    monkeypatch.setattr(vcf_reader, "scan_sizes", fail)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+    vcf_to_zarr(path, output, chunk_length=1, ploidy=None, engine=engine)
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    # the calls written before the triploid call are padded
+    assert ds.sizes["ploidy"] == 3
+    assert ds.attrs["mixed_ploidy"]
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(path, expected_output, chunk_length=1, ploidy=3, engine=engine)
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    for var in ["call_genotype", "call_genotype_mask", "call_genotype_phased"]:
+        assert_array_equal(ds[var].values, expected[var].values)
+
+    # calls with a higher ploidy than requested are still an error
+    with pytest.raises(ValueError, match=r"Variant at 3:100 has a call with ploidy 3"):
+        vcf_to_zarr(path, output, alt_number=None, engine=engine)
+
+
+@pytest.mark.parametrize(
+    "use_executor", [False, True],
+)
+def test_vcf_to_zarr__mixed_ploidy_parallel(tmp_path, use_executor):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    with ThreadPoolExecutor(2) as executor:
+        vcf_to_zarr(
+            path,
+            output,
+            regions=["2", "1", "3"],
+            chunk_length=2,
+            executor=executor if use_executor else None,
+            ploidy=None,
+        )
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+
+    # parts with a lower ploidy are padded (if they weren't scanned up front)
+    assert ds.attrs["mixed_ploidy"]
+    assert ds["call_genotype"].chunks == ((2, 2, 2), (2,), (3,))
+    expected_output = tmp_path.joinpath("expected.zarr").as_posix()
+    vcf_to_zarr(path, expected_output, ploidy=None)
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    order = [3, 4, 0, 1, 2, 5]
+    for var in ["call_genotype", "call_genotype_mask", "call_genotype_phased"]:
+        assert_array_equal(ds[var].values, expected[var].values[order])
+
+
+def test_read_vcf__mixed_ploidy(tmp_path):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    with pytest.raises(ValueError, match=r"Variant at 3:100 has a call with ploidy 3"):
+        read_vcf(path, regions=["1", "2", "3"]).compute()
+
+    ds = read_vcf(path, regions=["1", "2", "3"], ploidy=None)
+    assert ds.sizes["ploidy"] == 3
+    vcf_to_zarr(path, output, ploidy=None)
+    expected = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    for var in ["call_genotype", "call_genotype_mask", "call_genotype_phased"]:
+        assert_array_equal(ds[var].values, expected[var].values)
+
+    # only the regions that are read are scanned
+    assert read_vcf(path, regions="2", ploidy=None).sizes["ploidy"] == 1
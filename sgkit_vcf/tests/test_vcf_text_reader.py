@@ -0,0 +1,194 @@
+import gzip
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+import xarray as xr
+from numpy.testing import assert_array_equal
+
+from sgkit_vcf import partition_into_regions, read_vcf, vcf_to_zarr
+from sgkit_vcf.tests.utils import (
+    MIXED_PLOIDY_CALLS,
+    path_for_test,
+    write_mixed_ploidy_vcf,
+)
+from sgkit_vcf.vcf_generator import generate_vcf
+from sgkit_vcf.vcf_reader import open_vcf, read_text_vcf_chunks, read_vcf_chunks
+from sgkit_vcf.vcf_text_reader import VcfTextFile, is_text_vcf
+
+
+def read_all(chunks: Any) -> Dict[str, np.ndarray]:
+    arrays: Dict[str, List[np.ndarray]] = {}
+    for chunk in chunks:
+        for var, arr in chunk.items():
+            arrays.setdefault(var, []).append(arr.copy())
+    return {var: np.concatenate(arrs) for var, arrs in arrays.items()}
+
+
+def assert_native_matches_cyvcf2(
+    path: Any, region: Any = None, chunk_length: int = 1000, **kwargs: Any
+) -> None:
+    with open_vcf(path) as vcf:
+        expected = read_all(read_vcf_chunks(vcf, region, chunk_length, (), **kwargs))
+    with open_vcf(path) as vcf:
+        actual = read_all(
+            read_text_vcf_chunks(vcf, path, region, chunk_length, **kwargs)
+        )
+    assert actual.keys() == expected.keys()
+    for var in expected:
+        assert_array_equal(actual[var], expected[var], err_msg=var)
+
+
+def test_is_text_vcf(shared_datadir):
+    assert is_text_vcf(path_for_test(shared_datadir, "sample.vcf"))
+    assert is_text_vcf(path_for_test(shared_datadir, "sample.vcf.gz"))
+    assert not is_text_vcf(path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.bcf"))
+    assert not is_text_vcf(path_for_test(shared_datadir, "sample.vcf.gz.tbi"))
+
+
+@pytest.mark.parametrize(
+    "region",
+    [None, "20", "21", "20:10001600-10001700", "21:10000000-", "20:1-10000000", "22"],
+)
+@pytest.mark.parametrize(
+    "file", ["CEUTrio.20.21.gatk3.4.g.vcf.bgz", "CEUTrio.20.21.gatk3.4.csi.g.vcf.bgz"],
+)
+def test_read_text_vcf_chunks(shared_datadir, region, file):
+    path = path_for_test(shared_datadir, file)
+    assert_native_matches_cyvcf2(path, region)
+    assert_native_matches_cyvcf2(path, region, variant_end=True, alt_number=7)
+
+
+def test_read_text_vcf_chunks__uncompressed(shared_datadir, tmp_path):
+    path = tmp_path / "CEUTrio.20.21.gatk3.4.g.vcf"
+    with gzip.open(
+        path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz")
+    ) as f:
+        # no newline at the end of the file
+        path.write_bytes(f.read().rstrip(b"\n"))
+    assert_native_matches_cyvcf2(path, chunk_length=333)
+
+    with VcfTextFile(path) as f:
+        assert f.samples == ["NA12878"]
+        with pytest.raises(ValueError, match=r"Regions can only be read from"):
+            next(f.line_chunks("20"))
+
+
+@pytest.mark.parametrize(
+    "ploidy", [2, 3],
+)
+def test_read_text_vcf_chunks__generated(tmp_path, ploidy):
+    path = tmp_path / "sim.vcf.gz"
+    # more than 10 alleles means some calls don't fit the fixed-width pattern
+    generate_vcf(
+        path,
+        n_variants=3000,
+        n_samples=7,
+        contigs=3,
+        max_alt_alleles=12,
+        ploidy=ploidy,
+        missing_rate=0.1,
+        phased_rate=0.5,
+        num_workers=1,
+    )
+    assert_native_matches_cyvcf2(path, ploidy=ploidy)
+    for region in partition_into_regions(path, num_parts=5):
+        assert_native_matches_cyvcf2(path, region, ploidy=ploidy + 1)
+
+
+def test_read_text_vcf_chunks__fallback(tmp_path):
+    path = tmp_path / "calls.vcf"
+    path.write_text(
+        "##fileformat=VCFv4.2\n"
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+        '##INFO=<ID=AA,Number=1,Type=String,Description="Ancestral allele">\n'
+        '##INFO=<ID=END,Number=1,Type=Integer,Description="End position">\n'
+        "##contig=<ID=1>\n"
+        "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS0\tS1\tS2\n"
+        "1\t10\trs1\tA\tT\t.\t.\t.\tGT\t0|1\t1/1\t./.\n"
+        "1\t20\t.\tAC\tA,G\t.\t.\tEND=25\tGT\t0\t1|2\t.\n"
+        "1\t30\t.\tA\t.\t.\t.\t.\tGT:DP\t0/0:3\t.:2\t0|0:1\n"
+        "1\t40\t.\tA\tT\t.\t.\t.\tGT\t.|.\t0|.\t1/.\n"
+        "1\t50\t.\tA\tC,G,T,AC,AG,AT,CA,CG,CT,GA\t.\t.\t.\tGT\t10|1\t0/10\t2|3\n"
+        f"1\t60\t.\tA\tT\t.\t.\tAA={'A' * 300}\tGT\t0|0\t0|1\t1|1\n"
+        "1\t70\t.\tA\tT\t.\t.\t.\tGT\t0|1\t0|1\t0|1|1\n"
+    )
+    # the genotype calls for the fifth record have too many alleles to store
+    assert_native_matches_cyvcf2(path, chunk_length=2, ploidy=3, alt_number=10)
+
+    # records without a GT field have missing calls
+    with open(path, "a") as f:
+        f.write("1\t80\t.\tA\tT\t.\t.\t.\tDP\t1\t2\t3\n")
+    with open_vcf(path) as vcf:
+        actual = read_all(read_text_vcf_chunks(vcf, path, ploidy=3, alt_number=10))
+    assert_array_equal(actual["call_genotype"][-1], np.full((3, 3), -1))
+    assert not actual["call_genotype_phased"][-1].any()
+
+    with open_vcf(path) as vcf:
+        with pytest.raises(
+            ValueError, match=r"Variant at 1:70 has a call with ploidy 3"
+        ):
+            list(read_text_vcf_chunks(vcf, path, ploidy=2, alt_number=10))
+
+
+def test_read_text_vcf_chunks__unknown_contig(tmp_path):
+    path = tmp_path / "calls.vcf"
+    path.write_text(
+        "##fileformat=VCFv4.2\n"
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+        "##contig=<ID=1>\n"
+        "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS0\n"
+        "1\t10\t.\tA\tT\t.\t.\t.\tGT\t0|1\n"
+        "19\t20\t.\tA\tT\t.\t.\t.\tGT\t0|1\n"
+    )
+    with open_vcf(path) as vcf:
+        with pytest.raises(ValueError, match=r"'19' is not in list"):
+            list(read_text_vcf_chunks(vcf, path))
+
+
+def test_vcf_to_zarr__native_engine_mixed_ploidy(tmp_path):
+    path = tmp_path / "mixed.vcf.gz"
+    write_mixed_ploidy_vcf(path)
+    output = tmp_path.joinpath("vcf.zarr").as_posix()
+
+    vcf_to_zarr(path, output, ploidy=None, engine="native")
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    assert ds.attrs["mixed_ploidy"]
+    assert_array_equal(ds["variant_position"], [c[1] for c in MIXED_PLOIDY_CALLS])
+    assert_array_equal(
+        ds["call_genotype"],
+        [
+            [[0, 1, -2], [1, 1, -2]],
+            [[1, -2, -2], [0, 1, -2]],
+            [[-1, -1, -2], [0, 0, -2]],
+            [[0, -2, -2], [1, -2, -2]],
+            [[-1, -2, -2], [0, -2, -2]],
+            [[0, 1, 1], [0, 0, -2]],
+        ],
+    )
+    # as for cyvcf2, calls with fewer alleles than others in the record are phased
+    assert_array_equal(
+        ds["call_genotype_phased"],
+        [[False, True], [True, False], [False, True]]
+        + [[False, False], [False, False], [False, False]],
+    )
+
+
+@pytest.mark.parametrize(
+    "is_path", [True, False],
+)
+def test_vcf_to_zarr__native_engine(shared_datadir, is_path, tmp_path):
+    path = path_for_test(shared_datadir, "CEUTrio.20.21.gatk3.4.g.vcf.bgz", is_path)
+    output = tmp_path.joinpath("native.zarr").as_posix()
+    expected_output = tmp_path.joinpath("cyvcf2.zarr").as_posix()
+    regions = partition_into_regions(path, num_parts=4)
+
+    vcf_to_zarr(path, output, regions=regions, chunk_length=5_000, engine="native")
+    vcf_to_zarr(path, expected_output, regions=regions, chunk_length=5_000)
+
+    ds = xr.open_zarr(output)  # type: ignore[no-untyped-call]
+    expected = xr.open_zarr(expected_output)  # type: ignore[no-untyped-call]
+    xr.testing.assert_equal(ds, expected)
+
+    xr.testing.assert_equal(read_vcf(path, engine="native"), read_vcf(path))
@@ -1,6 +1,10 @@
+import gzip
 from pathlib import Path
+from typing import List, Sequence, Tuple
 
-from sgkit.typing import PathType
+from sgkit_vcf.bgzf import BgzfWriter
+from sgkit_vcf.tbi import TABIX_EXTENSION, build_tabix_index, write_tabix
+from sgkit_vcf.typing import PathType
 
 
 def path_for_test(shared_datadir: Path, file: str, is_path: bool = True) -> PathType:
@@ -12,3 +16,101 @@ def path_for_test(shared_datadir: Path, file: str, is_path: bool = True) -> Path
     if not is_path:
         path = str(path)
     return path
+
+
+def write_simple_vcf(
+    path: Path,
+) -> Tuple[List[str], List[Tuple[int, int, int, int, int]]]:
+    """Write a small bgzipped VCF with one variant every 1000 bases on contigs 1 and 3.
+
+    Returns the sequence names and the record locations, for building an index.
+    """
+    sequence_names = ["1", "2", "3"]
+    records = []
+    with open(path, "wb") as f, BgzfWriter(f) as w:
+        w.write(b"##fileformat=VCFv4.3\n")
+        for contig in sequence_names:
+            w.write(f"##contig=<ID={contig}>\n".encode())
+        w.write(b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        w.flush()
+        for contig_index in (0, 2):
+            for position in range(1000, 1_000_001, 1000):
+                line = f"{sequence_names[contig_index]}\t{position}\t.\tA\tT\t.\t.\t.\n"
+                start = w.tell()
+                w.write(line.encode())
+                records.append((contig_index, position - 1, position, start, w.tell()))
+    return sequence_names, records
+
+
+# genotype calls for samples S0 and S1 on contig 1 (diploid, apart from a haploid call),
+# contig 2 (haploid) and contig 3 (a triploid call)
+MIXED_PLOIDY_CALLS = [
+    ("1", 100, "0/1", "1|1"),
+    ("1", 200, "1", "0/1"),
+    ("1", 300, "./.", "0|0"),
+    ("2", 100, "0", "1"),
+    ("2", 200, ".", "0"),
+    ("3", 100, "0/1/1", "0/0"),
+]
+
+
+def write_mixed_ploidy_vcf(path: Path) -> None:
+    """Write a small bgzipped VCF, and its tabix index, with the calls in `MIXED_PLOIDY_CALLS`."""
+    sequence_names = ["1", "2", "3"]
+    records = []
+    with open(path, "wb") as f, BgzfWriter(f) as w:
+        w.write(b"##fileformat=VCFv4.3\n")
+        for contig in sequence_names:
+            w.write(f"##contig=<ID={contig}>\n".encode())
+        w.write(
+            b'##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+            b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS0\tS1\n"
+        )
+        w.flush()
+        for contig, position, gt0, gt1 in MIXED_PLOIDY_CALLS:
+            line = f"{contig}\t{position}\t.\tA\tT\t.\t.\t.\tGT\t{gt0}\t{gt1}\n"
+            start = w.tell()
+            w.write(line.encode())
+            contig_index = sequence_names.index(contig)
+            records.append((contig_index, position - 1, position, start, w.tell()))
+    write_tabix(str(path) + TABIX_EXTENSION, build_tabix_index(sequence_names, records))
+
+
+def write_sample_batches(
+    path: PathType, batches: Sequence[Tuple[Path, Sequence[int]]]
+) -> None:
+    """Split the samples of a bgzipped VCF into separate bgzipped VCFs, and their tabix indexes.
+
+    Each batch is an output path and the indexes of the samples to write to it. Every
+    output has all the records (and header lines) of the input.
+    """
+    with gzip.open(path, "rt") as f:
+        lines = f.read().splitlines()
+    sequence_names = [
+        line[len("##contig=<ID=") :].split(",")[0].rstrip(">")
+        for line in lines
+        if line.startswith("##contig=<ID=")
+    ]
+    for batch_path, samples in batches:
+        records = []
+        with open(batch_path, "wb") as out, BgzfWriter(out) as w:
+            for line in lines:
+                if line.startswith("##"):
+                    w.write(f"{line}\n".encode())
+                    continue
+                fields = line.split("\t")
+                line = "\t".join(fields[:9] + [fields[9 + i] for i in samples])
+                if line.startswith("#"):
+                    w.write(f"{line}\n".encode())
+                    w.flush()
+                    continue
+                start = w.tell()
+                w.write(f"{line}\n".encode())
+                contig_index = sequence_names.index(fields[0])
+                position = int(fields[1])
+                end = position + len(fields[3]) - 1
+                records.append((contig_index, position - 1, end, start, w.tell()))
+        write_tabix(
+            str(batch_path) + TABIX_EXTENSION,
+            build_tabix_index(sequence_names, records),
+        )
@@ -0,0 +1,9 @@
+"""Types used throughout sgkit_vcf.
+
+This is the same as `sgkit.typing.PathType`, which can't be imported without importing
+all of sgkit (and so Dask and xarray).
+"""
+from pathlib import Path
+from typing import Union
+
+PathType = Union[str, Path]
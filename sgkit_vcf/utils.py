@@ -3,22 +3,46 @@ import struct
 import tempfile
 import uuid
 from contextlib import contextmanager
-from typing import IO, Any, Dict, Iterator, Optional, Sequence, TypeVar
+from dataclasses import dataclass, field
+from math import factorial
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 from urllib.parse import urlparse
 
 import fsspec
-from yarl import URL
+import numpy as np
 
-from sgkit.typing import PathType
+from sgkit_vcf.typing import PathType
 
 T = TypeVar("T")
 
+# Strings longer than this are decoded one at a time by `gather_strings`, rather than
+# in a gathered array
+MAX_GATHERED_STRING_LENGTH = 256
+
 
 def ceildiv(a: int, b: int) -> int:
     """Safe integer ceil function"""
     return -(-a // b)
 
 
+def n_genotypes(n_alleles: int, ploidy: int) -> int:
+    """The number of distinct unphased genotypes, which is the length of Number=G fields."""
+    return factorial(n_alleles + ploidy - 1) // (
+        factorial(ploidy) * factorial(n_alleles - 1)
+    )
+
+
 # https://dev.to/orenovadia/solution-chunked-iterator-python-riddle-3ple
 def chunks(iterator: Iterator[T], n: int) -> Iterator[Iterator[T]]:
     """
@@ -31,6 +55,44 @@ def chunks(iterator: Iterator[T], n: int) -> Iterator[Iterator[T]]:
         yield itertools.chain([first], rest_of_chunk)  # concatenate the first item back
 
 
+def gather_bytes(u8: np.ndarray, offsets: np.ndarray, width: int) -> np.ndarray:
+    """Return the `width` bytes at each offset, as rows of an array (with zeros past the end of the data)."""
+    if len(offsets) > 0 and offsets.max() + width > len(u8):
+        u8 = np.concatenate([u8, np.zeros(width, dtype=np.uint8)])
+    # copy the rows out of a (no-copy) view of every window of `width` bytes
+    rows: np.ndarray = np.lib.stride_tricks.sliding_window_view(u8, width)[offsets]
+    return rows
+
+
+def gather_strings(
+    u8: np.ndarray, offsets: np.ndarray, lengths: np.ndarray
+) -> np.ndarray:
+    """Decode the UTF-8 strings with the given offsets and lengths, returning an object array.
+
+    The strings are gathered into a fixed-width bytes array and decoded in one go, so
+    trailing NUL bytes are dropped.
+    """
+    strings = np.empty(len(offsets), dtype=object)
+    width = max(int(lengths.max(initial=0)), 1)
+    if width > MAX_GATHERED_STRING_LENGTH:
+        # a few very long strings (such as structural variant alleles) are decoded
+        # one at a time, so they don't make the gathered array huge
+        for i in np.flatnonzero(lengths > MAX_GATHERED_STRING_LENGTH):
+            o = offsets[i]
+            strings[i] = u8[o : o + lengths[i]].tobytes().rstrip(b"\x00").decode()
+        short = lengths <= MAX_GATHERED_STRING_LENGTH
+        strings[short] = gather_strings(u8, offsets[short], lengths[short])
+        return strings
+    chars = gather_bytes(u8, offsets, width)
+    chars[np.arange(width) >= lengths[:, None]] = 0
+    fixed_width = chars.view(f"S{width}")[:, 0]
+    try:
+        strings[:] = fixed_width.astype(f"U{width}")  # fast, but only for ASCII
+    except UnicodeDecodeError:
+        strings[:] = np.char.decode(fixed_width, "utf-8")
+    return strings
+
+
 def get_file_length(
     path: PathType, storage_options: Optional[Dict[str, str]] = None
 ) -> int:
@@ -51,6 +113,104 @@ def get_file_offset(vfp: int) -> int:
     return vfp >> 16 & address_mask
 
 
+def reg2bin(beg: int, end: int, min_shift: int, depth: int) -> int:
+    """Calculate the bin for a 0-based, half-open interval, as defined in the CSI spec."""
+    end -= 1
+    s = min_shift
+    t = ((1 << depth * 3) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> s == end >> s:
+            return t + (beg >> s)
+        s += 3
+        t -= 1 << (level - 1) * 3
+    return 0
+
+
+def reg2bins(beg: int, end: int, min_shift: int, depth: int) -> List[int]:
+    """Calculate the bins that overlap a 0-based, half-open interval, as defined in the CSI spec."""
+    s = min_shift + depth * 3
+    end = min(end, 1 << s) - 1
+    t = 0
+    bins: List[int] = []
+    for level in range(depth + 1):
+        bins.extend(range(t + (beg >> s), t + (end >> s) + 1))
+        s -= 3
+        t += 1 << level * 3
+    return bins
+
+
+@dataclass
+class BinningIndex:
+    """The binning and linear index for one reference sequence, before serialization."""
+
+    bins: Dict[int, List[List[int]]] = field(default_factory=dict)
+    linear_index: List[int] = field(default_factory=list)
+    ref_beg: int = -1
+    ref_end: int = -1
+    n_records: int = 0
+
+
+def build_binning_index(
+    n_ref: int,
+    records: Iterable[Tuple[int, int, int, int, int]],
+    min_shift: int,
+    depth: int,
+) -> List[BinningIndex]:
+    """Build the binning and linear indexes for a sequence of records.
+
+    Parameters
+    ----------
+    n_ref : int
+        The number of reference sequences (contigs).
+    records : Iterable[Tuple[int, int, int, int, int]]
+        Tuples of (contig index, 0-based start, end (exclusive), virtual offset of record start,
+        virtual offset of record end) for each record, in file order.
+    min_shift : int
+        The number of bits for the minimal interval (14 for tabix).
+    depth : int
+        The depth of the binning index (5 for tabix).
+
+    Returns
+    -------
+    List[BinningIndex]
+        An index for each reference sequence.
+    """
+    indexes = [BinningIndex() for _ in range(n_ref)]
+    for contig, beg, end, vstart, vend in records:
+        index = indexes[contig]
+        bin = reg2bin(beg, end, min_shift, depth)
+        bin_chunks = index.bins.setdefault(bin, [])
+        # merge with the previous chunk in the bin if it ends in the same compressed block
+        if len(bin_chunks) > 0 and bin_chunks[-1][1] >> 16 == vstart >> 16:
+            bin_chunks[-1][1] = vend
+        else:
+            bin_chunks.append([vstart, vend])
+
+        linear_index = index.linear_index
+        last_window = max(end - 1, beg) >> min_shift
+        if len(linear_index) <= last_window:
+            linear_index.extend([-1] * (last_window + 1 - len(linear_index)))
+        for window in range(beg >> min_shift, last_window + 1):
+            if linear_index[window] == -1:
+                linear_index[window] = vstart
+
+        if index.ref_beg == -1:
+            index.ref_beg = vstart
+        index.ref_end = vend
+        index.n_records += 1
+
+    # Fill in empty windows, so that offsets are non-decreasing
+    for index in indexes:
+        linear_index = index.linear_index
+        first = next((offset for offset in linear_index if offset != -1), 0)
+        previous = first
+        for i, offset in enumerate(linear_index):
+            if offset == -1:
+                linear_index[i] = previous
+            previous = linear_index[i]
+    return indexes
+
+
 def read_bytes_as_value(f: IO[Any], fmt: str, nodata: Optional[Any] = None) -> Any:
     """Read bytes using a `struct` format string and return the unpacked data value.
 
@@ -95,21 +255,18 @@ def read_bytes_as_tuple(f: IO[Any], fmt: str) -> Sequence[Any]:
     return struct.Struct(fmt).unpack(data)
 
 
-def open_gzip(path: PathType, storage_options: Optional[Dict[str, str]]) -> IO[Any]:
-    url = str(path)
-    storage_options = storage_options or {}
-    openfile: IO[Any] = fsspec.open(url, compression="gzip", **storage_options)
-    return openfile
-
-
 def url_filename(url: str) -> str:
     """Extract the filename from a URL"""
+    from yarl import URL
+
     filename: str = URL(url).name
     return filename
 
 
 def build_url(dir_url: str, child_path: str) -> str:
     """Combine a URL for a directory with a child path"""
+    from yarl import URL
+
     url = URL(dir_url)
     # the division (/) operator discards query and fragment, so add them back
     return str((url / child_path).with_query(url.query).with_fragment(url.fragment))
@@ -0,0 +1,325 @@
+"""Convert VCF files as independent batch jobs, without a shared scheduler.
+
+`vcf_to_zarr` converts the parts of a conversion in a single process, using Dask or an
+executor to run them in parallel. On a batch scheduler (such as an array job on an HPC
+cluster), it's easier to run each part as a separate job. `plan_batch_conversion`
+splits a conversion into parts and returns a `BatchPlan`, which can be saved as JSON.
+Each job then loads the plan and converts one of its parts with `run_part`, and a final
+job merges the parts into the output with `merge_parts`, once they have all completed.
+The same steps can be run from the command line (see `sgkit_vcf.cli`), for example:
+
+    python -m sgkit_vcf run-part plan.json 17
+    python -m sgkit_vcf merge plan.json
+
+The part stores are written to a directory that must be shared by all the jobs. Each
+part is marked as done when it has been converted, so `merge_parts` can check that no
+jobs failed, and parts can be re-run if they did.
+"""
+import json
+import posixpath
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import fsspec
+
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.vcf_reader import (
+    DEFAULT_ALT_NUMBER,
+    DEFAULT_PLOIDY,
+    ConversionOptions,
+    VcfPart,
+    _convert_part,
+    _is_zarr,
+    _merge_parts,
+    _merge_sample_parts_to_zarr,
+    _vcf_to_zarrs_parts,
+    check_conversion_options,
+)
+
+# The version of the JSON format for plans, which is increased when it changes
+BATCH_PLAN_VERSION = 1
+
+# The suffix of the file that marks a part as converted
+DONE_SUFFIX = ".done"
+
+
+@dataclass
+class BatchPlan:
+    """A conversion split into parts that can be converted independently, then merged."""
+
+    output: str
+    # the directory for the part stores, which must be shared by all the jobs
+    tempdir: str
+    # the inputs, in order, and the parts to convert, in the order they are merged
+    inputs: List[str]
+    parts: List[VcfPart]
+    chunk_length: int
+    chunk_width: int
+    temp_chunk_length: int
+    merge_samples: bool = False
+    tempdir_storage_options: Dict[str, str] = field(default_factory=dict)
+    # the options for converting each part, such as fields and alt_number
+    options: ConversionOptions = field(default_factory=ConversionOptions)
+
+    def to_json(self) -> str:
+        """Return the plan as a JSON string."""
+        plan = asdict(self)
+        plan["version"] = BATCH_PLAN_VERSION
+        return json.dumps(plan, indent=2)
+
+    @classmethod
+    def from_json(cls, text: str) -> "BatchPlan":
+        """Return the plan from a JSON string, as returned by `to_json`."""
+        plan = json.loads(text)
+        version = plan.pop("version", None)
+        if version != BATCH_PLAN_VERSION:
+            raise ValueError(
+                f"Unsupported batch plan version {version}, expected {BATCH_PLAN_VERSION}"
+            )
+        plan["parts"] = [VcfPart(**part) for part in plan["parts"]]
+        plan["options"] = ConversionOptions(**plan["options"])
+        return cls(**plan)
+
+    def save(
+        self, path: PathType, storage_options: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Save the plan as a JSON file."""
+        with fsspec.open(str(path), "w", **(storage_options or {})) as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(
+        cls, path: PathType, storage_options: Optional[Dict[str, str]] = None
+    ) -> "BatchPlan":
+        """Load a plan from a JSON file, as saved by `save`."""
+        with fsspec.open(str(path), "r", **(storage_options or {})) as f:
+            return cls.from_json(f.read())
+
+
+def plan_batch_conversion(
+    input: Union[PathType, Sequence[PathType]],
+    output: PathType,
+    *,
+    tempdir: PathType,
+    regions: Union[None, Sequence[str], Sequence[Optional[Sequence[str]]]] = None,
+    chunk_length: int = 10_000,
+    chunk_width: int = 1_000,
+    temp_chunk_length: Optional[int] = None,
+    tempdir_storage_options: Optional[Dict[str, str]] = None,
+    fields: Optional[Sequence[str]] = None,
+    exclude_fields: Optional[Sequence[str]] = None,
+    field_defs: Optional[Dict[str, Dict[str, Any]]] = None,
+    pack_genotypes: bool = False,
+    sparse_hom_ref: bool = False,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    engine: str = "cyvcf2",
+    merge_samples: bool = False,
+    compute_stats: bool = False,
+) -> BatchPlan:
+    """Split a conversion of VCF files to a Zarr store into parts that can be converted as separate jobs.
+
+    The arguments have the same meaning as for `vcf_to_zarr`, and each region of each
+    input is a part. Nothing is converted: use `run_part` to convert each part of the
+    plan (in any order, and on any machine), then `merge_parts` to write the output.
+
+    Parameters
+    ----------
+    input : Union[PathType, Sequence[PathType]]
+        A path (or paths) to the input BCF or VCF file (or files).
+    output : PathType
+        Path to the directory of the output Zarr store.
+    tempdir : PathType
+        The directory to write the Zarr store for each part to, which must be
+        accessible (with the same path) from all the jobs. The stores are left in place
+        after they are merged.
+    regions : Union[None, Sequence[str], Sequence[Optional[Sequence[str]]]], optional
+        Genomic region or regions to extract variants for (see `vcf_to_zarr`).
+    chunk_length : int, optional
+        Length (number of variants) of chunks in the output, by default 10_000.
+    chunk_width : int, optional
+        Width (number of samples) of chunks in the output, by default 1_000.
+    temp_chunk_length : Optional[int], optional
+        Length (number of variants) of chunks in the part stores, by default
+        `chunk_length`.
+    tempdir_storage_options: Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend for tempdir (see `fsspec.open`).
+    fields : Optional[Sequence[str]], optional
+        INFO and FORMAT fields to extract (see `vcf_to_zarr`).
+    exclude_fields : Optional[Sequence[str]], optional
+        Fields to leave out of those matched by `fields`.
+    field_defs : Optional[Dict[str, Dict[str, Any]]], optional
+        Overrides for the header definitions of fields (see `vcf_to_zarr`).
+    pack_genotypes : bool, optional
+        Whether to bit-pack the genotype calls (see `vcf_to_zarr`).
+    sparse_hom_ref : bool, optional
+        Whether to store hom-ref calls sparsely (see `vcf_to_zarr`).
+    alt_number : Optional[int], optional
+        The number of ALT alleles to store for each variant (see `vcf_to_zarr`).
+    ploidy : Optional[int], optional
+        The number of alleles to store for each genotype call (see `vcf_to_zarr`).
+    engine : str, optional
+        The decoder to use (see `vcf_to_zarr`).
+    merge_samples : bool, optional
+        Whether the inputs are batches of samples to merge (see `vcf_to_zarr`).
+    compute_stats : bool, optional
+        Whether to compute summary statistics of the calls (see `vcf_to_zarr`).
+
+    Returns
+    -------
+    BatchPlan
+        The plan, which can be saved with `BatchPlan.save`.
+    """
+    options = ConversionOptions(
+        fields=fields,
+        exclude_fields=exclude_fields,
+        field_defs=field_defs,
+        pack_genotypes=pack_genotypes,
+        sparse_hom_ref=sparse_hom_ref,
+        alt_number=alt_number,
+        ploidy=ploidy,
+        engine=engine,
+        compute_stats=compute_stats,
+    )
+    check_conversion_options(
+        options,
+        chunk_length=chunk_length,
+        chunk_width=chunk_width,
+        temp_chunk_length=temp_chunk_length,
+        merge_samples=merge_samples,
+    )
+    inputs: Sequence[PathType] = (
+        [input] if isinstance(input, str) or isinstance(input, Path) else input
+    )
+    if merge_samples:
+        if regions is None or isinstance(regions, str):
+            input_region_list: Sequence[Optional[str]] = [regions]
+        elif all(isinstance(region, str) for region in regions):
+            input_region_list = regions  # type: ignore[assignment]
+        else:
+            raise ValueError(
+                f"To merge samples, regions must be a sequence of strings, which are used for every input: {regions}"
+            )
+        # the same regions are converted for every input
+        parts = _vcf_to_zarrs_parts(
+            inputs, tempdir, [input_region_list] * len(inputs)  # type: ignore[list-item]
+        )
+    else:
+        parts = _vcf_to_zarrs_parts(input, tempdir, regions)
+    for part in parts:
+        part.input = str(part.input)
+
+    return BatchPlan(
+        output=str(output),
+        tempdir=str(tempdir),
+        inputs=[str(i) for i in inputs],
+        parts=parts,
+        chunk_length=chunk_length,
+        chunk_width=chunk_width,
+        temp_chunk_length=temp_chunk_length or chunk_length,
+        merge_samples=merge_samples,
+        tempdir_storage_options=dict(tempdir_storage_options or {}),
+        options=options,
+    )
+
+
+def run_part(plan: BatchPlan, index: int) -> float:
+    """Convert a part of a plan to its Zarr store, and mark it as done.
+
+    A part may be converted more than once (for example, if a job is retried), in which
+    case its store is overwritten. It is not marked as done again until it has been
+    converted successfully.
+
+    Parameters
+    ----------
+    plan : BatchPlan
+        The plan.
+    index : int
+        The index of the part to convert, in ``plan.parts``.
+
+    Returns
+    -------
+    float
+        The time taken, in seconds.
+    """
+    if not 0 <= index < len(plan.parts):
+        raise ValueError(
+            f"Part index must be between 0 and {len(plan.parts) - 1}: {index}"
+        )
+    part = plan.parts[index]
+    # so an earlier run's marker can't vouch for a store that this run only partly writes
+    _clear_done(part.url, plan.tempdir_storage_options)
+    seconds = _convert_part(
+        part,
+        plan.temp_chunk_length,
+        plan.chunk_width,
+        plan.tempdir_storage_options,
+        plan.options,
+    )
+    _mark_done(part.url, plan.tempdir_storage_options, seconds)
+    return seconds
+
+
+def is_part_done(plan: BatchPlan, index: int) -> bool:
+    """Return True if a part of a plan has been converted."""
+    url = plan.parts[index].url + DONE_SUFFIX
+    fs, path = fsspec.core.url_to_fs(url, **plan.tempdir_storage_options)
+    return bool(fs.exists(path))
+
+
+def merge_parts(plan: BatchPlan) -> None:
+    """Merge the converted parts of a plan into its output Zarr store.
+
+    Parameters
+    ----------
+    plan : BatchPlan
+        The plan, all of whose parts must have been converted with `run_part`.
+
+    Raises
+    ------
+    ValueError
+        If any of the parts haven't been converted.
+    """
+    missing = [i for i in range(len(plan.parts)) if not is_part_done(plan, i)]
+    if len(missing) > 0:
+        raise ValueError(f"Parts have not been converted: {missing}")
+
+    urls = [part.url for part in plan.parts]
+    if plan.merge_samples:
+        regions = [part.region for part in plan.parts if part.input == plan.inputs[0]]
+        _merge_sample_parts_to_zarr(
+            urls,
+            plan.inputs,
+            regions,
+            plan.output,
+            plan.chunk_length,
+            plan.chunk_width,
+            plan.tempdir_storage_options,
+        )
+    else:
+        # parts with no variants don't have a store
+        urls = [url for url in urls if _is_zarr(url, plan.tempdir_storage_options)]
+        if len(urls) > 0:
+            _merge_parts(
+                urls,
+                plan.output,
+                plan.chunk_length,
+                plan.chunk_width,
+                plan.tempdir_storage_options,
+            )
+
+
+def _clear_done(url: str, storage_options: Dict[str, str]) -> None:
+    fs, path = fsspec.core.url_to_fs(url + DONE_SUFFIX, **storage_options)
+    if fs.exists(path):
+        fs.rm(path)
+
+
+def _mark_done(url: str, storage_options: Dict[str, str], seconds: float) -> None:
+    fs, path = fsspec.core.url_to_fs(url + DONE_SUFFIX, **storage_options)
+    # parts with no variants don't create their directory
+    fs.makedirs(posixpath.dirname(path), exist_ok=True)
+    with fs.open(path, "w") as f:
+        f.write(json.dumps(dict(seconds=seconds, time=time.time())))
@@ -0,0 +1,406 @@
+"""Functions for extracting INFO and FORMAT fields from VCF files, using their header definitions."""
+import fnmatch
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from cyvcf2 import VCF, Variant
+from numcodecs import Blosc
+
+from sgkit_vcf.utils import n_genotypes
+
+# Values for missing data, and for padding values beyond the number present in a record
+INT_MISSING, INT_FILL = -1, -2
+STR_MISSING, STR_FILL = ".", ""
+
+# Values that htslib uses for missing and padding integers
+HTSLIB_INT_MISSING = np.iinfo(np.int32).min
+HTSLIB_INT_VECTOR_END = HTSLIB_INT_MISSING + 1
+
+CATEGORIES = ("INFO", "FORMAT")
+DTYPES = dict(Integer="i4", Float="f4", Flag="bool", Character="O", String="O")
+
+# Numbers of values that depend on the number of alleles (and the ploidy)
+ALLELE_NUMBERS = ("A", "R", "G")
+
+# Storage dtypes that integer and fixed-point fields may be narrowed to, narrowest first
+INT_DTYPES = ("i1", "i2", "i4")
+FLOAT_DTYPES = ("f2", "f4")
+
+
+@dataclass(frozen=True)
+class FieldEncoding:
+    """How the values of a numeric field are stored.
+
+    Integer fields may be stored in a narrower signed integer `dtype`, and Float fields
+    may be stored as ``f2`` (half precision), which has a relative error of at most
+    2^-11 (about 0.05%) for values in the normal range.
+
+    Alternatively, Float fields may be quantized to fixed point by setting `scale`, in
+    which case each value ``x`` is stored as the integer ``round(x / scale)``, so the
+    absolute error is at most ``scale / 2``. Missing values are stored as the minimum
+    value of the integer dtype, and padding values as one more than the minimum.
+
+    Values greater than `max_value` are capped to it, and so are values that are too
+    large for the storage dtype. If `dtype` is not set, integer and fixed-point fields
+    are stored in the narrowest integer dtype that can hold `max_value`.
+    """
+
+    dtype: Optional[str] = None
+    max_value: Optional[float] = None
+    scale: Optional[float] = None
+
+
+@dataclass
+class VcfField:
+    """An INFO or FORMAT field to extract, and the variable it is stored in."""
+
+    category: str
+    key: str
+    vcf_number: str
+    vcf_type: str
+    description: str
+    # size of the trailing dimension, or None for fields with a single value
+    dimension: Optional[int]
+    encoding: FieldEncoding = FieldEncoding()
+
+    @property
+    def name(self) -> str:
+        prefix = "variant" if self.category == "INFO" else "call"
+        return f"{prefix}_{self.key}"
+
+    @property
+    def dimension_name(self) -> str:
+        if self.vcf_number == "A":
+            return "alt_alleles"
+        elif self.vcf_number == "R":
+            return "alleles"
+        elif self.vcf_number == "G":
+            return "genotypes"
+        return f"{self.category}_{self.key}_dim"
+
+    @property
+    def dims(self) -> List[str]:
+        dims = ["variants"]
+        if self.category == "FORMAT":
+            dims.append("samples")
+        if self.dimension is not None:
+            dims.append(self.dimension_name)
+        return dims
+
+    @property
+    def dtype(self) -> str:
+        """The dtype that values are stored in."""
+        if self.encoding.dtype is not None:
+            return self.encoding.dtype
+        if self.vcf_type == "Integer" or self.quantized:
+            return _narrowest_int_dtype(self.encoding.max_value, self.encoding.scale)
+        return DTYPES[self.vcf_type]
+
+    @property
+    def quantized(self) -> bool:
+        return self.encoding.scale is not None
+
+    @property
+    def missing_value(self) -> Any:
+        if self.quantized:
+            return np.iinfo(self.dtype).min
+        elif self.vcf_type == "Integer":
+            return INT_MISSING
+        elif self.vcf_type == "Float":
+            return np.nan
+        elif self.vcf_type == "Flag":
+            return False
+        return STR_MISSING
+
+    @property
+    def fill_value(self) -> Any:
+        if self.quantized:
+            return np.iinfo(self.dtype).min + 1
+        elif self.vcf_type == "Integer":
+            return INT_FILL
+        elif self.vcf_type == "Float":
+            return np.nan
+        return STR_FILL
+
+    @property
+    def attrs(self) -> Dict[str, Any]:
+        """Attributes for the variable that the field is stored in.
+
+        Quantized fields record their scale, and the stored values for missing and
+        padding values. (The CF names for these are avoided, since Xarray would decode
+        them to floats when reading the Zarr store.)
+        """
+        attrs: Dict[str, Any] = dict(comment=self.description)
+        if self.quantized:
+            attrs.update(
+                scale=self.encoding.scale,
+                missing=int(self.missing_value),
+                fill=int(self.fill_value),
+            )
+        return attrs
+
+    def shape(self, n_sample: int) -> Tuple[int, ...]:
+        """The shape of the values for a single variant."""
+        shape: Tuple[int, ...] = ()
+        if self.category == "FORMAT":
+            shape += (n_sample,)
+        if self.dimension is not None:
+            shape += (self.dimension,)
+        return shape
+
+    def decode(self, variant: Variant, buffer: np.ndarray, i: int) -> None:
+        """Decode the field for a variant into row `i` of `buffer`.
+
+        As many values are stored as fit in the buffer, which may be wider than the
+        field's `dimension` if the number of alleles is being found as records are
+        decoded.
+        """
+        if self.category == "INFO":
+            self._decode_info(variant.INFO.get(self.key), buffer, i)
+        else:
+            self._decode_format(variant.format(self.key), buffer, i)
+
+    def _decode_info(self, value: Any, buffer: np.ndarray, i: int) -> None:
+        if self.vcf_type == "Flag":
+            buffer[i] = value is not None
+            return
+        if value is None:
+            buffer[i] = self.missing_value
+            return
+        if isinstance(value, str) and self.dimension is not None:
+            value = value.split(",")
+        values: Any = value if isinstance(value, (tuple, list)) else (value,)
+        if self.vcf_type == "Integer":
+            values = self._encode(
+                np.array([INT_MISSING if v is None else v for v in values])
+            )
+        elif self.vcf_type == "Float":
+            values = self._encode(
+                np.array([np.nan if v is None else v for v in values])
+            )
+        if self.dimension is None:
+            buffer[i] = values[0]
+            return
+        n = min(len(values), buffer.shape[1])
+        buffer[i, :n] = values[:n]
+        buffer[i, n:] = self.fill_value
+
+    def _decode_format(self, values: Any, buffer: np.ndarray, i: int) -> None:
+        if values is None:
+            buffer[i] = self.missing_value
+            return
+        if self.vcf_type in ("String", "Character"):
+            # cyvcf2 returns a single string per sample, with commas separating values
+            values = np.where(values == "", STR_MISSING, values)
+            if self.dimension is None:
+                buffer[i] = values
+                return
+            for j, value in enumerate(values):
+                items = value.split(",")[: buffer.shape[2]]
+                buffer[i, j, : len(items)] = items
+                buffer[i, j, len(items) :] = STR_FILL
+            return
+        if self.vcf_type == "Integer":
+            values = np.where(values == HTSLIB_INT_MISSING, INT_MISSING, values)
+            values = np.where(values == HTSLIB_INT_VECTOR_END, INT_FILL, values)
+        values = self._encode(values)
+        if self.dimension is None:
+            buffer[i] = values[:, 0]
+            return
+        n = min(values.shape[1], buffer.shape[2])
+        buffer[i, :, :n] = values[:, :n]
+        buffer[i, :, n:] = self.fill_value
+
+    def _encode(self, values: np.ndarray) -> np.ndarray:
+        """Convert decoded numeric values to the storage encoding."""
+        max_value = self.encoding.max_value
+        if max_value is not None:
+            # missing and padding values are negative, so are not affected (nor is NaN)
+            values = np.minimum(values, max_value)
+        if self.quantized:
+            info = np.iinfo(self.dtype)
+            missing = np.isnan(values)
+            values = np.round(np.where(missing, 0, values) / self.encoding.scale)
+            values = np.clip(values, info.min + 2, info.max)
+            return np.where(missing, info.min, values).astype(self.dtype)
+        if self.vcf_type == "Integer":
+            # values below the dtype minimum would wrap around, so they are capped too,
+            # leaving room for two sentinel values, as for quantized values
+            info = np.iinfo(self.dtype)
+            return np.clip(values, info.min + 2, info.max)
+        finfo = np.finfo(self.dtype)
+        return np.clip(values, finfo.min, finfo.max)
+
+    @property
+    def compressor(self) -> Optional[Blosc]:
+        """A compressor for the field's values in Zarr, or None to use the default."""
+        if self.dtype == "O":
+            return None
+        # Bit shuffling suits single bytes, and byte shuffling suits wider numeric types
+        itemsize = np.dtype(self.dtype).itemsize
+        shuffle = Blosc.BITSHUFFLE if itemsize == 1 else Blosc.SHUFFLE
+        return Blosc(cname="zstd", clevel=7, shuffle=shuffle)
+
+
+def _narrowest_int_dtype(max_value: Optional[float], scale: Optional[float]) -> str:
+    if max_value is None:
+        return "i4"
+    max_stored = max_value / scale if scale is not None else max_value
+    for dtype in INT_DTYPES:
+        if max_stored <= np.iinfo(dtype).max:
+            return dtype
+    return "i4"
+
+
+def _field_encoding(
+    field: str, vcf_type: str, field_def: Dict[str, Any]
+) -> FieldEncoding:
+    encoding = FieldEncoding(
+        dtype=field_def.get("dtype"),
+        max_value=field_def.get("max_value"),
+        scale=field_def.get("scale"),
+    )
+    if encoding.scale is not None and vcf_type != "Float":
+        raise ValueError(f"Only Float fields can be quantized with a scale: {field}")
+    if encoding.dtype is not None:
+        if vcf_type == "Integer" or encoding.scale is not None:
+            allowed: Sequence[str] = INT_DTYPES
+        elif vcf_type == "Float":
+            allowed = FLOAT_DTYPES
+        else:
+            allowed = ()
+        if encoding.dtype not in allowed:
+            raise ValueError(
+                f"Field {field} cannot be stored with dtype {encoding.dtype}, "
+                f"must be one of {list(allowed)}"
+            )
+    return encoding
+
+
+def get_vcf_fields(
+    vcf: VCF,
+    fields: Optional[Sequence[str]] = None,
+    exclude_fields: Optional[Sequence[str]] = None,
+    field_defs: Optional[Mapping[str, Mapping[str, Any]]] = None,
+    alt_number: int = 3,
+    ploidy: int = 2,
+) -> List[VcfField]:
+    """Resolve the INFO and FORMAT fields to extract from a VCF file.
+
+    Parameters
+    ----------
+    vcf : VCF
+        The open VCF file, whose header defines the fields.
+    fields : Optional[Sequence[str]], optional
+        The fields to extract, as ``INFO/<key>`` or ``FORMAT/<key>``. Wildcards are
+        allowed, for example ``INFO/*`` extracts all INFO fields. By default None,
+        which means no fields. ``FORMAT/GT`` is ignored, since genotypes are always
+        extracted.
+    exclude_fields : Optional[Sequence[str]], optional
+        Fields to leave out of those matched by `fields`, in the same form.
+    field_defs : Optional[Mapping[str, Mapping[str, Any]]], optional
+        Overrides for the header definitions, keyed by field. ``Number`` and ``Type``
+        override the values in the header, and ``dimension`` sets the number of values
+        to store, which is required for fields with ``Number=.``. The ``dtype``,
+        ``max_value`` and ``scale`` of the `FieldEncoding` for numeric fields may also
+        be set, for example ``{"FORMAT/GQ": {"max_value": 99}}`` to cap GQ at 99 and
+        store it in a single byte.
+    alt_number : int, optional
+        The number of alternate alleles stored, which sizes ``Number=A``, ``R`` and
+        ``G`` fields.
+    ploidy : int, optional
+        The ploidy, which sizes ``Number=G`` fields.
+
+    Returns
+    -------
+    List[VcfField]
+        The fields, in header order.
+
+    Raises
+    ------
+    ValueError
+        If a field is not of the form ``INFO/<key>`` or ``FORMAT/<key>``, if a field
+        (without wildcards) is not defined in the header, if a field with
+        ``Number=.`` has no dimension in `field_defs`, or if a field's encoding is
+        not valid for its type.
+    """
+    if not fields:
+        return []
+    exclude_fields = exclude_fields or []
+    field_defs = field_defs or {}
+
+    for field in list(fields) + list(exclude_fields) + list(field_defs):
+        category = field.split("/")[0]
+        if category not in CATEGORIES or "/" not in field:
+            raise ValueError(
+                f"Field must be of the form INFO/<key> or FORMAT/<key>: {field}"
+            )
+
+    headers = {}
+    for h in vcf.header_iter():
+        if h.type in CATEGORIES:
+            info = h.info()
+            headers[f"{h.type}/{info['ID']}"] = info
+    for field in fields:
+        if not any(c in field for c in "*?[") and field not in headers:
+            raise ValueError(f"Field {field} is not defined in the VCF header")
+
+    vcf_fields = []
+    for field, info in headers.items():
+        if field == "FORMAT/GT":
+            continue
+        if not any(fnmatch.fnmatchcase(field, pattern) for pattern in fields):
+            continue
+        if any(fnmatch.fnmatchcase(field, pattern) for pattern in exclude_fields):
+            continue
+        field_def: Dict[str, Any] = {**info, **field_defs.get(field, {})}
+        vcf_number = field_def["Number"]
+        dimension: Optional[int]
+        if "dimension" in field_def:
+            dimension = int(field_def["dimension"])
+        elif vcf_number in ("0", "1"):
+            dimension = None
+        elif vcf_number in ALLELE_NUMBERS:
+            dimension = _allele_dimension(vcf_number, alt_number, ploidy)
+        elif vcf_number == ".":
+            raise ValueError(
+                f"Field {field} has Number=., so its dimension must be set in field_defs"
+            )
+        else:
+            dimension = int(vcf_number)
+        category, key = field.split("/", 1)
+        vcf_fields.append(
+            VcfField(
+                category=category,
+                key=key,
+                vcf_number=vcf_number,
+                vcf_type=field_def["Type"],
+                description=field_def.get("Description", "").strip('"'),
+                dimension=dimension,
+                encoding=_field_encoding(field, field_def["Type"], field_def),
+            )
+        )
+    return vcf_fields
+
+
+def resize_vcf_fields(
+    vcf_fields: Sequence[VcfField], alt_number: int, ploidy: int
+) -> List[VcfField]:
+    """Return the fields with the dimensions of ``Number=A``, ``R`` and ``G`` fields set for `alt_number` and `ploidy`."""
+    return [
+        replace(
+            field, dimension=_allele_dimension(field.vcf_number, alt_number, ploidy)
+        )
+        if field.vcf_number in ALLELE_NUMBERS
+        else field
+        for field in vcf_fields
+    ]
+
+
+def _allele_dimension(vcf_number: str, alt_number: int, ploidy: int) -> int:
+    if vcf_number == "A":
+        return alt_number
+    elif vcf_number == "R":
+        return alt_number + 1
+    return n_genotypes(alt_number + 1, ploidy)
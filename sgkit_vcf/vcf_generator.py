@@ -0,0 +1,604 @@
+"""Functions for generating synthetic VCF and BCF files, with matching indexes.
+
+Generated files are deterministic for a given seed, regardless of how many processes are
+used to generate them, so they can be used to reproduce large benchmark workloads locally.
+
+"""
+import os
+import shutil
+import struct
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from sgkit_vcf.bcf_reader import (
+    BCF_INT_DTYPE,
+    BCF_TYPE_CHAR,
+    BCF_TYPE_FLOAT,
+    BCF_TYPE_INT8,
+    BCF_TYPE_INT16,
+    BCF_TYPE_INT32,
+)
+from sgkit_vcf.bgzf import BGZF_EOF, BgzfWriter
+from sgkit_vcf.csi import CSI_EXTENSION, build_csi_index, write_csi
+from sgkit_vcf.tbi import TABIX_EXTENSION, build_tabix_index, write_tabix
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.utils import n_genotypes
+
+# Number, Type and Description of the INFO and FORMAT fields that can be generated
+INFO_FIELDS = {
+    "AC": ("A", "Integer", "Allele count in genotypes"),
+    "AN": ("1", "Integer", "Total number of alleles in called genotypes"),
+    "AF": ("A", "Float", "Allele frequency"),
+    "DP": ("1", "Integer", "Total depth"),
+    "DB": ("0", "Flag", "dbSNP membership"),
+    "AA": ("1", "String", "Ancestral allele"),
+}
+FORMAT_FIELDS = {
+    "GT": ("1", "String", "Genotype"),
+    "DP": ("1", "Integer", "Read depth"),
+    "GQ": ("1", "Integer", "Genotype quality"),
+    "AD": ("R", "Integer", "Allelic depths"),
+    "PL": ("G", "Integer", "Phred-scaled genotype likelihoods"),
+}
+
+BASES = np.array(["A", "C", "G", "T"])
+MEAN_VARIANT_SPACING = 100
+
+
+@dataclass
+class GeneratorOptions:
+    n_samples: int
+    ploidy: int
+    max_alt_alleles: int
+    missing_rate: float
+    phased_rate: float
+    info_fields: Sequence[str]
+    format_fields: Sequence[str]
+    is_bcf: bool
+    batch_size: int
+
+
+def generate_vcf(
+    path: PathType,
+    *,
+    n_variants: int = 1000,
+    n_samples: int = 10,
+    contigs: Union[int, Sequence[str]] = 1,
+    max_alt_alleles: int = 1,
+    ploidy: int = 2,
+    missing_rate: float = 0.0,
+    phased_rate: float = 0.0,
+    info_fields: Sequence[str] = (),
+    format_fields: Sequence[str] = ("GT",),
+    index: Optional[str] = None,
+    seed: int = 42,
+    num_workers: Optional[int] = None,
+) -> None:
+    """Generate a synthetic bgzipped VCF or BCF file, and an index for it.
+
+    Variants are split evenly across contigs, and the records for each contig are
+    generated in parallel, using a separate random stream per contig, so the output
+    only depends on `seed` (not on `num_workers`).
+
+    Parameters
+    ----------
+    path : PathType
+        The path of the file to write. Paths ending in `.bcf` are written as BCF,
+        otherwise a bgzipped VCF is written.
+    n_variants : int, optional
+        The total number of variants, by default 1000.
+    n_samples : int, optional
+        The number of samples, by default 10.
+    contigs : Union[int, Sequence[str]], optional
+        The number of contigs (which are named "1", "2", ...), or their names, by default 1.
+    max_alt_alleles : int, optional
+        The maximum number of alternate alleles at a site. The number of alternate alleles at
+        each site is chosen uniformly from 1 to this value, by default 1.
+    ploidy : int, optional
+        The ploidy of every call, by default 2.
+    missing_rate : float, optional
+        The probability that a call is missing, by default 0.
+    phased_rate : float, optional
+        The probability that a call is phased, by default 0.
+    info_fields : Sequence[str], optional
+        The INFO fields to generate, from "AC", "AN", "AF", "DP", "DB" and "AA", by default none.
+    format_fields : Sequence[str], optional
+        The FORMAT fields to generate, from "GT", "DP", "GQ", "AD" and "PL", by default just "GT".
+    index : Optional[str], optional
+        The type of index to write alongside the file: "tbi" or "csi". By default "tbi" is used
+        for VCF files, and "csi" for BCF files (which can't be indexed with tabix).
+    seed : int, optional
+        The seed for the random number generator, by default 42.
+    num_workers : Optional[int], optional
+        The number of processes to use to generate contigs in parallel. By default one per CPU
+        (up to the number of contigs) is used. Set to 1 to generate in the current process.
+
+    Raises
+    ------
+    ValueError
+        If an unknown INFO or FORMAT field is specified.
+    ValueError
+        If the index type is not supported for the file type.
+    """
+    path = str(path)
+    is_bcf = path.endswith(".bcf")
+    if index is None:
+        index = "csi" if is_bcf else "tbi"
+    if index not in ("tbi", "csi"):
+        raise ValueError(f"Index must be one of 'tbi' or 'csi': {index}")
+    if is_bcf and index == "tbi":
+        raise ValueError("BCF files can only be indexed with csi")
+    for field in info_fields:
+        if field not in INFO_FIELDS:
+            raise ValueError(f"Unknown INFO field: {field}")
+    for field in format_fields:
+        if field not in FORMAT_FIELDS:
+            raise ValueError(f"Unknown FORMAT field: {field}")
+
+    if isinstance(contigs, int):
+        contig_names = [str(i + 1) for i in range(contigs)]
+    else:
+        contig_names = list(contigs)
+    n_contigs = len(contig_names)
+    contig_variant_counts = [
+        n_variants // n_contigs + (1 if i < n_variants % n_contigs else 0)
+        for i in range(n_contigs)
+    ]
+    contig_lengths = [
+        n * MEAN_VARIANT_SPACING * 2 + 1000 for n in contig_variant_counts
+    ]
+
+    options = GeneratorOptions(
+        n_samples=n_samples,
+        ploidy=ploidy,
+        max_alt_alleles=max_alt_alleles,
+        missing_rate=missing_rate,
+        phased_rate=phased_rate,
+        info_fields=list(info_fields),
+        format_fields=list(format_fields),
+        is_bcf=is_bcf,
+        # keep the genotype buffers for a batch of variants to around 16M calls
+        batch_size=max(1, min(10_000, 2 ** 24 // max(1, n_samples * ploidy))),
+    )
+    header = vcf_header(contig_names, contig_lengths, options)
+    seeds = np.random.SeedSequence(seed).spawn(n_contigs)
+
+    if num_workers is None:
+        num_workers = min(os.cpu_count() or 1, n_contigs)
+
+    with tempfile.TemporaryDirectory(
+        dir=os.path.dirname(os.path.abspath(path))
+    ) as tmpdir:
+        jobs = [
+            (
+                str(Path(tmpdir) / f"contig-{i}"),
+                i,
+                contig_names[i],
+                contig_variant_counts[i],
+                seeds[i],
+                options,
+            )
+            for i in range(n_contigs)
+        ]
+        if num_workers > 1 and n_contigs > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                results = list(executor.map(_generate_contig, jobs))
+        else:
+            results = [_generate_contig(job) for job in jobs]
+
+        # Concatenate the header and the BGZF fragments for each contig, adjusting the
+        # virtual offsets of the records, which are relative to the start of each fragment
+        records: List[Tuple[int, int, int, int, int]] = []
+        with open(path, "wb") as f:
+            w = BgzfWriter(f)
+            w.write(header)
+            w.close(write_eof=False)
+            block_offset = w.block_offset
+            for fragment_path, fragment_records in results:
+                shift = block_offset << 16
+                records.extend(
+                    (contig, beg, end, vstart + shift, vend + shift)
+                    for contig, beg, end, vstart, vend in fragment_records
+                )
+                with open(fragment_path, "rb") as fragment:
+                    shutil.copyfileobj(fragment, f)
+                block_offset += os.path.getsize(fragment_path)
+            f.write(BGZF_EOF)
+
+    if index == "tbi":
+        write_tabix(path + TABIX_EXTENSION, build_tabix_index(contig_names, records))
+    else:
+        csi = build_csi_index(contig_names, records, is_vcf=not is_bcf)
+        write_csi(path + CSI_EXTENSION, csi)
+
+
+def vcf_header(
+    contig_names: Sequence[str],
+    contig_lengths: Sequence[int],
+    options: GeneratorOptions,
+) -> bytes:
+    """Return the VCF header text (or the BCF header, which includes the VCF header text)."""
+    lines = [
+        "##fileformat=VCFv4.3",
+        '##FILTER=<ID=PASS,Description="All filters passed">',
+    ]
+    for field in options.info_fields:
+        number, type, description = INFO_FIELDS[field]
+        lines.append(
+            f'##INFO=<ID={field},Number={number},Type={type},Description="{description}">'
+        )
+    for field in options.format_fields:
+        number, type, description = FORMAT_FIELDS[field]
+        lines.append(
+            f'##FORMAT=<ID={field},Number={number},Type={type},Description="{description}">'
+        )
+    for name, length in zip(contig_names, contig_lengths):
+        lines.append(f"##contig=<ID={name},length={length}>")
+    columns = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"]
+    if options.n_samples > 0:
+        columns += ["FORMAT"] + [f"S{i}" for i in range(options.n_samples)]
+    lines.append("\t".join(columns))
+    text = ("\n".join(lines) + "\n").encode("utf-8")
+    if not options.is_bcf:
+        return text
+    text += b"\x00"
+    return b"BCF\x02\x02" + struct.pack("<I", len(text)) + text
+
+
+def bcf_string_dictionary(options: GeneratorOptions) -> Dict[str, int]:
+    """Return the BCF string dictionary, which maps IDs to indexes in header order."""
+    dictionary: Dict[str, int] = {"PASS": 0}
+    for field in list(options.info_fields) + list(options.format_fields):
+        if field not in dictionary:
+            dictionary[field] = len(dictionary)
+    return dictionary
+
+
+def _generate_contig(
+    job: Tuple[str, int, str, int, Any, GeneratorOptions],
+) -> Tuple[str, List[Tuple[int, int, int, int, int]]]:
+    """Write the records for one contig to a BGZF fragment (with no EOF block)."""
+    fragment_path, contig_index, contig_name, n_variants, seed, options = job
+    rng = np.random.default_rng(seed)
+    records = []
+    dictionary = bcf_string_dictionary(options)
+    position = 0
+    with open(fragment_path, "wb") as f:
+        w = BgzfWriter(f)
+        for batch_start in range(0, n_variants, options.batch_size):
+            batch = _generate_batch(
+                rng,
+                min(options.batch_size, n_variants - batch_start),
+                position,
+                options,
+            )
+            position = int(batch["position"][-1])
+            if options.is_bcf:
+                encoded = _encode_bcf_records(contig_index, batch, dictionary, options)
+            else:
+                encoded = _encode_vcf_records(contig_name, batch, options)
+            for i, record in enumerate(encoded):
+                start = w.tell()
+                w.write(record)
+                beg = int(batch["position"][i]) - 1
+                rlen = len(batch["alleles"][i][0])
+                records.append((contig_index, beg, beg + rlen, start, w.tell()))
+        w.close(write_eof=False)
+    return fragment_path, records
+
+
+def _generate_batch(
+    rng: np.random.Generator, n: int, last_position: int, options: GeneratorOptions
+) -> Dict[str, Any]:
+    """Generate random data for a batch of `n` variants."""
+    n_samples, ploidy = options.n_samples, options.ploidy
+    position = last_position + np.cumsum(rng.integers(1, 2 * MEAN_VARIANT_SPACING, n))
+    n_alt = rng.integers(1, options.max_alt_alleles + 1, n)
+    ref_index = rng.integers(0, 4, n)
+    alleles = []
+    for i in range(n):
+        ref = BASES[ref_index[i]]
+        alts = [b for b in BASES if b != ref]
+        # use insertions for any further alleles beyond the three other bases
+        alts += [ref + "A" * k for k in range(1, n_alt[i] - 2)]
+        alleles.append([ref] + alts[: n_alt[i]])
+
+    # genotypes, with the allele for each call uniform over the alleles at the site
+    gt = np.floor(
+        rng.random((n, n_samples, ploidy)) * (n_alt + 1)[:, None, None]
+    ).astype(np.int32)
+    if options.missing_rate > 0:
+        gt[rng.random((n, n_samples)) < options.missing_rate] = -1
+    phased = rng.random((n, n_samples)) < options.phased_rate
+
+    batch: Dict[str, Any] = dict(
+        position=position, alleles=alleles, n_alt=n_alt, gt=gt, phased=phased
+    )
+
+    called = gt >= 0
+    if "AC" in options.info_fields or "AF" in options.info_fields:
+        batch["AC"] = [
+            [int(np.sum(gt[i] == a)) for a in range(1, n_alt[i] + 1)] for i in range(n)
+        ]
+    if "AN" in options.info_fields or "AF" in options.info_fields:
+        batch["AN"] = called.reshape(n, -1).sum(axis=1)
+    if "AF" in options.info_fields:
+        batch["AF"] = [
+            [ac / max(int(batch["AN"][i]), 1) for ac in batch["AC"][i]]
+            for i in range(n)
+        ]
+    if "DP" in options.info_fields:
+        batch["INFO_DP"] = rng.integers(0, 100 * max(1, n_samples), n)
+    if "DB" in options.info_fields:
+        batch["DB"] = rng.random(n) < 0.5
+    if "DP" in options.format_fields:
+        batch["FORMAT_DP"] = rng.integers(0, 100, (n, n_samples))
+    if "GQ" in options.format_fields:
+        batch["GQ"] = rng.integers(0, 100, (n, n_samples))
+    if "AD" in options.format_fields:
+        batch["AD"] = rng.integers(0, 50, (n, n_samples, options.max_alt_alleles + 1))
+    if "PL" in options.format_fields:
+        max_genotypes = n_genotypes(options.max_alt_alleles + 1, ploidy)
+        batch["PL"] = rng.integers(0, 1000, (n, n_samples, max_genotypes))
+    return batch
+
+
+def _n_values(number: str, n_alt: int, ploidy: int) -> int:
+    """The number of values for a field with the given Number at a site."""
+    if number == "A":
+        return n_alt
+    elif number == "R":
+        return n_alt + 1
+    elif number == "G":
+        return n_genotypes(n_alt + 1, ploidy)
+    return int(number)
+
+
+def _format_gt_bytes(gt: np.ndarray, phased: np.ndarray) -> np.ndarray:
+    """Format genotype calls with single digit alleles as VCF text, using byte arithmetic.
+
+    Returns an array of shape (variants, samples, 2 * ploidy) where the last byte for each
+    sample is a tab.
+    """
+    n, n_samples, ploidy = gt.shape
+    out = np.empty((n, n_samples, 2 * ploidy), dtype=np.uint8)
+    out[:, :, 0::2] = np.where(gt < 0, ord("."), gt + ord("0"))
+    if ploidy > 1:
+        out[:, :, 1:-1:2] = np.where(phased, ord("|"), ord("/"))[:, :, None]
+    out[:, :, -1] = ord("\t")
+    return out
+
+
+def _format_gt(gt: np.ndarray, phased: np.ndarray) -> np.ndarray:
+    """Format genotype calls as VCF strings, e.g. "0|1", returning a bytes array."""
+    n, n_samples, ploidy = gt.shape
+    if gt.max(initial=0) < 10:
+        out = np.ascontiguousarray(_format_gt_bytes(gt, phased)[:, :, :-1])
+        return out.view(f"S{2 * ploidy - 1}")[:, :, 0]
+    strings = np.where(gt < 0, ".", gt.astype(str))
+    result = strings[:, :, 0]
+    separator = np.where(phased, "|", "/")
+    for k in range(1, ploidy):
+        result = np.char.add(np.char.add(result, separator), strings[:, :, k])
+    return np.char.encode(result)
+
+
+def _encode_vcf_records(
+    contig_name: str, batch: Dict[str, Any], options: GeneratorOptions
+) -> List[bytes]:
+    """Encode a batch of variants as VCF text lines."""
+    n = len(batch["position"])
+    records = []
+    gt_strings = None
+    gt_bytes = None
+    if options.format_fields == ["GT"] and batch["gt"].max(initial=0) < 10:
+        # Fast path: the sample columns for each line can be formatted in one go
+        gt_bytes = _format_gt_bytes(batch["gt"], batch["phased"]).reshape(n, -1)
+    elif "GT" in options.format_fields:
+        gt_strings = _format_gt(batch["gt"], batch["phased"])
+    format_column = ":".join(options.format_fields)
+    for i in range(n):
+        alleles = batch["alleles"][i]
+        info = []
+        for field in options.info_fields:
+            if field in ("AC", "AF"):
+                fmt = "{:d}" if field == "AC" else "{:.4g}"
+                info.append(
+                    f"{field}=" + ",".join(fmt.format(v) for v in batch[field][i])
+                )
+            elif field == "AN":
+                info.append(f"AN={batch['AN'][i]}")
+            elif field == "DP":
+                info.append(f"DP={batch['INFO_DP'][i]}")
+            elif field == "DB":
+                if batch["DB"][i]:
+                    info.append("DB")
+            elif field == "AA":
+                info.append(f"AA={alleles[0]}")
+        columns = [
+            contig_name,
+            str(batch["position"][i]),
+            ".",
+            alleles[0],
+            ",".join(alleles[1:]),
+            ".",
+            "PASS",
+            ";".join(info) if len(info) > 0 else ".",
+        ]
+        line = "\t".join(columns).encode("utf-8")
+        if options.n_samples > 0:
+            if gt_bytes is not None:
+                samples = gt_bytes[i, :-1].tobytes()
+            else:
+                samples = b"\t".join(
+                    _format_sample_fields(batch, i, gt_strings, options)
+                )
+            line += b"\t" + format_column.encode("utf-8") + b"\t" + samples
+        records.append(line + b"\n")
+    return records
+
+
+def _format_sample_fields(
+    batch: Dict[str, Any],
+    i: int,
+    gt_strings: Optional[np.ndarray],
+    options: GeneratorOptions,
+) -> np.ndarray:
+    """Format the FORMAT fields for all samples of variant `i`, e.g. "0/1:12:99"."""
+    n_alt = int(batch["n_alt"][i])
+    values = []
+    for field in options.format_fields:
+        if field == "GT":
+            assert gt_strings is not None
+            values.append(gt_strings[i])
+            continue
+        data = batch["FORMAT_DP" if field == "DP" else field][i]
+        if data.ndim == 1:
+            values.append(data.astype("S"))
+            continue
+        k = _n_values(FORMAT_FIELDS[field][0], n_alt, options.ploidy)
+        strings = data[:, :k].astype("S")
+        joined = strings[:, 0]
+        for j in range(1, k):
+            joined = np.char.add(np.char.add(joined, b","), strings[:, j])
+        values.append(joined)
+    result = values[0]
+    for value in values[1:]:
+        result = np.char.add(np.char.add(result, b":"), value)
+    return result  # type: ignore[no-any-return]
+
+
+def _bcf_typed_descriptor(n: int, type: int) -> bytes:
+    if n < 15:
+        return bytes([n << 4 | type])
+    return bytes([15 << 4 | type]) + _bcf_typed_int(n)
+
+
+def _bcf_typed_int(value: int) -> bytes:
+    if -120 <= value <= 127:
+        return bytes([1 << 4 | BCF_TYPE_INT8]) + struct.pack("<b", value)
+    elif -32760 <= value <= 32767:
+        return bytes([1 << 4 | BCF_TYPE_INT16]) + struct.pack("<h", value)
+    return bytes([1 << 4 | BCF_TYPE_INT32]) + struct.pack("<i", value)
+
+
+def _bcf_typed_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _bcf_typed_descriptor(len(data), BCF_TYPE_CHAR) + data
+
+
+def _bcf_int_type(values: np.ndarray) -> int:
+    """The smallest BCF integer type that can hold the values (excluding reserved values)."""
+    lo, hi = int(values.min(initial=0)), int(values.max(initial=0))
+    if -120 <= lo and hi <= 127:
+        return BCF_TYPE_INT8
+    elif -32760 <= lo and hi <= 32767:
+        return BCF_TYPE_INT16
+    return BCF_TYPE_INT32
+
+
+def _bcf_typed_ints(values: Sequence[int]) -> bytes:
+    array = np.asarray(values)
+    type = _bcf_int_type(array)
+    return (
+        _bcf_typed_descriptor(len(array), type)
+        + array.astype(BCF_INT_DTYPE[type]).tobytes()
+    )
+
+
+def _bcf_typed_floats(values: Sequence[float]) -> bytes:
+    return (
+        _bcf_typed_descriptor(len(values), BCF_TYPE_FLOAT)
+        + np.asarray(values, dtype="<f4").tobytes()
+    )
+
+
+def _encode_bcf_records(
+    contig_index: int,
+    batch: Dict[str, Any],
+    dictionary: Dict[str, int],
+    options: GeneratorOptions,
+) -> List[bytes]:
+    """Encode a batch of variants as BCF records."""
+    n = len(batch["position"])
+    n_samples, ploidy = options.n_samples, options.ploidy
+    records = []
+    if "GT" in options.format_fields:
+        # BCF genotypes are (allele + 1) << 1 | phased, where the phase bit applies to
+        # all but the first allele, and 0 << 1 is a missing allele
+        gt = batch["gt"]
+        gt_bcf = ((gt + 1) << 1).astype("<i1")
+        if ploidy > 1:
+            gt_bcf[:, :, 1:] |= batch["phased"][:, :, None].astype("<i1")
+    for i in range(n):
+        alleles = batch["alleles"][i]
+        n_alt = int(batch["n_alt"][i])
+        info = []
+        for field in options.info_fields:
+            key = _bcf_typed_int(dictionary[field])
+            if field == "AC":
+                info.append(key + _bcf_typed_ints(batch["AC"][i]))
+            elif field == "AF":
+                info.append(key + _bcf_typed_floats(batch["AF"][i]))
+            elif field == "AN":
+                info.append(key + _bcf_typed_ints([int(batch["AN"][i])]))
+            elif field == "DP":
+                info.append(key + _bcf_typed_ints([int(batch["INFO_DP"][i])]))
+            elif field == "DB":
+                if batch["DB"][i]:
+                    info.append(key + bytes([0]))
+            elif field == "AA":
+                info.append(key + _bcf_typed_string(alleles[0]))
+        shared = b"".join(
+            [
+                struct.pack(
+                    "<iiiI",
+                    contig_index,
+                    int(batch["position"][i]) - 1,
+                    len(alleles[0]),
+                    0x7F800001,  # missing QUAL
+                ),
+                struct.pack(
+                    "<II",
+                    len(alleles) << 16 | len(info),
+                    len(options.format_fields) << 24 | n_samples,
+                ),
+                _bcf_typed_string("."),
+                b"".join(_bcf_typed_string(allele) for allele in alleles),
+                _bcf_typed_ints([dictionary["PASS"]]),
+                b"".join(info),
+            ]
+        )
+        indiv = []
+        if n_samples > 0:
+            for field in options.format_fields:
+                key = _bcf_typed_int(dictionary[field])
+                if field == "GT":
+                    indiv.append(
+                        key
+                        + _bcf_typed_descriptor(ploidy, BCF_TYPE_INT8)
+                        + gt_bcf[i].tobytes()
+                    )
+                    continue
+                data = batch["FORMAT_DP" if field == "DP" else field][i]
+                if data.ndim == 1:
+                    data = data[:, None]
+                else:
+                    k = _n_values(FORMAT_FIELDS[field][0], n_alt, ploidy)
+                    data = data[:, :k]
+                type = _bcf_int_type(data)
+                indiv.append(
+                    key
+                    + _bcf_typed_descriptor(data.shape[1], type)
+                    + data.astype(BCF_INT_DTYPE[type]).tobytes()
+                )
+        indiv_bytes = b"".join(indiv)
+        records.append(
+            struct.pack("<II", len(shared), len(indiv_bytes)) + shared + indiv_bytes
+        )
+    return records
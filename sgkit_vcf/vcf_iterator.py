@@ -0,0 +1,227 @@
+"""Iterate over chunks of variants decoded from VCF files, as NumPy arrays."""
+import queue
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.vcf_fields import get_vcf_fields
+from sgkit_vcf.vcf_reader import (
+    DEFAULT_ALT_NUMBER,
+    DEFAULT_PLOIDY,
+    ENGINES,
+    _input_regions,
+    _read_chunks,
+    allocate_buffers,
+    open_header,
+    scan_region_sizes,
+    variable_specs,
+)
+
+# How often (in seconds) blocked worker threads check whether the iterator has been closed
+WORKER_POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+def iter_vcf_chunks(
+    input: Union[PathType, Sequence[PathType]],
+    *,
+    regions: Union[None, str, Sequence[str], Sequence[Optional[Sequence[str]]]] = None,
+    chunk_length: int = 10_000,
+    fields: Optional[Sequence[str]] = None,
+    exclude_fields: Optional[Sequence[str]] = None,
+    field_defs: Optional[Dict[str, Dict[str, Any]]] = None,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    engine: str = "cyvcf2",
+    variables: Optional[Sequence[str]] = None,
+    recycle_buffers: bool = False,
+    prefetch: int = 1,
+    num_workers: int = 1,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Iterate over chunks of variants in one or more VCF files, as dicts of NumPy arrays.
+
+    Chunks are decoded on background threads while the caller is consuming earlier
+    chunks, so that decoding overlaps with whatever the caller does with them.
+
+    Each chunk has at most `chunk_length` variants, and never spans more than one
+    region. The arrays in each chunk are keyed by variable name, as in
+    `create_genotype_call_dataset`.
+
+    Parameters
+    ----------
+    input : Union[PathType, Sequence[PathType]]
+        A path (or paths) to the input BCF or VCF file (or files). VCF files should
+        be compressed and have a .tbi or .csi index file. BCF files should have a .csi
+        index file.
+    regions : Union[None, str, Sequence[str], Sequence[Optional[Sequence[str]]]], optional
+        Genomic region or regions to read variants for. For multiple inputs, multiple
+        input regions are specified as a sequence of values which may be None, or a
+        sequence of region strings. By default None, which means read all variants.
+    chunk_length : int, optional
+        The maximum number of variants in each chunk, by default 10,000.
+    fields : Optional[Sequence[str]], optional
+        INFO and FORMAT fields to decode, in addition to the genotypes and the fixed
+        fields (see `vcf_to_zarr`), by default None.
+    exclude_fields : Optional[Sequence[str]], optional
+        Fields to leave out of those matched by `fields`, by default None.
+    field_defs : Optional[Dict[str, Dict[str, Any]]], optional
+        Overrides for the header definitions of fields (see `vcf_to_zarr`), by default None.
+    alt_number : Optional[int], optional
+        The number of ALT alleles to store for each variant (see `vcf_to_zarr`), by
+        default 3. If None, the largest number of ALT alleles of any variant in the
+        regions is used, which is found by scanning them before any chunks are decoded.
+    ploidy : Optional[int], optional
+        The number of alleles to store for each genotype call, with calls that have
+        fewer padded with the fill value (see `vcf_to_zarr`), by default 2. If None,
+        the largest ploidy of any call in the regions is used, which is found by
+        scanning them (along with the alleles) before any chunks are decoded.
+    engine : str, optional
+        The decoder to use, "cyvcf2" or "native" (see `vcf_to_zarr`), by default "cyvcf2".
+    variables : Optional[Sequence[str]], optional
+        The variables to decode, by default None, which means all of them. Variables
+        that are not requested are not decoded at all.
+    recycle_buffers : bool, optional
+        If True, the arrays in a chunk are reused for a later chunk once the next
+        chunk has been requested, so the caller must have finished with (or copied)
+        them by then. This avoids allocating new arrays for every chunk. By default
+        False, which means every chunk has its own arrays.
+    prefetch : int, optional
+        The number of decoded chunks to hold ready for the caller, by default 1.
+    num_workers : int, optional
+        The number of threads to decode regions with, by default 1. With more than
+        one worker, regions are decoded concurrently and their chunks are interleaved
+        in the order that they are decoded, although the chunks within each region are
+        always in order. With one worker, chunks are in the order of the regions.
+
+    Yields
+    ------
+    Dict[str, np.ndarray]
+        The arrays for a chunk of variants.
+
+    Raises
+    ------
+    ValueError
+        If any of `variables` are not variables that are decoded from VCF, if
+        `chunk_length`, `prefetch` or `num_workers` are less than 1, or if `engine` is
+        not a known engine.
+    """
+    if chunk_length < 1:
+        raise ValueError(f"chunk_length must be at least 1: {chunk_length}")
+    if prefetch < 1:
+        raise ValueError(f"prefetch must be at least 1: {prefetch}")
+    if num_workers < 1:
+        raise ValueError(f"num_workers must be at least 1: {num_workers}")
+    if engine not in ENGINES:
+        raise ValueError(f"Engine must be one of {ENGINES}: {engine}")
+
+    input_regions = [
+        (input, region)
+        for input, input_region_list in _input_regions(input, regions)
+        for region in input_region_list
+    ]
+    if len(input_regions) == 0:
+        return  # no regions, so no chunks
+
+    alt_number, ploidy = scan_region_sizes(input_regions, alt_number, ploidy)
+    native = engine == "native" and not fields
+    with open_header(input_regions[0][0], native=native, header_only=True) as vcf:
+        vcf_fields = get_vcf_fields(
+            vcf,
+            fields,
+            exclude_fields,
+            field_defs,
+            alt_number=alt_number,
+            ploidy=ploidy,
+        )
+        specs = variable_specs(vcf, vcf_fields, False, alt_number, ploidy)
+    if variables is not None:
+        unknown_variables = [var for var in variables if var not in specs]
+        if len(unknown_variables) > 0:
+            raise ValueError(f"Unknown variables: {unknown_variables}")
+        specs = {var: spec for var, spec in specs.items() if var in variables}
+
+    work: "queue.Queue[Any]" = queue.Queue()
+    for input_region in input_regions:
+        work.put(input_region)
+
+    # Bounding the results queue stops the workers from running too far ahead
+    results: "queue.Queue[Any]" = queue.Queue(maxsize=prefetch)
+    free_buffers: "queue.Queue[Dict[str, np.ndarray]]" = queue.Queue()
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=WORKER_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker() -> None:
+        # the buffers that the current chunk is being decoded into
+        current_buffers: List[Dict[str, np.ndarray]] = []
+
+        def get_buffers() -> Dict[str, np.ndarray]:
+            try:
+                buffers = free_buffers.get_nowait()
+            except queue.Empty:
+                buffers = allocate_buffers(specs, chunk_length)
+            current_buffers[:] = [buffers]
+            return buffers
+
+        try:
+            while not stop.is_set():
+                try:
+                    input, region = work.get_nowait()
+                except queue.Empty:
+                    break
+                with open_header(input, region, native) as vcf:
+                    # decoded in the same way as by vcf_to_zarr
+                    for chunk in _read_chunks(
+                        vcf,
+                        input,
+                        region,
+                        chunk_length,
+                        vcf_fields,
+                        variant_end=False,
+                        alt_number=alt_number,
+                        ploidy=ploidy,
+                        engine=engine,
+                        get_buffers=get_buffers,
+                    ):
+                        if not put((chunk, current_buffers[0])):
+                            return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    threads = [
+        threading.Thread(target=worker, name=f"iter_vcf_chunks-{i}", daemon=True)
+        for i in range(num_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        n_running = num_workers
+        while n_running > 0:
+            item = results.get()
+            if item is _DONE:
+                n_running -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            chunk, buffers = item
+            yield chunk
+            if recycle_buffers:
+                free_buffers.put(buffers)
+    finally:
+        # Also reached if the caller stops iterating early
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -1,13 +1,28 @@
-from typing import Any, Dict, Optional, Sequence
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import fsspec
 import numpy as np
-from cyvcf2 import VCF
-
-from sgkit.typing import PathType
-from sgkit_vcf.csi import CSI_EXTENSION, read_csi
-from sgkit_vcf.tbi import TABIX_EXTENSION, read_tabix
-from sgkit_vcf.utils import ceildiv, get_file_length
+from fsspec.asyn import AsyncFileSystem, sync
+
+from sgkit_vcf.csi import (
+    CSI_EXTENSION,
+    CSIIndex,
+    bin_limit,
+    get_first_locus_in_bin,
+    read_csi,
+)
+from sgkit_vcf.profiling import span
+from sgkit_vcf.tbi import (
+    TABIX_DEPTH,
+    TABIX_EXTENSION,
+    TABIX_LINEAR_INDEX_INTERVAL_SIZE,
+    TABIX_MIN_SHIFT,
+    read_tabix,
+)
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.utils import ceildiv, get_file_length, get_file_offset, reg2bins
 
 
 def region_string(contig: str, start: int, end: Optional[int] = None) -> str:
@@ -45,14 +60,136 @@ def get_csi_path(
             return None
 
 
+def find_index_path(
+    vcf_path: PathType, storage_options: Optional[Dict[str, str]] = None
+) -> str:
+    """Return the path of the .tbi or .csi index for a VCF file, preferring .tbi."""
+    index_path = get_tabix_path(vcf_path, storage_options=storage_options)
+    if index_path is None:
+        index_path = get_csi_path(vcf_path, storage_options=storage_options)
+        if index_path is None:
+            raise ValueError("Cannot find .tbi or .csi file.")
+    return index_path
+
+
+@dataclass
+class VcfFileInfo:
+    """The size of a VCF or BCF file, and the location of its index."""
+
+    path: str
+    # the length of the file, in bytes
+    size: int
+    # the path of the .tbi or .csi index (preferring .tbi), or None if there isn't one
+    index_path: Optional[str]
+
+
+def get_vcf_file_infos(
+    vcf_paths: Sequence[PathType],
+    *,
+    storage_options: Optional[Dict[str, str]] = None,
+    max_concurrency: int = 256,
+) -> List[VcfFileInfo]:
+    """Find the sizes and indexes of many VCF or BCF files at once.
+
+    Finding the index and size of each file separately (as `find_index_path` and
+    `get_file_length` do) takes several requests per file, each made in turn, which is
+    slow for thousands of files in object storage. Here the files must all be on the same
+    filesystem, and a single filesystem instance is used for all the requests. For async
+    filesystems (such as HTTP, S3 and GCS), the requests are made concurrently.
+
+    Parameters
+    ----------
+    vcf_paths : Sequence[PathType]
+        The paths to the VCF or BCF files.
+    storage_options: Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+    max_concurrency : int, optional
+        The maximum number of requests to make at once to an async filesystem, by
+        default 256.
+
+    Returns
+    -------
+    List[VcfFileInfo]
+        The size and index path of each file, in the same order as `vcf_paths`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If any of the files don't exist.
+    """
+    if len(vcf_paths) == 0:
+        return []
+    urls = [str(path) for path in vcf_paths]
+    extensions = ("", TABIX_EXTENSION, CSI_EXTENSION)
+    fs, _, paths = fsspec.core.get_fs_token_paths(
+        [url + extension for url in urls for extension in extensions],
+        storage_options=storage_options or {},
+    )
+    with span("file info", "plan", files=len(urls)):
+        infos = _get_file_infos(fs, paths, max_concurrency)
+
+    file_infos = []
+    for i, url in enumerate(urls):
+        vcf_info, tabix_info, csi_info = infos[i * 3 : (i + 1) * 3]
+        if vcf_info is None:
+            raise FileNotFoundError(url)
+        if vcf_info.get("size") is None:
+            raise IOError(f"Cannot determine size of file {url}")  # pragma: no cover
+        if tabix_info is not None:
+            index_path: Optional[str] = url + TABIX_EXTENSION
+        elif csi_info is not None:
+            index_path = url + CSI_EXTENSION
+        else:
+            index_path = None
+        file_infos.append(VcfFileInfo(url, int(vcf_info["size"]), index_path))
+    return file_infos
+
+
+def _get_file_infos(
+    fs: Any, paths: Sequence[str], max_concurrency: int
+) -> List[Optional[Dict[str, Any]]]:
+    """Return the info for each path, or None if it doesn't exist."""
+    if isinstance(fs, AsyncFileSystem):
+
+        async def info(path: str, semaphore: asyncio.Semaphore) -> Any:
+            async with semaphore:
+                return await fs._info(path)
+
+        async def gather() -> List[Any]:
+            semaphore = asyncio.Semaphore(max_concurrency)
+            coros = [info(path, semaphore) for path in paths]
+            return await asyncio.gather(*coros, return_exceptions=True)
+
+        results = sync(fs.loop, gather)
+    else:
+        results = []
+        for path in paths:
+            try:
+                results.append(fs.info(path))
+            except FileNotFoundError as e:
+                results.append(e)
+
+    infos: List[Optional[Dict[str, Any]]] = []
+    for result in results:
+        if isinstance(result, FileNotFoundError):
+            infos.append(None)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            infos.append(result)
+    return infos
+
+
 def read_index(
     index_path: PathType, storage_options: Optional[Dict[str, str]] = None
 ) -> Any:
     url = str(index_path)
     if url.endswith(TABIX_EXTENSION):
-        return read_tabix(url, storage_options=storage_options)
+        with span("index read", "plan", index=url):
+            return read_tabix(url, storage_options=storage_options)
     elif url.endswith(CSI_EXTENSION):
-        return read_csi(url, storage_options=storage_options)
+        with span("index read", "plan", index=url):
+            return read_csi(url, storage_options=storage_options)
     else:
         raise ValueError("Only .tbi or .csi indexes are supported.")
 
@@ -63,7 +200,71 @@ def get_sequence_names(vcf_path: PathType, index: Any) -> Any:
         return index.sequence_names
     except AttributeError:
         # ... but csi doesn't, so fall back to the VCF header
-        return VCF(vcf_path).seqnames
+        from sgkit_vcf.vcf_reader import open_vcf, read_native_header
+
+        header = read_native_header(vcf_path)
+        if header is not None:
+            return header.seqnames
+        with open_vcf(vcf_path, header_only=True) as vcf:
+            return vcf.seqnames
+
+
+def region_virtual_offset(index: Any, contig_index: int, start: int) -> Optional[int]:
+    """Return a virtual file offset to read the records starting at or after `start` from.
+
+    The offset is at or before the first such record in the contig, so records before it
+    may need skipping. Returns None if the index has no records for the contig.
+    """
+    if isinstance(index, CSIIndex):
+        if contig_index >= len(index.bins):
+            return None
+        pseudo_bin = bin_limit(index.min_shift, index.depth) + 1
+        bins = [b for b in index.bins[contig_index] if b.bin != pseudo_bin]
+        if len(bins) == 0:
+            return None
+        # the records starting at or after `start` come after the first record that
+        # overlaps any bin that starts at or before it
+        before = [
+            b.loffset for b in bins if get_first_locus_in_bin(index, b.bin) <= start
+        ]
+        if len(before) > 0:
+            return max(before)
+        return min(b.loffset for b in bins)
+    else:
+        if contig_index >= len(index.linear_indexes):
+            return None
+        linear_index = index.linear_indexes[contig_index]
+        i = (start - 1) // TABIX_LINEAR_INDEX_INTERVAL_SIZE
+        if len(linear_index) == 0 or i >= len(linear_index):
+            # the linear index covers every record in the contig
+            return None
+        # the linear index is non-decreasing, but empty intervals may be zero
+        return int(max(linear_index[: i + 1]))
+
+
+def region_file_ranges(
+    index: Any, contig_index: int, start: int, end: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """Return the ranges of (compressed) file offsets that the records overlapping a region may be read from.
+
+    These are the chunks of the index bins that overlap the region, which are the parts of
+    the file that htslib reads for a region query. Each range ends at the start of the
+    BGZF block that the chunk ends in, so the caller must allow for that block.
+    """
+    if isinstance(index, CSIIndex):
+        min_shift, depth = index.min_shift, index.depth
+    else:
+        min_shift, depth = TABIX_MIN_SHIFT, TABIX_DEPTH
+    if contig_index >= len(index.bins):
+        return []
+    max_end = 1 << (min_shift + 3 * depth)
+    bins = set(reg2bins(start - 1, max_end if end is None else end, min_shift, depth))
+    return [
+        (get_file_offset(chunk.cnk_beg), get_file_offset(chunk.cnk_end))
+        for b in index.bins[contig_index]
+        if b.bin in bins
+        for chunk in b.chunks
+    ]
 
 
 def partition_into_regions(
@@ -72,6 +273,7 @@ def partition_into_regions(
     index_path: Optional[PathType] = None,
     num_parts: Optional[int] = None,
     target_part_size: Optional[int] = None,
+    file_length: Optional[int] = None,
     storage_options: Optional[Dict[str, str]] = None,
 ) -> Optional[Sequence[str]]:
     """
@@ -98,6 +300,9 @@ def partition_into_regions(
         The desired number of parts to partition the VCF file into, by default None
     target_part_size : Optional[int], optional
         The desired size, in bytes, of each (compressed) part of the partitioned VCF, by default None
+    file_length : Optional[int], optional
+        The length of the VCF file in bytes, by default None. If not specified, it is
+        found from the filesystem (see `get_vcf_file_infos` for finding it for many files).
     storage_options: Optional[Dict[str, str]], optional
         Any additional parameters for the storage backend (see `fsspec.open`).
 
@@ -129,14 +334,11 @@ def partition_into_regions(
         raise ValueError("target_part_size must be positive")
 
     if index_path is None:
-        index_path = get_tabix_path(vcf_path, storage_options=storage_options)
-        if index_path is None:
-            index_path = get_csi_path(vcf_path, storage_options=storage_options)
-            if index_path is None:
-                raise ValueError("Cannot find .tbi or .csi file.")
+        index_path = find_index_path(vcf_path, storage_options=storage_options)
 
     # Calculate the desired part file boundaries
-    file_length = get_file_length(vcf_path, storage_options=storage_options)
+    if file_length is None:
+        file_length = get_file_length(vcf_path, storage_options=storage_options)
     if num_parts is not None:
         target_part_size = file_length // num_parts
     elif target_part_size is not None:
@@ -181,9 +383,323 @@ def partition_into_regions(
                 regions.append(region_string(contig, start))
                 for ri in range(region_contigs[i] + 1, region_contigs[i + 1]):
                     regions.append(sequence_names[ri])  # pragma: no cover
-                regions.append(region_string(next_contig, 1, end))
+                if end > 0:  # the next region may start at the beginning of its contig
+                    regions.append(region_string(next_contig, 1, end))
     # Add any sequences at the end that were not skipped
     for ri in range(region_contigs[-1] + 1, len(sequence_names)):
         regions.append(sequence_names[ri])  # pragma: no cover
 
     return regions
+
+
+def partition_files_into_regions(
+    vcf_paths: Sequence[PathType],
+    *,
+    num_parts: Optional[int] = None,
+    target_part_size: Optional[int] = None,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> List[Optional[Sequence[str]]]:
+    """
+    Calculate genomic region strings to partition each of many VCF or BCF files into roughly equal parts.
+
+    This is the same as calling `partition_into_regions` for each file, except that the
+    sizes and indexes of the files are found at once with `get_vcf_file_infos`. The result
+    can be passed as the `regions` argument of `vcf_to_zarr`, along with the files.
+
+    Parameters
+    ----------
+    vcf_paths : Sequence[PathType]
+        The paths to the VCF or BCF files, which must all be on the same filesystem.
+    num_parts : Optional[int], optional
+        The desired number of parts to partition each file into, by default None
+    target_part_size : Optional[int], optional
+        The desired size, in bytes, of each (compressed) part, by default None
+    storage_options: Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+
+    Returns
+    -------
+    List[Optional[Sequence[str]]]
+        The region strings that partition each file, or None for a file that should not
+        be partitioned, in the same order as `vcf_paths`.
+    """
+    return [
+        partition_into_regions(
+            info.path,
+            index_path=info.index_path,
+            num_parts=num_parts,
+            target_part_size=target_part_size,
+            file_length=info.size,
+            storage_options=storage_options,
+        )
+        for info in get_vcf_file_infos(vcf_paths, storage_options=storage_options)
+    ]
+
+
+def parse_region(region: str) -> Tuple[str, int, Optional[int]]:
+    """Split a region string into its contig, start, and (optional) end, which are 1-based and inclusive."""
+    if ":" not in region:
+        return region, 1, None
+    contig, start_end = region.rsplit(":", 1)
+    start, _, end = start_end.partition("-")
+    return contig, int(start), int(end) if end != "" else None
+
+
+def estimate_region_sizes(
+    vcf_path: PathType,
+    regions: Sequence[Optional[str]],
+    *,
+    index_path: Optional[PathType] = None,
+    file_length: Optional[int] = None,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> List[int]:
+    """
+    Estimate the compressed size, in bytes, of the data for each region in a VCF or BCF file.
+
+    The estimates are found by looking up the file offsets of the region boundaries in the
+    .tbi or .csi file, so they are only accurate to the granularity of the index. They are
+    intended for load balancing (e.g. scheduling the largest parts first), not for exact
+    accounting.
+
+    Parameters
+    ----------
+    vcf_path : PathType
+        The path to the VCF file.
+    regions : Sequence[Optional[str]]
+        The region strings to estimate sizes for. A region of None stands for the whole file.
+    index_path : Optional[PathType], optional
+        The path to the VCF index (`.tbi` or `.csi`), by default None. If not specified, the
+        index path is constructed by appending the index suffix (`.tbi` or `.csi`) to the VCF path.
+    file_length : Optional[int], optional
+        The length of the VCF file in bytes, by default None. If not specified, it is
+        found from the filesystem (see `get_vcf_file_infos` for finding it for many files).
+    storage_options: Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+
+    Returns
+    -------
+    List[int]
+        The estimated size of each region, in the same order as `regions`.
+    """
+    if file_length is None:
+        file_length = get_file_length(vcf_path, storage_options=storage_options)
+    if all(region is None for region in regions):
+        return [file_length] * len(regions)
+
+    if index_path is None:
+        index_path = find_index_path(vcf_path, storage_options=storage_options)
+    index = read_index(index_path, storage_options=storage_options)
+    sequence_names = list(get_sequence_names(vcf_path, index))
+    file_offsets, contig_indexes, positions = index.offsets()
+
+    sizes = []
+    for region in regions:
+        if region is None:
+            sizes.append(file_length)
+            continue
+        contig, start, end = parse_region(region)
+        if contig not in sequence_names:
+            sizes.append(0)
+            continue
+        ci = sequence_names.index(contig)
+        begin_offset, end_offset = _region_offsets(
+            file_offsets, contig_indexes, positions, file_length, ci, start, end
+        )
+        sizes.append(max(end_offset - begin_offset, 0))
+    return sizes
+
+
+def estimate_region_variant_counts(
+    vcf_path: PathType,
+    regions: Sequence[Optional[str]],
+    *,
+    index_path: Optional[PathType] = None,
+    file_length: Optional[int] = None,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> Optional[List[int]]:
+    """
+    Estimate the number of variants in each region of a VCF or BCF file, from its index.
+
+    Indexes written by htslib store the number of records on each contig. The number of
+    variants in a region is estimated by scaling the count for its contig by the fraction
+    of the contig's compressed data that is in the region (see `estimate_region_sizes`),
+    so the estimates are exact for whole contigs, and otherwise assume that variants are
+    evenly spread through the data.
+
+    Parameters
+    ----------
+    vcf_path : PathType
+        The path to the VCF file.
+    regions : Sequence[Optional[str]]
+        The region strings to estimate counts for. A region of None stands for the whole file.
+    index_path : Optional[PathType], optional
+        The path to the VCF index (`.tbi` or `.csi`), by default None. If not specified, the
+        index path is constructed by appending the index suffix (`.tbi` or `.csi`) to the VCF path.
+    file_length : Optional[int], optional
+        The length of the VCF file in bytes, by default None. If not specified, it is
+        found from the filesystem (see `get_vcf_file_infos` for finding it for many files).
+    storage_options: Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+
+    Returns
+    -------
+    Optional[List[int]]
+        The estimated number of variants in each region, in the same order as `regions`,
+        or None if the index doesn't store record counts.
+    """
+    if index_path is None:
+        index_path = find_index_path(vcf_path, storage_options=storage_options)
+    index = read_index(index_path, storage_options=storage_options)
+    # contigs without any records have no bins, and so no count
+    record_counts = np.array(index.record_counts, dtype=np.int64)
+    if len(record_counts) == 0 or (record_counts < 0).all():
+        return None
+    record_counts = np.maximum(record_counts, 0)
+
+    if file_length is None:
+        file_length = get_file_length(vcf_path, storage_options=storage_options)
+    sequence_names = list(get_sequence_names(vcf_path, index))
+    file_offsets, contig_indexes, positions = index.offsets()
+
+    counts = []
+    for region in regions:
+        if region is None:
+            counts.append(int(record_counts.sum()))
+            continue
+        contig, start, end = parse_region(region)
+        if contig not in sequence_names:
+            counts.append(0)
+            continue
+        ci = sequence_names.index(contig)
+        if start <= 1 and end is None:
+            counts.append(int(record_counts[ci]))
+            continue
+        region_begin, region_end = _region_offsets(
+            file_offsets, contig_indexes, positions, file_length, ci, start, end
+        )
+        contig_begin, contig_end = _region_offsets(
+            file_offsets, contig_indexes, positions, file_length, ci, 1, None
+        )
+        fraction = max(region_end - region_begin, 0) / max(contig_end - contig_begin, 1)
+        counts.append(int(round(record_counts[ci] * min(fraction, 1.0))))
+    return counts
+
+
+def _region_offsets(
+    file_offsets: Any,
+    contig_indexes: Any,
+    positions: Any,
+    file_length: int,
+    ci: int,
+    start: int,
+    end: Optional[int],
+) -> Tuple[int, int]:
+    """Find the file offsets bounding a region, using the index entries from `index.offsets()`."""
+    # The region starts at the last index entry at or before its start position...
+    before = (contig_indexes == ci) & (positions <= start)
+    if before.any():
+        begin_offset = file_offsets[before].max()
+    else:
+        begin_offset = file_offsets[contig_indexes >= ci].min(initial=file_length)
+
+    # ... and ends at the first index entry after it
+    if end is None:
+        after = contig_indexes > ci
+    else:
+        after = (contig_indexes > ci) | ((contig_indexes == ci) & (positions > end))
+    end_offset = file_offsets[after].min(initial=file_length)
+    return int(begin_offset), int(end_offset)
+
+
+def split_region(
+    vcf_path: PathType,
+    region: Optional[str],
+    num_parts: int,
+    *,
+    index_path: Optional[PathType] = None,
+    storage_options: Optional[Dict[str, str]] = None,
+) -> Optional[Sequence[str]]:
+    """
+    Split a region of a compressed VCF or BCF file into smaller regions of roughly equal size.
+
+    Like `partition_into_regions`, the index is used to find boundaries that divide the
+    (compressed) data in the region evenly, so `num_parts` is a hint: fewer parts may be
+    returned if the index is not fine-grained enough. Every variant in the region is in
+    exactly one of the returned regions.
+
+    Parameters
+    ----------
+    vcf_path : PathType
+        The path to the VCF file.
+    region : Optional[str]
+        The region string to split, or None for the whole file.
+    num_parts : int
+        The desired number of parts to split the region into.
+    index_path : Optional[PathType], optional
+        The path to the VCF index (`.tbi` or `.csi`), by default None. If not specified, the
+        index path is constructed by appending the index suffix (`.tbi` or `.csi`) to the VCF path.
+    storage_options: Optional[Dict[str, str]], optional
+        Any additional parameters for the storage backend (see `fsspec.open`).
+
+    Returns
+    -------
+    Optional[Sequence[str]]
+        The region strings that partition the region, or None if the region can't be split.
+
+    Raises
+    ------
+    ValueError
+        If `num_parts` is not a positive integer.
+    """
+    if num_parts < 1:
+        raise ValueError("num_parts must be positive")
+    if region is None:
+        return partition_into_regions(
+            vcf_path,
+            index_path=index_path,
+            num_parts=num_parts,
+            storage_options=storage_options,
+        )
+    if num_parts == 1:
+        return None
+
+    if index_path is None:
+        index_path = find_index_path(vcf_path, storage_options=storage_options)
+    index = read_index(index_path, storage_options=storage_options)
+    sequence_names = list(get_sequence_names(vcf_path, index))
+    file_offsets, contig_indexes, positions = index.offsets()
+    file_length = get_file_length(vcf_path, storage_options=storage_options)
+
+    contig, start, end = parse_region(region)
+    if contig not in sequence_names:
+        return None
+    ci = sequence_names.index(contig)
+    begin_offset, end_offset = _region_offsets(
+        file_offsets, contig_indexes, positions, file_length, ci, start, end
+    )
+
+    # Candidate boundaries are the index entries inside the region that are past the
+    # start of its data, in position order
+    inside = (contig_indexes == ci) & (positions > start)
+    if end is not None:
+        inside &= positions <= end
+    inside &= (file_offsets > begin_offset) & (file_offsets < end_offset)
+    order = np.argsort(positions[inside], kind="stable")
+    candidate_positions = positions[inside][order]
+    candidate_offsets = np.maximum.accumulate(file_offsets[inside][order])
+
+    # Pick the first candidate at or after each evenly spaced target offset
+    targets = (
+        begin_offset
+        + (end_offset - begin_offset) * np.arange(1, num_parts) // num_parts
+    )
+    ind = np.searchsorted(candidate_offsets, targets)
+    ind = np.unique(ind[ind < len(candidate_offsets)])
+    boundaries = candidate_positions[ind]
+    if len(boundaries) == 0:
+        return None
+
+    starts = [start] + [int(b) for b in boundaries]
+    ends: List[Optional[int]] = [int(b) - 1 for b in boundaries]
+    ends.append(end)
+    return [region_string(contig, s, e) for s, e in zip(starts, ends)]
@@ -0,0 +1,399 @@
+"""Plan a conversion before running it, to check its size and memory use.
+
+`plan_vcf_to_zarr` works out what `vcf_to_zarr` would do with the same arguments,
+without converting anything: the parts that would be converted, how many variants are
+in each, how much memory each task would need, and how much data would be written.
+Only the headers and indexes of the inputs are read, along with the first thousand or so
+records of the first input, which are converted to an in-memory store with the same
+options to measure the size of each variable.
+
+The estimates are only as good as the assumptions behind them:
+
+- The number of variants in each part is found from the record counts in the index,
+  scaled by the fraction of its contig's compressed data that is in the part.
+- The size of each variable is assumed to be proportional to the number of variants
+  (and the number of samples, for call variables), at the rate measured for the sample.
+- Converting a part needs a few times the decoded size of a chunk of variants
+  (`PART_MEMORY_OVERHEAD`), for the decode buffers, the dataset built from them, and
+  the compressed chunks. Merging needs a couple of times the size of an output chunk
+  (`MERGE_MEMORY_OVERHEAD`), for the temporary chunks read and the output chunk
+  written.
+"""
+
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import xarray as xr
+from cyvcf2 import VCF
+
+from sgkit_vcf.genotype_packing import DIM_PACKED
+from sgkit_vcf.sparse_genotypes import DIM_DENSE_VARIANT
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.vcf_partition import (
+    estimate_region_sizes,
+    estimate_region_variant_counts,
+    get_vcf_file_infos,
+    region_string,
+)
+from sgkit_vcf.vcf_reader import (
+    DEFAULT_ALT_NUMBER,
+    DEFAULT_PLOIDY,
+    ConversionOptions,
+    _input_regions,
+    check_conversion_options,
+    open_vcf,
+    vcf_to_zarr_sequential,
+)
+
+# Multiples of the decoded size of a chunk that converting a part, or merging a chunk
+# of the output, is assumed to need
+PART_MEMORY_OVERHEAD = 4
+MERGE_MEMORY_OVERHEAD = 2
+
+# The assumed size of each element of an object (variable-length string) array
+OBJECT_ITEMSIZE = 64
+
+# Dimensions whose size is proportional to the number of variants or samples
+VARIANT_DIMS = ("variants", DIM_DENSE_VARIANT)
+SAMPLE_DIMS = ("samples", DIM_PACKED)
+
+
+@dataclass
+class PlannedPart:
+    """A region of an input that would be converted by a single task."""
+
+    input: str
+    region: Optional[str]
+    # the estimated size of the compressed input data for the region
+    compressed_bytes: int
+    # the estimated number of variants in the region
+    variants: int
+    # the estimated peak memory needed to convert the region
+    memory_bytes: int
+
+
+@dataclass
+class ConversionPlan:
+    """The tasks, memory use and output size that a conversion is estimated to have."""
+
+    # the parts that would be converted, in the order they are merged
+    parts: List[PlannedPart]
+    n_samples: int
+    # the estimated number of variants in the output
+    variants: int
+    chunk_length: int
+    chunk_width: int
+    temp_chunk_length: int
+    # the estimated peak memory needed by the largest part conversion task
+    part_memory_bytes: int
+    # the number of output chunks written when merging parts, or 0 if there's no merge
+    merge_tasks: int
+    # the estimated peak memory needed to write an output chunk when merging parts
+    merge_memory_bytes: int
+    # the estimated sizes of the intermediate stores in the temporary directory, and
+    # of the output store
+    temp_bytes: int
+    output_bytes: int
+    # problems found with the configuration, such as tasks that need too much memory
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def peak_memory_bytes(self) -> int:
+        """The estimated peak memory needed by any single task."""
+        return max(self.part_memory_bytes, self.merge_memory_bytes)
+
+
+@dataclass
+class _VariableSizes:
+    """The measured size of the variables for a sample of variants, split by how they scale."""
+
+    per_variant: float
+    per_call: float
+    fixed: float
+
+    def total(self, variants: int, samples: int) -> float:
+        return self.per_variant * variants + self.per_call * variants * samples
+
+
+def plan_vcf_to_zarr(
+    input: Union[PathType, Sequence[PathType]],
+    *,
+    regions: Union[None, Sequence[str], Sequence[Optional[Sequence[str]]]] = None,
+    chunk_length: int = 10_000,
+    chunk_width: int = 1_000,
+    temp_chunk_length: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None,
+    exclude_fields: Optional[Sequence[str]] = None,
+    field_defs: Optional[Dict[str, Dict[str, Any]]] = None,
+    pack_genotypes: bool = False,
+    sparse_hom_ref: bool = False,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    engine: str = "cyvcf2",
+    merge_samples: bool = False,
+    compute_stats: bool = False,
+    memory_limit: Optional[int] = None,
+    sample_size: int = 1_000,
+) -> ConversionPlan:
+    """Estimate the tasks, memory use and output size of a `vcf_to_zarr` conversion, without running it.
+
+    The arguments have the same meaning as for `vcf_to_zarr`, and invalid combinations
+    raise the same errors. The inputs must be indexed, since the estimates come from
+    their indexes and from converting a small sample of records (see the module
+    documentation for how the estimates are made).
+
+    Parameters
+    ----------
+    input : Union[PathType, Sequence[PathType]]
+        A path (or paths) to the input BCF or VCF file (or files).
+    regions : Union[None, Sequence[str], Sequence[Optional[Sequence[str]]]], optional
+        Genomic region or regions to extract variants for (see `vcf_to_zarr`).
+    chunk_length : int, optional
+        Length (number of variants) of chunks in the output, by default 10_000.
+    chunk_width : int, optional
+        Width (number of samples) of chunks in the output, by default 1_000.
+    temp_chunk_length : Optional[int], optional
+        Length (number of variants) of chunks for temporary intermediate files, by
+        default `chunk_length`.
+    fields : Optional[Sequence[str]], optional
+        INFO and FORMAT fields to extract (see `vcf_to_zarr`).
+    exclude_fields : Optional[Sequence[str]], optional
+        Fields to leave out of those matched by `fields`.
+    field_defs : Optional[Dict[str, Dict[str, Any]]], optional
+        Overrides for the header definitions of fields (see `vcf_to_zarr`).
+    pack_genotypes : bool, optional
+        Whether to bit-pack the genotype calls (see `vcf_to_zarr`).
+    sparse_hom_ref : bool, optional
+        Whether to store hom-ref calls sparsely (see `vcf_to_zarr`).
+    alt_number : Optional[int], optional
+        The number of ALT alleles to store for each variant (see `vcf_to_zarr`).
+    ploidy : Optional[int], optional
+        The number of alleles to store for each genotype call (see `vcf_to_zarr`).
+    engine : str, optional
+        The decoder to use (see `vcf_to_zarr`).
+    merge_samples : bool, optional
+        Whether the inputs are batches of samples to merge (see `vcf_to_zarr`).
+    compute_stats : bool, optional
+        Whether to compute summary statistics of the calls (see `vcf_to_zarr`).
+    memory_limit : Optional[int], optional
+        The memory available to each task, in bytes. If set, a warning is added to the
+        plan for each kind of task whose estimated memory use is more than this. By
+        default None.
+    sample_size : int, optional
+        The number of records of the first input to convert for measuring the size of
+        the variables, by default 1,000.
+
+    Returns
+    -------
+    ConversionPlan
+        The plan.
+    """
+    options = ConversionOptions(
+        fields=fields,
+        exclude_fields=exclude_fields,
+        field_defs=field_defs,
+        pack_genotypes=pack_genotypes,
+        sparse_hom_ref=sparse_hom_ref,
+        alt_number=alt_number,
+        ploidy=ploidy,
+        engine=engine,
+        compute_stats=compute_stats,
+    )
+    check_conversion_options(
+        options,
+        chunk_length=chunk_length,
+        chunk_width=chunk_width,
+        temp_chunk_length=temp_chunk_length,
+        merge_samples=merge_samples,
+    )
+    single_input = isinstance(input, str) or isinstance(input, Path)
+    inputs: List[PathType] = [input] if single_input else list(input)  # type: ignore
+    sequential = (
+        single_input and (regions is None or isinstance(regions, str))
+    ) and not merge_samples
+    if temp_chunk_length is None or sequential:
+        # the sequential conversion writes the output chunks directly
+        temp_chunk_length = chunk_length
+
+    if merge_samples:
+        if regions is not None and not isinstance(regions, str):
+            if not all(isinstance(region, str) for region in regions):
+                raise ValueError(
+                    f"To merge samples, regions must be a sequence of strings, which are used for every input: {regions}"
+                )
+            region_list: List[Optional[str]] = list(regions)  # type: ignore[arg-type]
+        else:
+            region_list = [regions]
+        input_regions = [(i, region_list) for i in inputs]
+    else:
+        input_regions = _input_regions(input, regions)  # type: ignore[arg-type]
+
+    sample_counts = {str(i): _count_samples(i) for i in inputs}
+    n_samples = (
+        sum(sample_counts.values()) if merge_samples else sample_counts[str(inputs[0])]
+    )
+
+    sizes = _measure_variable_sizes(inputs[0], sample_size, chunk_width, options)
+    compressed, decoded, sample_variants, sample_region = sizes
+
+    # find the sizes and indexes of all the inputs at once, since there may be many
+    file_infos = {info.path: info for info in get_vcf_file_infos(inputs)}
+    parts = []
+    temp_bytes = 0.0
+    for part_input, part_regions in input_regions:
+        info = file_infos[str(part_input)]
+        compressed_bytes = estimate_region_sizes(
+            part_input,
+            part_regions,
+            index_path=info.index_path,
+            file_length=info.size,
+        )
+        variant_counts = estimate_region_variant_counts(
+            part_input,
+            part_regions,
+            index_path=info.index_path,
+            file_length=info.size,
+        )
+        if variant_counts is None:
+            # the index doesn't have record counts, so use the density of the sample
+            sample_bytes = estimate_region_sizes(inputs[0], [sample_region])[0]
+            density = sample_variants / max(sample_bytes, 1)
+            variant_counts = [int(round(b * density)) for b in compressed_bytes]
+        part_samples = sample_counts[str(part_input)]
+        for region, part_bytes, variants in zip(
+            part_regions, compressed_bytes, variant_counts
+        ):
+            chunk_variants = min(variants, temp_chunk_length)
+            memory = decoded.total(chunk_variants, part_samples) * PART_MEMORY_OVERHEAD
+            parts.append(
+                PlannedPart(str(part_input), region, part_bytes, variants, int(memory))
+            )
+            temp_bytes += compressed.total(variants, part_samples)
+
+    if merge_samples:
+        # every input has the same variants, so count them for the first input only
+        variants = sum(p.variants for p in parts if p.input == str(inputs[0]))
+    else:
+        variants = sum(p.variants for p in parts)
+    if sequential:
+        merge_tasks = 0
+        merge_memory = 0
+        temp_bytes = 0
+    else:
+        merge_tasks = math.ceil(variants / chunk_length) * math.ceil(
+            n_samples / chunk_width
+        )
+        merge_memory = int(
+            decoded.total(min(variants, chunk_length), min(n_samples, chunk_width))
+            * MERGE_MEMORY_OVERHEAD
+        )
+
+    plan = ConversionPlan(
+        parts=parts,
+        n_samples=n_samples,
+        variants=variants,
+        chunk_length=chunk_length,
+        chunk_width=chunk_width,
+        temp_chunk_length=temp_chunk_length,
+        part_memory_bytes=max((p.memory_bytes for p in parts), default=0),
+        merge_tasks=merge_tasks,
+        merge_memory_bytes=merge_memory,
+        temp_bytes=int(temp_bytes),
+        output_bytes=int(compressed.total(variants, n_samples) + compressed.fixed),
+    )
+    if memory_limit is not None:
+        chunk_argument = "chunk_length" if sequential else "temp_chunk_length"
+        if plan.part_memory_bytes > memory_limit:
+            plan.warnings.append(
+                f"Converting a part needs about {plan.part_memory_bytes} bytes, which is "
+                f"more than the memory limit of {memory_limit} bytes: "
+                f"use a smaller {chunk_argument}"
+            )
+        if plan.merge_memory_bytes > memory_limit:
+            plan.warnings.append(
+                f"Merging a chunk needs about {plan.merge_memory_bytes} bytes, which is "
+                f"more than the memory limit of {memory_limit} bytes: "
+                "use a smaller chunk_length or chunk_width"
+            )
+    return plan
+
+
+def _count_samples(input: PathType) -> int:
+    with open_vcf(input, header_only=True) as vcf:
+        return len(vcf.samples)
+
+
+def _sample_region(input: PathType, sample_size: int) -> Tuple[Optional[str], int]:
+    """Find a region spanning the first `sample_size` records of an input (on its first contig)."""
+    vcf = VCF(str(input), lazy=True, gts012=False)
+    try:
+        contig = None
+        first = last = 0
+        n = 0
+        for variant in vcf:
+            if contig is None:
+                contig, first = variant.CHROM, variant.POS
+            elif variant.CHROM != contig:
+                break
+            last = variant.POS
+            n += 1
+            if n >= sample_size:
+                break
+    finally:
+        vcf.close()
+    if contig is None:
+        return None, 0
+    return region_string(contig, first, last), n
+
+
+def _measure_variable_sizes(
+    input: PathType, sample_size: int, chunk_width: int, options: ConversionOptions
+) -> Tuple[_VariableSizes, _VariableSizes, int, Optional[str]]:
+    """Convert a sample of records, and return the compressed and decoded sizes of the variables."""
+    region, n_records = _sample_region(input, sample_size)
+    store: Dict[str, bytes] = {}
+    if region is not None:
+        # a single chunk of variants, so they aren't padded
+        vcf_to_zarr_sequential(
+            input,
+            store,
+            region=region,
+            chunk_length=n_records,
+            chunk_width=chunk_width,
+            options=options,
+        )
+    if ".zgroup" not in store:
+        empty = _VariableSizes(0, 0, 0)
+        return empty, empty, 0, region
+    ds = xr.open_zarr(store)  # type: ignore[no-untyped-call]
+    n_variants = ds.sizes["variants"]
+    n_samples = ds.sizes["samples"]
+    compressed: Dict[str, float] = {}
+    for key, value in store.items():
+        var = key.split("/")[0]
+        if var in ds.variables and not key.split("/")[-1].startswith("."):
+            compressed[var] = compressed.get(var, 0) + len(value)
+    decoded = {var: _decoded_bytes(ds[var]) for var in ds.variables}
+
+    def split(var_bytes: Dict[str, float]) -> _VariableSizes:
+        sizes = _VariableSizes(0, 0, 0)
+        for var, nbytes in var_bytes.items():
+            dims = ds[var].dims
+            if not any(dim in VARIANT_DIMS for dim in dims):
+                sizes.fixed += nbytes
+            elif any(dim in SAMPLE_DIMS for dim in dims):
+                sizes.per_call += nbytes / (n_variants * n_samples)
+            else:
+                sizes.per_variant += nbytes / n_variants
+        return sizes
+
+    return split(compressed), split(decoded), n_variants, region
+
+
+def _decoded_bytes(array: xr.DataArray) -> float:
+    if array.dtype == np.dtype(object):
+        return float(array.size * OBJECT_ITEMSIZE)
+    return float(array.nbytes)
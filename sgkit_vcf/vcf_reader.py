@@ -1,29 +1,272 @@
+import concurrent.futures
 import itertools
-from contextlib import contextmanager
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Dict, Iterator, MutableMapping, Optional, Sequence, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 import dask
+import dask.array as da
 import fsspec
 import numpy as np
 import xarray as xr
+import zarr
 from cyvcf2 import VCF, Variant
 
 from sgkit.model import DIM_VARIANT, create_genotype_call_dataset
-from sgkit.typing import PathType
-from sgkit_vcf.utils import build_url, chunks, temporary_directory, url_filename
+from sgkit_vcf.bcf_reader import (
+    BcfFile,
+    decode_bcf_records,
+    is_bcf,
+    parse_header_dictionaries,
+)
+from sgkit_vcf.bgzf import BGZF_MAX_BLOCK_SIZE
+from sgkit_vcf.block_cache import uses_block_cache, write_local_copy
+from sgkit_vcf.call_stats import (
+    SAMPLE_STATS,
+    VARIANT_STATS,
+    add_variant_stats,
+    call_counts,
+    combine_sample_stats,
+    combine_variant_stats,
+    sample_stats_dataset,
+)
+from sgkit_vcf.csi import CSI_EXTENSION
+from sgkit_vcf.genotype_packing import (
+    DIM_PACKED,
+    PACKED_VARIABLE,
+    pack_dataset,
+    packed_chunk_size,
+)
+from sgkit_vcf.profiling import span, task_span, traced_store
+from sgkit_vcf.region_index import RegionIndexBuilder, write_region_index
+from sgkit_vcf.sparse_genotypes import (
+    DENSE_GENOTYPE_VARIABLE,
+    DENSE_PHASED_VARIABLE,
+    DIM_DENSE_VARIANT,
+    HOM_REF_VARIABLE,
+    sparsify_dataset,
+)
+from sgkit_vcf.tbi import TABIX_EXTENSION
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.utils import (
+    build_url,
+    chunks,
+    get_file_length,
+    get_file_offset,
+    temporary_directory,
+    url_filename,
+)
+from sgkit_vcf.vcf_fields import (
+    INT_FILL,
+    INT_MISSING,
+    STR_FILL,
+    STR_MISSING,
+    VcfField,
+    get_vcf_fields,
+    resize_vcf_fields,
+)
+from sgkit_vcf.vcf_partition import (
+    estimate_region_sizes,
+    find_index_path,
+    get_vcf_file_infos,
+    parse_region,
+    read_index,
+    region_file_ranges,
+    split_region,
+)
+from sgkit_vcf.vcf_text_reader import VcfTextFile, decode_text_records, is_text_vcf
 
 DEFAULT_ALT_NUMBER = 3  # see vcf_read.py in scikit_allel
+DEFAULT_PLOIDY = 2
+
+# The decoders that can be used for converting records
+ENGINES = ("cyvcf2", "native")
+
+# A function that returns the buffers to decode the next chunk of variants into
+BufferSource = Callable[[], Dict[str, np.ndarray]]
+
+# Dimensions whose size depends on the number of alleles or the ploidy, which may differ
+# between parts
+PADDED_DIMS = ("alleles", "alt_alleles", "genotypes", "ploidy")
+
+# How often to check for stragglers (in seconds), and how many sub-parts to split them into
+STRAGGLER_POLL_INTERVAL = 0.1
+STRAGGLER_SPLIT_PARTS = 4
+
+
+@dataclass
+class ConversionOptions:
+    """The options for converting each part of a VCF file, which have the same meaning as for `vcf_to_zarr`."""
+
+    # the INFO and FORMAT fields to extract, and overrides for their header definitions
+    fields: Optional[Sequence[str]] = None
+    exclude_fields: Optional[Sequence[str]] = None
+    field_defs: Optional[Dict[str, Dict[str, Any]]] = None
+    # how to store the genotype calls
+    pack_genotypes: bool = False
+    sparse_hom_ref: bool = False
+    # the number of ALT alleles and alleles per call to store, or None to find them
+    # from the input
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER
+    ploidy: Optional[int] = DEFAULT_PLOIDY
+    # the decoder to use, one of ENGINES
+    engine: str = "cyvcf2"
+    compute_stats: bool = False
+
+
+@dataclass
+class VcfHeader:
+    """The samples and contigs in the header of a BCF or text VCF file, read natively.
+
+    It has the ``samples`` and ``seqnames`` of a cyvcf2 `VCF`, so it can stand in for one
+    when the records are decoded natively.
+    """
+
+    samples: List[str]
+    seqnames: List[str]
+
+
+def read_native_header(path: PathType) -> Optional[VcfHeader]:
+    """Read the header of a BCF or text VCF file, or return None if the file is in neither format or its header has no contigs."""
+    if is_bcf(path):
+        with BcfFile(path) as bcf:
+            header_text, contigs = bcf.header_text, bcf.contigs
+    elif is_text_vcf(path):
+        with VcfTextFile(path) as f:
+            header_text = f.header_text
+        contigs, _ = parse_header_dictionaries(header_text)
+    else:
+        return None
+    if len(contigs) == 0:
+        return None  # cyvcf2 finds the contigs from the index
+    chrom_line = header_text.rstrip("\n").rsplit("\n", 1)[-1]
+    return VcfHeader(samples=chrom_line.split("\t")[9:], seqnames=contigs)
 
 
 @contextmanager
-def open_vcf(path: PathType) -> Iterator[VCF]:
-    """A context manager for opening a VCF file."""
-    vcf = VCF(path)
-    try:
+def open_vcf(
+    path: PathType, region: Optional[str] = None, header_only: bool = False
+) -> Iterator[VCF]:
+    """A context manager for opening a VCF file with cyvcf2.
+
+    If the block cache is enabled and the file is remote, htslib reads a local copy of
+    the parts of the file that it needs, which are read through the cache: the header,
+    and the records in `region` (or all the records if `region` is None), unless
+    `header_only` is True.
+    """
+    with _cached_copy(path, region, header_only) as local_path:
+        vcf = VCF(local_path)
+        try:
+            yield vcf
+        finally:
+            vcf.close()
+
+
+@contextmanager
+def open_header(
+    path: PathType,
+    region: Optional[str] = None,
+    native: bool = False,
+    header_only: bool = False,
+) -> Iterator[Union[VCF, VcfHeader]]:
+    """A context manager for the header of a VCF file.
+
+    If `native` is True (because the records are decoded natively), the header is read
+    natively where possible, so that cyvcf2 doesn't open the file. Otherwise it is an
+    open cyvcf2 `VCF`, with the arguments of `open_vcf`.
+    """
+    if native:
+        header = read_native_header(path)
+        if header is not None:
+            yield header
+            return
+    with open_vcf(path, region, header_only) as vcf:
         yield vcf
-    finally:
-        vcf.close()
+
+
+@contextmanager
+def _cached_copy(
+    path: PathType, region: Optional[str], header_only: bool
+) -> Iterator[PathType]:
+    if not uses_block_cache(path):
+        yield path
+        return
+    ranges, index_path = _htslib_file_ranges(path, region, header_only)
+    with tempfile.TemporaryDirectory(prefix="sgkit_vcf_") as directory:
+        local_path = os.path.join(directory, url_filename(str(path)) or "input")
+        write_local_copy(path, local_path, ranges)
+        if index_path is not None:
+            # htslib finds the index from the file name
+            if index_path.endswith(TABIX_EXTENSION):
+                suffix = TABIX_EXTENSION
+            else:
+                suffix = CSI_EXTENSION
+            write_local_copy(index_path, local_path + suffix)
+        yield local_path
+
+
+def _htslib_file_ranges(
+    path: PathType, region: Optional[str], header_only: bool
+) -> Tuple[Optional[List[Tuple[int, int]]], Optional[str]]:
+    """Return the byte ranges of a file that htslib reads for the header and the records in a region (or None for the whole file), and the path of the index that it reads (if any)."""
+    if region is None and not header_only:
+        return None, None
+    if is_bcf(path):
+        with BcfFile(path) as bcf:
+            header_end = get_file_offset(bcf.first_record_offset)
+            contigs = bcf.contigs
+    elif is_text_vcf(path):
+        with VcfTextFile(path) as f:
+            if not f.compressed:
+                return ([(0, f.first_record_offset)] if header_only else None), None
+            header_end = get_file_offset(f.first_record_offset)
+            contigs, _ = parse_header_dictionaries(f.header_text)
+    else:
+        return None, None
+    size = get_file_length(path)
+    # the last block is read to check that the file isn't truncated
+    ranges = [
+        (0, header_end + BGZF_MAX_BLOCK_SIZE),
+        (max(size - BGZF_MAX_BLOCK_SIZE, 0), size),
+    ]
+    if header_only:
+        return ranges, None
+
+    assert region is not None
+    try:
+        index_path = find_index_path(path)
+    except ValueError:
+        return None, None  # cyvcf2 raises an error for the missing index
+    index = read_index(index_path)
+    contig, start, end = parse_region(region)
+    sequence_names = list(getattr(index, "sequence_names", contigs))
+    if contig not in sequence_names:
+        return None, index_path
+    for chunk_start, chunk_end in region_file_ranges(
+        index, sequence_names.index(contig), start, end
+    ):
+        ranges.append((chunk_start, chunk_end + BGZF_MAX_BLOCK_SIZE))
+    return ranges, index_path
 
 
 def region_filter(
@@ -46,100 +289,560 @@ def get_region_start(region: str) -> int:
     return int(start)
 
 
+def variable_specs(
+    vcf: Union[VCF, VcfHeader],
+    vcf_fields: Sequence[VcfField] = (),
+    variant_end: bool = False,
+    alt_number: int = DEFAULT_ALT_NUMBER,
+    ploidy: int = DEFAULT_PLOIDY,
+) -> Dict[str, Tuple[Tuple[int, ...], str]]:
+    """Return the shape (excluding the variants dimension) and dtype of each variable decoded from a VCF file.
+
+    The end position of each variant is only decoded if `variant_end` is True. Alleles
+    are padded or truncated to `alt_number` ALT alleles, and genotype calls are padded
+    to `ploidy` alleles.
+    """
+    n_sample = len(vcf.samples)
+    n_allele = alt_number + 1
+    n_ploidy = ploidy
+
+    specs = dict(
+        variant_contig=((), "i1"),
+        variant_position=((), "i4"),
+        variant_id=((), "O"),
+        variant_allele=((n_allele,), "O"),
+        call_genotype=((n_sample, n_ploidy), "i1"),
+        call_genotype_phased=((n_sample,), "bool"),
+    )
+    if variant_end:
+        specs["variant_end"] = ((), "i4")
+    for field in vcf_fields:
+        specs[field.name] = (field.shape(n_sample), field.dtype)
+    return specs
+
+
+def read_vcf_chunks(
+    vcf: VCF,
+    region: Optional[str] = None,
+    chunk_length: int = 10_000,
+    vcf_fields: Sequence[VcfField] = (),
+    variant_end: bool = False,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    get_buffers: Optional[BufferSource] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Decode the variants in a region of an open VCF file, in chunks of `chunk_length` variants.
+
+    Each chunk is a dict of arrays keyed by variable name (as in `create_genotype_call_dataset`),
+    including a variable for each of `vcf_fields`, and ``variant_end`` if `variant_end` is
+    True. Alleles are padded or truncated to `alt_number` ALT alleles, and calls with
+    fewer than `ploidy` alleles are padded with the fill value (-2). The last chunk may
+    be shorter than `chunk_length`.
+
+    If `alt_number` is None, each chunk has as many ALT alleles as the largest number of
+    any variant in it or an earlier chunk, which is found as the variants are decoded,
+    so the chunks may get wider (but never narrower) along the allele dimensions. The
+    same goes for the ploidy if `ploidy` is None.
+
+    The arrays are reused between chunks, so they must be consumed (or copied) before the
+    next chunk is requested. Alternatively, `get_buffers` is called for the buffers to
+    decode each chunk into, and only the variables that have a buffer are decoded.
+    """
+    variant_contig_names = vcf.seqnames
+
+    def specs(alt_number: int, ploidy: int) -> Dict[str, Tuple[Tuple[int, ...], str]]:
+        fields = resize_vcf_fields(vcf_fields, alt_number, ploidy)
+        return variable_specs(vcf, fields, variant_end, alt_number, ploidy)
+
+    # Iterate through variants in batches of chunk_length
+
+    if region is None:
+        variants = vcf
+    else:
+        variants = vcf(region)
+
+    variants_chunks: Iterable[Iterable[Variant]] = chunks(
+        region_filter(variants, region), chunk_length
+    )
+    if alt_number is None or ploidy is None:
+        # a chunk may have to be decoded twice
+        variants_chunks = map(list, variants_chunks)
+    yield from _decode_chunks(
+        variants_chunks,
+        lambda variants_chunk, buffers, sizes: decode_variants(
+            variants_chunk, buffers, variant_contig_names, vcf_fields, sizes
+        ),
+        specs,
+        region,
+        chunk_length,
+        alt_number,
+        ploidy,
+        get_buffers,
+    )
+
+
+def read_bcf_chunks(
+    vcf: Union[VCF, VcfHeader],
+    path: PathType,
+    region: Optional[str] = None,
+    chunk_length: int = 10_000,
+    variant_end: bool = False,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    get_buffers: Optional[BufferSource] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Decode the variants in a region of a BCF file natively, in chunks of `chunk_length` variants.
+
+    The chunks are the same as those from `read_vcf_chunks` with no INFO or FORMAT fields,
+    but the records are read and decoded by `BcfFile` rather than by cyvcf2. The header
+    `vcf` (an open cyvcf2 `VCF` or a `VcfHeader`) is only used for its samples and contigs.
+    """
+    variant_contig_names = vcf.seqnames
+    with BcfFile(path) as bcf:
+        contig_indexes = np.array(
+            [
+                variant_contig_names.index(c) if c in variant_contig_names else -1
+                for c in bcf.contigs
+            ],
+            dtype="i1",
+        )
+        gt_key = bcf.dictionary.get("GT")
+
+        def decode(
+            records: Tuple[bytes, np.ndarray],
+            buffers: Dict[str, np.ndarray],
+            sizes: Optional[Dict[str, int]],
+        ) -> int:
+            data, offsets = records
+            return decode_bcf_records(
+                data, offsets, buffers, contig_indexes, gt_key, sizes
+            )
+
+        yield from _decode_chunks(
+            bcf.record_chunks(region, chunk_length),
+            decode,
+            lambda alt_number, ploidy: variable_specs(
+                vcf, (), variant_end, alt_number, ploidy
+            ),
+            region,
+            chunk_length,
+            alt_number,
+            ploidy,
+            get_buffers,
+        )
+
+
+def read_text_vcf_chunks(
+    vcf: Union[VCF, VcfHeader],
+    path: PathType,
+    region: Optional[str] = None,
+    chunk_length: int = 10_000,
+    variant_end: bool = False,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    get_buffers: Optional[BufferSource] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Decode the variants in a region of a text VCF file natively, in chunks of `chunk_length` variants.
+
+    The chunks are the same as those from `read_vcf_chunks` with no INFO or FORMAT fields,
+    but the lines are read and decoded by `VcfTextFile` rather than by cyvcf2. As for
+    `read_bcf_chunks`, the header `vcf` is only used for its samples and contigs.
+    """
+    contig_indexes = {name: i for i, name in enumerate(vcf.seqnames)}
+
+    def decode(
+        lines: Tuple[bytes, np.ndarray],
+        buffers: Dict[str, np.ndarray],
+        sizes: Optional[Dict[str, int]],
+    ) -> int:
+        data, starts = lines
+        return decode_text_records(data, starts, buffers, contig_indexes, sizes)
+
+    with VcfTextFile(path) as f:
+        yield from _decode_chunks(
+            f.line_chunks(region, chunk_length),
+            decode,
+            lambda alt_number, ploidy: variable_specs(
+                vcf, (), variant_end, alt_number, ploidy
+            ),
+            region,
+            chunk_length,
+            alt_number,
+            ploidy,
+            get_buffers,
+        )
+
+
+def _read_chunks(
+    vcf: Union[VCF, VcfHeader],
+    path: PathType,
+    region: Optional[str],
+    chunk_length: int,
+    vcf_fields: Sequence[VcfField],
+    variant_end: bool,
+    alt_number: Optional[int],
+    ploidy: Optional[int],
+    engine: str,
+    get_buffers: Optional[BufferSource] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Decode chunks of variants with the native decoder if the engine and input allow it, or cyvcf2 otherwise."""
+    if engine == "native" and len(vcf_fields) == 0:
+        if is_bcf(path):
+            return read_bcf_chunks(
+                vcf,
+                path,
+                region,
+                chunk_length,
+                variant_end,
+                alt_number,
+                ploidy,
+                get_buffers,
+            )
+        if is_text_vcf(path):
+            return read_text_vcf_chunks(
+                vcf,
+                path,
+                region,
+                chunk_length,
+                variant_end,
+                alt_number,
+                ploidy,
+                get_buffers,
+            )
+    return read_vcf_chunks(
+        vcf,
+        region,
+        chunk_length,
+        vcf_fields,
+        variant_end,
+        alt_number,
+        ploidy,
+        get_buffers,
+    )
+
+
+def _decode_chunks(
+    record_chunks: Iterable[Any],
+    decode: Callable[[Any, Dict[str, np.ndarray], Optional[Dict[str, int]]], int],
+    specs: Callable[[int, int], Dict[str, Tuple[Tuple[int, ...], str]]],
+    region: Optional[str],
+    chunk_length: int,
+    alt_number: Optional[int],
+    ploidy: Optional[int],
+    get_buffers: Optional[BufferSource],
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Decode each chunk of records with `decode`, into buffers for the variables in `specs`.
+
+    If `alt_number` or `ploidy` is None, the buffers hold the largest size seen so far
+    (and at least `DEFAULT_ALT_NUMBER` or `DEFAULT_PLOIDY`), and a chunk with a larger
+    size is decoded again into larger buffers. Each chunk is then trimmed to the largest
+    sizes in it or any earlier chunk.
+    """
+    if alt_number is not None and ploidy is not None:
+        get_buffers = _buffer_source(
+            specs(alt_number, ploidy), chunk_length, get_buffers
+        )
+        for records in record_chunks:
+            buffers = get_buffers()
+            with span("region read", "part", region=region) as span_args:
+                n = decode(records, buffers, None)
+                span_args["variants"] = n
+            yield chunk_arrays(buffers, n)
+        return
+
+    if get_buffers is not None:
+        raise ValueError(
+            "alt_number and ploidy must be set to decode into the given buffers"
+        )
+    fixed = dict(alt_number=alt_number, ploidy=ploidy)
+    defaults = dict(alt_number=DEFAULT_ALT_NUMBER, ploidy=DEFAULT_PLOIDY)
+    capacity = {k: defaults[k] if v is None else v for k, v in fixed.items()}
+    seen = {k: 1 if v is None else v for k, v in fixed.items()}
+    buffers = allocate_buffers(
+        specs(capacity["alt_number"], capacity["ploidy"]), chunk_length
+    )
+    for records in record_chunks:
+        with span("region read", "part", region=region) as span_args:
+            sizes: Dict[str, int] = {}
+            n = decode(records, buffers, sizes)
+            if ploidy is not None and sizes["ploidy"] > ploidy:
+                # decode the chunk again, to raise the decoder's error for the call
+                decode(records, buffers, None)
+            # the buffers grow at least twofold, so few chunks are decoded twice
+            grown = {
+                k: max(sizes[k], 2 * capacity[k])
+                for k, v in fixed.items()
+                if v is None and sizes[k] > capacity[k]
+            }
+            if len(grown) > 0:
+                capacity.update(grown)
+                buffers = allocate_buffers(
+                    specs(capacity["alt_number"], capacity["ploidy"]), chunk_length
+                )
+                n = decode(records, buffers, sizes)
+            for k, v in fixed.items():
+                if v is None:
+                    seen[k] = max(seen[k], sizes[k])
+            span_args["variants"] = n
+        yield _trim_chunk(
+            chunk_arrays(buffers, n), specs(seen["alt_number"], seen["ploidy"])
+        )
+
+
+def _trim_chunk(
+    chunk: Dict[str, np.ndarray], specs: Dict[str, Tuple[Tuple[int, ...], str]]
+) -> Dict[str, np.ndarray]:
+    """Return views of the arrays in a chunk, trimmed to the (smaller) shapes in `specs`."""
+    return {
+        var: array[(slice(None),) + tuple(slice(0, size) for size in specs[var][0])]
+        if var in specs
+        else array
+        for var, array in chunk.items()
+    }
+
+
+def _buffer_source(
+    specs: Dict[str, Tuple[Tuple[int, ...], str]],
+    chunk_length: int,
+    get_buffers: Optional[BufferSource],
+) -> BufferSource:
+    if get_buffers is not None:
+        return get_buffers
+    # by default, every chunk is decoded into the same buffers
+    buffers = allocate_buffers(specs, chunk_length)
+    return lambda: buffers
+
+
+def allocate_buffers(
+    specs: Dict[str, Tuple[Tuple[int, ...], str]], chunk_length: int
+) -> Dict[str, np.ndarray]:
+    """Allocate an array of `chunk_length` variants for each variable in `specs`."""
+    return {
+        var: np.empty((chunk_length,) + shape, dtype=dtype)
+        for var, (shape, dtype) in specs.items()
+    }
+
+
+def decode_variants(
+    variants: Iterator[Variant],
+    buffers: Dict[str, np.ndarray],
+    variant_contig_names: List[str],
+    vcf_fields: Sequence[VcfField] = (),
+    sizes: Optional[Dict[str, int]] = None,
+) -> int:
+    """Decode variants into the start of the given buffers, and return the number decoded.
+
+    Only the variables that have a buffer are decoded. If `sizes` is given, the largest
+    number of ALT alleles and the largest ploidy of any variant are stored in it (as
+    ``alt_number`` and ``ploidy``), and calls with a higher ploidy than `call_genotype`
+    holds are not decoded rather than being an error, so that the variants can be
+    decoded again into larger buffers.
+    """
+    field_buffers = [
+        (field, buffers[field.name]) for field in vcf_fields if field.name in buffers
+    ]
+    variant_contig = buffers.get("variant_contig")
+    variant_position = buffers.get("variant_position")
+    variant_end = buffers.get("variant_end")
+    variant_id = buffers.get("variant_id")
+    variant_allele = buffers.get("variant_allele")
+    call_genotype = buffers.get("call_genotype")
+    call_genotype_phased = buffers.get("call_genotype_phased")
+    if variant_allele is not None:
+        n_allele = variant_allele.shape[1]
+    if call_genotype is not None:
+        n_ploidy = call_genotype.shape[2]
+
+    n = 0
+    max_alt, max_ploidy = 0, 0
+    for i, variant in enumerate(variants):
+        if variant_id is not None:
+            variant_id[i] = variant.ID if variant.ID is not None else "."
+        if variant_contig is not None:
+            variant_contig[i] = variant_contig_names.index(variant.CHROM)
+        if variant_position is not None:
+            variant_position[i] = variant.POS
+        if variant_end is not None:
+            # includes the extent of reference blocks given by the END INFO field
+            variant_end[i] = variant.end
+
+        if sizes is not None:
+            max_alt = max(max_alt, len(variant.ALT))
+        if variant_allele is not None:
+            alleles = [variant.REF] + variant.ALT
+            if len(alleles) > n_allele:
+                alleles = alleles[:n_allele]
+            elif len(alleles) < n_allele:
+                alleles = alleles + ([""] * (n_allele - len(alleles)))
+            variant_allele[i] = alleles
+
+        if call_genotype is not None or call_genotype_phased is not None:
+            gt = variant.genotype.array()
+            if call_genotype is not None:
+                # the array is as wide as the largest call in the record, and any calls
+                # with fewer alleles are already padded with the fill value, so the
+                # record is copied in one go, then padded to the dataset's ploidy
+                k = gt.shape[1] - 1
+                max_ploidy = max(max_ploidy, k)
+                if k <= n_ploidy:
+                    call_genotype[i, :, :k] = gt[:, :k]
+                    call_genotype[i, :, k:] = INT_FILL
+                elif sizes is None:
+                    raise ValueError(
+                        f"Variant at {variant.CHROM}:{variant.POS} has a call with ploidy "
+                        f"{k}, which is more than {n_ploidy}; set ploidy to None to "
+                        "detect the ploidy from the input"
+                    )
+            if call_genotype_phased is not None:
+                call_genotype_phased[i] = gt[..., -1]
+
+        for field, buffer in field_buffers:
+            field.decode(variant, buffer, i)
+        n = i + 1
+    if sizes is not None:
+        sizes.update(alt_number=max_alt, ploidy=max_ploidy)
+    return n
+
+
+def chunk_arrays(buffers: Dict[str, np.ndarray], n: int) -> Dict[str, np.ndarray]:
+    """Return views of the first `n` variants in the buffers, adding `variant_id_mask` if needed."""
+    # Truncate np arrays (if last chunk is smaller than chunk_length)
+    chunk = {var: buffer[:n] for var, buffer in buffers.items()}
+    if "variant_id" in chunk:
+        chunk["variant_id_mask"] = chunk["variant_id"] == "."
+    return chunk
+
+
+def _chunk_to_dataset(
+    chunk: Dict[str, np.ndarray],
+    variant_contig_names: List[str],
+    sample_id: Any,
+    vcf_fields: Sequence[VcfField] = (),
+) -> xr.Dataset:
+    ds: xr.Dataset = create_genotype_call_dataset(
+        variant_contig_names=variant_contig_names,
+        variant_contig=chunk["variant_contig"],
+        variant_position=chunk["variant_position"],
+        variant_alleles=chunk["variant_allele"],
+        sample_id=sample_id,
+        call_genotype=chunk["call_genotype"],
+        call_genotype_phased=chunk["call_genotype_phased"],
+        variant_id=chunk["variant_id"],
+    )
+    ds["variant_id_mask"] = (
+        [DIM_VARIANT],
+        chunk["variant_id_mask"],
+    )
+    if "variant_end" in chunk:
+        ds["variant_end"] = ([DIM_VARIANT], chunk["variant_end"])
+        ds["variant_end"].attrs[
+            "comment"
+        ] = "The 1-based position of the last base of the variant."
+    _add_field_variables(ds, chunk, vcf_fields)
+    return ds
+
+
+def _add_field_variables(
+    ds: xr.Dataset, data: Dict[str, Any], vcf_fields: Sequence[VcfField]
+) -> None:
+    for field in vcf_fields:
+        ds[field.name] = (field.dims, data[field.name])
+        ds[field.name].attrs.update(field.attrs)
+
+
+def _max_str_len(a: np.ndarray) -> int:
+    return max(map(len, a.ravel()), default=0)
+
+
 def vcf_to_zarr_sequential(
     input: PathType,
     output: Union[PathType, MutableMapping[str, bytes]],
     region: Optional[str] = None,
     chunk_length: int = 10_000,
     chunk_width: int = 1_000,
+    options: Optional[ConversionOptions] = None,
+    region_index: bool = False,
 ) -> None:
 
-    with open_vcf(input) as vcf:
+    options = options or ConversionOptions()
+    alt_number, ploidy = options.alt_number, options.ploidy
+    output = traced_store(output, "part")
 
-        alt_number = DEFAULT_ALT_NUMBER
+    native = options.engine == "native" and not options.fields
+    with task_span("convert part", "part", input=str(input), region=region), open_header(
+        input, region, native
+    ) as vcf:
 
         sample_id = np.array(vcf.samples, dtype=str)
-        n_sample = len(sample_id)
-        n_allele = alt_number + 1
-        n_ploidy = 2  # TODO: support more than diploid
-
         variant_contig_names = vcf.seqnames
+        # if alt_number or ploidy is None, the fields are sized for each chunk as it
+        # is decoded
+        vcf_fields = get_vcf_fields(
+            vcf,
+            options.fields,
+            options.exclude_fields,
+            options.field_defs,
+            alt_number=DEFAULT_ALT_NUMBER if alt_number is None else alt_number,
+            ploidy=DEFAULT_PLOIDY if ploidy is None else ploidy,
+        )
 
         # Remember max lengths of variable-length strings
         max_variant_id_length = 0
         max_variant_allele_length = 0
-
-        # Iterate through variants in batches of chunk_length
-
-        if region is None:
-            variants = vcf
-        else:
-            variants = vcf(region)
-
-        variant_contig = np.empty(chunk_length, dtype="i1")
-        variant_position = np.empty(chunk_length, dtype="i4")
-        call_genotype = np.empty((chunk_length, n_sample, n_ploidy), dtype="i1")
-        call_genotype_phased = np.empty((chunk_length, n_sample), dtype=bool)
+        # and whether any calls have been padded to the ploidy
+        mixed_ploidy = False
+        # and the per-sample counts of genotype calls
+        sample_counts: Dict[str, np.ndarray] = {}
+        n_variants = 0
+        # and the runs of variants in each chunk, for the region index
+        index_builder = RegionIndexBuilder() if region_index else None
+        # and the sizes of the allele and ploidy dimensions in the output, which grow
+        # with the chunks if alt_number or ploidy is None
+        output_sizes: Dict[str, int] = {}
 
         first_variants_chunk = True
-        for variants_chunk in chunks(region_filter(variants, region), chunk_length):
-
-            variant_ids = []
-            variant_alleles = []
-
-            for i, variant in enumerate(variants_chunk):
-                variant_id = variant.ID if variant.ID is not None else "."
-                variant_ids.append(variant_id)
-                max_variant_id_length = max(max_variant_id_length, len(variant_id))
-                variant_contig[i] = variant_contig_names.index(variant.CHROM)
-                variant_position[i] = variant.POS
-
-                alleles = [variant.REF] + variant.ALT
-                if len(alleles) > n_allele:
-                    alleles = alleles[:n_allele]
-                elif len(alleles) < n_allele:
-                    alleles = alleles + ([""] * (n_allele - len(alleles)))
-                variant_alleles.append(alleles)
-                max_variant_allele_length = max(
-                    max_variant_allele_length, max(len(x) for x in alleles)
-                )
-
-                gt = variant.genotype.array()
-                call_genotype[i] = gt[..., 0:-1]
-                call_genotype_phased[i] = gt[..., -1]
-
-            # Truncate np arrays (if last chunk is smaller than chunk_length)
-            if i + 1 < chunk_length:
-                variant_contig = variant_contig[: i + 1]
-                variant_position = variant_position[: i + 1]
-                call_genotype = call_genotype[: i + 1]
-                call_genotype_phased = call_genotype_phased[: i + 1]
-
-            variant_id = np.array(variant_ids, dtype="O")
-            variant_id_mask = variant_id == "."
-            variant_alleles = np.array(variant_alleles, dtype="O")
-
-            ds: xr.Dataset = create_genotype_call_dataset(
-                variant_contig_names=variant_contig_names,
-                variant_contig=variant_contig,
-                variant_position=variant_position,
-                variant_alleles=variant_alleles,
-                sample_id=sample_id,
-                call_genotype=call_genotype,
-                call_genotype_phased=call_genotype_phased,
-                variant_id=variant_id,
+        for chunk in _read_chunks(
+            vcf,
+            input,
+            region,
+            chunk_length,
+            vcf_fields,
+            variant_end=options.sparse_hom_ref,
+            alt_number=alt_number,
+            ploidy=ploidy,
+            engine=options.engine,
+        ):
+            max_variant_id_length = max(
+                max_variant_id_length, _max_str_len(chunk["variant_id"])
+            )
+            max_variant_allele_length = max(
+                max_variant_allele_length, _max_str_len(chunk["variant_allele"])
             )
-            ds["variant_id_mask"] = (
-                [DIM_VARIANT],
-                variant_id_mask,
+
+            mixed_ploidy = mixed_ploidy or bool(
+                np.any(chunk["call_genotype"] == INT_FILL)
             )
+
+            ds = _chunk_to_dataset(chunk, variant_contig_names, sample_id, vcf_fields)
             ds.attrs["max_variant_id_length"] = max_variant_id_length
             ds.attrs["max_variant_allele_length"] = max_variant_allele_length
+            ds.attrs["mixed_ploidy"] = mixed_ploidy
+
+            if options.compute_stats:
+                variant_counts, chunk_sample_counts = call_counts(
+                    chunk["call_genotype"], ds.sizes["alleles"]
+                )
+                ds = add_variant_stats(ds, variant_counts)
+                for var, counts in chunk_sample_counts.items():
+                    sample_counts[var] = sample_counts.get(var, 0) + counts
+                n_variants += ds.sizes["variants"]
 
             if first_variants_chunk:
                 # Enforce uniform chunks in the variants dimension
                 # Also chunk in the samples direction
-                encoding = dict(
+                n_allele = ds.sizes["alleles"]
+                n_ploidy = ds.sizes["ploidy"]
+                encoding: Dict[str, Dict[str, Any]] = dict(
                     call_genotype=dict(chunks=(chunk_length, chunk_width, n_ploidy)),
                     call_genotype_mask=dict(
                         chunks=(chunk_length, chunk_width, n_ploidy)
@@ -152,12 +855,123 @@ def vcf_to_zarr_sequential(
                     variant_position=dict(chunks=(chunk_length,)),
                     sample_id=dict(chunks=(chunk_width,)),
                 )
-
+                for field in vcf_fields:
+                    field_chunks = (chunk_length,) + ds[field.name].shape[1:]
+                    if field.category == "FORMAT":
+                        field_chunks = (chunk_length, chunk_width) + field_chunks[2:]
+                    encoding[field.name] = dict(chunks=field_chunks)
+                    if field.compressor is not None:
+                        encoding[field.name]["compressor"] = field.compressor
+                if options.compute_stats:
+                    for var in VARIANT_STATS:
+                        encoding[var] = dict(chunks=(chunk_length,) + ds[var].shape[1:])
+                if options.pack_genotypes:
+                    for var in [
+                        "call_genotype",
+                        "call_genotype_mask",
+                        "call_genotype_phased",
+                    ]:
+                        del encoding[var]
+                    encoding[PACKED_VARIABLE] = dict(
+                        chunks=(
+                            chunk_length,
+                            packed_chunk_size(chunk_width, n_allele, n_ploidy),
+                        )
+                    )
+                    ds = pack_dataset(ds)
+                if options.sparse_hom_ref:
+                    encoding[DENSE_GENOTYPE_VARIABLE] = encoding.pop("call_genotype")
+                    encoding[DENSE_PHASED_VARIABLE] = encoding.pop(
+                        "call_genotype_phased"
+                    )
+                    del encoding["call_genotype_mask"]
+                    encoding[HOM_REF_VARIABLE] = dict(chunks=(chunk_length,))
+                    encoding["variant_end"] = dict(chunks=(chunk_length,))
+                    ds = sparsify_dataset(ds)
+
+                if index_builder is not None:
+                    index_builder.add_dataset(ds)
                 ds.to_zarr(output, mode="w", encoding=encoding)
+                output_sizes = {
+                    dim: ds.sizes[dim] for dim in PADDED_DIMS if dim in ds.dims
+                }
                 first_variants_chunk = False
             else:
+                if options.pack_genotypes:
+                    ds = pack_dataset(ds)
+                if options.sparse_hom_ref:
+                    ds = sparsify_dataset(ds)
+                if index_builder is not None:
+                    index_builder.add_dataset(ds)
+                grown = {
+                    dim: ds.sizes[dim]
+                    for dim, size in output_sizes.items()
+                    if ds.sizes[dim] > size
+                }
+                if len(grown) > 0:
+                    with span("widen", "part", region=region):
+                        _widen_store(output, grown, chunk_length)
+                    output_sizes.update(grown)
+                    if "ploidy" in grown:
+                        # the calls already in the output are padded
+                        mixed_ploidy = True
+                        ds.attrs["mixed_ploidy"] = True
                 # Append along the variants dimension
-                ds.to_zarr(output, append_dim=DIM_VARIANT)
+                _append_to_zarr(ds, output)
+
+        if options.compute_stats and not first_variants_chunk:
+            stats = sample_stats_dataset(sample_counts, n_variants)
+            # appending to the store replaces the dataset attributes
+            stats.attrs = ds.attrs
+            stats.to_zarr(
+                output,
+                mode="a",
+                encoding={var: dict(chunks=(chunk_width,)) for var in SAMPLE_STATS},
+            )
+        if index_builder is not None and not first_variants_chunk:
+            with span("region index", "part"):
+                write_region_index(output, index_builder.index())
+
+
+def _append_to_zarr(
+    ds: xr.Dataset, output: Union[PathType, MutableMapping[str, bytes]]
+) -> None:
+    """Append a dataset to a Zarr store along the variants dimension, and along the dense variants dimension if it has one."""
+    dense_vars = [v for v in ds.data_vars if DIM_DENSE_VARIANT in ds[v].dims]
+    if ds.sizes[DIM_VARIANT] > 0:
+        ds.drop_vars(dense_vars).to_zarr(output, append_dim=DIM_VARIANT)
+    if len(dense_vars) > 0 and ds.sizes[DIM_DENSE_VARIANT] > 0:
+        ds[dense_vars].to_zarr(output, append_dim=DIM_DENSE_VARIANT)
+
+
+def _widen_store(
+    output: Union[PathType, MutableMapping[str, bytes]],
+    sizes: Dict[str, int],
+    chunk_length: int,
+) -> None:
+    """Pad the allele and ploidy dimensions of the arrays in a Zarr store to `sizes`, in place.
+
+    The values are padded as by `_widen_dims`, for `chunk_length` rows at a time.
+    """
+    group = zarr.open_group(output, mode="r+")
+    for _, array in group.arrays():
+        dims = array.attrs["_ARRAY_DIMENSIONS"]
+        pad = {
+            dim: size - array.shape[dims.index(dim)]
+            for dim, size in sizes.items()
+            if dim in dims and size > array.shape[dims.index(dim)]
+        }
+        if len(pad) == 0:
+            continue
+        shape = array.shape
+        array.resize(*[n + pad.get(dim, 0) for dim, n in zip(dims, shape)])
+        for start in range(0, shape[0], chunk_length):
+            rows = slice(start, start + chunk_length)
+            values = array[(rows,) + tuple(slice(0, n) for n in shape[1:])]
+            values = xr.DataArray(values, dims=dims, attrs=dict(array.attrs))
+            array[rows] = _pad_end(values, pad).values
+    # Xarray reads the shapes from the consolidated metadata when appending
+    zarr.consolidate_metadata(group.store)
 
 
 def vcf_to_zarr_parallel(
@@ -169,9 +983,13 @@ def vcf_to_zarr_parallel(
     temp_chunk_length: Optional[int] = None,
     tempdir: Optional[PathType] = None,
     tempdir_storage_options: Optional[Dict[str, str]] = None,
+    executor: Optional[Any] = None,
+    straggler_factor: Optional[float] = None,
+    options: Optional[ConversionOptions] = None,
 ) -> None:
     """Convert specified regions of one or more VCF files to zarr files, then concat, rechunk, write to zarr"""
 
+    options = options or ConversionOptions()
     if temp_chunk_length is None:
         temp_chunk_length = chunk_length
 
@@ -179,6 +997,41 @@ def vcf_to_zarr_parallel(
         prefix="vcf_to_zarr_", dir=tempdir, storage_options=tempdir_storage_options
     ) as tmpdir:
 
+        if executor is not None:
+            # Merge parts into the output as they complete, overlapping with conversion
+            parts = _vcf_to_zarrs_parts(input, tmpdir, regions)
+            if options.alt_number is None or options.ploidy is None:
+                # the allele and ploidy dimensions are fixed once the first chunk is
+                # merged, so they are sized for all the parts before any are converted
+                with span("scan alleles", "plan"):
+                    alt_number, ploidy = _scan_part_sizes(
+                        parts, executor, options.alt_number, options.ploidy
+                    )
+                options = replace(options, alt_number=alt_number, ploidy=ploidy)
+            merge = StreamingMerge(
+                output,
+                [part.url for part in parts],
+                chunk_length,
+                chunk_width,
+                tempdir_storage_options,
+            )
+            completed = _convert_parts_as_completed(
+                parts,
+                executor,
+                temp_chunk_length,
+                chunk_width,
+                tempdir_storage_options or {},
+                straggler_factor,
+                options,
+            )
+            # close the generator if merging fails, so that it waits for any parts
+            # that are still running before the temporary directory is removed
+            with closing(completed):
+                for i, urls in completed:
+                    merge.part_completed(i, urls)
+            merge.close()
+            return
+
         paths = vcf_to_zarrs(
             input,
             tmpdir,
@@ -186,13 +1039,132 @@ def vcf_to_zarr_parallel(
             temp_chunk_length,
             chunk_width,
             tempdir_storage_options,
+            options=options,
         )
 
-        ds = zarrs_to_dataset(paths, chunk_length, chunk_width, tempdir_storage_options)
+        _merge_parts(paths, output, chunk_length, chunk_width, tempdir_storage_options)
+
 
-        # Ensure Dask task graph is efficient, see https://github.com/dask/dask/issues/5105
-        with dask.config.set({"optimization.fuse.ave-width": 50}):
-            ds.to_zarr(output, mode="w")
+def _merge_parts(
+    urls: Sequence[str],
+    output: Union[PathType, MutableMapping[str, bytes]],
+    chunk_length: int,
+    chunk_width: int,
+    storage_options: Optional[Dict[str, str]],
+) -> None:
+    """Concatenate the Zarr stores for parts along the variants dimension, and write them to the output."""
+    ds = zarrs_to_dataset(urls, chunk_length, chunk_width, storage_options)
+    with span("region index", "merge"):
+        index_builder = RegionIndexBuilder()
+        index_builder.add_dataset(ds)
+
+    # Ensure Dask task graph is efficient, see https://github.com/dask/dask/issues/5105
+    with dask.config.set({"optimization.fuse.ave-width": 50}), span(
+        "merge", "merge", variants=ds.sizes["variants"]
+    ):
+        ds.to_zarr(traced_store(output, "merge", "merge chunk"), mode="w")
+    with span("region index", "merge"):
+        write_region_index(output, index_builder.index())
+
+
+def vcf_to_zarr_merge_samples(
+    input: Sequence[PathType],
+    output: Union[PathType, MutableMapping[str, bytes]],
+    regions: Union[None, str, Sequence[str]],
+    chunk_length: int = 10_000,
+    chunk_width: int = 1_000,
+    temp_chunk_length: Optional[int] = None,
+    tempdir: Optional[PathType] = None,
+    tempdir_storage_options: Optional[Dict[str, str]] = None,
+    executor: Optional[Any] = None,
+    options: Optional[ConversionOptions] = None,
+) -> None:
+    """Convert the same regions of VCF files with disjoint samples to zarr files, then merge them along the samples dimension, rechunk, write to zarr"""
+
+    if temp_chunk_length is None:
+        temp_chunk_length = chunk_length
+    if regions is None or isinstance(regions, str):
+        input_region_list: Sequence[Optional[str]] = [regions]
+    elif all(isinstance(region, str) for region in regions):
+        input_region_list = regions
+    else:
+        raise ValueError(
+            f"To merge samples, regions must be a sequence of strings, which are used for every input: {regions}"
+        )
+    tempdir_storage_options = tempdir_storage_options or {}
+
+    with temporary_directory(
+        prefix="vcf_to_zarr_", dir=tempdir, storage_options=tempdir_storage_options
+    ) as tmpdir:
+        # every region of every input is converted in parallel
+        urls = vcf_to_zarrs(
+            input,
+            tmpdir,
+            [input_region_list] * len(input),  # type: ignore[list-item]
+            temp_chunk_length,
+            chunk_width,
+            tempdir_storage_options,
+            executor=executor,
+            options=options,
+        )
+
+        _merge_sample_parts_to_zarr(
+            urls,
+            input,
+            input_region_list,
+            output,
+            chunk_length,
+            chunk_width,
+            tempdir_storage_options,
+        )
+
+
+def _merge_sample_parts_to_zarr(
+    urls: Sequence[str],
+    input: Sequence[PathType],
+    regions: Sequence[Optional[str]],
+    output: Union[PathType, MutableMapping[str, bytes]],
+    chunk_length: int,
+    chunk_width: int,
+    storage_options: Dict[str, str],
+) -> None:
+    """Merge the Zarr stores for the same regions of inputs with different samples, and write them to the output.
+
+    The stores are in input order, then region order, as returned by `vcf_to_zarrs`.
+    """
+    datasets = []
+    for r, region in enumerate(regions):
+        region_urls = urls[r :: len(regions)]
+        is_zarr = [_is_zarr(url, storage_options) for url in region_urls]
+        if not any(is_zarr):
+            continue  # no input has any variants in the region
+        if not all(is_zarr):
+            empty = input[is_zarr.index(False)]
+            raise ValueError(
+                f"Inputs must have the same variants to merge samples, but {empty} has no variants in region {region}"
+            )
+        datasets.append(
+            _merge_sample_parts(
+                [_open_part(url, storage_options) for url in region_urls],
+                input,
+                region,
+            )
+        )
+
+    ds = _concat_parts(datasets, chunk_length, chunk_width)
+    for var, dtype in _fixed_length_string_dtypes(datasets).items():
+        ds[var] = ds[var].astype(dtype)
+    ds.attrs = _merged_attrs(ds)
+    with span("region index", "merge"):
+        index_builder = RegionIndexBuilder()
+        index_builder.add_dataset(ds)
+
+    with dask.config.set({"optimization.fuse.ave-width": 50}), span(
+        "merge", "merge", variants=ds.sizes["variants"]
+    ):
+        ds.to_zarr(traced_store(output, "merge", "merge chunk"), mode="w")
+    with span("region index", "merge"):
+        write_region_index(output, index_builder.index())
 
 
 def vcf_to_zarrs(
@@ -202,10 +1174,26 @@ def vcf_to_zarrs(
     chunk_length: int = 10_000,
     chunk_width: int = 1_000,
     output_storage_options: Optional[Dict[str, str]] = None,
+    executor: Optional[Any] = None,
+    straggler_factor: Optional[float] = None,
+    options: Optional[ConversionOptions] = None,
 ) -> Sequence[str]:
     """Convert specified regions of one or more VCF files to multiple Zarr on-disk stores,
     one per region.
 
+    By default the regions are converted in parallel using Dask (with whichever scheduler
+    is active). Alternatively, an `executor` may be supplied, in which case the regions are
+    submitted to it as separate tasks, largest first (using size estimates from the VCF
+    indexes), and the results are collected as they complete. A process pool avoids
+    contention for the GIL in the decoding loop, which limits the speedup from threads.
+
+    Since region sizes are only estimates, some parts may take much longer than others.
+    When using an executor, setting `straggler_factor` enables speculative execution of
+    such stragglers: once no parts are waiting to run, a part that has been running for
+    longer than `straggler_factor` times the median part time is split into smaller
+    regions, which are converted alongside the original. Whichever finishes first is
+    used, so a single region may produce more than one Zarr store.
+
     Parameters
     ----------
     input : Union[PathType, Sequence[PathType]]
@@ -224,56 +1212,308 @@ def vcf_to_zarrs(
         Width (number of samples) to use when storing chunks in output, by default 1_000.
     output_storage_options : Optional[Dict[str, str]], optional
         Any additional parameters for the storage backend, for the output (see `fsspec.open`).
+    executor : Optional[Any], optional
+        A `concurrent.futures.Executor` (such as a `ProcessPoolExecutor`), or a Dask
+        distributed `Client`, to run the conversion tasks on. By default None, which means
+        use Dask. Note that worker processes must be able to access `output`, so an
+        in-memory filesystem can only be used with a thread pool.
+    straggler_factor : Optional[float], optional
+        How many times longer than the median a part must run for before it is
+        speculatively re-executed as smaller parts, by default None, which means no
+        speculative execution. Only used with an `executor`.
+    options : Optional[ConversionOptions], optional
+        How to convert each part, such as the INFO and FORMAT fields to extract and the
+        number of ALT alleles to store, with the same meanings as the arguments of
+        `vcf_to_zarr`. By default None, which means the defaults of `vcf_to_zarr`. If
+        `alt_number` or `ploidy` is None, each part is sized for the alleles and calls
+        it contains.
 
     Returns
     -------
     Sequence[str]
-        A list of URLs to the Zarr outputs.
+        A list of URLs to the Zarr outputs, in region order.
     """
 
     output_storage_options = output_storage_options or {}
 
+    parts = _vcf_to_zarrs_parts(input, output, regions)
+    if executor is None:
+        tasks = [
+            dask.delayed(_convert_part)(
+                part,
+                chunk_length,
+                chunk_width,
+                output_storage_options,
+                options,
+            )
+            for part in parts
+        ]
+        dask.compute(*tasks)
+        return [part.url for part in parts]
+
+    part_urls: Dict[int, List[str]] = {}
+    for i, urls in _convert_parts_as_completed(
+        parts,
+        executor,
+        chunk_length,
+        chunk_width,
+        output_storage_options,
+        straggler_factor,
+        options,
+    ):
+        part_urls[i] = urls
+    return [url for i in range(len(parts)) for url in part_urls[i]]
+
+
+@dataclass
+class VcfPart:
+    """A region of a VCF file, and the URL of the Zarr store that it is converted to."""
+
+    input: PathType
+    region: Optional[str]
+    url: str
+
+
+def _input_regions(
+    input: Union[PathType, Sequence[PathType]],
+    regions: Union[None, str, Sequence[str], Sequence[Optional[Sequence[str]]]],
+) -> List[Tuple[PathType, List[Optional[str]]]]:
+    """Normalize the input and regions arguments to a list of inputs and their regions."""
     if isinstance(input, str) or isinstance(input, Path):
         # Single input
-        inputs: Sequence[PathType] = [input]
-        assert regions is not None  # this would just be sequential case
-        input_regions: Sequence[Optional[Sequence[str]]] = [regions]  # type: ignore
+        if regions is None or isinstance(regions, str):
+            return [(input, [regions])]
+        return [(input, list(regions))]  # type: ignore
     else:
         # Multiple inputs
-        inputs = input
         if regions is None:
-            input_regions = [None] * len(inputs)
-        else:
-            if len(regions) == 0 or isinstance(regions[0], str):
-                raise ValueError(
-                    f"For multiple inputs, multiple input regions must be a sequence of sequence of strings: {regions}"
-                )
-            input_regions = regions
-
-    assert len(inputs) == len(input_regions)
-
-    tasks = []
-    parts = []
-    for i, input in enumerate(inputs):
-        filename = url_filename(str(input))
-        input_region_list = input_regions[i]
-        if input_region_list is None:
-            # single partition case: make a list so the loop below works
-            input_region_list = [None]  # type: ignore
-        for r, region in enumerate(input_region_list):
-            part_url = build_url(str(output), f"{filename}/part-{r}.zarr")
-            output_part = fsspec.get_mapper(part_url, **output_storage_options)
-            parts.append(part_url)
-            task = dask.delayed(vcf_to_zarr_sequential)(
-                input,
-                output=output_part,
-                region=region,
-                chunk_length=chunk_length,
-                chunk_width=chunk_width,
+            return [(i, [None]) for i in input]
+        if len(regions) == 0 or isinstance(regions[0], str):
+            raise ValueError(
+                f"For multiple inputs, multiple input regions must be a sequence of sequence of strings: {regions}"
             )
-            tasks.append(task)
-    dask.compute(*tasks)
-    return parts
+        assert len(input) == len(regions)
+        return [
+            (i, [None] if r is None else list(r))  # type: ignore
+            for i, r in zip(input, regions)
+        ]
+
+
+def _vcf_to_zarrs_parts(
+    input: Union[PathType, Sequence[PathType]],
+    output: PathType,
+    regions: Union[None, Sequence[str], Sequence[Optional[Sequence[str]]]],
+) -> List[VcfPart]:
+    with span("plan", "plan"):
+        parts = []
+        filenames: Set[str] = set()
+        for i, (input, input_region_list) in enumerate(_input_regions(input, regions)):
+            filename = url_filename(str(input))
+            if filename in filenames:
+                # inputs in different directories may have the same name
+                filename = f"{filename}-{i}"
+            filenames.add(filename)
+            for r, region in enumerate(input_region_list):
+                part_url = build_url(str(output), f"{filename}/part-{r}.zarr")
+                parts.append(VcfPart(input, region, part_url))
+        return parts
+
+
+def _convert_part(
+    part: VcfPart,
+    chunk_length: int,
+    chunk_width: int,
+    output_storage_options: Dict[str, str],
+    options: Optional[ConversionOptions] = None,
+) -> float:
+    """Convert a part, returning the time taken in seconds."""
+    start = time.perf_counter()
+    output_part = fsspec.get_mapper(part.url, **output_storage_options)
+    vcf_to_zarr_sequential(
+        part.input,
+        output=output_part,
+        region=part.region,
+        chunk_length=chunk_length,
+        chunk_width=chunk_width,
+        options=options,
+    )
+    return time.perf_counter() - start
+
+
+def _estimate_part_sizes(parts: Sequence[VcfPart]) -> List[int]:
+    """Estimate the compressed input size of each part, reading each index only once."""
+    parts_by_input: Dict[str, List[int]] = defaultdict(list)
+    for i, part in enumerate(parts):
+        parts_by_input[str(part.input)].append(i)
+    # find the sizes and indexes of all the inputs at once, since there may be many
+    file_infos = get_vcf_file_infos(list(parts_by_input))
+    sizes = [0] * len(parts)
+    for info, (input, indexes) in zip(file_infos, parts_by_input.items()):
+        regions = [parts[i].region for i in indexes]
+        region_sizes = estimate_region_sizes(
+            input, regions, index_path=info.index_path, file_length=info.size
+        )
+        for i, size in zip(indexes, region_sizes):
+            sizes[i] = size
+    return sizes
+
+
+def _convert_parts_as_completed(
+    parts: Sequence[VcfPart],
+    executor: Any,
+    chunk_length: int,
+    chunk_width: int,
+    output_storage_options: Dict[str, str],
+    straggler_factor: Optional[float] = None,
+    options: Optional[ConversionOptions] = None,
+) -> Generator[Tuple[int, List[str]], None, None]:
+    """Convert parts using an executor, yielding each part as soon as it has been converted.
+
+    Parts are submitted in order of decreasing estimated size, so that the largest parts
+    don't end up running on their own at the end.
+
+    If `straggler_factor` is set, then once there are no more parts waiting to run, any part
+    that has been running for more than `straggler_factor` times the median time of the
+    parts completed so far is speculatively re-executed as smaller sub-parts (by splitting
+    its region), and whichever of the original or the sub-parts finish first are used.
+
+    Yields the index of each part and the URLs of the Zarr stores that hold its output, which
+    is either the part's own URL, or the URLs of any non-empty sub-parts.
+
+    When the generator finishes (or is closed), it waits for any abandoned parts that
+    are still running, so that none of them write to `output` after it returns.
+    """
+    if hasattr(executor, "get_executor"):
+        # a Dask distributed client
+        executor = executor.get_executor()
+
+    with span("plan", "plan"):
+        sizes = _estimate_part_sizes(parts)
+    order = sorted(range(len(parts)), key=lambda i: sizes[i], reverse=True)
+
+    def submit(part: VcfPart) -> concurrent.futures.Future:  # type: ignore[type-arg]
+        return executor.submit(
+            _convert_part,
+            part,
+            chunk_length,
+            chunk_width,
+            output_storage_options,
+            options,
+        )
+
+    # map from each future to its part index, and its sub-part index (None for the original)
+    futures: Dict[concurrent.futures.Future, Tuple[int, Optional[int]]] = {}  # type: ignore[type-arg]
+    for i in order:
+        futures[submit(parts[i])] = (i, None)
+    waiting = set(futures)
+    durations: List[float] = []
+    running_since: Dict[int, float] = {}
+    sub_parts: Dict[int, List[VcfPart]] = {}
+    sub_parts_done: Dict[int, int] = {}
+    timeout = None if straggler_factor is None else STRAGGLER_POLL_INTERVAL
+
+    try:
+        while len(waiting) > 0:
+            done, _ = concurrent.futures.wait(
+                waiting, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                duration = future.result()  # raise any exception from the task
+                i, j = futures[future]
+                waiting.discard(future)
+                if j is None:
+                    durations.append(duration)
+                    # no need for any sub-parts now
+                    _abandon(futures, waiting, i, original=False)
+                    yield i, [parts[i].url]
+                else:
+                    sub_parts_done[i] += 1
+                    if sub_parts_done[i] == len(sub_parts[i]):
+                        # no need for the original part now
+                        _abandon(futures, waiting, i, original=True)
+                        urls = [
+                            sub_part.url
+                            for sub_part in sub_parts[i]
+                            if _is_zarr(sub_part.url, output_storage_options)
+                        ]
+                        yield i, urls
+
+            if straggler_factor is not None and len(durations) > 0:
+                now = time.monotonic()
+                originals = [f for f in waiting if futures[f][1] is None]
+                for future in originals:
+                    if future.running():
+                        running_since.setdefault(futures[future][0], now)
+                if any(not f.running() for f in waiting):
+                    continue  # only speculate when there are no parts waiting to run
+                threshold = straggler_factor * statistics.median(durations)
+                for future in originals:
+                    i = futures[future][0]
+                    if i in sub_parts or now - running_since[i] <= threshold:
+                        continue
+                    # an empty list means the part can't be split
+                    sub_parts[i] = _split_part(parts[i], STRAGGLER_SPLIT_PARTS)
+                    sub_parts_done[i] = 0
+                    for j, sub_part in enumerate(sub_parts[i]):
+                        sub_future = submit(sub_part)
+                        futures[sub_future] = (i, j)
+                        waiting.add(sub_future)
+    finally:
+        for future in futures:
+            future.cancel()
+        # running tasks can't be cancelled, so wait for them to finish writing
+        concurrent.futures.wait(futures)
+
+
+def _scan_part_sizes(
+    parts: Sequence[VcfPart],
+    executor: Any,
+    alt_number: Optional[int],
+    ploidy: Optional[int],
+) -> Tuple[int, int]:
+    if hasattr(executor, "get_executor"):
+        # a Dask distributed client
+        executor = executor.get_executor()
+    sizes = list(
+        executor.map(
+            scan_sizes,
+            [part.input for part in parts],
+            [part.region for part in parts],
+            [alt_number] * len(parts),
+            [ploidy] * len(parts),
+        )
+    )
+    return max(a for a, _ in sizes), max(p for _, p in sizes)
+
+
+def _split_part(part: VcfPart, num_parts: int) -> List[VcfPart]:
+    regions = split_region(part.input, part.region, num_parts)
+    if regions is None:
+        return []
+    url = part.url[: -len(".zarr")]
+    return [
+        VcfPart(part.input, region, f"{url}-{j}.zarr")
+        for j, region in enumerate(regions)
+    ]
+
+
+def _abandon(
+    futures: Dict[concurrent.futures.Future, Tuple[int, Optional[int]]],  # type: ignore[type-arg]
+    waiting: Set[concurrent.futures.Future],  # type: ignore[type-arg]
+    i: int,
+    original: bool,
+) -> None:
+    """Stop waiting for either the original or the sub-parts of part `i`, cancelling them if they haven't started."""
+    for future in list(waiting):
+        index, j = futures[future]
+        if index == i and (j is None) == original:
+            future.cancel()
+            waiting.discard(future)
+
+
+def _is_zarr(url: str, storage_options: Dict[str, str]) -> bool:
+    # a part with no variants doesn't write a Zarr store
+    return ".zgroup" in fsspec.get_mapper(url, **storage_options)
 
 
 def zarrs_to_dataset(
@@ -306,34 +1546,514 @@ def zarrs_to_dataset(
 
     storage_options = storage_options or {}
 
-    datasets = [xr.open_zarr(fsspec.get_mapper(path, **storage_options)) for path in urls]  # type: ignore[no-untyped-call]
+    datasets = [_open_part(path, storage_options) for path in urls]
+
+    ds = _concat_parts(datasets, chunk_length, chunk_width)
+
+    # Set variable length strings to fixed length ones to avoid xarray/conventions.py:188 warning
+    # (Also avoids this issue: https://github.com/pydata/xarray/issues/3476)
+    for var, dtype in _fixed_length_string_dtypes(datasets).items():
+        ds[var] = ds[var].astype(dtype)
+    del ds.attrs["max_variant_id_length"]
+    del ds.attrs["max_variant_allele_length"]
+
+    return ds
+
+
+def _open_part(url: str, storage_options: Dict[str, str]) -> xr.Dataset:
+    return xr.open_zarr(  # type: ignore[no-untyped-call]
+        traced_store(fsspec.get_mapper(url, **storage_options), "merge")
+    )
+
+
+def _concat_parts(
+    datasets: Sequence[xr.Dataset], chunk_length: int, chunk_width: int
+) -> xr.Dataset:
+    datasets = _widen_dims(datasets)
+
+    # The per-sample statistics of the parts are summed, rather than concatenated
+    sample_stats = [v for v in SAMPLE_STATS if v in datasets[0]]
+    if len(sample_stats) > 0:
+        combined_sample_stats = combine_sample_stats(datasets)
+        datasets = [d.drop_vars(sample_stats) for d in datasets]
 
     # Combine the datasets into one
-    ds = xr.concat(datasets, dim="variants", data_vars="minimal")  # type: ignore[no-untyped-call, no-redef]
+    dense_vars = [
+        v for v in datasets[0].data_vars if DIM_DENSE_VARIANT in datasets[0][v].dims
+    ]
+    ds: xr.Dataset = xr.concat(  # type: ignore[no-untyped-call]
+        [d.drop_vars(dense_vars) for d in datasets], dim="variants", data_vars="minimal"
+    )
+    if len(dense_vars) > 0:
+        # the sparse genotype calls are concatenated along their own dimension
+        dense: xr.Dataset = xr.concat(  # type: ignore[no-untyped-call]
+            [d[dense_vars] for d in datasets], dim=DIM_DENSE_VARIANT
+        )
+        ds = ds.merge(dense)
+    if len(sample_stats) > 0:
+        ds = ds.assign(combined_sample_stats)
+    ds.attrs["mixed_ploidy"] = any(d.attrs.get("mixed_ploidy", False) for d in datasets)
 
     # This is a workaround to make rechunking work when the temp_chunk_length is different to chunk_length
     # See https://github.com/pydata/xarray/issues/4380
     for data_var in ds.data_vars:
-        if "variants" in ds[data_var].dims:
-            del ds[data_var].encoding["chunks"]
+        if "variants" in ds[data_var].dims or DIM_DENSE_VARIANT in ds[data_var].dims:
+            ds[data_var].encoding.pop("chunks", None)
 
     # Rechunk to uniform chunk size
-    ds: xr.Dataset = ds.chunk({"variants": chunk_length, "samples": chunk_width})
+    chunks = {"variants": chunk_length, "samples": chunk_width}
+    if len(dense_vars) > 0:
+        chunks[DIM_DENSE_VARIANT] = chunk_length
+    for dim in PADDED_DIMS:
+        if dim in ds.dims:
+            # undo any chunks added by padding
+            chunks[dim] = -1
+    if PACKED_VARIABLE in ds:
+        chunks[DIM_PACKED] = packed_chunk_size(
+            chunk_width, ds.sizes["alleles"], ds[PACKED_VARIABLE].attrs["ploidy"]
+        )
+    return ds.chunk(chunks)
 
-    # Set variable length strings to fixed length ones to avoid xarray/conventions.py:188 warning
-    # (Also avoids this issue: https://github.com/pydata/xarray/issues/3476)
+
+def _merge_sample_parts(
+    datasets: Sequence[xr.Dataset], inputs: Sequence[PathType], region: Optional[str]
+) -> xr.Dataset:
+    """Combine the parts for a region of inputs with disjoint samples along the samples dimension.
+
+    The inputs must have the same variants (contigs, positions and alleles) in the
+    region. Any per-variant statistics are summed over the inputs, and the other variables
+    without a samples dimension, such as INFO fields, are taken from the first input.
+    """
+    datasets = _widen_dims(datasets)
+    first = datasets[0]
+    for ds, input in zip(datasets[1:], inputs[1:]):
+        if ds.sizes["variants"] != first.sizes["variants"] or any(
+            not np.array_equal(ds[var].values, first[var].values)
+            for var in ("variant_contig", "variant_position", "variant_allele")
+        ):
+            raise ValueError(
+                f"Inputs must have the same variants to merge samples, but {input} differs from {inputs[0]} in region {region}"
+            )
+    sample_vars = [v for v in first.data_vars if "samples" in first[v].dims]
+    samples: xr.Dataset = xr.concat(  # type: ignore[no-untyped-call]
+        [ds[sample_vars] for ds in datasets], dim="samples"
+    )
+    sample_id, counts = np.unique(samples["sample_id"].values, return_counts=True)
+    if np.any(counts > 1):
+        raise ValueError(
+            f"Inputs must have disjoint samples to merge them: {list(sample_id[counts > 1])}"
+        )
+    ds = first.drop_vars(sample_vars).merge(samples)
+    if VARIANT_STATS[0] in first:
+        ds = ds.assign(combine_variant_stats(datasets))
+    ds.attrs = dict(first.attrs)
+    ds.attrs["mixed_ploidy"] = any(d.attrs.get("mixed_ploidy", False) for d in datasets)
+    return ds
+
+
+def _widen_dims(datasets: Sequence[xr.Dataset]) -> List[xr.Dataset]:
+    """Pad the allele and ploidy dimensions of each part to the largest size in any part.
+
+    Parts that were converted with ``alt_number=None`` or ``ploidy=None`` are sized for
+    the alleles and calls they contain, so they may differ. Padding goes at the end of
+    each dimension, which keeps the VCF order of values for genotypes (``Number=G``) as
+    well as for alleles. Parts whose calls are padded are marked as mixed ploidy.
+    """
+    sizes = {
+        dim: max(ds.sizes[dim] for ds in datasets)
+        for dim in PADDED_DIMS
+        if dim in datasets[0].dims
+    }
+    widened = []
+    for ds in datasets:
+        pad = {
+            dim: size - ds.sizes[dim]
+            for dim, size in sizes.items()
+            if ds.sizes[dim] < size
+        }
+        if len(pad) > 0:
+            padded = {
+                var: _pad_end(ds[var], pad).assign_attrs(ds[var].attrs)
+                for var in ds.data_vars
+                if any(dim in ds[var].dims for dim in pad)
+            }
+            ds = ds.drop_vars(list(padded)).assign(padded)
+            if "ploidy" in pad:
+                ds.attrs["mixed_ploidy"] = True
+        widened.append(ds)
+    return widened
+
+
+def _missing_and_fill_values(array: xr.DataArray) -> Tuple[Any, Any]:
+    """The values that a variable uses for missing values and for padding, as when it is decoded."""
+    if "fill" in array.attrs:
+        return array.attrs["missing"], array.attrs["fill"]  # quantized fields
+    elif array.dtype.kind == "i":
+        return INT_MISSING, INT_FILL
+    elif array.dtype.kind == "f":
+        return np.nan, np.nan
+    return STR_MISSING, STR_FILL
+
+
+def _pad_end(array: xr.DataArray, pad: Dict[str, int]) -> xr.DataArray:
+    missing_value, fill_value = _missing_and_fill_values(array)
+    for dim, n in pad.items():
+        if dim not in array.dims:
+            continue
+        if dim == "ploidy":
+            # calls are padded with the fill value (and masked), as when they are decoded
+            padding = xr.full_like(
+                array.isel({dim: 0}), True if array.dtype == bool else INT_FILL
+            )
+        else:
+            # values for a field that is missing from a record are all missing values,
+            # so they stay that way, and other values are padded with the fill value
+            all_missing = (array == missing_value).all(dim)
+            padding = xr.where(all_missing, missing_value, fill_value).astype(
+                array.dtype
+            )
+        padding = padding.expand_dims({dim: n}, axis=array.dims.index(dim))
+        array = xr.concat([array, padding], dim=dim)  # type: ignore[no-untyped-call]
+    return array
+
+
+def _fixed_length_string_dtypes(datasets: Sequence[xr.Dataset]) -> Dict[str, str]:
     max_variant_id_length = max(ds.attrs["max_variant_id_length"] for ds in datasets)
     max_variant_allele_length = max(
         ds.attrs["max_variant_allele_length"] for ds in datasets
     )
-    ds["variant_id"] = ds["variant_id"].astype(f"S{max_variant_id_length}")
-    ds["variant_allele"] = ds["variant_allele"].astype(f"S{max_variant_allele_length}")
-    del ds.attrs["max_variant_id_length"]
-    del ds.attrs["max_variant_allele_length"]
+    return dict(
+        variant_id=f"S{max_variant_id_length}",
+        variant_allele=f"S{max_variant_allele_length}",
+    )
+
+
+def _merged_attrs(ds: xr.Dataset) -> Dict[str, Any]:
+    # the string length attrs are only needed while merging
+    return {k: v for k, v in ds.attrs.items() if not k.startswith("max_variant_")}
+
+
+class StreamingMerge:
+    """Merges Zarr parts into a single output store as they are completed, in any order.
+
+    Whenever a contiguous prefix of the parts has completed, all whole chunks (of
+    `chunk_length` variants) that are available are written to the output, and any
+    remaining variants are held back until the next part completes. The fixed-length
+    string variables depend on every part, so they are written by `close`.
+    """
+
+    def __init__(
+        self,
+        output: Union[PathType, MutableMapping[str, bytes]],
+        urls: Sequence[str],
+        chunk_length: int,
+        chunk_width: int,
+        storage_options: Optional[Dict[str, str]] = None,
+    ):
+        self.output = traced_store(output, "merge", "merge chunk")
+        self.urls = urls
+        self.chunk_length = chunk_length
+        self.chunk_width = chunk_width
+        self.storage_options = storage_options or {}
+        # the URLs of the stores holding each completed part, or None if not completed
+        self.part_urls: List[Optional[Sequence[str]]] = [None] * len(urls)
+        self.next_part = 0  # the first part that has not been added to the buffer
+        self.buffer: List[xr.Dataset] = []  # variants that have not been written yet
+        self.n_variants_written = 0
+        # the runs of variants in each chunk written, for the region index
+        self.region_index = RegionIndexBuilder()
+
+    def part_completed(self, index: int, urls: Optional[Sequence[str]] = None) -> None:
+        """Record that the part with the given index has completed, and write any chunks that are now available.
+
+        If the part's output was written to different stores (for example, if it was split
+        into smaller parts), then their URLs are passed in `urls`.
+        """
+        self.part_urls[index] = [self.urls[index]] if urls is None else urls
+        n_parts = self.next_part
+        while self.next_part < len(self.urls):
+            part_urls = self.part_urls[self.next_part]
+            if part_urls is None:
+                break
+            # the per-sample statistics depend on every part, so are written by close
+            self.buffer.extend(
+                _open_part(url, self.storage_options).drop_vars(
+                    SAMPLE_STATS, errors="ignore"
+                )
+                for url in part_urls
+            )
+            self.next_part += 1
+        if self.next_part > n_parts:
+            self._write(final=False)
+
+    def close(self) -> None:
+        """Write the remaining variants, the string variables and any per-sample statistics, once all parts have completed."""
+        if self.next_part < len(self.urls):
+            raise ValueError("Not all parts have completed")
+        self._write(final=True)
+
+        datasets = [
+            _open_part(url, self.storage_options)
+            for part_urls in self.part_urls
+            for url in part_urls  # type: ignore[union-attr]
+        ]
+        ds = _concat_parts(datasets, self.chunk_length, self.chunk_width)
+        string_dtypes = _fixed_length_string_dtypes(datasets)
+        ds = xr.Dataset(
+            {
+                **{var: ds[var].astype(dtype) for var, dtype in string_dtypes.items()},
+                **{var: ds[var] for var in SAMPLE_STATS if var in ds},
+            },
+            attrs=_merged_attrs(ds),
+        )
+        with span("merge", "merge"):
+            ds.to_zarr(self.output, mode="a")
+        with span("region index", "merge"):
+            write_region_index(self.output, self.region_index.index())
+
+    def _write(self, final: bool) -> None:
+        if len(self.buffer) == 0:
+            return
+        ds = _concat_parts(self.buffer, self.chunk_length, self.chunk_width)
+        # the number of variants (and sparse genotype calls) to write
+        n_write: Dict[str, int] = {}
+        for dim in ("variants", DIM_DENSE_VARIANT):
+            if dim in ds.dims:
+                n = ds.sizes[dim]
+                n_write[dim] = n if final else n - n % self.chunk_length
+        # there are never more sparse genotype calls than variants, so if there are no
+        # variants to write then there are no calls to write either, except at the end
+        if all(n == 0 for n in n_write.values()):
+            return
+        ds_write = ds.isel({dim: slice(0, n) for dim, n in n_write.items()})
+        ds_write = ds_write.drop_vars(["variant_id", "variant_allele"])
+        ds_write.attrs = _merged_attrs(ds)
+        with span("region index", "merge"):
+            self.region_index.add_dataset(ds_write)
+        with dask.config.set({"optimization.fuse.ave-width": 50}), span(
+            "merge", "merge", variants=n_write["variants"]
+        ):
+            if self.n_variants_written == 0:
+                ds_write.to_zarr(
+                    self.output, mode="w", encoding=self._dense_encoding(ds_write)
+                )
+            else:
+                # Only variables with a variants (or dense variants) dimension are extended
+                non_variant_vars = [
+                    v
+                    for v in ds_write.data_vars
+                    if "variants" not in ds_write[v].dims
+                    and DIM_DENSE_VARIANT not in ds_write[v].dims
+                ]
+                ds_write = ds_write.drop_vars(non_variant_vars)
+                _append_to_zarr(ds_write, self.output)
+        self.n_variants_written += n_write["variants"]
+        if any(n < ds.sizes[dim] for dim, n in n_write.items()):
+            self.buffer = [ds.isel({dim: slice(n, None) for dim, n in n_write.items()})]
+        else:
+            self.buffer = []
+
+    def _dense_encoding(self, ds: xr.Dataset) -> Dict[str, Dict[str, Any]]:
+        # sparse genotype calls may be empty when they are first written, so their
+        # chunks are set explicitly rather than taken from the Dask chunks
+        return {
+            str(var): dict(
+                chunks=(self.chunk_length,)
+                + tuple(c[0] for c in ds[var].data.chunks[1:])
+            )
+            for var in ds.data_vars
+            if DIM_DENSE_VARIANT in ds[var].dims
+        }
+
+
+def read_vcf(
+    input: Union[PathType, Sequence[PathType]],
+    *,
+    regions: Union[None, str, Sequence[str], Sequence[Optional[Sequence[str]]]] = None,
+    fields: Optional[Sequence[str]] = None,
+    exclude_fields: Optional[Sequence[str]] = None,
+    field_defs: Optional[Dict[str, Dict[str, Any]]] = None,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    engine: str = "cyvcf2",
+) -> xr.Dataset:
+    """Read specified regions of one or more VCF files into a lazily-loaded dataset.
 
+    No intermediate files are written. Instead, the variables in the returned dataset are
+    Dask arrays, with one chunk (along the variants dimension) per region, so that each
+    region is only decoded when it is needed for a computation. The number of variants
+    in each region is found up front by counting them (in parallel), which is much cheaper
+    than decoding them.
+
+    Since each region is decoded in full whenever any chunk in it is needed, the regions
+    should be chosen so that they fit comfortably in memory, for example by using
+    `partition_into_regions`.
+
+    Parameters
+    ----------
+    input : Union[PathType, Sequence[PathType]]
+        A path (or paths) to the input BCF or VCF file (or files). VCF files should
+        be compressed and have a .tbi or .csi index file. BCF files should have a .csi
+        index file.
+    regions : Union[None, str, Sequence[str], Sequence[Optional[Sequence[str]]]], optional
+        Genomic region or regions to read variants for. For multiple inputs, multiple
+        input regions are specified as a sequence of values which may be None, or a
+        sequence of region strings. By default None, which means read all variants.
+    fields : Optional[Sequence[str]], optional
+        INFO and FORMAT fields to read, in addition to the genotypes and the fixed
+        fields (see `vcf_to_zarr`), by default None.
+    exclude_fields : Optional[Sequence[str]], optional
+        Fields to leave out of those matched by `fields`, by default None.
+    field_defs : Optional[Dict[str, Dict[str, Any]]], optional
+        Overrides for the header definitions of fields (see `vcf_to_zarr`), by default None.
+    ploidy : Optional[int], optional
+        The number of alleles to store for each genotype call, with calls that have
+        fewer padded with the fill value (see `vcf_to_zarr`), by default 2. If None,
+        the largest ploidy of any call in the regions is used, which is found by
+        scanning them up front.
+    engine : str, optional
+        The decoder to use for each region (see `vcf_to_zarr`), by default "cyvcf2".
+
+    Returns
+    -------
+    xr.Dataset
+        A dataset in the layout of `create_genotype_call_dataset`, backed by Dask arrays.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Engine must be one of {ENGINES}: {engine}")
+    input_regions = [
+        (input, region)
+        for input, input_region_list in _input_regions(input, regions)
+        for region in input_region_list
+    ]
+
+    if ploidy is None:
+        with span("scan alleles", "plan"):
+            _, ploidy = scan_region_sizes(input_regions, DEFAULT_ALT_NUMBER, ploidy)
+
+    native = engine == "native" and not fields
+    with open_header(input_regions[0][0], native=native, header_only=True) as vcf:
+        sample_id = np.array(vcf.samples, dtype=str)
+        variant_contig_names = vcf.seqnames
+        vcf_fields = get_vcf_fields(
+            vcf, fields, exclude_fields, field_defs, ploidy=ploidy
+        )
+        specs = variable_specs(vcf, vcf_fields, ploidy=ploidy)
+
+    with span("count", "plan"):
+        counts = dask.compute(
+            *[dask.delayed(count_variants)(i, r) for i, r in input_regions]
+        )
+
+    blocks: Dict[str, List[Any]] = {var: [] for var in specs}
+    for (input, region), n_variants in zip(input_regions, counts):
+        if n_variants == 0:
+            continue
+        arrays = dask.delayed(_read_region, pure=True)(
+            input, region, n_variants, vcf_fields, ploidy, engine
+        )
+        for var, (shape, dtype) in specs.items():
+            blocks[var].append(
+                da.from_delayed(arrays[var], shape=(n_variants,) + shape, dtype=dtype)
+            )
+    data = {}
+    for var, (shape, dtype) in specs.items():
+        if len(blocks[var]) == 0:
+            # there are no variants in any of the regions
+            blocks[var].append(
+                da.from_array(np.empty((0,) + shape, dtype=dtype), chunks=-1)
+            )
+        data[var] = da.concatenate(blocks[var])
+
+    ds: xr.Dataset = create_genotype_call_dataset(
+        variant_contig_names=variant_contig_names,
+        variant_contig=data["variant_contig"],
+        variant_position=data["variant_position"],
+        variant_alleles=data["variant_allele"],
+        sample_id=sample_id,
+        call_genotype=data["call_genotype"],
+        call_genotype_phased=data["call_genotype_phased"],
+        variant_id=data["variant_id"],
+    )
+    ds["variant_id_mask"] = (
+        [DIM_VARIANT],
+        data["variant_id"] == ".",
+    )
+    _add_field_variables(ds, data, vcf_fields)
     return ds
 
 
+def _read_region(
+    input: PathType,
+    region: Optional[str],
+    n_variants: int,
+    vcf_fields: Sequence[VcfField] = (),
+    ploidy: int = DEFAULT_PLOIDY,
+    engine: str = "cyvcf2",
+) -> Dict[str, np.ndarray]:
+    native = engine == "native" and len(vcf_fields) == 0
+    with task_span("read region", "part", input=str(input), region=region), open_header(
+        input, region, native
+    ) as vcf:
+        # read the whole region as a single chunk
+        chunks = list(
+            _read_chunks(
+                vcf,
+                input,
+                region,
+                n_variants,
+                vcf_fields,
+                variant_end=False,
+                alt_number=DEFAULT_ALT_NUMBER,
+                ploidy=ploidy,
+                engine=engine,
+            )
+        )
+    if len(chunks) != 1 or len(chunks[0]["variant_position"]) != n_variants:
+        raise ValueError(
+            f"Number of variants in region {region} of {input} changed while reading"
+        )
+    return chunks[0]
+
+
+def check_conversion_options(
+    options: ConversionOptions,
+    *,
+    chunk_length: int,
+    chunk_width: int,
+    temp_chunk_length: Optional[int],
+    merge_samples: bool,
+    straggler_factor: Optional[float] = None,
+) -> None:
+    """Raise a ValueError if the options for `vcf_to_zarr` can't be used together."""
+    pack_genotypes = options.pack_genotypes
+    sparse_hom_ref = options.sparse_hom_ref
+    if temp_chunk_length is not None:
+        if chunk_length % temp_chunk_length != 0:
+            raise ValueError(
+                f"Temporary chunk length in variant dimension ({temp_chunk_length}) "
+                f"must evenly divide target chunk length {chunk_length}"
+            )
+    if pack_genotypes and sparse_hom_ref:
+        raise ValueError("Only one of pack_genotypes and sparse_hom_ref may be set")
+    if pack_genotypes and options.alt_number is None:
+        raise ValueError("alt_number must be set to pack genotypes")
+    if options.engine not in ENGINES:
+        raise ValueError(f"Engine must be one of {ENGINES}: {options.engine}")
+    if (pack_genotypes or sparse_hom_ref) and options.ploidy is None:
+        raise ValueError(
+            "ploidy must be set to pack genotypes or store hom-ref calls sparsely"
+        )
+    if pack_genotypes and chunk_width % 8 != 0:
+        raise ValueError(
+            f"Chunk width must be a multiple of 8 to pack genotypes: {chunk_width}"
+        )
+    if merge_samples:
+        if pack_genotypes or sparse_hom_ref or straggler_factor is not None:
+            raise ValueError(
+                "merge_samples cannot be combined with pack_genotypes, sparse_hom_ref or straggler_factor"
+            )
+
+
 def vcf_to_zarr(
     input: Union[PathType, Sequence[PathType]],
     output: Union[PathType, MutableMapping[str, bytes]],
@@ -344,6 +2064,18 @@ def vcf_to_zarr(
     temp_chunk_length: Optional[int] = None,
     tempdir: Optional[PathType] = None,
     tempdir_storage_options: Optional[Dict[str, str]] = None,
+    executor: Optional[Any] = None,
+    straggler_factor: Optional[float] = None,
+    fields: Optional[Sequence[str]] = None,
+    exclude_fields: Optional[Sequence[str]] = None,
+    field_defs: Optional[Dict[str, Dict[str, Any]]] = None,
+    pack_genotypes: bool = False,
+    sparse_hom_ref: bool = False,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+    engine: str = "cyvcf2",
+    merge_samples: bool = False,
+    compute_stats: bool = False,
 ) -> None:
     """Convert specified regions of one or more VCF files to a single Zarr on-disk store.
 
@@ -383,15 +2115,144 @@ def vcf_to_zarr(
         use the system default temporary directory.
     tempdir_storage_options: Optional[Dict[str, str]], optional
         Any additional parameters for the storage backend for tempdir (see `fsspec.open`).
+    executor : Optional[Any], optional
+        A `concurrent.futures.Executor` or Dask distributed `Client` to convert the
+        regions on, when converting in parallel (see `vcf_to_zarrs`). By default None,
+        which means use Dask. When an executor is used, the intermediate outputs are
+        merged into `output` as they complete, rather than after all of them have
+        completed, so the two steps overlap.
+    straggler_factor : Optional[float], optional
+        Enables speculative execution of slow parts when using an `executor` (see
+        `vcf_to_zarrs`), by default None.
+    fields : Optional[Sequence[str]], optional
+        INFO and FORMAT fields to extract, in addition to the genotypes and the fixed
+        fields, for example ``["INFO/DP", "FORMAT/DP", "FORMAT/GQ"]``. Wildcards are
+        allowed, as in ``["INFO/*"]``. Each field is stored in a variable named
+        ``variant_<key>`` for INFO fields, or ``call_<key>`` for FORMAT fields, with a
+        dtype and shape determined by its header definition. By default None, which
+        means no extra fields. Fields that are not requested are never decoded.
+    exclude_fields : Optional[Sequence[str]], optional
+        Fields to leave out of those matched by `fields`, by default None.
+    field_defs : Optional[Dict[str, Dict[str, Any]]], optional
+        Overrides for the header definitions of fields, keyed by field, for example
+        ``{"FORMAT/AD": {"Number": "R"}}``. The ``Number`` and ``Type`` of a field may be
+        overridden, and ``dimension`` sets the number of values to store, which is
+        required for fields with ``Number=.``. Numeric fields may be stored more
+        compactly by setting ``dtype``, ``max_value`` (to cap values) or ``scale`` (to
+        quantize floats to fixed point), as in ``{"FORMAT/GQ": {"max_value": 99}}``;
+        see `FieldEncoding`. These are applied as values are decoded. By default None.
+    pack_genotypes : bool, optional
+        If True, store the genotype calls and their phases in a single bit-packed
+        ``call_genotype_packed`` variable, instead of the ``call_genotype``,
+        ``call_genotype_mask`` and ``call_genotype_phased`` variables. Each allele
+        index takes just enough bits for the number of alleles (two for biallelic
+        data), plus one bit per call for the phase. Use
+        ``ds.packed_genotypes.unpack()`` to get the usual variables back (lazily) after
+        opening the store. `chunk_width` must be a multiple of 8. By default False.
+    sparse_hom_ref : bool, optional
+        If True, don't store genotype calls for variants whose calls are all unphased
+        hom-ref, such as gVCF reference blocks. These variants are flagged in a
+        ``variant_hom_ref`` variable, and the calls for the other variants are stored
+        in ``dense_call_genotype`` and ``dense_call_genotype_phased`` variables, along
+        a ``dense_variants`` dimension. The end position of each variant (from the
+        ``END`` INFO field for reference blocks) is stored in ``variant_end``. Use
+        ``ds.sparse_genotypes.densify()`` to get the usual variables back (lazily)
+        after opening the store. Cannot be combined with `pack_genotypes`. By default
+        False.
+    alt_number : Optional[int], optional
+        The number of ALT alleles to store for each variant, by default 3. Variants
+        with fewer are padded with empty strings, and any more are dropped (along with
+        their values in fields with ``Number=A``, ``R`` or ``G``). If None, the
+        largest number of ALT alleles of any variant is used, so that no alleles are
+        dropped and no space is wasted on padding. This is found as the records are
+        decoded, so variants converted before one with more ALT alleles are padded
+        when it is reached, and regions with fewer alleles are padded when they are
+        merged. If an `executor` is used, the input is scanned for it before any
+        regions are converted instead, since the output is merged as they complete.
+        Cannot be combined with `pack_genotypes`, since the number of bits per allele
+        depends on the number of alleles.
+    ploidy : Optional[int], optional
+        The number of alleles to store for each genotype call, by default 2. Calls with
+        fewer alleles (such as haploid calls on chrY in a diploid dataset) are padded
+        with the fill value (-2), which is masked in ``call_genotype_mask``, and the
+        ``mixed_ploidy`` attribute of the dataset is set to True. Calls with more
+        alleles are an error. If None, the largest ploidy of any call is used, which is
+        found as the records are decoded, along with the number of alleles (see
+        `alt_number`), and calls with a lower ploidy are padded as above. Cannot be combined
+        with `pack_genotypes` or `sparse_hom_ref`.
+    engine : str, optional
+        The decoder to use, by default "cyvcf2", which decodes each record with cyvcf2.
+        If "native", BCF inputs are decoded by reading records straight from the BGZF
+        blocks (starting at the offsets in the .csi index for regions), and the genotype
+        calls for a whole chunk of records are decoded with vectorized NumPy operations,
+        which is several times faster. Text VCF inputs (uncompressed, or bgzipped
+        and indexed) are decoded by splitting whole chunks of lines at once, and records
+        whose calls all have single-digit alleles and a ``GT``-only FORMAT (such as
+        ``0|1``) have their calls decoded with vectorized byte operations too. Any other
+        records fall back to a per-record parser, so the output is the same either way.
+        The native decoders only handle the fixed fields and the genotype calls, so
+        cyvcf2 is still used when any `fields` are requested, and for other inputs
+        (such as gzipped, but not bgzipped, VCFs). If the local block cache is enabled
+        (see `sgkit_vcf.block_cache.block_cache`), the native decoders read remote
+        inputs through it directly, while cyvcf2 reads a local copy of the header and
+        the blocks for each region, which is made through the cache.
+    merge_samples : bool, optional
+        If True, the inputs are treated as batches of samples for the same variants
+        (for example, per-batch VCFs called at the same sites), and are merged along
+        the samples dimension instead of being concatenated along the variants
+        dimension, in the order given. `regions` must then be None or a sequence of
+        region strings, and the same regions are converted for every input, in
+        parallel. The inputs must have the same contigs, positions and alleles in each
+        region, and no samples in common, otherwise a ValueError is raised. Variables
+        without a samples dimension (such as INFO fields) are taken from the first
+        input. Cannot be combined with `pack_genotypes`, `sparse_hom_ref` or
+        `straggler_factor`. By default False.
+    compute_stats : bool, optional
+        If True, compute summary statistics of the genotype calls while converting,
+        so that the store doesn't have to be read again for quality control. For each
+        variant, the numbers of called, heterozygous, hom-ref, hom-alt and non-ref calls
+        are stored in ``variant_n_called``, ``variant_n_het``, ``variant_n_hom_ref``,
+        ``variant_n_hom_alt`` and ``variant_n_non_ref``, along with the call rate in
+        ``variant_call_rate`` and the count of each allele in ``variant_allele_count``.
+        The same counts over all variants are stored for each sample, in
+        ``sample_n_called`` and so on, along with ``sample_call_rate``; these are
+        accumulated for each part, and summed when the parts are merged. By default
+        False.
     """
 
-    if temp_chunk_length is not None:
-        if chunk_length % temp_chunk_length != 0:
-            raise ValueError(
-                f"Temporary chunk length in variant dimension ({temp_chunk_length}) "
-                f"must evenly divide target chunk length {chunk_length}"
-            )
-    if (isinstance(input, str) or isinstance(input, Path)) and (
+    options = ConversionOptions(
+        fields=fields,
+        exclude_fields=exclude_fields,
+        field_defs=field_defs,
+        pack_genotypes=pack_genotypes,
+        sparse_hom_ref=sparse_hom_ref,
+        alt_number=alt_number,
+        ploidy=ploidy,
+        engine=engine,
+        compute_stats=compute_stats,
+    )
+    check_conversion_options(
+        options,
+        chunk_length=chunk_length,
+        chunk_width=chunk_width,
+        temp_chunk_length=temp_chunk_length,
+        merge_samples=merge_samples,
+        straggler_factor=straggler_factor,
+    )
+    if merge_samples:
+        vcf_to_zarr_merge_samples(
+            [input] if isinstance(input, str) or isinstance(input, Path) else input,
+            output,
+            regions=regions,  # type: ignore[arg-type]
+            chunk_length=chunk_length,
+            chunk_width=chunk_width,
+            temp_chunk_length=temp_chunk_length,
+            tempdir=tempdir,
+            tempdir_storage_options=tempdir_storage_options,
+            executor=executor,
+            options=options,
+        )
+    elif (isinstance(input, str) or isinstance(input, Path)) and (
         regions is None or isinstance(regions, str)
     ):
         vcf_to_zarr_sequential(
@@ -400,6 +2261,8 @@ def vcf_to_zarr(
             region=regions,
             chunk_length=chunk_length,
             chunk_width=chunk_width,
+            options=options,
+            region_index=True,
         )
     else:
         vcf_to_zarr_parallel(
@@ -411,15 +2274,81 @@ def vcf_to_zarr(
             temp_chunk_length=temp_chunk_length,
             tempdir=tempdir,
             tempdir_storage_options=tempdir_storage_options,
+            executor=executor,
+            straggler_factor=straggler_factor,
+            options=options,
         )
 
 
 def count_variants(path: PathType, region: Optional[str] = None) -> int:
     """Count the number of variants in a VCF file."""
-    with open_vcf(path) as vcf:
+    with open_vcf(path, region) as vcf:
         if region is not None:
             vcf = vcf(region)
         count = 0
         for variant in region_filter(vcf, region):
             count = count + 1
         return count
+
+
+def max_alt_alleles(path: PathType, region: Optional[str] = None) -> int:
+    """Return the largest number of ALT alleles of any variant in a VCF file, and at least one.
+
+    Each record is parsed in full by cyvcf2, so this costs about as much as decoding the
+    fixed fields of the variants.
+    """
+    return scan_sizes(path, region, alt_number=None)[0]
+
+
+def max_ploidy(path: PathType, region: Optional[str] = None) -> int:
+    """Return the largest ploidy of any call in a VCF file, and at least one.
+
+    As for `max_alt_alleles`, each record is parsed in full.
+    """
+    return scan_sizes(path, region, ploidy=None)[1]
+
+
+def scan_sizes(
+    path: PathType,
+    region: Optional[str] = None,
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+) -> Tuple[int, int]:
+    """Return `alt_number` and `ploidy`, finding any that are None from a VCF file.
+
+    Missing values are found in a single pass over the records, as the largest number
+    of ALT alleles of any variant, and the largest ploidy of any call (each at least one).
+    """
+    if alt_number is not None and ploidy is not None:
+        return alt_number, ploidy
+    max_alt, max_call_ploidy = 1, 1
+    with open_vcf(path, region) as vcf:
+        if region is not None:
+            vcf = vcf(region)
+        for variant in region_filter(vcf, region):
+            if alt_number is None:
+                max_alt = max(max_alt, len(variant.ALT))
+            if ploidy is None:
+                # the largest ploidy of any call in the record
+                max_call_ploidy = max(max_call_ploidy, variant.ploidy)
+    return (
+        max_alt if alt_number is None else alt_number,
+        max_call_ploidy if ploidy is None else ploidy,
+    )
+
+
+def scan_region_sizes(
+    input_regions: Sequence[Tuple[PathType, Optional[str]]],
+    alt_number: Optional[int] = DEFAULT_ALT_NUMBER,
+    ploidy: Optional[int] = DEFAULT_PLOIDY,
+) -> Tuple[int, int]:
+    """Return `alt_number` and `ploidy`, finding any that are None from the largest in any of the (input, region) pairs.
+
+    The regions are scanned in parallel (see `scan_sizes`).
+    """
+    if alt_number is not None and ploidy is not None:
+        return alt_number, ploidy
+    sizes = dask.compute(
+        *[dask.delayed(scan_sizes)(i, r, alt_number, ploidy) for i, r in input_regions]
+    )
+    return max(a for a, _ in sizes), max(p for _, p in sizes)
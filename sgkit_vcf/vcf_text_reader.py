@@ -0,0 +1,535 @@
+"""A vectorized decoder for text VCF files whose genotypes are all fixed-width calls.
+
+Imputed and phased panels typically have a ``GT``-only FORMAT column, with every call
+written as single-digit alleles like ``0|1``. For such records the calls are at a fixed
+stride after the FORMAT column, so a whole chunk of lines can be decoded with a few
+NumPy byte operations: the tab and newline positions give the fixed fields, and each
+call is two bytes per allele (the allele and the following separator or tab).
+
+Records that don't fit the pattern (such as those with more FORMAT fields, multi-digit
+alleles, or mixed ploidy) are decoded by a simple per-record parser instead, so any
+text VCF can be read. Only the fixed fields and the genotype calls are decoded.
+"""
+
+import re
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from sgkit_vcf.bcf_reader import parse_header_dictionaries
+from sgkit_vcf.bgzf import BgzfReader, decompress_block, read_block
+from sgkit_vcf.block_cache import open_input
+from sgkit_vcf.typing import PathType
+from sgkit_vcf.utils import gather_bytes, gather_strings
+from sgkit_vcf.vcf_fields import INT_FILL, INT_MISSING
+from sgkit_vcf.vcf_partition import (
+    find_index_path,
+    get_sequence_names,
+    parse_region,
+    read_index,
+    region_virtual_offset,
+)
+
+VCF_MAGIC = b"##fileformat=VCF"
+
+# The number of bytes to read at a time from an uncompressed file
+TEXT_READ_SIZE = 1 << 16
+
+_TAB = ord("\t")
+_NEWLINE = ord("\n")
+_DOT = ord(".")
+_PHASED = ord("|")
+_UNPHASED = ord("/")
+_ZERO = ord("0")
+_GT_SEPARATOR = re.compile(rb"[|/]")
+
+# Lookup tables from pairs of bytes (as little-endian uint16 values) to single-digit
+# allele indexes: each allele is followed by a separator, except the last in a call,
+# which is followed by a tab (or the newline, for the last call in a line)
+_NOT_AN_ALLELE = -3
+_INNER_ALLELE_CODES = np.full(1 << 16, _NOT_AN_ALLELE, dtype=np.int8)
+_LAST_ALLELE_CODES = np.full(1 << 16, _NOT_AN_ALLELE, dtype=np.int8)
+for _allele, _code in [(_DOT, INT_MISSING)] + [(_ZERO + i, i) for i in range(10)]:
+    for _separator in (_PHASED, _UNPHASED):
+        _INNER_ALLELE_CODES[_separator << 8 | _allele] = _code
+    for _separator in (_TAB, _NEWLINE):
+        _LAST_ALLELE_CODES[_separator << 8 | _allele] = _code
+
+
+# The number of bytes at the start of each line to look for the fixed fields in
+FIXED_FIELDS_WINDOW = 256
+
+
+def is_text_vcf(
+    path: PathType, storage_options: Optional[Dict[str, str]] = None
+) -> bool:
+    """Return True if a file is an uncompressed or BGZF-compressed text VCF file."""
+    with open_input(path, storage_options) as f:
+        start = f.read(len(VCF_MAGIC))
+        if start == VCF_MAGIC:
+            return True
+        f.seek(0)
+        try:
+            block = read_block(f)
+        except ValueError:
+            return False
+        return decompress_block(block).startswith(VCF_MAGIC) if block else False
+
+
+class VcfTextFile:
+    """An open text VCF file, whose lines can be read for a region, in chunks."""
+
+    def __init__(
+        self, path: PathType, storage_options: Optional[Dict[str, str]] = None
+    ):
+        self.path = str(path)
+        self.storage_options = storage_options or {}
+        self._file: IO[Any] = open_input(self.path, self.storage_options)
+        self.compressed = self._file.read(len(VCF_MAGIC)) != VCF_MAGIC
+        self._file.seek(0)
+        self.reader: Optional[BgzfReader] = None
+        read: Callable[[], bytes]
+        if self.compressed:
+            self.reader = BgzfReader(self._file)
+            read = self.reader.read_block_remainder
+        else:
+            read = self._read_text
+
+        # read up to the end of the #CHROM line
+        header = bytearray()
+        while True:
+            more = read()
+            if len(more) == 0:
+                raise ValueError(f"File has no #CHROM header line: {self.path}")
+            header += more
+            chrom_line = header.find(b"\n#CHROM")
+            if chrom_line >= 0 and header.find(b"\n", chrom_line + 1) >= 0:
+                break
+        header_length = header.find(b"\n", chrom_line + 1) + 1
+        self.header_text = header[:header_length].decode("utf-8")
+        columns = self.header_text[chrom_line + 1 :].rstrip("\n").split("\t")
+        self.samples = columns[9:]
+        if self.reader is not None:
+            self.reader.seek(0)
+            self.reader.read(header_length)
+            self.first_record_offset = self.reader.tell()
+        else:
+            self.first_record_offset = header_length
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "VcfTextFile":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _sequence_names(self, index: Any) -> List[str]:
+        # a .csi index doesn't store the contig names, which are numbered in the order
+        # of the header's contig lines
+        if hasattr(index, "sequence_names"):
+            return list(index.sequence_names)
+        contigs, _ = parse_header_dictionaries(self.header_text)
+        if len(contigs) > 0:
+            return contigs
+        return list(get_sequence_names(self.path, index))
+
+    def _read_text(self) -> bytes:
+        data: bytes = self._file.read(TEXT_READ_SIZE)
+        return data
+
+    def line_chunks(
+        self, region: Optional[str] = None, chunk_length: int = 10_000
+    ) -> Iterator[Tuple[bytes, np.ndarray]]:
+        """Iterate over chunks of (up to) `chunk_length` records that start in a region.
+
+        Each chunk is a buffer of decompressed data, and the offsets of the starts of the
+        record lines in it. Every line in the buffer ends with a newline. As for the VCF
+        decoder, a region includes the records whose position is between its start and
+        end (inclusive), but not earlier records that overlap it.
+        """
+        read: Callable[[], bytes]
+        if self.reader is not None:
+            read = self.reader.read_block_remainder
+        else:
+            read = self._read_text
+        if region is None:
+            contig, start, end = None, 1, None
+            if self.reader is not None:
+                self.reader.seek(self.first_record_offset)
+            else:
+                self._file.seek(self.first_record_offset)
+        else:
+            if self.reader is None:
+                raise ValueError(
+                    f"Regions can only be read from compressed and indexed files: {self.path}"
+                )
+            contig, start, end = parse_region(region)
+            index_path = find_index_path(self.path, self.storage_options)
+            index = read_index(index_path, self.storage_options)
+            sequence_names = self._sequence_names(index)
+            if contig not in sequence_names:
+                return
+            offset = region_virtual_offset(index, sequence_names.index(contig), start)
+            if offset is None:
+                return
+            self.reader.seek(offset)
+
+        data = bytearray()
+        scanned = 0  # the offset that lines have been found up to
+        line_starts: List[np.ndarray] = []
+        n_lines = 0
+        finished = False
+        while not finished:
+            more = read()
+            if len(more) == 0:
+                finished = True
+                if scanned < len(data) and not data.endswith(b"\n"):
+                    more = b"\n"  # the last line has no newline
+            data += more
+            u8 = np.frombuffer(data, dtype=np.uint8)
+            newlines = scanned + np.flatnonzero(u8[scanned:] == _NEWLINE)
+            if len(newlines) > 0:
+                starts = np.concatenate([[scanned], newlines[:-1] + 1])
+                scanned = int(newlines[-1]) + 1
+                if contig is not None:
+                    in_region, past_region = _lines_in_region(
+                        u8, starts, contig, start, end
+                    )
+                    if past_region:
+                        finished = True
+                    starts = starts[in_region]
+                line_starts.append(starts)
+                n_lines += len(starts)
+            del u8  # so data can be resized
+
+            while n_lines >= chunk_length or (finished and n_lines > 0):
+                all_starts = np.concatenate(line_starts)
+                chunk_starts = all_starts[:chunk_length]
+                yield bytes(data), chunk_starts
+                # drop the data for the lines that have been yielded
+                rest = all_starts[chunk_length:]
+                consumed = int(rest[0]) if len(rest) > 0 else scanned
+                del data[:consumed]
+                scanned -= consumed
+                line_starts = [rest - consumed]
+                n_lines = len(rest)
+
+
+def _lines_in_region(
+    u8: np.ndarray, starts: np.ndarray, contig: str, start: int, end: Optional[int]
+) -> Tuple[np.ndarray, bool]:
+    """Return a mask of the lines in a region, and whether any line is past its end."""
+    prefix = np.frombuffer(contig.encode() + b"\t", dtype=np.uint8)
+    on_contig = np.all(gather_bytes(u8, starts, len(prefix)) == prefix, axis=1)
+    pos_starts = starts + len(prefix)
+    pos_ends = _next_separators(u8, pos_starts)
+    pos = _parse_ints(u8, pos_starts, pos_ends - pos_starts)
+    past = ~on_contig
+    if end is not None:
+        past |= pos > end
+    if past.any():
+        # the lines are sorted, so none after the first past the end are in the region
+        first_past = int(np.argmax(past))
+        in_region = np.arange(len(starts)) < first_past
+        return in_region & (pos >= start), True
+    return pos >= start, False
+
+
+def _next_separators(u8: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Return the offset of the first tab or newline at or after each offset."""
+    separators = np.flatnonzero((u8 == _TAB) | (u8 == _NEWLINE))
+    return separators[np.searchsorted(separators, offsets)]
+
+
+def _next_newlines(u8: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Return the offset of the first newline at or after each offset."""
+    newlines = np.flatnonzero(u8 == _NEWLINE)
+    return newlines[np.searchsorted(newlines, offsets)]
+
+
+def _field_bounds(
+    u8: np.ndarray, starts: np.ndarray, n_fields: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the offsets of the ends of the first `n_fields` fields of each line, and of the line ends.
+
+    Missing fields are empty, at the end of the line.
+    """
+    line_ends = _next_newlines(u8, starts)
+    # look for the separators near the start of each line, rather than in all the data
+    window = gather_bytes(u8, starts, FIXED_FIELDS_WINDOW)
+    separators = np.flatnonzero((window == _TAB) | (window == _NEWLINE))
+    first = np.searchsorted(separators, np.arange(len(starts)) * FIXED_FIELDS_WINDOW)
+    index = np.minimum(first[:, None] + np.arange(n_fields), len(separators) - 1)
+    row, column = np.divmod(separators[index], FIXED_FIELDS_WINDOW)
+    bounds = starts[:, None] + column
+    missing = row != np.arange(len(starts))[:, None]
+    long = missing.any(axis=1) & (line_ends - starts >= FIXED_FIELDS_WINDOW)
+    if long.any():
+        # lines with long fixed fields are searched in full
+        separators = np.flatnonzero((u8 == _TAB) | (u8 == _NEWLINE))
+        first = np.searchsorted(separators, starts[long])
+        index = np.minimum(first[:, None] + np.arange(n_fields), len(separators) - 1)
+        bounds[long] = separators[index]
+        missing[long] = False
+    bounds[missing] = len(u8)
+    return np.minimum(bounds, line_ends[:, None]), line_ends
+
+
+def _parse_ints(u8: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Parse the unsigned decimal integers with the given offsets and lengths."""
+    width = max(int(lengths.max(initial=0)), 1)
+    digits = gather_bytes(u8, offsets, width).astype(np.int64) - _ZERO
+    exponents = lengths[:, None] - 1 - np.arange(width)
+    values = np.where(exponents >= 0, digits * 10 ** np.maximum(exponents, 0), 0)
+    return values.sum(axis=1)
+
+
+def decode_text_records(
+    data: bytes,
+    starts: np.ndarray,
+    buffers: Dict[str, np.ndarray],
+    contig_indexes: Dict[str, int],
+    sizes: Optional[Dict[str, int]] = None,
+) -> int:
+    """Decode text VCF record lines into the start of the given buffers, and return the number decoded.
+
+    Every field is decoded for all the lines at once, using NumPy operations on the
+    line `starts` in `data` (as returned by `VcfTextFile.line_chunks`). Genotype calls
+    are decoded in one go for the lines whose calls fit a fixed-width pattern, and line
+    by line for the others.
+
+    The buffers are as for the VCF decoder, and only the variables that have a buffer are
+    decoded. `contig_indexes` maps contig names to the value of ``variant_contig``. If
+    `sizes` is given, the largest number of ALT alleles and the largest ploidy of any
+    record are stored in it (as ``alt_number`` and ``ploidy``), and calls with a higher
+    ploidy than `call_genotype` holds are not decoded rather than being an error, so
+    that the lines can be decoded again into larger buffers.
+    """
+    variant_contig = buffers.get("variant_contig")
+    variant_position = buffers.get("variant_position")
+    variant_end = buffers.get("variant_end")
+    variant_id = buffers.get("variant_id")
+    variant_allele = buffers.get("variant_allele")
+    call_genotype = buffers.get("call_genotype")
+    call_genotype_phased = buffers.get("call_genotype_phased")
+
+    u8 = np.frombuffer(data, dtype=np.uint8)
+    n = len(starts)
+    # the end of each of CHROM, POS, ID, REF, ALT, QUAL, FILTER, INFO and FORMAT
+    bounds, line_ends = _field_bounds(u8, starts, 9)
+    field_starts = np.concatenate([starts[:, None], bounds[:, :-1] + 1], axis=1)
+    lengths = bounds - field_starts
+
+    if variant_contig is not None:
+        chroms = gather_strings(u8, starts, lengths[:, 0])
+        names, inverse = np.unique(chroms, return_inverse=True)
+        for name in names:
+            if name not in contig_indexes:
+                # the same error as looking up the contig with cyvcf2
+                raise ValueError(f"{name!r} is not in list")
+        variant_contig[:n] = np.array([contig_indexes[c] for c in names])[inverse]
+    pos = _parse_ints(u8, field_starts[:, 1], lengths[:, 1])
+    if variant_position is not None:
+        variant_position[:n] = pos
+    if variant_end is not None:
+        # the END INFO field gives the extent of reference blocks
+        variant_end[:n] = pos + lengths[:, 3] - 1
+        info_end = _info_end(u8, field_starts[:, 7], bounds[:, 7])
+        has_end = info_end >= 0
+        variant_end[:n][has_end] = info_end[has_end]
+    if variant_id is not None:
+        variant_id[:n] = gather_strings(u8, field_starts[:, 2], lengths[:, 2])
+    if variant_allele is not None or sizes is not None:
+        max_alt = _decode_alleles(u8, field_starts, lengths, variant_allele, n)
+        if sizes is not None:
+            sizes["alt_number"] = max_alt
+
+    if call_genotype is not None or call_genotype_phased is not None:
+        max_ploidy = _decode_genotypes(
+            data,
+            u8,
+            starts,
+            bounds,
+            line_ends,
+            call_genotype,
+            call_genotype_phased,
+            strict=sizes is None,
+        )
+        if sizes is not None:
+            sizes["ploidy"] = max_ploidy
+    return n
+
+
+def _info_end(
+    u8: np.ndarray, info_starts: np.ndarray, info_ends: np.ndarray
+) -> np.ndarray:
+    """Return the value of the END key in the INFO field of each line, or -1 if there is none."""
+    end = np.full(len(info_starts), -1, dtype=np.int64)
+    keys = np.flatnonzero(u8[:-4] == ord("E"))
+    keys = keys[(u8[keys + 1] == ord("N")) & (u8[keys + 2] == ord("D"))]
+    keys = keys[(u8[keys + 3] == ord("=")) & (keys > 0)]
+    # the key must start an INFO entry
+    keys = keys[(u8[keys - 1] == _TAB) | (u8[keys - 1] == ord(";"))]
+    line = np.searchsorted(info_starts, keys, side="right") - 1
+    in_info = (line >= 0) & (keys >= info_starts[line]) & (keys < info_ends[line])
+    keys, line = keys[in_info], line[in_info]
+    if len(keys) > 0:
+        values = gather_bytes(u8, keys + 4, 12)
+        is_digit = (values >= _ZERO) & (values <= _ZERO + 9)
+        value_lengths = np.where(
+            is_digit.all(axis=1), is_digit.shape[1], np.argmin(is_digit, axis=1)
+        )
+        end[line] = _parse_ints(u8, keys + 4, value_lengths)
+    return end
+
+
+def _decode_alleles(
+    u8: np.ndarray,
+    field_starts: np.ndarray,
+    lengths: np.ndarray,
+    variant_allele: Optional[np.ndarray],
+    n: int,
+) -> int:
+    """Decode the alleles into the first `n` rows of `variant_allele` (if any), and return the largest number of ALT alleles."""
+    alt = gather_strings(u8, field_starts[:, 4], lengths[:, 4])
+    alt[alt == "."] = ""
+    # most sites have a single ALT allele, which is copied directly
+    multi = np.array([a.find(",") >= 0 for a in alt], dtype=bool)
+    split = {i: alt[i].split(",") for i in np.flatnonzero(multi)}
+    max_alt = max(map(len, split.values()), default=int(np.any(alt != "")))
+    if variant_allele is None:
+        return max_alt
+    alleles = variant_allele[:n]
+    alleles[...] = ""
+    alleles[:, 0] = gather_strings(u8, field_starts[:, 3], lengths[:, 3])
+    if alleles.shape[1] > 1:
+        alleles[~multi, 1] = alt[~multi]
+        for i, alts in split.items():
+            alts = alts[: alleles.shape[1] - 1]
+            alleles[i, 1 : len(alts) + 1] = alts
+    return max_alt
+
+
+def _decode_genotypes(
+    data: bytes,
+    u8: np.ndarray,
+    starts: np.ndarray,
+    bounds: np.ndarray,
+    line_ends: np.ndarray,
+    call_genotype: Optional[np.ndarray],
+    call_genotype_phased: Optional[np.ndarray],
+    strict: bool = True,
+) -> int:
+    """Decode the genotype calls of the lines, and return the largest ploidy of any line."""
+    buffer: Any = call_genotype if call_genotype is not None else call_genotype_phased
+    n_samples = buffer.shape[1]
+    if n_samples == 0:
+        return 0
+    max_ploidy = 0
+    calls_start = bounds[:, 8] + 1
+    calls_end = line_ends
+    # each call has k single-digit alleles, each followed by a separator (or the tab
+    # or newline after the call), so the calls have a fixed stride of 2k bytes
+    calls_length = calls_end + 1 - calls_start
+    gt_only = (bounds[:, 8] - bounds[:, 7] == 3) & np.all(
+        gather_bytes(u8, bounds[:, 7] + 1, 2) == np.frombuffer(b"GT", np.uint8),
+        axis=1,
+    )
+    stride = calls_length // n_samples
+    fixed = gt_only & (calls_length % n_samples == 0) & (stride % 2 == 0) & (stride > 0)
+    for s in np.unique(stride[fixed]):
+        index = np.flatnonzero(fixed & (stride == s))
+        k = int(s) // 2
+        chars = np.lib.stride_tricks.sliding_window_view(u8, int(s) * n_samples)
+        chars = chars[calls_start[index]]
+        pairs = chars.view("<u2").reshape(len(index), n_samples, k)
+        inner = _INNER_ALLELE_CODES[pairs[..., :-1]]
+        last = _LAST_ALLELE_CODES[pairs[..., -1]]
+        fits = np.all(inner != _NOT_AN_ALLELE, axis=(1, 2))
+        fits &= np.all(last != _NOT_AN_ALLELE, axis=1)
+        fits &= np.all(pairs[:, :-1, -1] >> 8 == _TAB, axis=1)
+        if not fits.all():
+            fixed[index[~fits]] = False
+            index, pairs = index[fits], pairs[fits]
+            inner, last = inner[fits], last[fits]
+        if len(index) == 0:
+            continue
+        max_ploidy = max(max_ploidy, k)
+        if call_genotype is not None and _check_ploidy(
+            k, call_genotype, data, starts[index[0]], strict
+        ):
+            call_genotype[index, :, : k - 1] = inner
+            call_genotype[index, :, k - 1] = last
+            call_genotype[index, :, k:] = INT_FILL
+        if call_genotype_phased is not None:
+            # as for cyvcf2, the phase of a call is given by its second allele
+            if k > 1:
+                call_genotype_phased[index] = pairs[..., 0] >> 8 == _PHASED
+            else:
+                call_genotype_phased[index] = False
+
+    for i in np.flatnonzero(~fixed):
+        line = data[starts[i] : line_ends[i]]
+        k = _parse_genotypes(
+            line, i, n_samples, call_genotype, call_genotype_phased, strict
+        )
+        max_ploidy = max(max_ploidy, k)
+    return max_ploidy
+
+
+def _parse_genotypes(
+    line: bytes,
+    i: int,
+    n_samples: int,
+    call_genotype: Optional[np.ndarray],
+    call_genotype_phased: Optional[np.ndarray],
+    strict: bool = True,
+) -> int:
+    """Decode the genotype calls for a line that doesn't fit the fixed-width pattern, and return their ploidy."""
+    fields = line.split(b"\t")
+    if len(fields) < 10 or fields[8].split(b":")[0] != b"GT":
+        # no GT field means every call is missing
+        if call_genotype is not None:
+            call_genotype[i] = INT_MISSING
+        if call_genotype_phased is not None:
+            call_genotype_phased[i] = False
+        return 0
+    calls = [f.split(b":", 1)[0] for f in fields[9 : 9 + n_samples]]
+    calls += [b"."] * (n_samples - len(calls))
+    alleles = [_GT_SEPARATOR.split(c) for c in calls]
+    k = max(len(a) for a in alleles)
+    if call_genotype is not None and _check_ploidy(k, call_genotype, line, 0, strict):
+        call_genotype[i] = INT_FILL
+        for j, a in enumerate(alleles):
+            call_genotype[i, j, : len(a)] = [
+                INT_MISSING if allele == b"." else int(allele) for allele in a
+            ]
+    if call_genotype_phased is not None:
+        # as for cyvcf2, the phase of a call is given by its second allele, and calls
+        # with fewer alleles than the others in the record are reported as phased
+        call_genotype_phased[i] = [
+            k > 1 and (len(a) == 1 or c[len(a[0])] == _PHASED)
+            for a, c in zip(alleles, calls)
+        ]
+    return k
+
+
+def _check_ploidy(
+    k: int, call_genotype: np.ndarray, data: bytes, start: int, strict: bool
+) -> bool:
+    """Return whether the calls of a record (the line at `start`) fit the dataset's ploidy.
+
+    If they have more alleles, and `strict` is True, an error is raised.
+    """
+    n_ploidy = call_genotype.shape[2]
+    if k > n_ploidy and strict:
+        chrom, pos = (
+            data[start : data.index(b"\t", start) + 12].decode().split("\t")[:2]
+        )
+        raise ValueError(
+            f"Variant at {chrom}:{pos} has a call with ploidy {k}, which is more than "
+            f"{n_ploidy}; set ploidy to None to detect the ploidy from the input"
+        )
+    return k <= n_ploidy